@@ -7,9 +7,11 @@ from typing import Optional
 from datetime import datetime, timezone
 import logging
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import aiohttp
+from database import db
+from clientes_busqueda_service import campos_busqueda
+from identidad_cache_service import identidad_cache
 
 load_dotenv()
 
@@ -18,10 +20,6 @@ logger = logging.getLogger(__name__)
 # Router
 router = APIRouter(prefix="/telegram", tags=["telegram"])
 
-# MongoDB
-mongo_client = AsyncIOMotorClient(os.environ.get("MONGO_URL"))
-db = mongo_client[os.environ.get("DB_NAME", "netcash_mbco")]
-
 # Token del bot
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
 
@@ -72,6 +70,8 @@ async def alta_cliente_telegram(data: AltaClienteTelegramRequest):
                 "notas": f"Cliente dado de alta desde web con comisión {data.comision_pct}%"
             }
             
+            nuevo_cliente.update(campos_busqueda(nuevo_cliente))
+            
             await db.clientes.insert_one(nuevo_cliente)
             logger.info(f"[NetCash][AltaWeb] Cliente nuevo creado: {cliente_id}")
         
@@ -86,6 +86,8 @@ async def alta_cliente_telegram(data: AltaClienteTelegramRequest):
             }}
         )
         
+        identidad_cache.invalidar_cliente(cliente_id)
+        
         # 3. Crear o actualizar usuario en usuarios_telegram
         usuario_telegram = await db.usuarios_telegram.find_one(
             {"telegram_id": data.telegram_id},
@@ -120,6 +122,8 @@ async def alta_cliente_telegram(data: AltaClienteTelegramRequest):
             await db.usuarios_telegram.insert_one(nuevo_usuario_telegram)
             logger.info(f"[NetCash][AltaWeb] Usuario Telegram creado: {data.telegram_id}")
         
+        identidad_cache.invalidar_usuario_telegram(data.telegram_id)
+        
         # 4. Enviar mensaje de bienvenida por Telegram
         mensaje = (
             f"Hola {data.nombre} 👋\n\n"
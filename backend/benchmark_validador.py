@@ -0,0 +1,414 @@
+"""
+Benchmark y corpus de regresión de los validadores de comprobantes
+
+Corre sobre un directorio de comprobantes etiquetados y mide, en una sola pasada,
+velocidad y exactitud de:
+- ValidadorComprobantes.validar_comprobante (comprobantes de clientes)
+- BancoParserFactory.parsear_comprobante (sobre el texto extraído)
+- ComprobantePagoValidatorService.validar_comprobante (pagos de Tesorería)
+
+Reporta tiempos por etapa (extracción de texto, búsqueda de CLABE, búsqueda de
+beneficiario, fuzzy, parser de banco), latencia p50/p95/p99, archivos/seg y la
+diferencia de veredictos contra las etiquetas esperadas. La salida es JSON e
+incluye VALIDADOR_THABYETHA_VERSION para comparar corridas entre versiones.
+
+Uso:
+    python benchmark_validador.py /ruta/corpus --repeticiones 3 --salida bench_v3.6.json
+    python benchmark_validador.py /ruta/corpus --motor v36 --comparar bench_v3.6.json
+    python benchmark_validador.py /ruta/corpus --guardar-etiquetas
+
+Etiquetas (etiquetas.json dentro del directorio del corpus):
+{
+  "cuenta_activa": {"banco": "STP", "clabe": "646180139409481462",
+                    "beneficiario": "JARDINERIA Y COMERCIO THABYETHA SA DE CV"},
+  "comprobantes": {
+    "vault_1507500.pdf": {"valido": true, "metodo_clabe": "completa"},
+    "union_agroindustrial.pdf": {"valido": false},
+    "tesoreria/pago_nc0023.pdf": {"tipo": "pago_tesoreria", "capital": 100000.0, "comision": 375.0,
+                                  "folio_concepto": "23456x209xMx11", "valido": true}
+  }
+}
+Los archivos sin etiqueta se validan igual y se reportan como "sin_etiqueta".
+"""
+
+import argparse
+import functools
+import json
+import logging
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from banco_specific_parsers import BancoParserFactory
+from comprobante_matcher import comprobante_matcher
+from comprobante_pago_validator_service import ComprobantePagoValidatorService
+from texto_extraido_cache_service import texto_extraido_cache_service
+from validador_comprobantes_service import ValidadorComprobantes, VALIDADOR_THABYETHA_VERSION
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_ETIQUETAS = "etiquetas.json"
+EXTENSIONES_CORPUS = {".pdf": "application/pdf", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png"}
+TIPO_COMPROBANTE = "comprobante"
+TIPO_PAGO_TESORERIA = "pago_tesoreria"
+# Campos de la etiqueta que son datos de entrada, no veredicto esperado
+CAMPOS_ENTRADA = {"tipo", "capital", "comision", "folio_concepto", "cuenta_activa"}
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil con interpolación lineal (p entre 0 y 100)"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = (len(ordenados) - 1) * p / 100.0
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicion - inferior)
+
+
+def resumen_latencias(segundos: List[float]) -> Dict:
+    """p50/p95/p99/media/max en milisegundos"""
+    ms = [s * 1000 for s in segundos]
+    return {
+        "p50": round(percentil(ms, 50), 3),
+        "p95": round(percentil(ms, 95), 3),
+        "p99": round(percentil(ms, 99), 3),
+        "media": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "max": round(max(ms), 3) if ms else 0.0,
+        "muestras": len(ms)
+    }
+
+
+class Cronometro:
+    """Instrumenta métodos de los validadores para medir cada etapa por archivo"""
+
+    def __init__(self):
+        self.por_archivo: Dict[str, float] = defaultdict(float)
+        self.ultimo: Dict[str, object] = {}
+        self._envueltos = []
+
+    def envolver(self, objeto, metodo: str, etapa: str):
+        original = getattr(objeto, metodo)
+
+        @functools.wraps(original)
+        def medido(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                resultado = original(*args, **kwargs)
+                self.ultimo[etapa] = resultado
+                return resultado
+            finally:
+                self.por_archivo[etapa] += time.perf_counter() - inicio
+
+        setattr(objeto, metodo, medido)
+        self._envueltos.append((objeto, metodo))
+
+    def medir(self, etapa: str, funcion, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args)
+        finally:
+            self.por_archivo[etapa] += time.perf_counter() - inicio
+
+    def reiniciar_archivo(self):
+        self.por_archivo = defaultdict(float)
+        self.ultimo = {}
+
+    def restaurar(self):
+        """Quita la instrumentación (los métodos vuelven a ser los de la clase)"""
+        for objeto, metodo in reversed(self._envueltos):
+            delattr(objeto, metodo)
+        self._envueltos = []
+
+
+def crear_validador(motor: str) -> ValidadorComprobantes:
+    """'actual' = comprobante_matcher, 'v36' = implementación línea por línea original"""
+    if motor == "v36":
+        from validador_comprobantes_v36 import ValidadorComprobantesV36
+        return ValidadorComprobantesV36()
+    return ValidadorComprobantes()
+
+
+def cargar_corpus(directorio: Path) -> Dict:
+    """Archivos del corpus con su etiqueta (si existe)"""
+    ruta_etiquetas = directorio / ARCHIVO_ETIQUETAS
+    etiquetas = json.loads(ruta_etiquetas.read_text(encoding="utf-8")) if ruta_etiquetas.exists() else {}
+
+    comprobantes = etiquetas.get("comprobantes", {})
+    archivos = sorted(
+        str(ruta.relative_to(directorio)) for ruta in directorio.rglob("*")
+        if ruta.is_file() and ruta.suffix.lower() in EXTENSIONES_CORPUS
+    )
+    faltantes = [nombre for nombre in comprobantes if nombre not in archivos]
+    if faltantes:
+        logger.warning(f"[Benchmark] Etiquetas sin archivo en el corpus: {faltantes}")
+
+    return {
+        "cuenta_activa": etiquetas.get("cuenta_activa"),
+        "archivos": [(nombre, comprobantes.get(nombre)) for nombre in archivos]
+    }
+
+
+def _veredicto_comprobante(validador: ValidadorComprobantes, cronometro: Cronometro,
+                           ruta: Path, cuenta_activa: Dict) -> Dict:
+    es_valido, razon = validador.validar_comprobante(str(ruta), EXTENSIONES_CORPUS[ruta.suffix.lower()], cuenta_activa)
+
+    veredicto = {"valido": es_valido, "razon": razon}
+    resultado_clabe = cronometro.ultimo.get("busqueda_clabe")
+    if resultado_clabe:
+        veredicto["metodo_clabe"] = resultado_clabe[1]
+
+    texto = cronometro.ultimo.get("extraccion_texto")
+    if texto:
+        try:
+            datos_banco = cronometro.medir("parser_banco", BancoParserFactory.parsear_comprobante, texto)
+            veredicto["banco"] = datos_banco.get("banco")
+        except Exception as e:
+            veredicto["banco"] = None
+            veredicto["error_parser"] = str(e)
+
+    return veredicto
+
+
+def _veredicto_pago(validador_pago: ComprobantePagoValidatorService, ruta: Path, etiqueta: Dict) -> Dict:
+    es_valido, errores, _ = validador_pago.validar_comprobante(
+        str(ruta),
+        Decimal(str(etiqueta["capital"])),
+        Decimal(str(etiqueta["comision"])),
+        etiqueta["folio_concepto"]
+    )
+    return {"valido": es_valido, "errores": errores}
+
+
+def comparar_con_etiqueta(veredicto: Dict, etiqueta: Optional[Dict]) -> Optional[Dict]:
+    """Campos esperados que no coinciden (None si no hay etiqueta con veredicto)"""
+    if not etiqueta:
+        return None
+    esperado = {k: v for k, v in etiqueta.items() if k not in CAMPOS_ENTRADA}
+    if not esperado:
+        return None
+    return {
+        campo: {"esperado": valor, "obtenido": veredicto.get(campo)}
+        for campo, valor in esperado.items()
+        if veredicto.get(campo) != valor
+    }
+
+
+def ejecutar_benchmark(directorio: Path, repeticiones: int = 1, motor: str = "actual",
+                       cuenta_activa: Optional[Dict] = None, usar_cache_texto: bool = False) -> Dict:
+    """
+    Corre todos los validadores sobre el corpus y arma el reporte.
+
+    Args:
+        directorio: Directorio con los comprobantes (y opcionalmente etiquetas.json)
+        repeticiones: Veces que se valida cada archivo (la latencia usa todas)
+        motor: 'actual' o 'v36'
+        cuenta_activa: Cuenta contra la que se valida (si no, la de etiquetas.json)
+        usar_cache_texto: Si es False la extracción de texto se mide en frío en cada repetición
+    """
+    corpus = cargar_corpus(directorio)
+    cuenta_activa = cuenta_activa or corpus["cuenta_activa"]
+
+    validador = crear_validador(motor)
+    validador_pago = ComprobantePagoValidatorService()
+
+    cronometro = Cronometro()
+    cronometro.envolver(validador, "extraer_texto_comprobante", "extraccion_texto")
+    cronometro.envolver(validador, "buscar_clabe_en_texto", "busqueda_clabe")
+    cronometro.envolver(validador, "buscar_beneficiario_en_texto", "busqueda_beneficiario")
+    cronometro.envolver(comprobante_matcher, "_mejor_candidato_fuzzy", "fuzzy")
+    cronometro.envolver(validador_pago, "_extraer_texto_pdf", "extraccion_texto")
+    cronometro.envolver(validador_pago, "_validar_texto", "validacion_pago")
+
+    latencias: List[float] = []
+    etapas: Dict[str, List[float]] = defaultdict(list)
+    resultados = []
+
+    cache_habilitado = texto_extraido_cache_service.habilitado
+    texto_extraido_cache_service.habilitado = usar_cache_texto
+
+    inicio_total = time.perf_counter()
+    try:
+        for nombre, etiqueta in corpus["archivos"]:
+            ruta = directorio / nombre
+            tipo = (etiqueta or {}).get("tipo", TIPO_COMPROBANTE)
+            cuenta_archivo = (etiqueta or {}).get("cuenta_activa") or cuenta_activa
+
+            if tipo == TIPO_COMPROBANTE and not cuenta_archivo:
+                resultados.append({"archivo": nombre, "tipo": tipo, "error": "sin cuenta_activa"})
+                continue
+
+            veredicto = None
+            latencias_archivo = []
+            etapas_archivo: Dict[str, float] = defaultdict(float)
+
+            for _ in range(repeticiones):
+                cronometro.reiniciar_archivo()
+                inicio = time.perf_counter()
+                try:
+                    if tipo == TIPO_PAGO_TESORERIA:
+                        veredicto = _veredicto_pago(validador_pago, ruta, etiqueta)
+                    else:
+                        veredicto = _veredicto_comprobante(validador, cronometro, ruta, cuenta_archivo)
+                except Exception as e:
+                    veredicto = {"valido": None, "error": f"{type(e).__name__}: {e}"}
+                duracion = time.perf_counter() - inicio
+
+                latencias.append(duracion)
+                latencias_archivo.append(duracion)
+                for etapa, segundos in cronometro.por_archivo.items():
+                    etapas[etapa].append(segundos)
+                    etapas_archivo[etapa] += segundos
+
+            resultados.append({
+                "archivo": nombre,
+                "tipo": tipo,
+                "veredicto": veredicto,
+                "diferencias": comparar_con_etiqueta(veredicto, etiqueta),
+                "latencia_ms": round(sum(latencias_archivo) / len(latencias_archivo) * 1000, 3),
+                "etapas_ms": {e: round(s / repeticiones * 1000, 3) for e, s in etapas_archivo.items()}
+            })
+    finally:
+        cronometro.restaurar()
+        texto_extraido_cache_service.habilitado = cache_habilitado
+    tiempo_total = time.perf_counter() - inicio_total
+
+    con_etiqueta = [r for r in resultados if r.get("diferencias") is not None]
+    difieren = [r for r in con_etiqueta if r["diferencias"]]
+
+    return {
+        "validador_version": VALIDADOR_THABYETHA_VERSION,
+        "motor": motor,
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "corpus": str(directorio),
+        "repeticiones": repeticiones,
+        "cache_texto": usar_cache_texto,
+        "archivos": len(resultados),
+        "validaciones": len(latencias),
+        "tiempo_total_seg": round(tiempo_total, 3),
+        "archivos_por_seg": round(len(latencias) / tiempo_total, 3) if tiempo_total > 0 else 0.0,
+        "latencia_ms": resumen_latencias(latencias),
+        "etapas_ms": {etapa: resumen_latencias(valores) for etapa, valores in sorted(etapas.items())},
+        "veredictos": {
+            "con_etiqueta": len(con_etiqueta),
+            "coinciden": len(con_etiqueta) - len(difieren),
+            "difieren": len(difieren),
+            "sin_etiqueta": len(resultados) - len(con_etiqueta)
+        },
+        "diferencias": [{"archivo": r["archivo"], "campos": r["diferencias"]} for r in difieren],
+        "resultados": resultados
+    }
+
+
+def comparar_reportes(anterior: Dict, actual: Dict) -> Dict:
+    """Cambios de veredicto y de latencia entre dos corridas del benchmark"""
+    previos = {r["archivo"]: r.get("veredicto") for r in anterior.get("resultados", [])}
+    cambios = [
+        {"archivo": r["archivo"], "antes": previos[r["archivo"]], "despues": r.get("veredicto")}
+        for r in actual["resultados"]
+        if r["archivo"] in previos and previos[r["archivo"]] != r.get("veredicto")
+    ]
+    p50_antes = anterior.get("latencia_ms", {}).get("p50") or 0.0
+    return {
+        "version_anterior": anterior.get("validador_version"),
+        "motor_anterior": anterior.get("motor"),
+        "version_actual": actual["validador_version"],
+        "motor_actual": actual["motor"],
+        "veredictos_cambiados": cambios,
+        "p50_ms_antes": p50_antes,
+        "p50_ms_despues": actual["latencia_ms"]["p50"],
+        "speedup_p50": round(p50_antes / actual["latencia_ms"]["p50"], 3) if actual["latencia_ms"]["p50"] else None
+    }
+
+
+def guardar_etiquetas(directorio: Path, reporte: Dict):
+    """Congela los veredictos actuales como esperados (línea base para regresiones)"""
+    ruta = directorio / ARCHIVO_ETIQUETAS
+    etiquetas = json.loads(ruta.read_text(encoding="utf-8")) if ruta.exists() else {}
+    comprobantes = etiquetas.setdefault("comprobantes", {})
+
+    for resultado in reporte["resultados"]:
+        veredicto = resultado.get("veredicto")
+        if not veredicto or veredicto.get("valido") is None:
+            continue
+        etiqueta = comprobantes.setdefault(resultado["archivo"], {})
+        etiqueta["valido"] = veredicto["valido"]
+        for campo in ("metodo_clabe", "banco"):
+            if campo in veredicto:
+                etiqueta[campo] = veredicto[campo]
+
+    ruta.write_text(json.dumps(etiquetas, indent=2, ensure_ascii=False), encoding="utf-8")
+    return ruta
+
+
+def _imprimir_resumen(reporte: Dict, comparacion: Optional[Dict]):
+    latencia = reporte["latencia_ms"]
+    veredictos = reporte["veredictos"]
+    print(f"📊 Validador {reporte['validador_version']} (motor={reporte['motor']})", file=sys.stderr)
+    print(f"   Archivos: {reporte['archivos']} x{reporte['repeticiones']} | {reporte['archivos_por_seg']} archivos/seg", file=sys.stderr)
+    print(f"   Latencia ms: p50={latencia['p50']} p95={latencia['p95']} p99={latencia['p99']}", file=sys.stderr)
+    for etapa, stats in reporte["etapas_ms"].items():
+        print(f"   - {etapa}: p50={stats['p50']} p95={stats['p95']} p99={stats['p99']}", file=sys.stderr)
+    print(f"   Veredictos: {veredictos['coinciden']}/{veredictos['con_etiqueta']} coinciden, "
+          f"{veredictos['sin_etiqueta']} sin etiqueta", file=sys.stderr)
+    for diferencia in reporte["diferencias"]:
+        print(f"   ❌ {diferencia['archivo']}: {diferencia['campos']}", file=sys.stderr)
+    if comparacion:
+        print(f"   Cambios vs {comparacion['version_anterior']} ({comparacion['motor_anterior']}): "
+              f"{len(comparacion['veredictos_cambiados'])} veredicto(s), speedup p50 x{comparacion['speedup_p50']}",
+              file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark y corpus de regresión de validadores de comprobantes")
+    parser.add_argument("directorio", type=Path, help="Directorio con comprobantes (y etiquetas.json)")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--motor", choices=["actual", "v36"], default="actual")
+    parser.add_argument("--salida", type=Path, help="Archivo JSON de salida (por defecto stdout)")
+    parser.add_argument("--comparar", type=Path, help="Reporte JSON anterior para comparar veredictos")
+    parser.add_argument("--guardar-etiquetas", action="store_true",
+                        help="Guarda los veredictos de esta corrida como esperados en etiquetas.json")
+    parser.add_argument("--cache-texto", action="store_true",
+                        help="Usar el caché de texto extraído (por defecto se extrae en frío)")
+    parser.add_argument("--logs", action="store_true", help="Mantener logs INFO de los validadores")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.logs else logging.WARNING)
+    if not args.logs:
+        # Los logs INFO de los validadores dominarían la medición
+        logging.disable(logging.INFO)
+
+    try:
+        reporte = ejecutar_benchmark(args.directorio, args.repeticiones, args.motor,
+                                     usar_cache_texto=args.cache_texto)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    comparacion = None
+    if args.comparar:
+        comparacion = comparar_reportes(json.loads(args.comparar.read_text(encoding="utf-8")), reporte)
+        reporte["comparacion"] = comparacion
+
+    salida = json.dumps(reporte, indent=2, ensure_ascii=False, default=str)
+    if args.salida:
+        args.salida.write_text(salida, encoding="utf-8")
+    else:
+        print(salida)
+
+    if args.guardar_etiquetas:
+        ruta = guardar_etiquetas(args.directorio, reporte)
+        print(f"✅ Etiquetas guardadas en {ruta}", file=sys.stderr)
+
+    _imprimir_resumen(reporte, comparacion)
+
+    # Código de salida distinto de 0 si hay regresiones (útil en CI)
+    hay_regresion = reporte["veredictos"]["difieren"] > 0 or bool(comparacion and comparacion["veredictos_cambiados"])
+    return 1 if hay_regresion else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""Búsqueda de clientes para el selector de la web (GET /api/clientes/buscar)
+
+Antes la búsqueda eran cuatro $regex sin ancla ni escape, insensibles a
+mayúsculas, sobre nombre, email, telefono_completo y telefono: ningún índice
+los resuelve (recorren todo el catálogo) y el texto del usuario se usaba como
+expresión regular.
+
+Ahora cada cliente guarda una clave de búsqueda normalizada (sin acentos, en
+minúsculas, solo letras y dígitos):
+
+Colección MongoDB: clientes
+- busqueda.nombre: nombre normalizado (orden alfabético)
+- busqueda.tokens: palabras de nombre, email y teléfonos
+- busqueda.prefijos: prefijos de cada token (typeahead, índice multikey)
+- busqueda.ngramas: trigramas de cada token (coincidencias a media palabra,
+  p. ej. los últimos dígitos del teléfono)
+- busqueda.version: versión de la clave (reindexar() recalcula las viejas)
+
+- buscar(): cada término debe ser prefijo de algún token ($all sobre
+  busqueda.prefijos). Si no hay resultados se reintenta con trigramas.
+  Orden por relevancia (palabras completas, nombre que empieza con la
+  consulta, cliente activo) y después alfabético; paginado por página.
+- campos_busqueda(cliente): la clave que se guarda al crear o editar.
+- reindexar(): calcula la clave de los clientes que no la tienen (al arrancar).
+
+Uso manual:
+    python clientes_busqueda_service.py --reindexar [--todos]
+"""
+
+import asyncio
+import logging
+import re
+import sys
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'clientes'
+VERSION_CLAVE = 1
+
+CAMPOS_FUENTE = ["nombre", "email", "telefono", "telefono_completo"]
+
+LIMITE_DEFAULT = 20
+LIMITE_MAXIMO = 100
+# Los términos más largos se comparan por su prefijo de este tamaño
+PREFIJO_MAXIMO = 20
+TAMANO_NGRAMA = 3
+LOTE_REINDEXADO = 500
+
+PROYECCION_CLIENTE = {"_id": 0, "busqueda": 0}
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas sin acentos; todo lo que no sea letra o dígito se vuelve espacio"""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(_NO_ALFANUMERICO.sub(" ", sin_acentos.lower()).split())
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    return normalizar(texto).split()
+
+
+def _ngramas(token: str) -> List[str]:
+    return [token[i:i + TAMANO_NGRAMA] for i in range(len(token) - TAMANO_NGRAMA + 1)]
+
+
+def campos_busqueda(cliente: Dict[str, Any]) -> Dict[str, Any]:
+    """Clave de búsqueda del cliente, lista para un $set o para el documento a insertar"""
+    tokens: List[str] = []
+    for campo in CAMPOS_FUENTE:
+        for token in tokenizar(cliente.get(campo)):
+            if token not in tokens:
+                tokens.append(token)
+
+    prefijos = sorted({t[:n] for t in tokens for n in range(1, min(len(t), PREFIJO_MAXIMO) + 1)})
+    ngramas = sorted({g for t in tokens for g in _ngramas(t)})
+    return {"busqueda": {
+        "nombre": normalizar(cliente.get("nombre")),
+        "tokens": tokens,
+        "prefijos": prefijos,
+        "ngramas": ngramas,
+        "version": VERSION_CLAVE,
+    }}
+
+
+class ClientesBusquedaService:
+    """Búsqueda por prefijo / trigramas con orden por relevancia"""
+
+    def construir_pipeline(self, q: str, pagina: int, limite: int, ngramas: bool) -> List[Dict]:
+        terminos = tokenizar(q)
+        orden = {"busqueda.nombre": 1, "id": 1}
+        if not terminos:
+            filtro: Dict[str, Any] = {}
+            etapas: List[Dict] = []
+        else:
+            if ngramas:
+                # Términos cortos no tienen trigramas: se exigen como prefijo
+                condiciones = [
+                    {"busqueda.ngramas": {"$all": _ngramas(t)}} if len(t) >= TAMANO_NGRAMA
+                    else {"busqueda.prefijos": t}
+                    for t in terminos
+                ]
+                filtro = condiciones[0] if len(condiciones) == 1 else {"$and": condiciones}
+            else:
+                filtro = {"busqueda.prefijos": {"$all": [t[:PREFIJO_MAXIMO] for t in terminos]}}
+
+            consulta = " ".join(terminos)
+            etapas = [{"$addFields": {"_relevancia": {"$add": [
+                {"$multiply": [2, {"$size": {"$setIntersection": [
+                    {"$ifNull": ["$busqueda.tokens", []]}, terminos
+                ]}}]},
+                {"$cond": [{"$eq": [{"$indexOfCP": [{"$ifNull": ["$busqueda.nombre", ""]}, consulta]}, 0]}, 3, 0]},
+                {"$cond": [{"$eq": ["$estado", "activo"]}, 1, 0]},
+            ]}}}]
+            orden = {"_relevancia": -1, **orden}
+
+        return [
+            {"$match": filtro},
+            *etapas,
+            {"$sort": orden},
+            {"$skip": (pagina - 1) * limite},
+            # Uno extra para saber si hay otra página
+            {"$limit": limite + 1},
+            {"$project": {**PROYECCION_CLIENTE, "_relevancia": 0} if etapas else PROYECCION_CLIENTE},
+        ]
+
+    async def _ejecutar(self, q: str, pagina: int, limite: int, ngramas: bool) -> List[Dict]:
+        pipeline = self.construir_pipeline(q, pagina, limite, ngramas)
+        return await db[COLLECTION_NAME].aggregate(pipeline).to_list(limite + 1)
+
+    async def buscar(self, q: str = "", pagina: int = 1, limite: int = LIMITE_DEFAULT,
+                     ngramas: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Busca clientes por nombre, email o teléfono.
+
+        Args:
+            ngramas: True = coincidencias a media palabra, False = solo prefijos,
+                     None = prefijos y, si no hay resultados, trigramas
+
+        Returns:
+            {"clientes": [...], "pagina", "limite", "hay_mas", "modo": "prefijo" | "ngramas"}
+        """
+        pagina = max(1, pagina)
+        limite = max(1, min(limite, LIMITE_MAXIMO))
+
+        usar_ngramas = bool(ngramas)
+        clientes = await self._ejecutar(q, pagina, limite, usar_ngramas)
+        if ngramas is None and not clientes and pagina == 1 and tokenizar(q):
+            usar_ngramas = True
+            clientes = await self._ejecutar(q, pagina, limite, usar_ngramas)
+
+        return {
+            "clientes": clientes[:limite],
+            "pagina": pagina,
+            "limite": limite,
+            "hay_mas": len(clientes) > limite,
+            "modo": "ngramas" if usar_ngramas else "prefijo",
+        }
+
+    async def reindexar(self, todos: bool = False) -> int:
+        """Calcula la clave de búsqueda de los clientes sin clave o con una versión vieja"""
+        filtro = {} if todos else {"busqueda.version": {"$ne": VERSION_CLAVE}}
+        proyeccion = {"_id": 1, **{campo: 1 for campo in CAMPOS_FUENTE}}
+
+        actualizados = 0
+        lote: List[UpdateOne] = []
+        async for cliente in db[COLLECTION_NAME].find(filtro, proyeccion):
+            lote.append(UpdateOne({"_id": cliente["_id"]}, {"$set": campos_busqueda(cliente)}))
+            if len(lote) >= LOTE_REINDEXADO:
+                await db[COLLECTION_NAME].bulk_write(lote, ordered=False)
+                actualizados += len(lote)
+                lote = []
+        if lote:
+            await db[COLLECTION_NAME].bulk_write(lote, ordered=False)
+            actualizados += len(lote)
+
+        if actualizados:
+            logger.info(f"[BusquedaClientes] Clave de búsqueda calculada para {actualizados} clientes")
+        return actualizados
+
+
+# Instancia global del servicio
+clientes_busqueda_service = ClientesBusquedaService()
+
+
+async def main(argv: List[str]) -> int:
+    if "--reindexar" not in argv:
+        print("Uso: python clientes_busqueda_service.py --reindexar [--todos]")
+        return 2
+    actualizados = await clientes_busqueda_service.reindexar(todos="--todos" in argv)
+    print(f"Clientes reindexados: {actualizados}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,268 @@
+"""Índice de huellas de comprobantes para detectar duplicados con una búsqueda puntual
+
+Antes los duplicados se buscaban dentro de los arrays embebidos
+(comprobantes.archivo_hash / comprobantes.file_hash / comprobantes.clave_rastreo)
+de solicitudes_netcash y operaciones, y luego se recorrían los arrays devueltos
+para encontrar el archivo original.
+
+Colección MongoDB: comprobante_fingerprints (una huella por comprobante, tipo y operación)
+- ambito: alcance del duplicado, igual que las reglas previas de cada canal
+    "web"                    → operaciones (cualquier estado)
+    "telegram:<cliente_id>"  → solicitudes_netcash del mismo cliente
+- tipo: "hash" (SHA-256 del archivo) | "clave_rastreo" (solo web)
+- valor, operacion_id, coleccion, folio_mbco, nombre_archivo, estado
+- índice único (ambito, tipo, valor, operacion_id)
+
+Las huellas se escriben en la misma transacción que el $push / eliminación del
+comprobante (ver database.ejecutar_en_transaccion) y solo se borran cuando se
+elimina el comprobante o la operación. Al detectar una coincidencia se confirma
+el estado actual de las operaciones dueñas (por id): las que hoy no bloquean
+duplicados se omiten sin borrar su huella, porque pueden volver a un estado
+que bloquea (p. ej. esperando_validacion_ana → lista_para_mbc).
+
+Backfill de datos existentes:
+    python comprobante_fingerprints_service.py --backfill
+"""
+
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from database import db, ejecutar_en_transaccion
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'comprobante_fingerprints'
+
+COLECCION_WEB = 'operaciones'
+COLECCION_TELEGRAM = 'solicitudes_netcash'
+
+TIPO_HASH = "hash"
+TIPO_CLAVE_RASTREO = "clave_rastreo"
+
+AMBITO_WEB = "web"
+
+
+def ambito_telegram(cliente_id: str) -> str:
+    return f"telegram:{cliente_id}"
+
+
+def ambito_de(coleccion: str, cliente_id: Optional[str] = None) -> str:
+    """Ámbito de duplicados de una operación según su canal"""
+    return AMBITO_WEB if coleccion == COLECCION_WEB else ambito_telegram(cliente_id)
+
+
+def valores_comprobante(coleccion: str, comprobante: Dict) -> Dict[str, str]:
+    """tipo -> valor de las huellas de un comprobante (los duplicados marcados no tienen huella)"""
+    if comprobante.get("es_duplicado"):
+        return {}
+    valores = {}
+    file_hash = comprobante.get("file_hash") if coleccion == COLECCION_WEB else comprobante.get("archivo_hash")
+    if file_hash:
+        valores[TIPO_HASH] = file_hash
+    if coleccion == COLECCION_WEB and comprobante.get("clave_rastreo"):
+        valores[TIPO_CLAVE_RASTREO] = comprobante["clave_rastreo"]
+    return valores
+
+
+class ComprobanteFingerprintsService:
+    """Mantiene y consulta la colección comprobante_fingerprints"""
+
+    async def en_transaccion(self, operacion: Callable[[Any], Awaitable[Any]]) -> Any:
+        """Ejecuta operacion(session): escritura del comprobante + huellas en una transacción"""
+        return await ejecutar_en_transaccion(operacion)
+
+    def huellas(self, coleccion: str, operacion: Dict, comprobantes: Iterable[Dict]) -> List[Dict]:
+        """
+        Huellas de los comprobantes de una operación.
+
+        Args:
+            coleccion: "operaciones" (web) o "solicitudes_netcash" (Telegram)
+            operacion: Al menos {"id"}; Telegram requiere "cliente_id".
+                       folio_mbco / estado se guardan como referencia.
+        """
+        ambito = ambito_de(coleccion, operacion.get("cliente_id"))
+        resultado = []
+        for comprobante in comprobantes:
+            for tipo, valor in valores_comprobante(coleccion, comprobante).items():
+                resultado.append({
+                    "ambito": ambito,
+                    "tipo": tipo,
+                    "valor": valor,
+                    "coleccion": coleccion,
+                    "operacion_id": operacion["id"],
+                    "folio_mbco": operacion.get("folio_mbco"),
+                    "estado": operacion.get("estado"),
+                    "nombre_archivo": comprobante.get("nombre_archivo"),
+                })
+        return resultado
+
+    async def registrar(self, huellas: List[Dict], session=None) -> int:
+        """
+        Registra huellas. Cada operación tiene su propia huella del valor; si ya la
+        tenía se conserva la original (y su created_at).
+
+        Returns:
+            Número de huellas nuevas
+        """
+        if not huellas:
+            return 0
+        ahora = datetime.now(timezone.utc)
+        operaciones = [
+            UpdateOne(
+                {"ambito": h["ambito"], "tipo": h["tipo"], "valor": h["valor"], "operacion_id": h["operacion_id"]},
+                {"$setOnInsert": {**h, "created_at": ahora}},
+                upsert=True
+            )
+            for h in huellas
+        ]
+        resultado = await db[COLLECTION_NAME].bulk_write(operaciones, ordered=False, session=session)
+        return resultado.upserted_count
+
+    async def quitar_comprobantes(self, coleccion: str, operacion: Dict, eliminados: Iterable[Dict],
+                                  restantes: Iterable[Dict] = (), session=None) -> int:
+        """
+        Elimina las huellas de comprobantes descartados/eliminados de una operación,
+        salvo las que otro comprobante restante de la misma operación sigue usando.
+        """
+        en_uso = {(t, v) for c in restantes for t, v in valores_comprobante(coleccion, c).items()}
+        quitar = {
+            (t, v) for c in eliminados for t, v in valores_comprobante(coleccion, c).items()
+        } - en_uso
+        if not quitar:
+            return 0
+
+        resultado = await db[COLLECTION_NAME].delete_many(
+            {
+                "operacion_id": operacion["id"],
+                "ambito": ambito_de(coleccion, operacion.get("cliente_id")),
+                "$or": [{"tipo": t, "valor": v} for t, v in sorted(quitar)]
+            },
+            session=session
+        )
+        return resultado.deleted_count
+
+    async def actualizar_comprobante(self, coleccion: str, operacion: Dict, anterior: Dict,
+                                     actual: Dict, comprobantes: Iterable[Dict], session=None):
+        """
+        Tras editar un comprobante (re-OCR, captura manual): quita las huellas de sus
+        valores anteriores que ya no usa ningún comprobante y registra las del valor nuevo.
+
+        Args:
+            anterior: El comprobante antes de editarlo
+            actual: El comprobante editado
+            comprobantes: Todos los comprobantes de la operación ya editados
+        """
+        comprobantes = list(comprobantes)
+        await self.quitar_comprobantes(coleccion, operacion, [anterior], comprobantes, session=session)
+        await self.registrar(self.huellas(coleccion, operacion, [actual]), session=session)
+
+    async def quitar_operacion(self, operacion_id: str, session=None) -> int:
+        """Elimina todas las huellas de una operación borrada"""
+        resultado = await db[COLLECTION_NAME].delete_many({"operacion_id": operacion_id}, session=session)
+        return resultado.deleted_count
+
+    async def buscar_duplicados(self, coleccion: str, ambito: str, tipo: str, valores: Iterable[str],
+                                excluir_operacion_id: Optional[str] = None,
+                                estados_bloqueo: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        Resuelve qué valores ya pertenecen a otra operación.
+
+        Una consulta al índice de huellas; solo si hay coincidencias, una consulta
+        por id a la colección dueña para confirmar su estado actual. Si varias
+        operaciones vigentes tienen el valor, se reporta la más antigua.
+
+        Args:
+            estados_bloqueo: Si se indica, solo cuentan operaciones en esos estados
+
+        Returns:
+            Dict valor -> {"id", "folio_mbco", "estado", "cliente_nombre", "nombre_archivo"}
+        """
+        valores = list(dict.fromkeys(v for v in valores if v))
+        if not valores:
+            return {}
+
+        filtro = {"ambito": ambito, "tipo": tipo}
+        filtro["valor"] = valores[0] if len(valores) == 1 else {"$in": valores}
+        huellas = await db[COLLECTION_NAME].find(filtro, {"_id": 0}).sort("created_at", 1).to_list(None)
+        huellas = [h for h in huellas if h["operacion_id"] != excluir_operacion_id]
+        if not huellas:
+            return {}
+
+        filtro_duenas = {"id": {"$in": list({h["operacion_id"] for h in huellas})}}
+        if estados_bloqueo is not None:
+            filtro_duenas["estado"] = {"$in": estados_bloqueo}
+        duenas = await db[coleccion].find(
+            filtro_duenas,
+            {"_id": 0, "id": 1, "folio_mbco": 1, "estado": 1, "cliente_nombre": 1}
+        ).to_list(None)
+        vigentes = {d["id"]: d for d in duenas}
+
+        encontrados = {}
+        for huella in huellas:
+            duena = vigentes.get(huella["operacion_id"])
+            # Dueña en un estado que hoy permite reutilizar el comprobante: se omite,
+            # su huella se queda para cuando vuelva a un estado que bloquea
+            if duena is None or huella["valor"] in encontrados:
+                continue
+            encontrados[huella["valor"]] = {
+                "id": duena["id"],
+                "folio_mbco": duena.get("folio_mbco"),
+                "estado": duena.get("estado"),
+                "cliente_nombre": duena.get("cliente_nombre"),
+                "nombre_archivo": huella.get("nombre_archivo")
+            }
+        return encontrados
+
+    async def backfill(self) -> Dict[str, int]:
+        """
+        Genera las huellas de todos los comprobantes existentes (idempotente).
+
+        Las operaciones se recorren de la más antigua a la más nueva, así el
+        created_at de las huellas respeta el orden en que se usó el comprobante.
+        Se incluyen las solicitudes en cualquier estado: el estado se confirma al buscar.
+        """
+        resumen = {"operaciones": 0, "huellas_nuevas": 0}
+        consultas = [
+            (COLECCION_WEB, {"comprobantes.0": {"$exists": True}}, "fecha_creacion"),
+            (COLECCION_TELEGRAM, {"comprobantes.0": {"$exists": True}}, "created_at"),
+        ]
+        for coleccion, filtro, campo_fecha in consultas:
+            cursor = db[coleccion].find(
+                filtro,
+                {"_id": 0, "id": 1, "cliente_id": 1, "folio_mbco": 1, "estado": 1, "comprobantes": 1}
+            ).sort(campo_fecha, 1)
+            async for operacion in cursor:
+                resumen["operaciones"] += 1
+                resumen["huellas_nuevas"] += await self.registrar(
+                    self.huellas(coleccion, operacion, operacion.get("comprobantes", []))
+                )
+
+        logger.info(f"[Fingerprints] ✅ Backfill: {resumen['operaciones']} operaciones, "
+                    f"{resumen['huellas_nuevas']} huellas nuevas")
+        return resumen
+
+
+# Instancia global del servicio
+comprobante_fingerprints_service = ComprobanteFingerprintsService()
+
+
+async def main(argv: List[str]) -> int:
+    if "--backfill" not in argv:
+        print("Uso: python comprobante_fingerprints_service.py --backfill")
+        return 2
+    from indices_service import aplicar_indices
+    await aplicar_indices()
+    resumen = await comprobante_fingerprints_service.backfill()
+    print(f"Operaciones recorridas: {resumen['operaciones']}")
+    print(f"Huellas nuevas: {resumen['huellas_nuevas']}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,499 @@
+"""Motor de búsqueda de CLABE y beneficiario en el texto de un comprobante
+
+Reemplaza la búsqueda línea por línea de ValidadorComprobantes (V3.6) con:
+
+1. TextoComprobante: el texto se parte en líneas y se normaliza UNA sola vez
+   (mayúsculas, versión compacta sin espacios, versión sin acentos por línea).
+   Todo lo demás se calcula sobre ese índice, de forma perezosa.
+2. Patrones de palabras clave precompilados (una alternación por grupo).
+3. Fuzzy matching del beneficiario acotado: antes de calcular
+   SequenceMatcher.ratio() sobre un candidato se descartan los que no pueden
+   llegar al umbral, usando cotas superiores exactas del ratio
+   (longitudes, multiconjunto de caracteres y distancia indel con banda).
+
+Los veredictos son idénticos a V3.6: las cotas solo evitan calcular ratios
+que no pueden superar el umbral, y el ratio final sigue siendo el de difflib.
+"""
+
+import logging
+import re
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+from functools import cached_property
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Umbral de similitud del fuzzy matching de beneficiario (V3.5)
+UMBRAL_FUZZY = 0.85
+
+CLABE_VAULT_THABYETHA = "646180139409481462"
+
+
+def _compilar(palabras: List[str]) -> "re.Pattern":
+    """Alternación literal: search() equivale a any(p in texto for p in palabras)"""
+    return re.compile("|".join(re.escape(p) for p in palabras))
+
+
+# ==================== PATRONES PRECOMPILADOS ====================
+
+_RE_CLABE_AISLADA = re.compile(r'\b(\d{18})\b')
+_RE_18_DIGITOS = re.compile(r'(\d{18})')
+_RE_ESPACIOS = re.compile(r'\s+')
+
+KEYWORDS_ORIGEN = ["ORIGEN", "ASOCIADA", "ORDENANTE", "CUENTA CARGO"]
+# MEJORADO V3.6: Agregar "RETIRO" para Vault/Panekneva
+KEYWORDS_ORIGEN_EXTENDIDAS = KEYWORDS_ORIGEN + ["RETIRO", "CUENTA DE RETIRO"]
+KEYWORDS_IGNORAR = ["RASTREO", "REFERENCIA", "AUTORIZACION", "FOLIO", "NUMERO DE"]
+KEYWORDS_DESTINO = [
+    "DESTINO", "BENEFICIAR", "ABONO", "RECEPTOR", "DESTINATARIO",
+    "CLABE RECEPTOR", "CUENTA RECEPTOR", "CLABE BENEFICIAR",
+    "DEPOSITO", "DEPÓSITO", "CUENTA DE DEPOSITO", "CUENTA DE DEPÓSITO",
+    "BANCO DESTINO", "TITULAR DE LA CUENTA BENEFICIARIA"
+]
+KEYWORDS_ORIGEN_SUFIJO = ["ORIGEN", "ORDENANTE", "ASOCIADA", "CARGO"]
+KEYWORDS_DESTINO_SUFIJO = [
+    "DESTINO", "BENEFICIAR", "ABONO", "RECEPTOR", "DESTINATARIO",
+    "CUENTA DESTINO", "CUENTA ABONO", "CUENTA BENEFICIAR",
+    "CLABE DESTINO", "PARA", "DEPOSITO", "DEPÓSITO", "CUENTA DE DEPOSITO", "CUENTA DE DEPÓSITO",
+    "BANCO DESTINO", "TITULAR DE LA CUENTA BENEFICIARIA"
+]
+KEYWORDS_CONTEXTO_BENEFICIARIO = ["BENEFICIAR", "DESTINATARIO", "TITULAR", "PARA", "NOMBRE"]
+CONECTORES = {'Y', 'DE', 'SA', 'CV', 'LA', 'EL', 'LOS', 'LAS', 'DEL', 'CON', 'POR', 'PARA'}
+
+_RE_ORIGEN_EXTENDIDO = _compilar(KEYWORDS_ORIGEN_EXTENDIDAS)
+_RE_ORIGEN = _compilar(KEYWORDS_ORIGEN)
+_RE_IGNORAR = _compilar(KEYWORDS_IGNORAR)
+_RE_DESTINO = _compilar(KEYWORDS_DESTINO)
+_RE_ORIGEN_SUFIJO = _compilar(KEYWORDS_ORIGEN_SUFIJO)
+_RE_DESTINO_SUFIJO = _compilar(KEYWORDS_DESTINO_SUFIJO)
+
+# Variaciones de razón social que se unifican como "SA DE CV" (en orden)
+_REEMPLAZOS_RAZON_SOCIAL = [
+    ('S A DE C V', 'SA DE CV'),
+    ('SADE CV', 'SA DE CV'),
+    ('SA DECV', 'SA DE CV'),
+    ('SADECV', 'SA DE CV'),
+    ('S DE RL DE CV', 'SA DE CV'),  # Incluir S DE RL
+]
+_TABLA_PUNTUACION = str.maketrans({'.': ' ', ',': ' ', '-': ' ', '/': ' '})
+
+
+def quitar_acentos(texto: str) -> str:
+    return unicodedata.normalize('NFKD', texto).encode('ASCII', 'ignore').decode('ASCII')
+
+
+def normalizar_avanzado(texto: str) -> str:
+    """Sin acentos, mayúsculas, sin puntuación, razón social unificada y espacios simples"""
+    texto = quitar_acentos(texto).upper().translate(_TABLA_PUNTUACION)
+    for original, reemplazo in _REEMPLAZOS_RAZON_SOCIAL:
+        texto = texto.replace(original, reemplazo)
+    return _RE_ESPACIOS.sub(' ', texto).strip()
+
+
+def distancia_indel_acotada(a: str, b: str, limite: int) -> int:
+    """
+    Distancia de edición solo con inserciones/borrados (len(a) + len(b) - 2*LCS),
+    calculada en una banda de ancho 2*limite+1.
+
+    Returns:
+        La distancia si es <= limite, o limite + 1 si la excede
+    """
+    la, lb = len(a), len(b)
+    fuera = limite + 1
+    if abs(la - lb) > limite:
+        return fuera
+
+    previa = [j if j <= limite else fuera for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        actual = [fuera] * (lb + 1)
+        actual[0] = i if i <= limite else fuera
+        ca = a[i - 1]
+        minimo_fila = actual[0]
+        for j in range(max(1, i - limite), min(lb, i + limite) + 1):
+            if ca == b[j - 1]:
+                valor = previa[j - 1]
+            else:
+                valor = min(previa[j], actual[j - 1]) + 1
+            if valor > fuera:
+                valor = fuera
+            actual[j] = valor
+            if valor < minimo_fila:
+                minimo_fila = valor
+        if minimo_fila > limite:
+            return fuera
+        previa = actual
+
+    return previa[lb] if previa[lb] <= limite else fuera
+
+
+class TextoComprobante:
+    """Índice del texto de un comprobante: líneas y normalizaciones calculadas una vez"""
+
+    def __init__(self, texto: str):
+        self.texto = texto
+
+    @cached_property
+    def lineas(self) -> List[str]:
+        return self.texto.split('\n')
+
+    @cached_property
+    def lineas_upper(self) -> List[str]:
+        return [linea.upper() for linea in self.lineas]
+
+    @cached_property
+    def lineas_compactas(self) -> List[str]:
+        """Líneas sin espacios ni retornos de carro (CLABEs con dígitos separados)"""
+        return [linea.replace(' ', '').replace('\r', '') for linea in self.lineas]
+
+    @cached_property
+    def texto_upper(self) -> str:
+        return self.texto.upper()
+
+    @cached_property
+    def lineas_norm(self) -> List[str]:
+        return [normalizar_avanzado(linea) for linea in self.lineas]
+
+    @cached_property
+    def texto_norm(self) -> str:
+        # Equivale a normalizar_avanzado(texto): los reemplazos no cruzan saltos de línea
+        return ' '.join(linea for linea in self.lineas_norm if linea)
+
+    @cached_property
+    def clabes(self) -> List[str]:
+        """
+        CLABEs de 18 dígitos: aisladas en el texto original y, después, en el
+        texto sin espacios (CLABEs partidas por espacios o saltos de línea).
+        """
+        encontradas = _RE_CLABE_AISLADA.findall(self.texto)
+        encontradas.extend(_RE_18_DIGITOS.findall(_RE_ESPACIOS.sub('', self.texto)))
+        return list(dict.fromkeys(encontradas))
+
+    def linea_de(self, clabe: str) -> int:
+        """Índice de la primera línea que contiene la CLABE (-1 si ninguna)"""
+        for i, linea in enumerate(self.lineas_compactas):
+            if clabe in linea:
+                return i
+        return -1
+
+
+class ComprobanteMatcher:
+    """Búsqueda de CLABE destino y beneficiario (reglas V3.6) sobre un TextoComprobante"""
+
+    # ==================== CLABE ====================
+
+    def _clasificar_clabe(self, indice: TextoComprobante, clabe: str, total_clabes: int) -> Optional[Dict]:
+        """Determina si una CLABE completa del texto es de DESTINO (None si no aparece en una sola línea)"""
+        linea_clabe = indice.linea_de(clabe)
+        if linea_clabe == -1:
+            return None
+
+        lineas_upper = indice.lineas_upper
+
+        # Contexto: 15 líneas antes y 5 después (V3.6, layouts tipo Vault/Panekneva)
+        inicio_contexto = max(0, linea_clabe - 15)
+        fin_contexto = min(len(lineas_upper), linea_clabe + 6)
+        contexto = '\n'.join(lineas_upper[inicio_contexto:fin_contexto])
+        texto_antes = '\n'.join(lineas_upper[inicio_contexto:linea_clabe])
+        linea_actual = lineas_upper[linea_clabe]
+
+        # Layout tabular "ORIGEN | DESTINO" en alguna de las 3 líneas anteriores
+        linea_encabezado = None
+        for i in range(max(0, linea_clabe - 3), linea_clabe):
+            if "ORIGEN" in lineas_upper[i] and "DESTINO" in lineas_upper[i]:
+                linea_encabezado = lineas_upper[i]
+                break
+
+        if linea_encabezado:
+            idx_clabe = linea_actual.find(clabe)
+            if idx_clabe != -1:
+                # Columna por posición: la más cercana a la CLABE
+                idx_origen = linea_encabezado.find("ORIGEN")
+                idx_destino = linea_encabezado.find("DESTINO")
+                es_origen = abs(idx_clabe - idx_destino) >= abs(idx_clabe - idx_origen)
+                logger.info(f"[ValidadorComprobantes] CLABE {clabe} en columna {'ORIGEN' if es_origen else 'DESTINO'} (layout tabular)")
+            else:
+                es_origen = bool(_RE_ORIGEN.search(texto_antes))
+        else:
+            es_origen = bool(_RE_ORIGEN_EXTENDIDO.search(texto_antes))
+
+        # Ignorar si la CLABE misma es rastreo/referencia (su línea o la anterior)
+        linea_anterior = lineas_upper[linea_clabe - 1] if linea_clabe > 0 else ""
+        es_rastreo = bool(_RE_IGNORAR.search(linea_anterior) or _RE_IGNORAR.search(linea_actual))
+
+        es_destino = bool(_RE_DESTINO.search(contexto))
+
+        # V3.5: si es origen y destino a la vez, decide la palabra clave más cercana
+        if es_origen and es_destino:
+            idx_clabe = contexto.find(clabe)
+            distancia_origen = self._distancia_minima(contexto, KEYWORDS_ORIGEN, idx_clabe)
+            distancia_destino = self._distancia_minima(contexto, KEYWORDS_DESTINO, idx_clabe)
+
+            if distancia_destino < distancia_origen:
+                es_origen = False
+                logger.info(f"[ValidadorComprobantes] Ambigüedad resuelta: DESTINO más cercano (dist={distancia_destino} vs {distancia_origen})")
+            else:
+                logger.info(f"[ValidadorComprobantes] Ambigüedad resuelta: ORIGEN más cercano (dist={distancia_origen} vs {distancia_destino})")
+
+        return {
+            "es_origen": es_origen,
+            "es_rastreo": es_rastreo,
+            "es_destino": es_destino,
+            "es_clabe_destino": not es_origen and not es_rastreo and (es_destino or total_clabes == 1),
+            "contexto": contexto
+        }
+
+    @staticmethod
+    def _distancia_minima(contexto: str, palabras: List[str], idx_clabe: int) -> float:
+        """Distancia de la primera aparición de cada palabra a la CLABE (inf si no aplica)"""
+        if idx_clabe == -1:
+            return float('inf')
+        distancias = [abs(idx - idx_clabe) for idx in (contexto.find(p) for p in palabras) if idx != -1]
+        return min(distancias) if distancias else float('inf')
+
+    def _patrones_sufijo(self, clabe_objetivo: str) -> List[str]:
+        """Formatos de cuenta enmascarada a buscar (en orden de prioridad)"""
+        sufijo_4 = clabe_objetivo[-4:]
+        sufijo_3 = clabe_objetivo[-3:]
+        return [
+            # "CLABE-462", "Clabe-2915", etc.
+            f"CLABE-{sufijo_3}", f"CLABE-{sufijo_4}", f"CLABE {sufijo_3}", f"CLABE {sufijo_4}",
+            # "*7228", "**7228", "***7228", "****7228"
+            f"*{sufijo_4}", f"**{sufijo_4}", f"***{sufijo_4}", f"****{sufijo_4}",
+            f"*{sufijo_3}", f"**{sufijo_3}", f"***{sufijo_3}", f"****{sufijo_3}",
+            # "65**0938" (dígitos al inicio y al final)
+            f"{clabe_objetivo[:2]}**{sufijo_4}", f"{clabe_objetivo[:3]}**{sufijo_4}",
+            # "...2915", "...462"
+            f"...{sufijo_4}", f"...{sufijo_3}",
+        ]
+
+    def _buscar_sufijo_enmascarado(self, indice: TextoComprobante, clabe_objetivo: str) -> bool:
+        texto = indice.texto
+        texto_upper = indice.texto_upper
+
+        for patron in self._patrones_sufijo(clabe_objetivo):
+            patron = patron.upper()
+            idx = texto_upper.find(patron)
+            if idx == -1:
+                continue
+
+            logger.info(f"[ValidadorComprobantes] ⚠️ Encontrado patrón enmascarado: '{patron}'")
+
+            # Contexto de 150 caracteres alrededor del patrón
+            contexto = texto[max(0, idx - 150):min(len(texto), idx + len(patron) + 150)].upper()
+
+            # No debe estar en una línea de origen/ordenante
+            linea_patron = next((linea for linea in contexto.split('\n') if patron in linea), None)
+            if linea_patron and _RE_ORIGEN_SUFIJO.search(linea_patron):
+                logger.warning(f"[ValidadorComprobantes] ❌ Patrón {patron} está en línea de ORIGEN")
+                continue
+
+            if not _RE_DESTINO_SUFIJO.search(quitar_acentos(contexto)):
+                logger.warning(f"[ValidadorComprobantes] ❌ Patrón {patron} NO está en contexto de destino")
+                continue
+
+            logger.info(f"[ValidadorComprobantes] ✅✅✅ SUFIJO ENMASCARADO VÁLIDO encontrado ({patron} en contexto de DESTINO)")
+            return True
+
+        return False
+
+    def buscar_clabe(self, indice: TextoComprobante, clabe_objetivo: str) -> Tuple[bool, str]:
+        """
+        Busca la CLABE/cuenta objetivo (reglas V3.6).
+
+        Returns:
+            Tuple (encontrada: bool, metodo: "completa" | "sufijo_enmascarado" | "no_encontrada")
+        """
+        if not clabe_objetivo or len(clabe_objetivo) != 18:
+            logger.warning(f"[ValidadorComprobantes] CLABE objetivo inválida: {clabe_objetivo}")
+            return False, "no_encontrada"
+
+        es_vault_thabyetha = (clabe_objetivo == CLABE_VAULT_THABYETHA)
+        if es_vault_thabyetha:
+            logger.info(f"[VAULT_DEBUG] Texto completo extraído ({len(indice.texto)} caracteres):")
+            logger.info(f"[VAULT_DEBUG] {indice.texto}")
+
+        # PASO A: CLABEs completas en contexto de DESTINO
+        clabes_completas = indice.clabes
+        logger.info(f"[ValidadorComprobantes] CLABEs de 18 dígitos encontradas: {clabes_completas}")
+
+        clabes_destino = []
+        for clabe in clabes_completas:
+            clasificacion = self._clasificar_clabe(indice, clabe, len(clabes_completas))
+            if clasificacion is None:
+                continue
+
+            estado = f"origen={clasificacion['es_origen']}, rastreo={clasificacion['es_rastreo']}, destino={clasificacion['es_destino']}"
+            if clasificacion["es_clabe_destino"]:
+                clabes_destino.append(clabe)
+                logger.info(f"[ValidadorComprobantes] ✓ CLABE {clabe} identificada como DESTINO ({estado})")
+            else:
+                logger.info(f"[ValidadorComprobantes] ✗ CLABE {clabe} ignorada ({estado})")
+                if es_vault_thabyetha:
+                    logger.info(f"[VAULT_DEBUG]   - Contexto (primeros 300 chars): {clasificacion['contexto'][:300]}")
+
+        if clabe_objetivo in clabes_destino:
+            logger.info(f"[ValidadorComprobantes] ✅✅✅ CLABE COMPLETA ENCONTRADA: {clabe_objetivo}")
+            return True, "completa"
+
+        # Hay CLABEs de destino pero ninguna coincide: inválido
+        if clabes_destino:
+            logger.warning(f"[ValidadorComprobantes] ❌ Hay CLABEs de destino {clabes_destino} pero NINGUNA coincide con {clabe_objetivo}")
+            return False, "no_encontrada"
+
+        # PASO B: sufijos enmascarados
+        logger.info(f"[ValidadorComprobantes] No hay CLABE completa de destino. Buscando sufijos enmascarados...")
+        if self._buscar_sufijo_enmascarado(indice, clabe_objetivo):
+            return True, "sufijo_enmascarado"
+
+        logger.warning(f"[ValidadorComprobantes] ❌ CLABE objetivo NO encontrada")
+        return False, "no_encontrada"
+
+    # ==================== BENEFICIARIO ====================
+
+    @staticmethod
+    def _candidatos_fuzzy(indice: TextoComprobante, min_len: int, max_len: int):
+        """
+        Líneas normalizadas y subcadenas de hasta 9 palabras consecutivas con
+        longitud en [min_len, max_len]. Cada candidato se produce una sola vez.
+        """
+        vistos = set()
+        for linea in indice.lineas_norm:
+            if len(linea) < min_len or len(linea) > max_len * 2:
+                continue
+
+            if linea not in vistos:
+                vistos.add(linea)
+                yield linea
+
+            palabras = linea.split()
+            # Longitud de ' '.join(palabras[i:j]) sin construir la cadena
+            acumulado = [0]
+            for palabra in palabras:
+                acumulado.append(acumulado[-1] + len(palabra))
+
+            for i in range(len(palabras)):
+                for j in range(i + 1, min(i + 10, len(palabras) + 1)):
+                    longitud = acumulado[j] - acumulado[i] + (j - i - 1)
+                    if longitud > max_len:
+                        break
+                    if longitud >= min_len:
+                        subcadena = ' '.join(palabras[i:j])
+                        if subcadena not in vistos:
+                            vistos.add(subcadena)
+                            yield subcadena
+
+    def _mejor_candidato_fuzzy(self, indice: TextoComprobante, objetivo: str) -> Tuple[float, Optional[str]]:
+        """
+        Mejor SequenceMatcher.ratio() entre el objetivo y los candidatos del texto,
+        calculado solo para candidatos cuya cota superior alcanza el umbral.
+
+        Cotas (todas >= ratio de difflib): 2*min(la,lb)/(la+lb), intersección de
+        multiconjuntos de caracteres y 1 - indel/(la+lb) con indel en banda.
+        """
+        longitud = len(objetivo)
+        min_len = max(10, int(longitud * 0.7))  # Mínimo 70% de longitud
+        max_len = int(longitud * 1.3)  # Máximo 130% de longitud
+
+        conteo_objetivo = Counter(objetivo)
+        mejor_score = 0.0
+        mejor_candidato = None
+        evaluados = 0
+
+        for candidato in self._candidatos_fuzzy(indice, min_len, max_len):
+            total = longitud + len(candidato)
+            piso = max(mejor_score, UMBRAL_FUZZY)
+
+            if 2.0 * min(longitud, len(candidato)) / total < piso:
+                continue
+
+            comunes = sum((conteo_objetivo & Counter(candidato)).values())
+            if 2.0 * comunes / total < piso:
+                continue
+
+            # ratio <= 2*LCS/total = 1 - indel/total (margen para redondeo de flotantes)
+            limite = int((1.0 - piso) * total + 1e-9)
+            if distancia_indel_acotada(objetivo, candidato, limite) > limite:
+                continue
+
+            evaluados += 1
+            ratio = SequenceMatcher(None, objetivo, candidato).ratio()
+            if ratio > mejor_score:
+                mejor_score = ratio
+                mejor_candidato = candidato
+
+        logger.info(f"[VALIDADOR_FUZZY_BENEFICIARIO] Candidatos con ratio calculado: {evaluados}")
+        return mejor_score, mejor_candidato
+
+    def buscar_beneficiario(self, indice: TextoComprobante, beneficiario_objetivo: str,
+                            clabe_completa_encontrada: bool = False) -> bool:
+        """Busca el beneficiario objetivo (reglas V3.5/V3.6, fuzzy solo con CLABE completa)"""
+        if not beneficiario_objetivo:
+            return False
+
+        texto_norm = indice.texto_norm
+        beneficiario_norm = normalizar_avanzado(beneficiario_objetivo)
+
+        logger.info(f"[ValidadorComprobantes] Buscando beneficiario normalizado: {beneficiario_norm}")
+
+        # Intento 1: Match completo
+        if beneficiario_norm in texto_norm:
+            logger.info(f"[ValidadorComprobantes] ✅ Beneficiario completo encontrado (match exacto)")
+            return True
+
+        # Intento 2: Sin "SA DE CV" al final (muchas veces se omite en apps móviles)
+        beneficiario_sin_sadecv = beneficiario_norm.replace('SA DE CV', '').replace('S DE RL', '').strip()
+        if len(beneficiario_sin_sadecv) >= 10 and beneficiario_sin_sadecv in texto_norm:
+            logger.info(f"[ValidadorComprobantes] ✅ Beneficiario encontrado sin SA DE CV")
+            return True
+
+        # Intento 3: 70% de palabras clave (≥4 caracteres, no conectores)
+        palabras_benef = [p for p in beneficiario_norm.split() if len(p) >= 4 and p not in CONECTORES]
+        if not palabras_benef:
+            palabras_benef = [p for p in beneficiario_norm.split() if len(p) >= 3]
+
+        if palabras_benef:
+            palabras_encontradas = [p for p in palabras_benef if p in texto_norm]
+            porcentaje = len(palabras_encontradas) / len(palabras_benef)
+            logger.info(f"[ValidadorComprobantes] Palabras encontradas: {palabras_encontradas} ({int(porcentaje*100)}%)")
+
+            if porcentaje >= 0.7:
+                logger.info(f"[ValidadorComprobantes] ✅ Beneficiario encontrado (70%+ de palabras clave)")
+                return True
+
+            # Intento 4: palabras clave en los 250 caracteres después de "Beneficiario:", "Destinatario:", etc.
+            for keyword in KEYWORDS_CONTEXTO_BENEFICIARIO:
+                idx = texto_norm.find(keyword)
+                if idx == -1:
+                    continue
+                fragmento = texto_norm[idx:idx + 250]
+                porcentaje_frag = sum(1 for p in palabras_benef if p in fragmento) / len(palabras_benef)
+                if porcentaje_frag >= 0.7:
+                    logger.info(f"[ValidadorComprobantes] ✅ Beneficiario encontrado cerca de '{keyword}' ({int(porcentaje_frag*100)}%)")
+                    return True
+
+        # V3.5: FUZZY MATCHING (solo si CLABE completa de 18 dígitos fue encontrada exacta)
+        logger.info(f"[VALIDADOR_FUZZY_BENEFICIARIO] clabe_completa_encontrada={clabe_completa_encontrada}")
+
+        if not clabe_completa_encontrada:
+            logger.info(f"[ValidadorComprobantes] No se aplicó fuzzy matching (CLABE completa no encontrada)")
+            logger.warning(f"[ValidadorComprobantes] ❌ Beneficiario NO encontrado suficientemente en el texto")
+            return False
+
+        mejor_score, mejor_candidato = self._mejor_candidato_fuzzy(indice, beneficiario_norm)
+
+        logger.info(f"[VALIDADOR_FUZZY_BENEFICIARIO] Mejor candidato: '{mejor_candidato}'")
+        logger.info(f"[VALIDADOR_FUZZY_BENEFICIARIO] Score de similitud: {mejor_score:.3f} (umbral: {UMBRAL_FUZZY})")
+
+        if mejor_score >= UMBRAL_FUZZY:
+            logger.info(f"[VALIDADOR_FUZZY_BENEFICIARIO] ✅ MATCH FUZZY exitoso! nombre_ocr='{mejor_candidato}' nombre_objetivo='{beneficiario_norm}' score={mejor_score:.3f}")
+            return True
+
+        logger.warning(f"[VALIDADOR_FUZZY_BENEFICIARIO] ❌ Ningún candidato alcanza el umbral ({UMBRAL_FUZZY})")
+        logger.warning(f"[ValidadorComprobantes] ❌ Beneficiario NO encontrado suficientemente en el texto")
+        return False
+
+
+# Instancia global
+comprobante_matcher = ComprobanteMatcher()
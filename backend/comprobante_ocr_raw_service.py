@@ -0,0 +1,216 @@
+"""Payloads OCR crudos de comprobantes fuera de las solicitudes/operaciones
+
+Cada comprobante guardaba en ocr_data.datos_completos la respuesta completa del
+OCR (Gemini), y se leía en cada listado, verificación de duplicados y lectura
+de la solicitud después de cada comprobante subido por Telegram.
+
+Ahora el comprobante embebido conserva solo un resumen (ocr_data sin
+datos_completos, más cantidad_transacciones / montos_individuales, que sí se
+usan en los flujos) y un id; el payload crudo vive en:
+
+Colección MongoDB: comprobante_ocr_raw
+- comprobante_id (único), operacion_id, coleccion
+- datos_completos: respuesta completa del OCR
+- created_at
+
+Lectura explícita: GET /api/operaciones/{id}?include=ocr_raw y
+GET /api/netcash/solicitudes/{id}?include=ocr_raw
+
+Migración de datos existentes:
+    python comprobante_ocr_raw_service.py --migrar
+"""
+
+import asyncio
+import logging
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from database import db, ejecutar_en_transaccion
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'comprobante_ocr_raw'
+
+INCLUDE_OCR_RAW = "ocr_raw"
+
+# Campo de ocr_data que se mueve a la colección lateral
+CAMPO_RAW = "datos_completos"
+# Datos del payload crudo que los flujos sí consultan; se copian al resumen
+CAMPOS_RESUMEN = ["cantidad_transacciones", "montos_individuales"]
+
+# Proyección para lecturas de solo consulta de documentos aún no migrados
+PROYECCION_SIN_OCR_RAW = {"_id": 0, f"comprobantes.ocr_data.{CAMPO_RAW}": 0}
+
+
+def incluye_ocr_raw(include: Optional[str]) -> bool:
+    """Interpreta el query param include (lista separada por comas)"""
+    return bool(include) and INCLUDE_OCR_RAW in [p.strip() for p in include.split(",")]
+
+
+def separar(comprobante: Dict) -> Tuple[Dict, Optional[Any]]:
+    """
+    Separa el payload crudo de un comprobante.
+
+    Returns:
+        (comprobante compacto con id, payload crudo o None si no tenía)
+    """
+    compacto = dict(comprobante)
+    compacto.setdefault("id", str(uuid.uuid4()))
+    ocr_data = compacto.get("ocr_data")
+    if not isinstance(ocr_data, dict) or CAMPO_RAW not in ocr_data:
+        return compacto, None
+
+    ocr_data = dict(ocr_data)
+    raw = ocr_data.pop(CAMPO_RAW)
+    if isinstance(raw, dict):
+        for campo in CAMPOS_RESUMEN:
+            if campo in raw and campo not in ocr_data:
+                ocr_data[campo] = raw[campo]
+    ocr_data["raw_externo"] = raw is not None
+    compacto["ocr_data"] = ocr_data
+    return compacto, raw
+
+
+def sin_ocr_raw(comprobantes: Iterable[Dict]) -> List[Dict]:
+    """Copia de los comprobantes sin el payload crudo (documentos aún no migrados)"""
+    resultado = []
+    for comprobante in comprobantes:
+        ocr_data = comprobante.get("ocr_data")
+        if isinstance(ocr_data, dict) and CAMPO_RAW in ocr_data:
+            comprobante = {**comprobante, "ocr_data": {k: v for k, v in ocr_data.items() if k != CAMPO_RAW}}
+        resultado.append(comprobante)
+    return resultado
+
+
+class ComprobanteOcrRawService:
+    """Guarda y recupera los payloads OCR crudos por comprobante"""
+
+    def separar_comprobantes(self, coleccion: str, operacion_id: str,
+                             comprobantes: Iterable[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Returns:
+            (comprobantes compactos, documentos para comprobante_ocr_raw)
+        """
+        compactos, documentos = [], []
+        for comprobante in comprobantes:
+            compacto, raw = separar(comprobante)
+            compactos.append(compacto)
+            if raw is not None:
+                documentos.append({
+                    "comprobante_id": compacto["id"],
+                    "operacion_id": operacion_id,
+                    "coleccion": coleccion,
+                    CAMPO_RAW: raw
+                })
+        return compactos, documentos
+
+    async def guardar(self, documentos: List[Dict], session=None) -> int:
+        """Inserta o reemplaza los payloads (idempotente por comprobante_id)"""
+        if not documentos:
+            return 0
+        ahora = datetime.now(timezone.utc)
+        operaciones = [
+            UpdateOne(
+                {"comprobante_id": d["comprobante_id"]},
+                {"$set": d, "$setOnInsert": {"created_at": ahora}},
+                upsert=True
+            )
+            for d in documentos
+        ]
+        await db[COLLECTION_NAME].bulk_write(operaciones, ordered=False, session=session)
+        return len(operaciones)
+
+    async def obtener(self, comprobante_ids: List[str]) -> Dict[str, Any]:
+        """comprobante_id -> payload crudo"""
+        if not comprobante_ids:
+            return {}
+        documentos = await db[COLLECTION_NAME].find(
+            {"comprobante_id": {"$in": comprobante_ids}},
+            {"_id": 0, "comprobante_id": 1, CAMPO_RAW: 1}
+        ).to_list(None)
+        return {d["comprobante_id"]: d.get(CAMPO_RAW) for d in documentos}
+
+    async def adjuntar(self, operacion: Dict) -> Dict:
+        """Vuelve a poner ocr_data.datos_completos en los comprobantes (include=ocr_raw)"""
+        comprobantes = operacion.get("comprobantes") or []
+        payloads = await self.obtener([c["id"] for c in comprobantes if c.get("id")])
+        for comprobante in comprobantes:
+            if comprobante.get("id") in payloads:
+                comprobante["ocr_data"] = {**(comprobante.get("ocr_data") or {}),
+                                           CAMPO_RAW: payloads[comprobante["id"]]}
+        return operacion
+
+    async def quitar_comprobantes(self, comprobantes: Iterable[Dict], session=None) -> int:
+        ids = [c["id"] for c in comprobantes if c.get("id")]
+        if not ids:
+            return 0
+        resultado = await db[COLLECTION_NAME].delete_many({"comprobante_id": {"$in": ids}}, session=session)
+        return resultado.deleted_count
+
+    async def quitar_operacion(self, operacion_id: str, session=None) -> int:
+        resultado = await db[COLLECTION_NAME].delete_many({"operacion_id": operacion_id}, session=session)
+        return resultado.deleted_count
+
+    async def migrar(self, colecciones: Iterable[str] = ("solicitudes_netcash", "operaciones")) -> Dict[str, int]:
+        """
+        Mueve los payloads embebidos existentes a comprobante_ocr_raw (idempotente).
+
+        Cada documento se reescribe solo si su arreglo de comprobantes no cambió
+        desde que se leyó; los que cambiaron se cuentan en "omitidas" y quedan
+        para la siguiente corrida.
+        """
+        resumen = {"documentos": 0, "payloads": 0, "omitidas": 0}
+        for coleccion in colecciones:
+            cursor = db[coleccion].find(
+                {f"comprobantes.ocr_data.{CAMPO_RAW}": {"$exists": True}},
+                {"_id": 1, "id": 1, "comprobantes": 1}
+            )
+            async for documento in cursor:
+                originales = documento["comprobantes"]
+                compactos, payloads = self.separar_comprobantes(coleccion, documento["id"], originales)
+
+                async def escribir(session):
+                    resultado = await db[coleccion].update_one(
+                        {"_id": documento["_id"], "comprobantes": originales},
+                        {"$set": {"comprobantes": compactos}},
+                        session=session
+                    )
+                    if resultado.modified_count:
+                        await self.guardar(payloads, session=session)
+                    return resultado.modified_count
+
+                if await ejecutar_en_transaccion(escribir):
+                    resumen["documentos"] += 1
+                    resumen["payloads"] += len(payloads)
+                else:
+                    resumen["omitidas"] += 1
+
+        logger.info(f"[OCR-Raw] ✅ Migración: {resumen['documentos']} documentos, {resumen['payloads']} payloads, "
+                    f"{resumen['omitidas']} omitidos por cambios concurrentes")
+        return resumen
+
+
+# Instancia global del servicio
+comprobante_ocr_raw_service = ComprobanteOcrRawService()
+
+
+async def main(argv: List[str]) -> int:
+    if "--migrar" not in argv:
+        print("Uso: python comprobante_ocr_raw_service.py --migrar")
+        return 2
+    from indices_service import aplicar_indices
+    await aplicar_indices()
+    resumen = await comprobante_ocr_raw_service.migrar()
+    print(f"Documentos migrados: {resumen['documentos']}")
+    print(f"Payloads movidos: {resumen['payloads']}")
+    print(f"Omitidos (cambiaron durante la migración): {resumen['omitidas']}")
+    return 0 if not resumen["omitidas"] else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -19,7 +19,8 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from decimal import Decimal, ROUND_HALF_UP
-import PyPDF2
+
+from texto_extraido_cache_service import texto_extraido_cache_service
 
 logger = logging.getLogger(__name__)
 
@@ -52,18 +53,59 @@ class ComprobantePagoValidatorService:
             - lista_errores: Lista de mensajes de error (vacía si es_válido=True)
             - datos_extraidos: Dict con capital_pdf, comision_pdf, conceptos_pdf, etc.
         """
+        self._log_inicio_validacion(pdf_path, capital_esperado, comision_esperada, folio_concepto)
+        
+        # 1. Leer y extraer texto del PDF
+        texto_completo = self._extraer_texto_pdf(pdf_path)
+        
+        return self._validar_texto(texto_completo, capital_esperado, comision_esperada, folio_concepto)
+    
+    async def validar_comprobante_async(
+        self,
+        pdf_path: str,
+        capital_esperado: Decimal,
+        comision_esperada: Decimal,
+        folio_concepto: str
+    ) -> Tuple[bool, List[str], Dict]:
+        """
+        Igual que validar_comprobante, pero extrae el texto del PDF en el pool
+        de procesos para no bloquear el event loop (ej: monitor de emails).
+        """
+        self._log_inicio_validacion(pdf_path, capital_esperado, comision_esperada, folio_concepto)
+        
+        texto_completo = await self._extraer_texto_pdf_async(pdf_path)
+        
+        return self._validar_texto(texto_completo, capital_esperado, comision_esperada, folio_concepto)
+    
+    def _log_inicio_validacion(
+        self,
+        pdf_path: str,
+        capital_esperado: Decimal,
+        comision_esperada: Decimal,
+        folio_concepto: str
+    ):
         logger.info(f"[ComprobantePago-P4A] Iniciando validación de comprobante: {pdf_path}")
         logger.info(f"[ComprobantePago-P4A] Capital esperado: ${capital_esperado}")
         logger.info(f"[ComprobantePago-P4A] Comisión esperada: ${comision_esperada}")
         logger.info(f"[ComprobantePago-P4A] Concepto esperado: {folio_concepto}")
+    
+    def _validar_texto(
+        self,
+        texto_completo: str,
+        capital_esperado: Decimal,
+        comision_esperada: Decimal,
+        folio_concepto: str
+    ) -> Tuple[bool, List[str], Dict]:
+        """
+        Valida el texto ya extraído del comprobante contra los montos esperados
         
+        Returns:
+            Tuple de (es_valido, lista_errores, datos_extraidos)
+        """
         errores = []
         datos_extraidos = {}
         
         try:
-            # 1. Leer y extraer texto del PDF
-            texto_completo = self._extraer_texto_pdf(pdf_path)
-            
             if not texto_completo:
                 error_msg = "No se pudo extraer texto del PDF. El archivo puede estar dañado o ser un escaneo sin OCR."
                 logger.error(f"[ComprobantePago-P4A] {error_msg}")
@@ -149,26 +191,42 @@ class ComprobantePagoValidatorService:
             Texto completo del PDF
         """
         try:
-            texto_completo = ""
-            
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                num_paginas = len(pdf_reader.pages)
-                
-                logger.info(f"[ComprobantePago-P4A] PDF tiene {num_paginas} página(s)")
-                
-                for i, page in enumerate(pdf_reader.pages):
-                    texto_pagina = page.extract_text()
-                    if texto_pagina:
-                        texto_completo += texto_pagina + "\n"
-                        logger.debug(f"[ComprobantePago-P4A] Página {i+1}: {len(texto_pagina)} caracteres")
+            return self._unir_paginas(texto_extraido_cache_service.extraer_pdf(pdf_path)["paginas"])
             
-            return texto_completo
+        except Exception as e:
+            logger.exception(f"[ComprobantePago-P4A] Error extrayendo texto del PDF: {str(e)}")
+            return ""
+    
+    async def _extraer_texto_pdf_async(self, pdf_path: str) -> str:
+        """
+        Extrae todo el texto de un PDF en el pool de procesos
+        
+        Args:
+            pdf_path: Ruta al archivo PDF
+        
+        Returns:
+            Texto completo del PDF
+        """
+        try:
+            paginas = (await texto_extraido_cache_service.extraer_pdf_async(pdf_path))["paginas"]
+            return self._unir_paginas(paginas)
             
         except Exception as e:
             logger.exception(f"[ComprobantePago-P4A] Error extrayendo texto del PDF: {str(e)}")
             return ""
     
+    def _unir_paginas(self, paginas: List[str]) -> str:
+        """Une el texto por página omitiendo páginas vacías"""
+        logger.info(f"[ComprobantePago-P4A] PDF tiene {len(paginas)} página(s)")
+        
+        texto_completo = ""
+        for i, texto_pagina in enumerate(paginas):
+            if texto_pagina:
+                texto_completo += texto_pagina + "\n"
+                logger.debug(f"[ComprobantePago-P4A] Página {i+1}: {len(texto_pagina)} caracteres")
+        
+        return texto_completo
+    
     def _parsear_movimientos(self, texto: str, folio_concepto: str) -> List[Dict]:
         """
         Parsea el texto del PDF para extraer movimientos relacionados con el folio
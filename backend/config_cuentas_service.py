@@ -11,19 +11,12 @@ Regla: Solo puede haber UNA cuenta activa por tipo.
 import logging
 from typing import Optional, List, Dict
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
 
 from netcash_models import CuentaBancaria, TipoCuenta
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 COLLECTION_NAME = 'config_cuentas_netcash'
 
 
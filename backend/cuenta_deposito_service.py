@@ -7,17 +7,10 @@ de depósito que usan los clientes para transferencias NetCash.
 import logging
 from typing import Optional, Dict, List
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión a MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 COLLECTION_NAME = 'config_cuenta_deposito_netcash'
 
 
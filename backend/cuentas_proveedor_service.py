@@ -9,20 +9,13 @@ La configuración se almacena en BD para facilitar cambios de proveedor sin toca
 """
 
 import logging
-import os
 from typing import Optional, Dict, List
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 from uuid import uuid4
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 COLLECTION_NAME = 'cuentas_proveedor_netcash'
 
 
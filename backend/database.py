@@ -0,0 +1,195 @@
+"""Cliente MongoDB compartido
+
+Antes cada módulo creaba su propio AsyncIOMotorClient al importarse (y algunos
+handlers/schedulers uno nuevo en cada llamada), cada uno con su pool de
+conexiones y sus hilos de monitoreo. Ahora todo el proceso usa un solo cliente,
+creado la primera vez que se usa (después de load_dotenv).
+
+Uso en los módulos:
+    from database import db
+    await db.solicitudes_netcash.find_one(...)
+    await db[COLLECTION_NAME].find_one(...)
+
+Configuración (variables de entorno):
+- MONGO_URL / DB_NAME
+- MONGO_MAX_POOL_SIZE (50), MONGO_MIN_POOL_SIZE (0), MONGO_MAX_IDLE_MS (300000)
+- MONGO_SERVER_SELECTION_TIMEOUT_MS (10000), MONGO_CONNECT_TIMEOUT_MS (10000)
+- MONGO_SOCKET_TIMEOUT_MS (sin límite), MONGO_WAIT_QUEUE_TIMEOUT_MS (sin límite)
+
+estadisticas_pool() expone el uso del pool (GET /api/db/pool) y cerrar_cliente()
+se llama en el shutdown. ejecutar_en_transaccion() agrupa varias escrituras en una
+transacción (replica set); en un servidor standalone las ejecuta sin sesión.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# "Transaction numbers are only allowed on a replica set member or mongos"
+CODIGO_SIN_TRANSACCIONES = 20
+
+
+class MonitorPool(monitoring.ConnectionPoolListener):
+    """Cuenta eventos del pool de conexiones (se invoca desde los hilos de PyMongo)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {
+            "conexiones_creadas": 0,
+            "conexiones_cerradas": 0,
+            "checkouts": 0,
+            "checkouts_fallidos": 0,
+            "en_uso": 0,
+            "max_en_uso": 0,
+            "pools_limpiados": 0
+        }
+
+    def _sumar(self, clave: str, cantidad: int = 1):
+        with self._lock:
+            self.contadores[clave] += cantidad
+            if clave == "en_uso":
+                self.contadores["max_en_uso"] = max(self.contadores["max_en_uso"], self.contadores["en_uso"])
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._sumar("pools_limpiados")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._sumar("conexiones_creadas")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._sumar("conexiones_cerradas")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._sumar("checkouts_fallidos")
+        logger.warning(f"[MongoDB] No se obtuvo conexión del pool: {event.reason}")
+
+    def connection_checked_out(self, event):
+        self._sumar("checkouts")
+        self._sumar("en_uso")
+
+    def connection_checked_in(self, event):
+        self._sumar("en_uso", -1)
+
+
+def _entero_env(nombre: str, default: Optional[int]) -> Optional[int]:
+    valor = os.getenv(nombre)
+    return int(valor) if valor else default
+
+
+def opciones_cliente() -> Dict[str, Any]:
+    """Opciones del pool leídas del entorno (las de valor None usan el default de PyMongo)"""
+    opciones = {
+        "maxPoolSize": _entero_env('MONGO_MAX_POOL_SIZE', 50),
+        "minPoolSize": _entero_env('MONGO_MIN_POOL_SIZE', 0),
+        "maxIdleTimeMS": _entero_env('MONGO_MAX_IDLE_MS', 300000),
+        "serverSelectionTimeoutMS": _entero_env('MONGO_SERVER_SELECTION_TIMEOUT_MS', 10000),
+        "connectTimeoutMS": _entero_env('MONGO_CONNECT_TIMEOUT_MS', 10000),
+        "socketTimeoutMS": _entero_env('MONGO_SOCKET_TIMEOUT_MS', None),
+        "waitQueueTimeoutMS": _entero_env('MONGO_WAIT_QUEUE_TIMEOUT_MS', None),
+        "appname": os.getenv('MONGO_APP_NAME', 'netcash-mbco')
+    }
+    return {k: v for k, v in opciones.items() if v is not None}
+
+
+_lock_cliente = threading.Lock()
+_cliente: Optional[AsyncIOMotorClient] = None
+_monitor = MonitorPool()
+_transacciones_soportadas = True
+
+
+def obtener_cliente() -> AsyncIOMotorClient:
+    """Cliente único del proceso; se crea en la primera llamada"""
+    global _cliente
+    if _cliente is None:
+        with _lock_cliente:
+            if _cliente is None:
+                opciones = opciones_cliente()
+                _cliente = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[_monitor], **opciones)
+                logger.info(f"[MongoDB] Cliente compartido creado (maxPoolSize={opciones['maxPoolSize']}, "
+                            f"minPoolSize={opciones['minPoolSize']})")
+    return _cliente
+
+
+def obtener_db(nombre: Optional[str] = None) -> AsyncIOMotorDatabase:
+    """Base de datos de la app (DB_NAME) u otra por nombre"""
+    return obtener_cliente()[nombre or os.getenv('DB_NAME', 'netcash_mbco')]
+
+
+class BaseDatosCompartida:
+    """Proxy de la base de datos: no crea el cliente hasta el primer acceso a una colección"""
+
+    def __getattr__(self, nombre: str):
+        return getattr(obtener_db(), nombre)
+
+    def __getitem__(self, nombre: str):
+        return obtener_db()[nombre]
+
+
+db = BaseDatosCompartida()
+
+
+async def ejecutar_en_transaccion(operacion: Callable[[Any], Awaitable[T]]) -> T:
+    """
+    Ejecuta operacion(session) dentro de una transacción.
+
+    Todas las escrituras de la operación deben recibir session=session. Si el
+    servidor no soporta transacciones (standalone) se ejecuta con session=None,
+    y se recuerda para no volver a intentarlo.
+    """
+    global _transacciones_soportadas
+    if _transacciones_soportadas:
+        try:
+            async with await obtener_cliente().start_session() as sesion:
+                return await sesion.with_transaction(operacion)
+        except OperationFailure as e:
+            if e.code != CODIGO_SIN_TRANSACCIONES:
+                raise
+            _transacciones_soportadas = False
+            logger.warning("[MongoDB] El servidor no soporta transacciones; escrituras sin transacción")
+    return await operacion(None)
+
+
+def estadisticas_pool() -> Dict[str, Any]:
+    """Uso del pool de conexiones y configuración vigente"""
+    contadores = dict(_monitor.contadores)
+    return {
+        "cliente_creado": _cliente is not None,
+        "transacciones": _transacciones_soportadas,
+        **contadores,
+        "conexiones_abiertas": contadores["conexiones_creadas"] - contadores["conexiones_cerradas"],
+        "configuracion": opciones_cliente()
+    }
+
+
+def cerrar_cliente():
+    """Cierra el cliente compartido (shutdown); un uso posterior crea uno nuevo"""
+    global _cliente
+    with _lock_cliente:
+        if _cliente is not None:
+            _cliente.close()
+            _cliente = None
+            logger.info("[MongoDB] Cliente compartido cerrado")
@@ -2,7 +2,6 @@
 SOLO crea operaciones cuando TODO es válido (reglas duras)
 """
 
-import os
 import re
 import logging
 import asyncio
@@ -11,12 +10,12 @@ from typing import Dict, List, Tuple, Optional
 from uuid import uuid4
 from pathlib import Path
 
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 
 from gmail_service import gmail_service
 from cuenta_deposito_service import cuenta_deposito_service
 from validador_comprobantes_service import validador_comprobantes
+from database import db
 
 load_dotenv()
 
@@ -30,12 +29,6 @@ logging.basicConfig(
     ]
 )
 
-# Conexión a MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 ATTACHMENTS_DIR = Path("/app/backend/uploads/email_attachments")
 ATTACHMENTS_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -305,7 +298,7 @@ class EmailMonitor:
             validacion['campos_faltantes'].append('comprobante')
         else:
             # Validar comprobantes contra cuenta activa
-            al_menos_uno_valido, validaciones = validador_comprobantes.validar_todos_comprobantes(archivos, cuenta_activa)
+            al_menos_uno_valido, validaciones = await validador_comprobantes.validar_todos_comprobantes_async(archivos, cuenta_activa)
             
             if al_menos_uno_valido:
                 validacion['campos_validos'].append('comprobante_valido')
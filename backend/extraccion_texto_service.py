@@ -0,0 +1,163 @@
+"""Extracción de texto de comprobantes fuera del event loop
+
+PyPDF2 y pytesseract son llamadas síncronas y CPU-bound. Ejecutadas dentro
+de un handler async (FastAPI / Telegram) bloquean a todos los demás requests
+del worker mientras se procesa un PDF grande o una imagen escaneada.
+
+Este servicio las ejecuta en un ProcessPoolExecutor acotado:
+- Número de procesos configurable (EXTRACCION_TEXTO_WORKERS)
+- Timeout por tarea (EXTRACCION_TEXTO_TIMEOUT_SEG)
+- Cancelación: si el llamador se cancela, la tarea pendiente se descarta;
+  si una tarea excede el timeout mientras corre, el pool se reinicia para
+  liberar el proceso atorado.
+
+Las funciones de extracción a nivel de módulo también se usan en modo
+síncrono (sin pool) para los llamadores que no son async.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Intentar importar librerías de OCR/extracción
+try:
+    import PyPDF2
+    PYPDF2_AVAILABLE = True
+except ImportError:
+    PYPDF2_AVAILABLE = False
+    logger.warning("[ExtraccionTexto] PyPDF2 no disponible")
+
+try:
+    from PIL import Image
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+    logger.warning("[ExtraccionTexto] pytesseract no disponible")
+
+
+class ExtraccionTextoTimeout(Exception):
+    """La extracción excedió el tiempo máximo permitido"""
+
+
+# ==================== FUNCIONES DE EXTRACCIÓN ====================
+# Deben ser funciones de módulo para poder enviarse al pool de procesos.
+
+def extraer_paginas_pdf(ruta_archivo: str) -> List[str]:
+    """
+    Extrae el texto de cada página de un PDF.
+
+    Returns:
+        Lista con el texto de cada página (cadena vacía si la página no tiene texto)
+
+    Raises:
+        RuntimeError si PyPDF2 no está disponible; errores de lectura del PDF se propagan
+    """
+    if not PYPDF2_AVAILABLE:
+        raise RuntimeError("PyPDF2 no disponible")
+
+    with open(ruta_archivo, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+
+
+def extraer_texto_imagen(ruta_archivo: str, lang: str = 'spa') -> str:
+    """
+    Extrae texto de una imagen usando Tesseract.
+
+    Raises:
+        RuntimeError si pytesseract no está disponible; errores de OCR se propagan
+    """
+    if not PYTESSERACT_AVAILABLE:
+        raise RuntimeError("pytesseract no disponible")
+
+    image = Image.open(ruta_archivo)
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+# ==================== POOL DE PROCESOS ====================
+
+class ExtraccionTextoService:
+    """Ejecuta la extracción de texto en un pool de procesos acotado"""
+
+    def __init__(self):
+        self.max_workers = int(os.getenv('EXTRACCION_TEXTO_WORKERS', str(min(4, os.cpu_count() or 1))))
+        self.timeout_seg = float(os.getenv('EXTRACCION_TEXTO_TIMEOUT_SEG', '60'))
+        # Tareas máximas en vuelo (ejecutándose + en cola del pool)
+        self.max_pendientes = int(os.getenv('EXTRACCION_TEXTO_MAX_PENDIENTES', str(self.max_workers * 4)))
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._semaforo_loop = None
+
+    def _obtener_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # "spawn" evita heredar hilos del proceso padre (Motor, schedulers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"[ExtraccionTexto] Pool de procesos iniciado ({self.max_workers} workers)")
+        return self._pool
+
+    def _obtener_semaforo(self) -> asyncio.Semaphore:
+        # El semáforo queda ligado al loop donde se usa por primera vez
+        loop = asyncio.get_running_loop()
+        if self._semaforo is None or self._semaforo_loop is not loop:
+            self._semaforo = asyncio.Semaphore(self.max_pendientes)
+            self._semaforo_loop = loop
+        return self._semaforo
+
+    def _reiniciar_pool(self):
+        """Descarta el pool actual terminando sus procesos (ej: tarea atorada)"""
+        pool = self._pool
+        self._pool = None
+        if pool is None:
+            return
+
+        logger.warning("[ExtraccionTexto] Reiniciando pool de procesos")
+        # ProcessPoolExecutor no expone una forma pública de matar un worker ocupado
+        for proceso in list(getattr(pool, "_processes", {}).values()):
+            try:
+                proceso.terminate()
+            except Exception:
+                pass
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _ejecutar(self, funcion, *args, timeout: Optional[float] = None):
+        timeout = self.timeout_seg if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+
+        async with self._obtener_semaforo():
+            future = loop.run_in_executor(self._obtener_pool(), funcion, *args)
+            try:
+                return await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"[ExtraccionTexto] Timeout ({timeout}s) ejecutando {funcion.__name__}{args}")
+                self._reiniciar_pool()
+                raise ExtraccionTextoTimeout(f"Extracción excedió {timeout}s")
+
+    async def extraer_paginas_pdf(self, ruta_archivo: str, timeout: Optional[float] = None) -> List[str]:
+        """Versión async de extraer_paginas_pdf (ejecutada en el pool)"""
+        return await self._ejecutar(extraer_paginas_pdf, str(ruta_archivo), timeout=timeout)
+
+    async def extraer_texto_imagen(self, ruta_archivo: str, lang: str = 'spa',
+                                   timeout: Optional[float] = None) -> str:
+        """Versión async de extraer_texto_imagen (ejecutada en el pool)"""
+        return await self._ejecutar(extraer_texto_imagen, str(ruta_archivo), lang, timeout=timeout)
+
+    def shutdown(self):
+        """Cierra el pool (llamar al apagar el servidor)"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("[ExtraccionTexto] Pool de procesos detenido")
+
+
+# Instancia global del servicio
+extraccion_texto_service = ExtraccionTextoService()
@@ -0,0 +1,180 @@
+"""Asignación de folios NetCash (NC-000123) para web y Telegram
+
+Antes había tres generadores: server.generar_folio_mbco y el legacy de
+NetCashService ordenaban folio_mbco como texto en ambas colecciones (dos
+consultas ordenadas por creación y carrera entre creaciones simultáneas), y
+NetCashService._generar_folio_mbco usaba el contador atómico.
+
+Ahora ambos canales piden el folio a este servicio:
+
+Colección MongoDB: counters
+- {_id: "folio_mbco", sequence_value: último número asignado}
+
+- siguiente(): find_one_and_update con $inc (ReturnDocument.AFTER)
+- Bloques: con FOLIO_MBCO_BLOQUE=N (> 1) cada proceso reserva N folios por
+  viaje y los entrega desde memoria. Los folios de un bloque no usado (reinicio)
+  se pierden, y entre procesos el orden de folio deja de seguir el de creación.
+  Por defecto 1 (sin bloques).
+- reparar(): compara el contador con el mayor folio numérico existente en
+  operaciones y solicitudes_netcash y reporta folios repetidos; con
+  aplicar=True sube el contador ($max, nunca lo baja). Se aplica al arrancar.
+
+Uso manual:
+    python folio_mbco_service.py --reparar [--aplicar]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from typing import Any, Dict, List
+
+from pymongo import ReturnDocument
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'counters'
+CONTADOR_ID = "folio_mbco"
+PREFIJO = "NC-"
+
+COLECCIONES_CON_FOLIO = ["operaciones", "solicitudes_netcash"]
+
+# Folios con formato NC-<dígitos>; otros (NC-EMAIL-..., capturados a mano) no cuentan para la secuencia
+_PATRON_FOLIO = r"^NC-[0-9]+$"
+
+
+def formatear_folio(numero: int) -> str:
+    return f"{PREFIJO}{numero:06d}"
+
+
+class FolioMbcoService:
+    """Contador atómico de folios con reserva opcional por bloques"""
+
+    def __init__(self):
+        self.tamano_bloque = max(1, int(os.environ.get('FOLIO_MBCO_BLOQUE', '1')))
+        # Bloque reservado por este proceso: próximos números [_siguiente, _limite]
+        self._siguiente = 1
+        self._limite = 0
+        self._lock = asyncio.Lock()
+        self._stats = {"asignados": 0, "reservas": 0}
+
+    async def _reservar(self, cantidad: int) -> int:
+        """Incrementa el contador y devuelve el último número reservado"""
+        contador = await db[COLLECTION_NAME].find_one_and_update(
+            {"_id": CONTADOR_ID},
+            {"$inc": {"sequence_value": cantidad}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._stats["reservas"] += 1
+        return contador["sequence_value"]
+
+    async def siguiente(self) -> str:
+        """Asigna el siguiente folio (único entre canales y procesos)"""
+        if self.tamano_bloque == 1:
+            numero = await self._reservar(1)
+        else:
+            async with self._lock:
+                if self._siguiente > self._limite:
+                    self._limite = await self._reservar(self.tamano_bloque)
+                    self._siguiente = self._limite - self.tamano_bloque + 1
+                    logger.info(f"[Folios] Bloque reservado: {formatear_folio(self._siguiente)} - "
+                                f"{formatear_folio(self._limite)}")
+                numero = self._siguiente
+                self._siguiente += 1
+
+        self._stats["asignados"] += 1
+        folio = formatear_folio(numero)
+        logger.info(f"[Folios] Folio asignado: {folio}")
+        return folio
+
+    def _pipeline_folios(self) -> List[Dict]:
+        """Número y folio de cada documento con folio de la secuencia, en ambas colecciones"""
+        rama = [
+            {"$match": {"folio_mbco": {"$regex": _PATRON_FOLIO}}},
+            {"$project": {
+                "_id": 0,
+                "folio": "$folio_mbco",
+                "numero": {"$toLong": {"$substrCP": [
+                    "$folio_mbco", len(PREFIJO), {"$subtract": [{"$strLenCP": "$folio_mbco"}, len(PREFIJO)]}
+                ]}},
+            }},
+        ]
+        otras = COLECCIONES_CON_FOLIO[1:]
+        return [
+            *rama,
+            *[{"$unionWith": {"coll": coleccion, "pipeline": rama}} for coleccion in otras],
+            {"$group": {"_id": "$numero", "folio": {"$first": "$folio"}, "cantidad": {"$sum": 1}}},
+            {"$facet": {
+                "maximo": [{"$group": {"_id": None, "numero": {"$max": "$_id"}}}],
+                "repetidos": [{"$match": {"cantidad": {"$gt": 1}}}, {"$sort": {"_id": 1}}, {"$limit": 50}],
+            }},
+        ]
+
+    async def reparar(self, aplicar: bool = False) -> Dict[str, Any]:
+        """
+        Reconciliación del contador con los folios existentes.
+
+        Returns:
+            {"contador", "maximo_en_datos", "desfasado", "ajustado", "repetidos": [{"folio", "cantidad"}]}
+        """
+        documento = await db[COLLECTION_NAME].find_one({"_id": CONTADOR_ID})
+        contador = documento.get("sequence_value", 0) if documento else 0
+
+        resultado = await db[COLECCIONES_CON_FOLIO[0]].aggregate(self._pipeline_folios()).to_list(1)
+        facetas = resultado[0] if resultado else {"maximo": [], "repetidos": []}
+        maximo = facetas["maximo"][0]["numero"] if facetas["maximo"] else 0
+        repetidos = [{"folio": r["folio"], "cantidad": r["cantidad"]} for r in facetas["repetidos"]]
+
+        desfasado = contador < maximo
+        ajustado = False
+        if desfasado and aplicar:
+            await db[COLLECTION_NAME].update_one(
+                {"_id": CONTADOR_ID},
+                {"$max": {"sequence_value": maximo}},
+                upsert=True
+            )
+            ajustado = True
+            logger.warning(f"[Folios] Contador ajustado de {contador} a {maximo} (último folio en datos)")
+        if repetidos:
+            logger.warning(f"[Folios] ⚠️ Folios repetidos: {', '.join(r['folio'] for r in repetidos)}")
+
+        return {
+            "contador": maximo if ajustado else contador,
+            "maximo_en_datos": maximo,
+            "desfasado": desfasado,
+            "ajustado": ajustado,
+            "repetidos": repetidos,
+        }
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        return {
+            "tamano_bloque": self.tamano_bloque,
+            "disponibles_en_bloque": max(0, self._limite - self._siguiente + 1),
+            **self._stats,
+        }
+
+
+# Instancia global del servicio
+folio_mbco_service = FolioMbcoService()
+
+
+async def main(argv: List[str]) -> int:
+    if "--reparar" not in argv:
+        print("Uso: python folio_mbco_service.py --reparar [--aplicar]")
+        return 2
+    resultado = await folio_mbco_service.reparar(aplicar="--aplicar" in argv)
+    print(f"Contador: {resultado['contador']}")
+    print(f"Mayor folio en datos: {formatear_folio(resultado['maximo_en_datos'])}")
+    if resultado["desfasado"] and not resultado["ajustado"]:
+        print("⚠️  El contador está detrás de los datos; usa --aplicar para ajustarlo")
+    for repetido in resultado["repetidos"]:
+        print(f"⚠️  {repetido['folio']} aparece {repetido['cantidad']} veces")
+    return 0 if not resultado["repetidos"] and (not resultado["desfasado"] or resultado["ajustado"]) else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
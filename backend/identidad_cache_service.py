@@ -0,0 +1,218 @@
+"""Caché de identidades: usuario de Telegram, cliente y usuario NetCash
+
+Casi todos los handlers del bot llaman es_cliente_activo u
+obtener_o_crear_usuario: un find_one con $or en usuarios_telegram y otro en
+clientes por cada update. Las notificaciones a Ana y Tesorería repetían las
+búsquedas de usuarios_repo en usuarios_netcash.
+
+- obtener(espacio, clave, cargar, etiquetas): devuelve lo cacheado o llama
+  cargar() una sola vez aunque lleguen varias peticiones a la vez. Se
+  entrega una copia, así que el llamador puede modificar el documento.
+- Caché negativo: un None (usuario no registrado, cliente inexistente) se
+  guarda con un TTL más corto.
+- Invalidación por etiqueta: cada entrada lleva etiquetas como
+  ("telegram_id", "123"), ("chat_id", "123") o ("cliente", id). Quien escribe
+  en usuarios_telegram / clientes / usuarios_netcash invalida sus etiquetas,
+  incluidas las entradas negativas del mismo usuario.
+- Métricas por espacio: aciertos, fallos, aciertos negativos, invalidaciones
+  y tasa de aciertos (obtener_estadisticas).
+
+El caché es por proceso: lo que cambia server.py (dashboard) lo ve el bot en
+otro proceso cuando vence el TTL.
+
+Variables de entorno:
+- IDENTIDAD_CACHE_TTL_SEG: vida de una entrada encontrada (default 30)
+- IDENTIDAD_CACHE_TTL_NEGATIVO_SEG: vida de una entrada "no existe" (default 10)
+- IDENTIDAD_CACHE_MAX: entradas máximas (default 10000)
+"""
+
+import asyncio
+import copy
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+ESPACIO_USUARIO_TELEGRAM = "usuario_telegram"
+ESPACIO_CLIENTE = "cliente"
+ESPACIO_USUARIO_NETCASH = "usuario_netcash"
+ESPACIO_USUARIOS_POR_PERMISO = "usuarios_por_permiso"
+
+Etiqueta = Tuple[str, str]
+
+
+def etiquetas_usuario_telegram(telegram_id: Any = None, chat_id: Any = None) -> Set[Etiqueta]:
+    etiquetas = set()
+    if telegram_id is not None:
+        etiquetas.add(("telegram_id", str(telegram_id)))
+    if chat_id is not None:
+        etiquetas.add(("chat_id", str(chat_id)))
+    return etiquetas
+
+
+def etiquetas_de_usuario_telegram(usuario: Dict[str, Any]) -> Set[Etiqueta]:
+    """Etiquetas que salen del documento de usuarios_telegram (incluye su cliente)"""
+    etiquetas = etiquetas_usuario_telegram(usuario.get("telegram_id"), usuario.get("chat_id"))
+    if usuario.get("id_cliente"):
+        etiquetas.add(("cliente", str(usuario["id_cliente"])))
+    return etiquetas
+
+
+class IdentidadCache:
+    """Caché TTL con entradas negativas, invalidación por etiqueta y métricas"""
+
+    def __init__(self, ttl_seg: float = 30, ttl_negativo_seg: float = 10, max_entradas: int = 10000):
+        self.ttl_seg = ttl_seg
+        self.ttl_negativo_seg = ttl_negativo_seg
+        self.max_entradas = max_entradas
+        # (espacio, clave) -> (valor, vence_en, etiquetas)
+        self._entradas: "OrderedDict[Tuple[str, Hashable], Tuple[Any, float, Set[Etiqueta]]]" = OrderedDict()
+        self._por_etiqueta: Dict[Etiqueta, Set[Tuple[str, Hashable]]] = {}
+        self._en_vuelo: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        # Cambia con cada invalidación: una carga que empezó antes no se guarda
+        self._generacion = 0
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def desde_entorno(cls) -> "IdentidadCache":
+        return cls(
+            ttl_seg=float(os.environ.get('IDENTIDAD_CACHE_TTL_SEG', '30')),
+            ttl_negativo_seg=float(os.environ.get('IDENTIDAD_CACHE_TTL_NEGATIVO_SEG', '10')),
+            max_entradas=max(1, int(os.environ.get('IDENTIDAD_CACHE_MAX', '10000'))),
+        )
+
+    def _contar(self, espacio: str, metrica: str):
+        stats = self._stats.setdefault(
+            espacio, {"aciertos": 0, "aciertos_negativos": 0, "fallos": 0, "invalidaciones": 0}
+        )
+        stats[metrica] += 1
+
+    def _quitar(self, llave: Tuple[str, Hashable]):
+        entrada = self._entradas.pop(llave, None)
+        if entrada is None:
+            return
+        for etiqueta in entrada[2]:
+            llaves = self._por_etiqueta.get(etiqueta)
+            if llaves is not None:
+                llaves.discard(llave)
+                if not llaves:
+                    del self._por_etiqueta[etiqueta]
+
+    def _guardar(self, llave: Tuple[str, Hashable], valor: Any, etiquetas: Set[Etiqueta]):
+        self._quitar(llave)
+        ttl = self.ttl_seg if valor is not None else self.ttl_negativo_seg
+        self._entradas[llave] = (valor, time.monotonic() + ttl, etiquetas)
+        for etiqueta in etiquetas:
+            self._por_etiqueta.setdefault(etiqueta, set()).add(llave)
+        while len(self._entradas) > self.max_entradas:
+            self._quitar(next(iter(self._entradas)))
+
+    async def obtener(
+        self,
+        espacio: str,
+        clave: Hashable,
+        cargar: Callable[[], Awaitable[Any]],
+        etiquetas: Iterable[Etiqueta] = (),
+        etiquetas_del_valor: Optional[Callable[[Any], Iterable[Etiqueta]]] = None,
+    ) -> Any:
+        """
+        Valor cacheado de (espacio, clave); si no hay, await cargar().
+
+        Los errores de cargar() se propagan y no se cachean.
+
+        Args:
+            etiquetas: etiquetas conocidas de antemano (las de la consulta)
+            etiquetas_del_valor: etiquetas adicionales que salen del documento
+                (p. ej. el id_cliente de un usuario)
+        """
+        llave = (espacio, clave)
+        entrada = self._entradas.get(llave)
+        if entrada is not None:
+            if entrada[1] > time.monotonic():
+                self._entradas.move_to_end(llave)
+                self._contar(espacio, "aciertos" if entrada[0] is not None else "aciertos_negativos")
+                return copy.deepcopy(entrada[0])
+            self._quitar(llave)
+
+        self._contar(espacio, "fallos")
+        # Una sola carga por llave; corre en su propia tarea para que cancelar a
+        # un llamador no cancele la carga de los demás
+        tarea = self._en_vuelo.get(llave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(self._cargar(llave, cargar, set(etiquetas), etiquetas_del_valor))
+            self._en_vuelo[llave] = tarea
+            tarea.add_done_callback(
+                lambda t: self._en_vuelo.pop(llave) if self._en_vuelo.get(llave) is t else None
+            )
+        return copy.deepcopy(await asyncio.shield(tarea))
+
+    async def _cargar(self, llave, cargar, etiquetas: Set[Etiqueta], etiquetas_del_valor) -> Any:
+        generacion = self._generacion
+        valor = await cargar()
+        # Una invalidación durante la carga puede dejar el valor leído viejo
+        if generacion == self._generacion:
+            if valor is not None and etiquetas_del_valor is not None:
+                etiquetas = etiquetas | set(etiquetas_del_valor(valor))
+            self._guardar(llave, valor, etiquetas)
+        return valor
+
+    def _nueva_generacion(self):
+        # Las cargas en curso pueden traer el valor de antes del cambio: los
+        # siguientes llamadores ya no las esperan
+        self._generacion += 1
+        self._en_vuelo.clear()
+
+    def invalidar(self, *etiquetas: Etiqueta) -> int:
+        """Quita las entradas con cualquiera de las etiquetas"""
+        self._nueva_generacion()
+        llaves = set()
+        for etiqueta in etiquetas:
+            llaves.update(self._por_etiqueta.get(etiqueta, ()))
+        for llave in llaves:
+            self._contar(llave[0], "invalidaciones")
+            self._quitar(llave)
+        return len(llaves)
+
+    def invalidar_espacio(self, espacio: str) -> int:
+        self._nueva_generacion()
+        llaves = [llave for llave in self._entradas if llave[0] == espacio]
+        for llave in llaves:
+            self._contar(espacio, "invalidaciones")
+            self._quitar(llave)
+        return len(llaves)
+
+    def invalidar_usuario_telegram(self, telegram_id: Any = None, chat_id: Any = None) -> int:
+        """Tras escribir en usuarios_telegram (alta, vinculación, cambio de rol o chat_id)"""
+        return self.invalidar(*etiquetas_usuario_telegram(telegram_id, chat_id))
+
+    def invalidar_cliente(self, id_cliente: Any) -> int:
+        """Tras crear, editar, activar o aprobar un cliente"""
+        return self.invalidar(("cliente", str(id_cliente)))
+
+    def invalidar_usuarios_netcash(self) -> int:
+        """Tras crear o modificar usuarios_netcash (roles y permisos)"""
+        return (self.invalidar_espacio(ESPACIO_USUARIO_NETCASH)
+                + self.invalidar_espacio(ESPACIO_USUARIOS_POR_PERMISO))
+
+    def limpiar(self):
+        self._nueva_generacion()
+        self._entradas.clear()
+        self._por_etiqueta.clear()
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        espacios = {}
+        for espacio, stats in self._stats.items():
+            consultas = stats["aciertos"] + stats["aciertos_negativos"] + stats["fallos"]
+            espacios[espacio] = {
+                **stats,
+                "tasa_aciertos": round((stats["aciertos"] + stats["aciertos_negativos"]) / consultas, 3)
+                if consultas else 0.0,
+            }
+        return {"entradas": len(self._entradas), "espacios": espacios}
+
+
+# Instancia global del servicio
+identidad_cache = IdentidadCache.desde_entorno()
@@ -6,8 +6,8 @@ import os
 import asyncio
 import logging
 from datetime import datetime, timezone, timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
+from database import db
 
 load_dotenv()
 
@@ -17,11 +17,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-mongo_client = AsyncIOMotorClient(mongo_url)
-db = mongo_client[os.environ.get('DB_NAME', 'netcash_mbco')]
-
 ESTADOS_EN_CAPTURA = [
     "EN_CAPTURA",
     "ESPERANDO_COMPROBANTES",
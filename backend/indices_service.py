@@ -0,0 +1,270 @@
+"""Registro declarativo de índices MongoDB para las colecciones calientes
+
+Fuera del script crear_indices_netcash_pdf_learning.py nada creaba índices, así
+que las búsquedas por id, las verificaciones de duplicados por hash/clave de
+rastreo, el orden por folio_mbco y las búsquedas por telegram_id/chat_id
+recorrían colecciones completas (COLLSCAN).
+
+- INDICES_REGISTRADOS: índices por colección; se aplican de forma idempotente
+  al arrancar el servidor (startup_event) y el bot de Telegram (post_init)
+- CONSULTAS_CRITICAS: consultas reales del código; verificar_consultas_criticas()
+  corre explain() sobre cada una y marca las que siguen haciendo COLLSCAN
+
+Uso manual:
+    python indices_service.py            # aplicar índices + verificar planes
+    python indices_service.py --verificar  # solo verificar planes
+"""
+
+import asyncio
+import logging
+import sys
+from datetime import datetime
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Códigos de MongoDB cuando ya existe un índice equivalente con otro nombre/opciones
+CODIGOS_CONFLICTO_INDICE = {85, 86}
+
+# Sin "name": se usa el nombre por defecto (ej: "id_1"), igual que los
+# create_index() existentes, para no chocar con índices ya creados.
+INDICES_REGISTRADOS: Dict[str, List[Dict[str, Any]]] = {
+    "solicitudes_netcash": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("comprobantes.archivo_hash", ASCENDING)]},
+        {"keys": [("folio_mbco", DESCENDING)]},
+        {"keys": [("email_thread_id", ASCENDING), ("estado", ASCENDING)]},
+        {"keys": [("estado", ASCENDING)]},
+        {"keys": [("cliente_id", ASCENDING), ("estado", ASCENDING)]},
+        {"keys": [("created_at", DESCENDING), ("id", DESCENDING)]},
+        {"keys": [("cliente_id", ASCENDING), ("created_at", DESCENDING)]},
+    ],
+    "operaciones": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("comprobantes.file_hash", ASCENDING)]},
+        {"keys": [("comprobantes.clave_rastreo", ASCENDING)]},
+        {"keys": [("folio_mbco", DESCENDING)]},
+        {"keys": [("fecha_creacion", DESCENDING), ("id", DESCENDING)]},
+        {"keys": [("id_cliente", ASCENDING), ("fecha_creacion", DESCENDING)]},
+    ],
+    "clientes": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("telegram_id", ASCENDING)]},
+        {"keys": [("email", ASCENDING)]},
+        {"keys": [("busqueda.prefijos", ASCENDING)]},
+        {"keys": [("busqueda.ngramas", ASCENDING)]},
+        {"keys": [("busqueda.nombre", ASCENDING), ("id", ASCENDING)]},
+    ],
+    "usuarios_telegram": [
+        {"keys": [("telegram_id", ASCENDING)]},
+        {"keys": [("chat_id", ASCENDING)]},
+    ],
+    "usuarios_netcash": [
+        {"keys": [("telegram_id", ASCENDING), ("activo", ASCENDING)]},
+        {"keys": [("rol_negocio", ASCENDING), ("activo", ASCENDING)]},
+    ],
+    "comprobante_fingerprints": [
+        {"keys": [("ambito", ASCENDING), ("tipo", ASCENDING), ("valor", ASCENDING), ("operacion_id", ASCENDING)],
+         "unique": True},
+        {"keys": [("ambito", ASCENDING), ("tipo", ASCENDING), ("valor", ASCENDING), ("created_at", ASCENDING)]},
+        {"keys": [("operacion_id", ASCENDING)]},
+    ],
+    "comprobante_ocr_raw": [
+        {"keys": [("comprobante_id", ASCENDING)], "unique": True},
+        {"keys": [("operacion_id", ASCENDING)]},
+    ],
+    "operaciones_view": [
+        {"keys": [("id", ASCENDING)]},
+        {"keys": [("fecha_orden", DESCENDING), ("id", DESCENDING)]},
+        {"keys": [("estado", ASCENDING), ("fecha_orden", DESCENDING), ("id", DESCENDING)]},
+        {"keys": [("cliente_id", ASCENDING), ("fecha_orden", DESCENDING), ("id", DESCENDING)]},
+    ],
+    "ocr_jobs": [
+        {"keys": [("id", ASCENDING)], "unique": True},
+        {"keys": [("estado", ASCENDING), ("disponible_en", ASCENDING)]},
+    ],
+    "telegram_persistencia": [
+        {"keys": [("expira_en", ASCENDING)], "expireAfterSeconds": 0},
+        {"keys": [("tipo", ASCENDING), ("nombre", ASCENDING), ("expira_en", ASCENDING)]},
+    ],
+}
+
+# Consultas calientes tal como aparecen en el código (valores de ejemplo)
+CONSULTAS_CRITICAS: List[Dict[str, Any]] = [
+    {"nombre": "solicitud_por_id", "coleccion": "solicitudes_netcash",
+     "filtro": {"id": "x"}},
+    {"nombre": "operacion_por_id", "coleccion": "operaciones",
+     "filtro": {"id": "x"}},
+    {"nombre": "duplicado_archivo_hash_telegram", "coleccion": "solicitudes_netcash",
+     "filtro": {"comprobantes.archivo_hash": {"$in": ["x"]}}},
+    {"nombre": "duplicado_file_hash_web", "coleccion": "operaciones",
+     "filtro": {"comprobantes.file_hash": {"$in": ["x"]}}},
+    {"nombre": "duplicado_clave_rastreo", "coleccion": "operaciones",
+     "filtro": {"comprobantes.clave_rastreo": "x"}},
+    {"nombre": "huella_comprobante", "coleccion": "comprobante_fingerprints",
+     "filtro": {"ambito": "web", "tipo": "hash", "valor": "x"}, "sort": [("created_at", ASCENDING)]},
+    {"nombre": "ocr_raw_por_comprobante", "coleccion": "comprobante_ocr_raw",
+     "filtro": {"comprobante_id": {"$in": ["x"]}}},
+    {"nombre": "folios_secuencia_telegram", "coleccion": "solicitudes_netcash",
+     "filtro": {"folio_mbco": {"$regex": "^NC-[0-9]+$"}}},
+    {"nombre": "folios_secuencia_web", "coleccion": "operaciones",
+     "filtro": {"folio_mbco": {"$regex": "^NC-[0-9]+$"}}},
+    {"nombre": "listado_operaciones_web", "coleccion": "operaciones",
+     "filtro": {}, "sort": [("fecha_creacion", DESCENDING), ("id", DESCENDING)]},
+    {"nombre": "listado_solicitudes_telegram", "coleccion": "solicitudes_netcash",
+     "filtro": {}, "sort": [("created_at", DESCENDING), ("id", DESCENDING)]},
+    {"nombre": "stats_operaciones_web_cliente", "coleccion": "operaciones",
+     "filtro": {"id_cliente": "x", "fecha_creacion": {"$gte": "2025-01-01T00:00:00"}}},
+    {"nombre": "stats_solicitudes_telegram_cliente", "coleccion": "solicitudes_netcash",
+     "filtro": {"cliente_id": "x", "created_at": {"$gte": datetime(2025, 1, 1)}}},
+    {"nombre": "vista_operacion_por_id", "coleccion": "operaciones_view",
+     "filtro": {"id": "x"}},
+    {"nombre": "vista_listado_por_estado", "coleccion": "operaciones_view",
+     "filtro": {"estado": {"$in": ["DATOS_COMPLETOS"]}}, "sort": [("fecha_orden", DESCENDING), ("id", DESCENDING)]},
+    {"nombre": "email_por_thread_id", "coleccion": "solicitudes_netcash",
+     "filtro": {"email_thread_id": "x", "estado": "enviado_a_tesoreria"}},
+    {"nombre": "email_por_folio", "coleccion": "solicitudes_netcash",
+     "filtro": {"folio_mbco": "x", "estado": "enviado_a_tesoreria"}},
+    {"nombre": "usuario_telegram_por_telegram_id", "coleccion": "usuarios_telegram",
+     "filtro": {"telegram_id": "x"}},
+    {"nombre": "usuario_telegram_por_chat_id", "coleccion": "usuarios_telegram",
+     "filtro": {"chat_id": "x"}},
+    {"nombre": "usuario_netcash_por_telegram_id", "coleccion": "usuarios_netcash",
+     "filtro": {"telegram_id": "x", "activo": True}},
+    {"nombre": "cliente_por_id", "coleccion": "clientes",
+     "filtro": {"id": "x"}},
+    {"nombre": "busqueda_clientes_prefijo", "coleccion": "clientes",
+     "filtro": {"busqueda.prefijos": {"$all": ["x"]}}},
+    {"nombre": "busqueda_clientes_ngramas", "coleccion": "clientes",
+     "filtro": {"busqueda.ngramas": {"$all": ["xyz"]}}},
+    {"nombre": "listado_clientes_alfabetico", "coleccion": "clientes",
+     "filtro": {}, "sort": [("busqueda.nombre", ASCENDING), ("id", ASCENDING)]},
+    {"nombre": "conversaciones_telegram_vigentes", "coleccion": "telegram_persistencia",
+     "filtro": {"tipo": "conversacion", "nombre": "netcash", "expira_en": {"$gt": datetime(2025, 1, 1)}}},
+]
+
+
+def _modelo_indice(spec: Dict[str, Any]) -> IndexModel:
+    opciones = {k: v for k, v in spec.items() if k != "keys"}
+    return IndexModel(spec["keys"], **opciones)
+
+
+async def aplicar_indices() -> Dict[str, Any]:
+    """
+    Crea todos los índices registrados. Idempotente: MongoDB ignora los que ya existen.
+
+    Un índice que no se puede crear (conflicto con uno existente, duplicados que
+    impiden un unique) se reporta y no detiene el arranque.
+
+    Returns:
+        Dict con "creados" (nombres por colección) y "errores"
+    """
+    resumen = {"creados": {}, "errores": []}
+
+    for coleccion, specs in INDICES_REGISTRADOS.items():
+        creados = []
+        for spec in specs:
+            try:
+                creados.extend(await db[coleccion].create_indexes([_modelo_indice(spec)]))
+            except OperationFailure as e:
+                if e.code in CODIGOS_CONFLICTO_INDICE:
+                    logger.warning(f"[Indices] {coleccion} {spec['keys']}: ya existe un índice equivalente ({str(e)})")
+                    continue
+                logger.error(f"[Indices] ❌ {coleccion} {spec['keys']}: {str(e)}")
+                resumen["errores"].append({"coleccion": coleccion, "keys": spec["keys"], "error": str(e)})
+            except Exception as e:
+                logger.error(f"[Indices] ❌ {coleccion} {spec['keys']}: {str(e)}")
+                resumen["errores"].append({"coleccion": coleccion, "keys": spec["keys"], "error": str(e)})
+        resumen["creados"][coleccion] = creados
+
+    total = sum(len(nombres) for nombres in resumen["creados"].values())
+    logger.info(f"[Indices] ✅ {total} índice(s) asegurados en {len(INDICES_REGISTRADOS)} colecciones, "
+                f"{len(resumen['errores'])} error(es)")
+    return resumen
+
+
+def etapas_plan(plan: Any) -> List[str]:
+    """Lista todas las etapas (stage) de un plan de explain(), en cualquier nivel"""
+    etapas = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            etapas.append(plan["stage"])
+        for valor in plan.values():
+            etapas.extend(etapas_plan(valor))
+    elif isinstance(plan, list):
+        for elemento in plan:
+            etapas.extend(etapas_plan(elemento))
+    return etapas
+
+
+async def verificar_consultas_criticas() -> List[Dict[str, Any]]:
+    """
+    Corre explain() sobre cada consulta crítica y marca las que hacen COLLSCAN.
+
+    Returns:
+        Lista de {"nombre", "coleccion", "etapas", "collscan"} (o "error")
+    """
+    resultados = []
+
+    for consulta in CONSULTAS_CRITICAS:
+        cursor = db[consulta["coleccion"]].find(consulta["filtro"])
+        if consulta.get("sort"):
+            cursor = cursor.sort(consulta["sort"])
+        try:
+            explicacion = await cursor.limit(1).explain()
+        except Exception as e:
+            logger.error(f"[Indices] No se pudo obtener el plan de {consulta['nombre']}: {str(e)}")
+            resultados.append({"nombre": consulta["nombre"], "coleccion": consulta["coleccion"], "error": str(e)})
+            continue
+
+        etapas = etapas_plan(explicacion.get("queryPlanner", {}).get("winningPlan", {}))
+        collscan = "COLLSCAN" in etapas
+        if collscan:
+            logger.warning(f"[Indices] ⚠️ {consulta['nombre']} ({consulta['coleccion']}) hace COLLSCAN: {etapas}")
+        resultados.append({
+            "nombre": consulta["nombre"],
+            "coleccion": consulta["coleccion"],
+            "etapas": etapas,
+            "collscan": collscan
+        })
+
+    con_collscan = [r["nombre"] for r in resultados if r.get("collscan")]
+    if con_collscan:
+        logger.warning(f"[Indices] {len(con_collscan)} consulta(s) crítica(s) sin índice: {', '.join(con_collscan)}")
+    else:
+        logger.info(f"[Indices] ✅ {len(resultados)} consultas críticas usan índice")
+    return resultados
+
+
+async def asegurar_indices(verificar_planes: bool = True) -> Dict[str, Any]:
+    """Aplica el registro y (opcional) verifica los planes. Nunca lanza: se usa en el arranque."""
+    try:
+        resumen = await aplicar_indices()
+        if verificar_planes:
+            resumen["consultas"] = await verificar_consultas_criticas()
+        return resumen
+    except Exception as e:
+        logger.error(f"[Indices] Error asegurando índices: {str(e)}")
+        return {"creados": {}, "errores": [{"error": str(e)}]}
+
+
+async def main(argv: List[str]) -> int:
+    if "--verificar" in argv:
+        resultados = await verificar_consultas_criticas()
+    else:
+        resultados = (await asegurar_indices())["consultas"]
+
+    for r in resultados:
+        estado = "ERROR" if "error" in r else ("COLLSCAN" if r["collscan"] else "OK")
+        print(f"{estado:9} {r['coleccion']:22} {r['nombre']}")
+
+    return 1 if any(r.get("collscan") or "error" in r for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
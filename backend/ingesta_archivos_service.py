@@ -0,0 +1,216 @@
+"""Ingesta de archivos subidos: una sola pasada a disco con hash, límite y tipo real
+
+Antes cada archivo se escribía a disco (download_to_drive en el bot,
+shutil.copyfileobj en la web) y después se volvía a leer completo para
+calcular el SHA-256; el tipo se adivinaba por la extensión del nombre.
+
+IngestaArchivosService escribe el archivo por bloques y en la misma pasada:
+- calcula el SHA-256,
+- corta la transferencia si pasa de INGESTA_MAX_MB (ArchivoDemasiadoGrande)
+  y borra lo escrito,
+- detecta el tipo por los primeros bytes (firma), no por la extensión.
+  Los documentos de Office (.docx, .xlsx, .odt...) tienen la firma de un ZIP:
+  solo se toman como ZIP con extensión .zip o si no tienen el manifiesto de
+  Office ([Content_Types].xml / mimetype).
+
+Devuelve un ArchivoIngerido (ruta, tamaño, sha256, mime_type) que las etapas
+siguientes (duplicados, OCR, ZIP) usan sin volver a leer el archivo para
+calcular el hash o el tipo. El archivo aparece en su ruta final solo
+completo: se escribe en <ruta>.parcial y se renombra al terminar.
+
+Variables de entorno:
+- INGESTA_MAX_MB: tamaño máximo de un archivo (default 20, el límite de descarga de la Bot API)
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import zipfile
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiohttp
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+TAMANO_BLOQUE = 64 * 1024
+BYTES_FIRMA = 16
+
+MIME_DESCONOCIDO = "application/octet-stream"
+MIME_PDF = "application/pdf"
+MIME_ZIP = "application/zip"
+
+EXTENSION_POR_MIME = {
+    MIME_PDF: ".pdf",
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/tiff": ".tiff",
+    MIME_ZIP: ".zip",
+}
+
+
+class ArchivoDemasiadoGrande(ValueError):
+    """El archivo excede el tamaño máximo de ingesta"""
+
+    def __init__(self, tamano: int, maximo: int):
+        self.tamano = tamano
+        self.maximo = maximo
+        super().__init__(f"El archivo pesa más de {maximo // (1024 * 1024)} MB")
+
+
+def detectar_mime(cabecera: bytes) -> str:
+    """Tipo del archivo según su firma (magic bytes)"""
+    if cabecera.startswith(b"%PDF-"):
+        return MIME_PDF
+    if cabecera.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if cabecera.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if cabecera.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if cabecera[:4] == b"RIFF" and cabecera[8:12] == b"WEBP":
+        return "image/webp"
+    if cabecera.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    # Local file header, ZIP vacío, ZIP partido
+    if cabecera.startswith((b"PK\x03\x04", b"PK\x05\x06", b"PK\x07\x08")):
+        return MIME_ZIP
+    return MIME_DESCONOCIDO
+
+
+# Entradas que identifican un documento de Office (OOXML / OpenDocument) dentro del ZIP
+MANIFIESTOS_OFFICE = ("[Content_Types].xml", "mimetype")
+
+
+def es_documento_office(ruta: Path) -> bool:
+    """True si el archivo con firma ZIP es en realidad un documento de Office"""
+    try:
+        with zipfile.ZipFile(ruta) as zf:
+            nombres = set(zf.namelist())
+    except (zipfile.BadZipFile, OSError):
+        # ZIP dañado: se deja como ZIP y el procesamiento del ZIP reporta el error
+        return False
+    return any(manifiesto in nombres for manifiesto in MANIFIESTOS_OFFICE)
+
+
+class ArchivoIngerido(BaseModel):
+    """Descriptor de un archivo ya escrito a disco"""
+    ruta: str
+    nombre_original: str
+    tamano: int
+    sha256: str
+    mime_type: str
+
+    @property
+    def es_zip(self) -> bool:
+        return self.mime_type == MIME_ZIP
+
+    @property
+    def es_pdf(self) -> bool:
+        return self.mime_type == MIME_PDF
+
+
+class IngestaArchivosService:
+    """Escritura por bloques con hash, límite de tamaño y detección de tipo"""
+
+    def __init__(self):
+        self.max_bytes = int(float(os.getenv('INGESTA_MAX_MB', '20')) * 1024 * 1024)
+
+    def verificar_tamano(self, tamano: Optional[int]):
+        """Rechazo anticipado cuando el tamaño se conoce antes de transferir"""
+        if tamano is not None and tamano > self.max_bytes:
+            raise ArchivoDemasiadoGrande(tamano, self.max_bytes)
+
+    async def guardar(self, bloques: AsyncIterator[bytes], destino: Path,
+                      nombre_original: str) -> ArchivoIngerido:
+        """
+        Escribe los bloques en destino calculando hash, tamaño y tipo.
+
+        Raises:
+            ArchivoDemasiadoGrande: al pasar del máximo (no queda nada en disco)
+        """
+        destino = Path(destino)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        parcial = destino.with_name(destino.name + ".parcial")
+
+        sha256 = hashlib.sha256()
+        cabecera = b""
+        tamano = 0
+        archivo = await asyncio.to_thread(open, parcial, "wb")
+        try:
+            async for bloque in bloques:
+                if not bloque:
+                    continue
+                tamano += len(bloque)
+                if tamano > self.max_bytes:
+                    raise ArchivoDemasiadoGrande(tamano, self.max_bytes)
+                if len(cabecera) < BYTES_FIRMA:
+                    cabecera += bloque[:BYTES_FIRMA - len(cabecera)]
+                sha256.update(bloque)
+                await asyncio.to_thread(archivo.write, bloque)
+            await asyncio.to_thread(archivo.close)
+            await asyncio.to_thread(os.replace, parcial, destino)
+        except BaseException:
+            archivo.close()
+            parcial.unlink(missing_ok=True)
+            raise
+
+        mime_type = detectar_mime(cabecera)
+        if (mime_type == MIME_ZIP and not nombre_original.lower().endswith(".zip")
+                and await asyncio.to_thread(es_documento_office, destino)):
+            mime_type = MIME_DESCONOCIDO
+
+        ingerido = ArchivoIngerido(
+            ruta=str(destino),
+            nombre_original=nombre_original,
+            tamano=tamano,
+            sha256=sha256.hexdigest(),
+            mime_type=mime_type,
+        )
+        logger.info(f"[Ingesta] {nombre_original}: {tamano} bytes, {ingerido.mime_type}, "
+                    f"sha256 {ingerido.sha256[:16]}...")
+        return ingerido
+
+    async def desde_upload(self, upload, destino: Path) -> ArchivoIngerido:
+        """Archivo subido a FastAPI (UploadFile)"""
+        self.verificar_tamano(getattr(upload, "size", None))
+
+        async def bloques():
+            while bloque := await upload.read(TAMANO_BLOQUE):
+                yield bloque
+
+        return await self.guardar(bloques(), destino, upload.filename or Path(destino).name)
+
+    async def desde_telegram(self, archivo_tg, destino: Path, nombre_original: str) -> ArchivoIngerido:
+        """
+        Archivo de Telegram (telegram.File de get_file()).
+
+        Con la Bot API en la nube file_path es la URL de descarga y se transfiere
+        por bloques; con un servidor Bot API local es una ruta en disco.
+        """
+        self.verificar_tamano(archivo_tg.file_size)
+        file_path = archivo_tg.file_path or ""
+
+        if file_path.startswith(("http://", "https://")):
+            async with aiohttp.ClientSession() as sesion:
+                async with sesion.get(file_path) as respuesta:
+                    respuesta.raise_for_status()
+                    self.verificar_tamano(respuesta.content_length)
+                    return await self.guardar(
+                        respuesta.content.iter_chunked(TAMANO_BLOQUE), destino, nombre_original
+                    )
+
+        async def bloques_locales():
+            with open(file_path, "rb") as origen:
+                while bloque := await asyncio.to_thread(origen.read, TAMANO_BLOQUE):
+                    yield bloque
+
+        return await self.guardar(bloques_locales(), destino, nombre_original)
+
+
+# Instancia global del servicio
+ingesta_archivos_service = IngestaArchivosService()
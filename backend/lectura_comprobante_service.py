@@ -0,0 +1,157 @@
+"""Lectura escalonada de comprobantes: capa de texto local antes que el LLM
+
+La mayoría de los comprobantes de bancos digitales (ALBO, ESPIRAL/Fondeadora...)
+son PDFs con capa de texto completa. Leerlos con Gemini Vision cuesta varios
+segundos por archivo en el flujo de Telegram, cuando el texto ya está ahí.
+
+Niveles:
+1. texto_local: texto del PDF (texto_extraido_cache_service) + parser del banco
+   (BancoParserFactory). Se acepta solo si OCRConfidenceValidator lo considera
+   confiable y la CLABE activa aparece completa en contexto de destino.
+2. llm: ocr_service.leer_comprobante (Gemini Vision, con su propio caché).
+
+El resultado tiene el mismo formato que ocr_service.leer_comprobante y registra
+el nivel que lo produjo en "nivel_extraccion" (y, si hubo fallback, el motivo
+en "motivo_fallback_local").
+"""
+
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from banco_specific_parsers import BancoParserFactory
+from ocr_confidence_validator import ocr_confidence_validator
+from texto_extraido_cache_service import texto_extraido_cache_service
+from validador_comprobantes_service import ValidadorComprobantes
+
+logger = logging.getLogger(__name__)
+
+NIVEL_TEXTO_LOCAL = "texto_local"
+NIVEL_LLM = "llm"
+
+
+class LecturaComprobanteService:
+    """Lee comprobantes con la capa de texto local y recurre al LLM solo si hace falta"""
+
+    def __init__(self):
+        self.habilitado = os.getenv('LECTURA_LOCAL_HABILITADA', 'true').lower() != 'false'
+        self.validador = ValidadorComprobantes()
+
+        self.estadisticas = {
+            NIVEL_TEXTO_LOCAL: 0,
+            NIVEL_LLM: 0,
+            "motivos_fallback": {}
+        }
+
+    async def leer_comprobante(self, archivo_path: str, mime_type: str, cuenta_activa: Dict,
+                               file_hash: Optional[str] = None,
+                               ignorar_cache: bool = False) -> Dict[str, Any]:
+        """
+        Lee un comprobante probando primero la capa de texto local.
+
+        Args:
+            archivo_path: Ruta al archivo del comprobante
+            mime_type: Tipo MIME del archivo
+            cuenta_activa: Cuenta de depósito activa (para confirmar la CLABE destino)
+            file_hash: Hash SHA-256 ya calculado por el llamador
+            ignorar_cache: Se pasa al OCR con LLM (ej: /reocr)
+
+        Returns:
+            Datos del comprobante en el formato de ocr_service.leer_comprobante
+            más "nivel_extraccion"
+        """
+        motivo = "lectura_local_deshabilitada"
+        if self.habilitado:
+            datos, motivo = await self._leer_texto_local(archivo_path, mime_type, cuenta_activa, file_hash)
+            if datos is not None:
+                self.estadisticas[NIVEL_TEXTO_LOCAL] += 1
+                logger.info(f"[Lectura] ✅ Comprobante leído con texto local ({datos['banco_emisor']}): {archivo_path}")
+                return datos
+
+        logger.info(f"[Lectura] Usando LLM para {archivo_path} (motivo: {motivo})")
+        self.estadisticas[NIVEL_LLM] += 1
+        motivos = self.estadisticas["motivos_fallback"]
+        motivos[motivo] = motivos.get(motivo, 0) + 1
+
+        datos = await self._leer_con_llm(archivo_path, mime_type, file_hash, ignorar_cache)
+        datos["nivel_extraccion"] = NIVEL_LLM
+        datos["motivo_fallback_local"] = motivo
+        return datos
+
+    async def _leer_con_llm(self, archivo_path: str, mime_type: str,
+                            file_hash: Optional[str], ignorar_cache: bool) -> Dict[str, Any]:
+        from ocr_service import ocr_service
+        return await ocr_service.leer_comprobante(
+            archivo_path, mime_type, file_hash=file_hash, ignorar_cache=ignorar_cache
+        )
+
+    async def _leer_texto_local(self, archivo_path: str, mime_type: str, cuenta_activa: Dict,
+                                file_hash: Optional[str]) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Intenta leer el comprobante sin LLM.
+
+        Returns:
+            (datos, motivo): datos es None si el resultado local no es confiable,
+            en cuyo caso motivo explica por qué
+        """
+        if mime_type != "application/pdf" and not str(archivo_path).lower().endswith(".pdf"):
+            return None, "no_es_pdf"
+
+        try:
+            entrada = await texto_extraido_cache_service.extraer_pdf_async(archivo_path, file_hash=file_hash)
+        except Exception as e:
+            logger.warning(f"[Lectura] No se pudo extraer texto local de {archivo_path}: {str(e)}")
+            return None, "error_extraccion"
+
+        paginas = [p for p in entrada["paginas"] if p.strip()]
+        # Estados de cuenta / lotes: el parser solo toma el primer monto
+        if len(paginas) > 1:
+            return None, "multiples_paginas"
+        texto = "\n".join(paginas)
+
+        datos_parser = BancoParserFactory.parsear_comprobante(texto) if texto else {}
+        if not datos_parser or datos_parser.get("requiere_parser_especifico"):
+            return None, "sin_parser_especifico"
+        if datos_parser.get("error"):
+            return None, datos_parser["error"]
+
+        es_confiable, motivo_fallo, advertencias = ocr_confidence_validator.validar_confianza_ocr({
+            **datos_parser,
+            "texto_completo": texto,
+            "banco_ordenante": datos_parser.get("banco") or ""
+        })
+        if not es_confiable:
+            return None, motivo_fallo
+
+        # La validez del comprobante depende de la CLABE destino: solo se acepta
+        # el nivel local si aparece completa; enmascarada o ausente la lee el LLM
+        clabe_activa = cuenta_activa.get("clabe", "")
+        encontrada, metodo = self.validador.buscar_clabe_en_texto(texto, clabe_activa)
+        if not (encontrada and metodo == "completa"):
+            return None, "clabe_no_confirmada"
+
+        return {
+            "monto": datos_parser["monto_detectado"],
+            "banco_emisor": datos_parser.get("banco") or entrada.get("banco_detectado"),
+            "cuenta_beneficiaria": clabe_activa,
+            "nombre_beneficiario": datos_parser.get("beneficiario_reportado"),
+            "clave_rastreo": None,
+            "fecha": None,
+            "referencia": None,
+            "transacciones_multiples": False,
+            "cantidad_transacciones": 1,
+            "nivel_extraccion": NIVEL_TEXTO_LOCAL,
+            "advertencias_locales": advertencias
+        }, None
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """Lecturas por nivel y motivos de fallback al LLM"""
+        total = self.estadisticas[NIVEL_TEXTO_LOCAL] + self.estadisticas[NIVEL_LLM]
+        return {
+            **self.estadisticas,
+            "porcentaje_local": round(self.estadisticas[NIVEL_TEXTO_LOCAL] / total, 4) if total else 0.0
+        }
+
+
+# Instancia global del servicio
+lectura_comprobante_service = LecturaComprobanteService()
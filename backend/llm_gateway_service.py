@@ -0,0 +1,290 @@
+"""Gateway de llamadas al LLM (Gemini) con límites, reintentos y circuit breaker
+
+Sin este gateway cada carga de comprobante llamaba al proveedor sin timeout ni
+límite: cuando el proveedor se degradaba, todas las cargas de Telegram y Web se
+acumulaban detrás y terminaban con "Error al procesar comprobante".
+
+Cada llamada pasa por:
+1. Circuit breaker: si el proveedor está degradado se rechaza de inmediato
+   (LLMNoDisponible) y el llamador manda el comprobante a captura manual
+2. Token bucket: máximo LLM_RATE_POR_SEG llamadas/seg con ráfaga LLM_RAFAGA
+3. Semáforo global: máximo LLM_MAX_CONCURRENCIA llamadas en vuelo
+4. Timeout por intento y deadline total por llamada
+5. Reintentos con backoff exponencial + jitter solo en errores transitorios
+
+Métricas en obtener_metricas() (expuestas en GET /api/llm/metricas).
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CIRCUITO_CERRADO = "cerrado"
+CIRCUITO_ABIERTO = "abierto"
+CIRCUITO_SEMI_ABIERTO = "semi_abierto"
+
+# Fragmentos de mensajes de error del proveedor que indican una falla transitoria
+PATRONES_TRANSITORIOS = (
+    "429", "500", "502", "503", "504", "rate limit", "resource_exhausted", "overloaded",
+    "unavailable", "timeout", "timed out", "deadline", "connection", "temporarily"
+)
+
+
+class LLMNoDisponible(Exception):
+    """El LLM no está disponible (circuito abierto o deadline agotado)"""
+
+
+def es_error_transitorio(error: BaseException) -> bool:
+    """True si vale la pena reintentar (timeouts, red, 429/5xx del proveedor)"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    mensaje = str(error).lower()
+    return any(patron in mensaje for patron in PATRONES_TRANSITORIOS)
+
+
+class TokenBucket:
+    """Limitador de tasa: `tasa` tokens por segundo con capacidad `capacidad`"""
+
+    def __init__(self, tasa: float, capacidad: int):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._tokens = float(capacidad)
+        self._ultimo = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+
+    def _obtener_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    async def adquirir(self) -> float:
+        """Espera hasta obtener un token. Regresa los segundos esperados."""
+        if self.tasa <= 0:
+            return 0.0
+        esperado = 0.0
+        async with self._obtener_lock():
+            self._recargar()
+            while self._tokens < 1:
+                espera = (1 - self._tokens) / self.tasa
+                await asyncio.sleep(espera)
+                esperado += espera
+                self._recargar()
+            self._tokens -= 1
+        return esperado
+
+
+class CircuitBreaker:
+    """Abre el circuito tras N fallas transitorias seguidas; prueba de nuevo tras el enfriamiento"""
+
+    def __init__(self, umbral_fallos: int, enfriamiento_seg: float):
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento_seg = enfriamiento_seg
+        self.estado = CIRCUITO_CERRADO
+        self.fallos_consecutivos = 0
+        self.abierto_desde: Optional[float] = None
+        self.aperturas = 0
+        self._prueba_en_curso = False
+
+    def permitir(self) -> bool:
+        if self.estado == CIRCUITO_CERRADO:
+            return True
+        if self.estado == CIRCUITO_ABIERTO:
+            if time.monotonic() - self.abierto_desde < self.enfriamiento_seg:
+                return False
+            self.estado = CIRCUITO_SEMI_ABIERTO
+            logger.info("[LLM-Gateway] Circuito semi-abierto: probando proveedor")
+        # Semi-abierto: una sola llamada de prueba a la vez
+        if self._prueba_en_curso:
+            return False
+        self._prueba_en_curso = True
+        return True
+
+    def registrar_exito(self):
+        if self.estado != CIRCUITO_CERRADO:
+            logger.info("[LLM-Gateway] ✅ Circuito cerrado: proveedor recuperado")
+        self.estado = CIRCUITO_CERRADO
+        self.fallos_consecutivos = 0
+        self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        self.fallos_consecutivos += 1
+        self._prueba_en_curso = False
+        if self.estado == CIRCUITO_SEMI_ABIERTO or self.fallos_consecutivos >= self.umbral_fallos:
+            if self.estado != CIRCUITO_ABIERTO:
+                self.aperturas += 1
+                logger.error(f"[LLM-Gateway] ❌ Circuito abierto tras {self.fallos_consecutivos} falla(s); "
+                             f"captura manual por {self.enfriamiento_seg:.0f}s")
+            self.estado = CIRCUITO_ABIERTO
+            self.abierto_desde = time.monotonic()
+
+    def liberar_prueba(self):
+        """La llamada de prueba terminó sin veredicto sobre el proveedor (ej: error no transitorio)"""
+        self._prueba_en_curso = False
+
+
+class LLMGateway:
+    """Punto único de salida hacia el LLM"""
+
+    def __init__(self):
+        self.max_concurrencia = int(os.getenv('LLM_MAX_CONCURRENCIA', '4'))
+        self.timeout_seg = float(os.getenv('LLM_TIMEOUT_SEG', '45'))
+        self.deadline_seg = float(os.getenv('LLM_DEADLINE_SEG', '120'))
+        self.max_reintentos = int(os.getenv('LLM_MAX_REINTENTOS', '2'))
+        self.backoff_base_seg = float(os.getenv('LLM_BACKOFF_BASE_SEG', '1'))
+
+        self.token_bucket = TokenBucket(
+            tasa=float(os.getenv('LLM_RATE_POR_SEG', '2')),
+            capacidad=int(os.getenv('LLM_RAFAGA', '4'))
+        )
+        self.circuito = CircuitBreaker(
+            umbral_fallos=int(os.getenv('LLM_CB_UMBRAL_FALLOS', '5')),
+            enfriamiento_seg=float(os.getenv('LLM_CB_ENFRIAMIENTO_SEG', '60'))
+        )
+
+        self._semaforo: Optional[asyncio.Semaphore] = None
+        self._semaforo_loop = None
+        self._latencias = deque(maxlen=500)
+        self.metricas = {
+            "llamadas": 0,
+            "exitos": 0,
+            "fallos": 0,
+            "reintentos": 0,
+            "timeouts": 0,
+            "rechazos_circuito": 0,
+            "en_vuelo": 0,
+            "espera_rate_limit_seg": 0.0
+        }
+
+    def _obtener_semaforo(self) -> asyncio.Semaphore:
+        # El semáforo queda ligado al loop donde se usa por primera vez
+        loop = asyncio.get_running_loop()
+        if self._semaforo is None or self._semaforo_loop is not loop:
+            self._semaforo = asyncio.Semaphore(self.max_concurrencia)
+            self._semaforo_loop = loop
+        return self._semaforo
+
+    def _backoff(self, intento: int) -> float:
+        base = self.backoff_base_seg * (2 ** intento)
+        return base + random.uniform(0, base / 2)
+
+    async def ejecutar(self, llamada: Callable[[], Awaitable[T]], nombre: str = "llm",
+                       deadline_seg: Optional[float] = None) -> T:
+        """
+        Ejecuta una llamada al LLM con todas las protecciones.
+
+        Args:
+            llamada: Fábrica de la corrutina (se invoca de nuevo en cada reintento)
+            nombre: Etiqueta para logs
+            deadline_seg: Tiempo total máximo incluyendo reintentos y esperas
+
+        Raises:
+            LLMNoDisponible si el circuito está abierto o se agotó el deadline;
+            errores no transitorios (y el último transitorio) se propagan tal cual
+        """
+        self.metricas["llamadas"] += 1
+        limite = time.monotonic() + (deadline_seg or self.deadline_seg)
+        intento = 0
+
+        while True:
+            if not self.circuito.permitir():
+                self.metricas["rechazos_circuito"] += 1
+                raise LLMNoDisponible(f"Proveedor LLM degradado (circuito {self.circuito.estado})")
+
+            error = None
+            try:
+                self.metricas["espera_rate_limit_seg"] += await self.token_bucket.adquirir()
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self.circuito.liberar_prueba()
+                    raise LLMNoDisponible(f"Deadline agotado para {nombre}")
+
+                async with self._obtener_semaforo():
+                    self.metricas["en_vuelo"] += 1
+                    inicio = time.monotonic()
+                    try:
+                        resultado = await asyncio.wait_for(llamada(), timeout=min(self.timeout_seg, restante))
+                    finally:
+                        self.metricas["en_vuelo"] -= 1
+                        self._latencias.append(time.monotonic() - inicio)
+            except LLMNoDisponible:
+                raise
+            except asyncio.CancelledError:
+                self.circuito.liberar_prueba()
+                raise
+            except Exception as e:
+                error = e
+
+            if error is None:
+                self.circuito.registrar_exito()
+                self.metricas["exitos"] += 1
+                return resultado
+
+            if isinstance(error, asyncio.TimeoutError):
+                self.metricas["timeouts"] += 1
+
+            if not es_error_transitorio(error):
+                # Respuesta inválida / error del llamador: no dice nada del proveedor
+                self.circuito.liberar_prueba()
+                self.metricas["fallos"] += 1
+                raise error
+
+            self.circuito.registrar_fallo()
+            espera = self._backoff(intento)
+            if intento >= self.max_reintentos or time.monotonic() + espera >= limite:
+                self.metricas["fallos"] += 1
+                logger.error(f"[LLM-Gateway] {nombre} falló tras {intento + 1} intento(s): {str(error) or type(error).__name__}")
+                raise error
+
+            intento += 1
+            self.metricas["reintentos"] += 1
+            logger.warning(f"[LLM-Gateway] {nombre}: error transitorio ({str(error) or type(error).__name__}), "
+                           f"reintento {intento} en {espera:.1f}s")
+            await asyncio.sleep(espera)
+
+    def disponible(self) -> bool:
+        """False mientras el circuito está abierto (sin consumir la llamada de prueba)"""
+        return not (
+            self.circuito.estado == CIRCUITO_ABIERTO
+            and time.monotonic() - self.circuito.abierto_desde < self.circuito.enfriamiento_seg
+        )
+
+    def obtener_metricas(self) -> Dict[str, Any]:
+        """Métricas del gateway para monitoreo"""
+        latencias = sorted(self._latencias)
+
+        def _percentil(p: float) -> Optional[float]:
+            if not latencias:
+                return None
+            return round(latencias[min(int(len(latencias) * p), len(latencias) - 1)], 3)
+
+        return {
+            **self.metricas,
+            "espera_rate_limit_seg": round(self.metricas["espera_rate_limit_seg"], 3),
+            "circuito": self.circuito.estado,
+            "fallos_consecutivos": self.circuito.fallos_consecutivos,
+            "aperturas_circuito": self.circuito.aperturas,
+            "latencia_p50_seg": _percentil(0.50),
+            "latencia_p95_seg": _percentil(0.95),
+            "max_concurrencia": self.max_concurrencia
+        }
+
+
+# Instancia global del gateway
+llm_gateway = LLMGateway()
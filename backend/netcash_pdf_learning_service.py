@@ -9,19 +9,13 @@ Colección MongoDB: netcash_pdf_learning
 import logging
 from typing import Optional, Dict, List
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from uuid import uuid4
 import hashlib
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 COLLECTION_NAME = 'netcash_pdf_learning'
 
 
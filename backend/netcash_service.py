@@ -18,17 +18,18 @@ Reglas Duras (Etapa 1):
 5. Comprobante válido (CLABE completa + beneficiario de cuenta concertadora activa)
 """
 
+import asyncio
 import logging
 import re
-from typing import Optional, Dict, List, Tuple
+from typing import Any, Awaitable, Callable, Optional, Dict, List, Tuple
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from decimal import Decimal
 
 # Servicios de OCR mejorado
 from banco_specific_parsers import banco_parser_factory
 from ocr_confidence_validator import ocr_confidence_validator
+from lectura_comprobante_service import lectura_comprobante_service
 
 # Servicio de aprendizaje (P2)
 from netcash_pdf_learning_service import netcash_pdf_learning_service
@@ -40,84 +41,89 @@ from netcash_models import (
 )
 from cuenta_deposito_service import cuenta_deposito_service
 from validador_comprobantes_service import ValidadorComprobantes
+from pymongo import ReturnDocument, UpdateOne
 
-logger = logging.getLogger(__name__)
+from database import db
+from comprobante_fingerprints_service import comprobante_fingerprints_service, ambito_telegram, TIPO_HASH
+from comprobante_ocr_raw_service import comprobante_ocr_raw_service
+from operaciones_stats_service import operaciones_stats_service
+from folio_mbco_service import folio_mbco_service
+from ingesta_archivos_service import MIME_DESCONOCIDO, ArchivoIngerido
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
+logger = logging.getLogger(__name__)
 
 COLLECTION_NAME = 'solicitudes_netcash'
 
+# Aviso de etapa terminada al procesar comprobantes: progreso(etapa, datos)
+Progreso = Callable[[str, Dict[str, Any]], Awaitable[Any]]
 
-class NetCashService:
-    """Servicio central para gestión de solicitudes NetCash"""
+
+class UnidadDeTrabajo:
+    """
+    Cambios de una operación lógica sobre solicitudes, escritos juntos al confirmar.
     
-    def __init__(self):
-        self.validador_comprobantes = ValidadorComprobantes()
+    Cada etapa (validación, totales, cambio de estado, histórico) agrega sus
+    $set / $push aquí en lugar de escribir por su cuenta. confirmar() emite un
+    solo update por solicitud con los operadores combinados: find_one_and_update
+    con la post-imagen si se pide el documento, bulk_write si hay varias
+    solicitudes. Un $set posterior sobre el mismo campo reemplaza al anterior.
+    """
+    
+    def __init__(self, coleccion: str = COLLECTION_NAME):
+        self.coleccion = coleccion
+        self._cambios: Dict[str, Dict[str, Dict]] = {}
+    
+    def _de(self, solicitud_id: str) -> Dict[str, Dict]:
+        return self._cambios.setdefault(solicitud_id, {"$set": {}, "$push": {}})
     
-    async def _generar_folio_mbco(self) -> str:
+    def set(self, solicitud_id: str, campos: Dict):
+        self._de(solicitud_id)["$set"].update(campos)
+    
+    def push(self, solicitud_id: str, campo: str, *valores):
+        cambios = self._de(solicitud_id)["$push"]
+        cambios.setdefault(campo, {"$each": []})["$each"].extend(valores)
+    
+    @property
+    def vacia(self) -> bool:
+        return not self._cambios
+    
+    async def confirmar(self, devolver_documento: bool = False, session=None) -> Optional[Dict]:
         """
-        Genera un folio secuencial para operaciones NetCash (ej: NC-000123).
-        Usa contador atómico en colección 'counters' para garantizar secuencia única.
-        No reutiliza números de operaciones eliminadas.
+        Escribe los cambios acumulados. No vacía la unidad: dentro de una
+        transacción el callback puede reintentarse y debe escribir lo mismo.
+        
+        Returns:
+            Con devolver_documento y una sola solicitud: la solicitud después del
+            update (sin _id), o None si no existe. En otro caso None.
         """
-        try:
-            # Usar find_one_and_update atómico para incrementar el contador
-            result = await db.counters.find_one_and_update(
-                {"_id": "folio_mbco"},
-                {"$inc": {"sequence_value": 1}},
-                upsert=True,
-                return_document=True  # Retorna el documento DESPUÉS del update
+        updates = {sid: {op: c for op, c in ops.items() if c} for sid, ops in self._cambios.items()}
+        documento = None
+        if len(updates) == 1:
+            (solicitud_id, update), = updates.items()
+            if devolver_documento:
+                documento = await db[self.coleccion].find_one_and_update(
+                    {"id": solicitud_id}, update,
+                    projection={"_id": 0},
+                    return_document=ReturnDocument.AFTER,
+                    session=session
+                )
+            else:
+                await db[self.coleccion].update_one({"id": solicitud_id}, update, session=session)
+        elif updates:
+            await db[self.coleccion].bulk_write(
+                [UpdateOne({"id": sid}, update) for sid, update in updates.items()],
+                ordered=False, session=session
             )
-            
-            nuevo_numero = result["sequence_value"]
-            logger.info(f"[NetCash] Folio generado atómicamente: NC-{nuevo_numero:06d}")
-            return f"NC-{nuevo_numero:06d}"
-            
-        except Exception as e:
-            logger.error(f"[NetCash] Error generando folio con contador: {str(e)}")
-            # Fallback al método anterior solo si falla el contador
-            return await self._generar_folio_mbco_legacy()
+        return documento
+
+
+class NetCashService:
+    """Servicio central para gestión de solicitudes NetCash"""
     
-    async def _generar_folio_mbco_legacy(self) -> str:
-        """
-        Método legacy de generación de folio (solo como fallback).
-        DEPRECATED: No usar directamente, solo como fallback de emergencia.
-        """
-        ultimo_numero = 0
-        
-        ultima_web = await db.operaciones.find_one(
-            {"folio_mbco": {"$exists": True, "$ne": None}},
-            {"_id": 0, "folio_mbco": 1},
-            sort=[("folio_mbco", -1)]
-        )
-        
-        if ultima_web and ultima_web.get("folio_mbco"):
-            try:
-                num_web = int(ultima_web["folio_mbco"].split("-")[1])
-                ultimo_numero = max(ultimo_numero, num_web)
-            except (IndexError, ValueError):
-                pass
-        
-        ultima_telegram = await db.solicitudes_netcash.find_one(
-            {"folio_mbco": {"$exists": True, "$ne": None}},
-            {"_id": 0, "folio_mbco": 1},
-            sort=[("folio_mbco", -1)]
-        )
-        
-        if ultima_telegram and ultima_telegram.get("folio_mbco"):
-            try:
-                num_telegram = int(ultima_telegram["folio_mbco"].split("-")[1])
-                ultimo_numero = max(ultimo_numero, num_telegram)
-            except (IndexError, ValueError):
-                pass
-        
-        nuevo_numero = ultimo_numero + 1
-        logger.warning(f"[NetCash] Usando método legacy para folio: NC-{nuevo_numero:06d}")
-        return f"NC-{nuevo_numero:06d}"
+    def __init__(self):
+        self.validador_comprobantes = ValidadorComprobantes()
+        # OCR simultáneos al procesar un ZIP
+        self.zip_ocr_concurrencia = int(os.getenv('ZIP_OCR_CONCURRENCIA', '4'))
     
     # ==================== CREACIÓN Y ACTUALIZACIÓN ====================
     
@@ -141,7 +147,7 @@ class NetCashService:
             solicitud_id = f"nc-{timestamp}"
             
             # Generar folio secuencial NC-XXXXXX
-            folio_mbco = await self._generar_folio_mbco()
+            folio_mbco = await folio_mbco_service.siguiente()
             logger.info(f"[NetCash] Folio generado: {folio_mbco}")
             
             # Crear solicitud base
@@ -182,6 +188,7 @@ class NetCashService:
             }
             
             await db[COLLECTION_NAME].insert_one(solicitud)
+            operaciones_stats_service.invalidar()
             logger.info(f"[NetCash] ✅ Solicitud creada: {solicitud_id}")
             
             # Retornar sin _id
@@ -255,19 +262,40 @@ class NetCashService:
             - Si es válido: (True, None)
             - Si es inválido: (True, None) (se agrega pero marcado como inválido)
         """
+        agregado, razon, _ = await self.agregar_comprobante_detallado(solicitud_id, archivo_url, nombre_archivo)
+        return agregado, razon
+    
+    async def agregar_comprobante_detallado(self, solicitud_id: str, archivo_url: str,
+                                            nombre_archivo: str,
+                                            progreso: Optional[Progreso] = None,
+                                            archivo: Optional[ArchivoIngerido] = None) -> Tuple[bool, Optional[str], Optional[Dict]]:
+        """
+        Igual que agregar_comprobante, devolviendo además la solicitud tal como quedó
+        (post-imagen de la escritura), para no volver a leerla.
+        
+        Args:
+            progreso: callback opcional por etapa terminada: "hash", "ocr", "validado"
+            archivo: descriptor de la ingesta (hash y tipo ya calculados al descargar)
+        
+        Returns:
+            Tupla (agregado, razon, solicitud o None si no se escribió)
+        """
         try:
             logger.info(f"[NetCash] Agregando comprobante a {solicitud_id}: {nombre_archivo}")
             
-            # PASO 1: Calcular hash SHA-256 del archivo
-            import hashlib
-            file_hash = self._calcular_hash_archivo(archivo_url)
+            # PASO 1: Hash SHA-256 del archivo (de la ingesta, o leyéndolo fuera del event loop)
+            if archivo is not None:
+                file_hash = archivo.sha256
+            else:
+                file_hash = await asyncio.to_thread(self._calcular_hash_archivo, archivo_url)
             logger.info(f"[NetCash] Hash del archivo: {file_hash}")
+            await self._avisar_progreso(progreso, "hash")
             
             # PASO 2: Obtener solicitud actual
             solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id}, {"_id": 0})
             if not solicitud:
                 logger.error(f"[NetCash] Solicitud {solicitud_id} no encontrada")
-                return False, "solicitud_no_encontrada"
+                return False, "solicitud_no_encontrada", None
             
             cliente_id = solicitud.get("cliente_id")
             comprobantes_existentes = solicitud.get("comprobantes", [])
@@ -275,101 +303,28 @@ class NetCashService:
             # PASO 2A: Verificar duplicado LOCAL (dentro de la misma operación)
             for comp in comprobantes_existentes:
                 if comp.get("archivo_hash") == file_hash:
-                    logger.warning(f"[NetCash] ⚠️ COMPROBANTE DUPLICADO LOCAL detectado: {nombre_archivo}")
-                    logger.warning(f"[NetCash] Hash duplicado: {file_hash}")
-                    logger.warning(f"[NetCash] Original: {comp.get('nombre_archivo')}")
-                    
-                    # Agregar el comprobante pero marcado como duplicado local
-                    comprobante_duplicado = {
-                        "archivo_url": archivo_url,
-                        "nombre_archivo": nombre_archivo,
-                        "archivo_hash": file_hash,
-                        "es_valido": False,
-                        "es_duplicado": True,
-                        "tipo_duplicado": "local",
-                        "duplicado_de": comp.get("nombre_archivo"),
-                        "validacion_detalle": {
-                            "razon": f"Comprobante duplicado de '{comp.get('nombre_archivo')}' en esta operación",
-                        },
-                        "cuenta_detectada": None,
-                        "monto_detectado": None
-                    }
-                    
-                    await db[COLLECTION_NAME].update_one(
-                        {"id": solicitud_id},
-                        {
-                            "$push": {"comprobantes": comprobante_duplicado},
-                            "$set": {"updated_at": datetime.now(timezone.utc)}
-                        }
+                    comprobante_duplicado = self._comprobante_duplicado_local(
+                        archivo_url, nombre_archivo, file_hash, comp
                     )
-                    
-                    return False, "duplicado_local"
+                    actualizada = await self._push_comprobantes(
+                        solicitud_id, [comprobante_duplicado], devolver_solicitud=True
+                    )
+                    await self._avisar_progreso(progreso, "validado", duplicado=True)
+                    return False, "duplicado_local", actualizada
             
             # PASO 2B: Verificar duplicado GLOBAL (en otras operaciones del mismo cliente)
-            # Buscar si este hash ya existe en otras solicitudes del cliente
-            # Excluir estados: rechazada, demo, cancelada (permiten reutilizar comprobante)
-            estados_que_bloquean_duplicados = [
-                "comprobantes_recibidos",  # Operación activa recibiendo comprobantes
-                "lista_para_mbc",          # Operación lista para procesar
-                "en_proceso_mbc",           # Operación en proceso
-                "completada",               # Operación completada
-                "borrador"                  # Operación en borrador
-            ]
-            
-            otras_solicitudes = await db[COLLECTION_NAME].find(
-                {
-                    "cliente_id": cliente_id,
-                    "id": {"$ne": solicitud_id},  # Excluir la solicitud actual
-                    "estado": {"$in": estados_que_bloquean_duplicados},
-                    "comprobantes.archivo_hash": file_hash  # Buscar por hash en array
-                },
-                {"_id": 0, "id": 1, "folio_mbco": 1, "estado": 1, "comprobantes": 1}
-            ).to_list(10)
-            
-            if otras_solicitudes:
-                # Encontrado en otra operación
-                solicitud_original = otras_solicitudes[0]
-                folio_original = solicitud_original.get("folio_mbco", "Sin folio")
-                id_original = solicitud_original.get("id")
-                
-                # Buscar el comprobante específico con ese hash
-                nombre_original = None
-                for comp in solicitud_original.get("comprobantes", []):
-                    if comp.get("archivo_hash") == file_hash:
-                        nombre_original = comp.get("nombre_archivo")
-                        break
-                
-                logger.warning(f"[NetCash] ⚠️ COMPROBANTE DUPLICADO GLOBAL detectado: {nombre_archivo}")
-                logger.warning(f"[NetCash] Ya usado en operación: {folio_original} (ID: {id_original})")
-                logger.warning(f"[NetCash] Archivo original: {nombre_original}")
-                
-                # Agregar el comprobante pero marcado como duplicado global
-                comprobante_duplicado_global = {
-                    "archivo_url": archivo_url,
-                    "nombre_archivo": nombre_archivo,
-                    "archivo_hash": file_hash,
-                    "es_valido": False,
-                    "es_duplicado": True,
-                    "tipo_duplicado": "global",
-                    "operacion_original": folio_original,
-                    "id_solicitud_original": id_original,
-                    "duplicado_de": nombre_original,
-                    "validacion_detalle": {
-                        "razon": f"Comprobante ya utilizado en operación {folio_original}",
-                    },
-                    "cuenta_detectada": None,
-                    "monto_detectado": None
-                }
-                
-                await db[COLLECTION_NAME].update_one(
-                    {"id": solicitud_id},
-                    {
-                        "$push": {"comprobantes": comprobante_duplicado_global},
-                        "$set": {"updated_at": datetime.now(timezone.utc)}
-                    }
+            duplicados_globales = await self._buscar_duplicados_globales(cliente_id, solicitud_id, [file_hash])
+            
+            if file_hash in duplicados_globales:
+                original = duplicados_globales[file_hash]
+                comprobante_duplicado_global = self._comprobante_duplicado_global(
+                    archivo_url, nombre_archivo, file_hash, original
                 )
-                
-                return False, f"duplicado_global:{folio_original}"
+                actualizada = await self._push_comprobantes(
+                    solicitud_id, [comprobante_duplicado_global], devolver_solicitud=True
+                )
+                await self._avisar_progreso(progreso, "validado", duplicado=True)
+                return False, f"duplicado_global:{original['folio_mbco']}", actualizada
             
             # PASO 3: No es duplicado, procesar normalmente
             logger.info(f"[NetCash] Comprobante único, procesando validación...")
@@ -379,301 +334,469 @@ class NetCashService:
             
             if not cuenta_activa:
                 logger.error(f"[NetCash] No hay cuenta concertadora activa")
-                return False, "sin_cuenta_activa"
+                return False, "sin_cuenta_activa", None
             
-            # Determinar MIME type
-            mime_type = "application/pdf" if archivo_url.lower().endswith(".pdf") else "image/jpeg"
-            if archivo_url.lower().endswith(".png"):
-                mime_type = "image/png"
+            # El tipo detectado por la firma en la ingesta; sin descriptor, por extensión
+            tipo = {"mime_type": archivo.mime_type} if archivo is not None else {}
+            comprobante_detalle = await self._analizar_comprobante_ocr(
+                archivo_url, nombre_archivo, file_hash, cuenta_activa, **tipo
+            )
+            await self._avisar_progreso(progreso, "ocr")
             
-            # LOG EXPLÍCITO - Para correlacionar con logs del validador
-            logger.info(f"[NC TELEGRAM] Procesando comprobante: {nombre_archivo}")
-            logger.info(f"[NC TELEGRAM] Cuenta activa: banco={cuenta_activa.get('banco')} clabe={cuenta_activa.get('clabe')}")
+            # Agregar a la solicitud
+            actualizada = await self._push_comprobantes(
+                solicitud_id,
+                [comprobante_detalle],
+                self._campos_update_comprobante(comprobante_detalle, es_primero=len(comprobantes_existentes) == 0),
+                cliente_id=cliente_id,
+                devolver_solicitud=True
+            )
             
-            # ⭐ UNIFICADO: Usar el mismo OCR de Web (Gemini Vision) para Telegram
-            from ocr_service import ocr_service
+            await self._avisar_progreso(progreso, "validado", valido=comprobante_detalle["es_valido"])
             
-            logger.info(f"[NetCash-OCR] Usando OCR unificado (Gemini Vision)...")
-            datos_ocr = await ocr_service.leer_comprobante(archivo_url, mime_type)
+            ocr_data = comprobante_detalle["ocr_data"]
+            logger.info(f"[NetCash] ✅ Comprobante agregado: válido={comprobante_detalle['es_valido']}, monto={comprobante_detalle['monto_detectado']}, ocr_confiable={ocr_data['es_confiable']}")
             
-            # ⭐ DEBUG: Mostrar datos crudos del OCR
-            logger.info(f"[NetCash-OCR] 📊 Datos crudos OCR: monto={datos_ocr.get('monto')}, tipo_monto={type(datos_ocr.get('monto'))}")
-            logger.info(f"[NetCash-OCR] 📊 Banco={datos_ocr.get('banco_emisor')}, Cuenta={datos_ocr.get('cuenta_beneficiaria')}")
+            # Retornar información adicional para que el bot pueda actuar
+            # CORREGIDO: Activar captura manual siempre que OCR no sea confiable (no solo en primer comprobante)
+            return True, self._razon_retorno(comprobante_detalle), actualizada
             
-            # Verificar si hubo error en OCR
-            if datos_ocr.get("error"):
-                logger.warning(f"[NetCash-OCR] Error en OCR: {datos_ocr.get('error')}")
-                es_confiable = False
-                motivo_fallo = "error_ocr"
-                advertencias = [datos_ocr.get("error")]
+        except Exception as e:
+            logger.error(f"[NetCash] Error agregando comprobante: {str(e)}")
+            return False, "error", None
+    
+    # ==================== ETAPAS DE AGREGAR COMPROBANTE ====================
+    # Compartidas por agregar_comprobante (un archivo) y procesar_archivo_zip (lote)
+    
+    async def _avisar_progreso(self, progreso: Optional[Progreso], etapa: str, **datos):
+        """Avisa una etapa terminada; un fallo del aviso no interrumpe el procesamiento"""
+        if progreso is None:
+            return
+        try:
+            await progreso(etapa, datos)
+        except Exception as e:
+            logger.warning(f"[NetCash] No se pudo avisar progreso '{etapa}': {str(e)}")
+    
+    # Excluir estados: rechazada, demo, cancelada (permiten reutilizar comprobante)
+    ESTADOS_QUE_BLOQUEAN_DUPLICADOS = [
+        "comprobantes_recibidos",  # Operación activa recibiendo comprobantes
+        "lista_para_mbc",          # Operación lista para procesar
+        "en_proceso_mbc",           # Operación en proceso
+        "completada",               # Operación completada
+        "borrador"                  # Operación en borrador
+    ]
+    
+    def _comprobante_duplicado_local(self, archivo_url: str, nombre_archivo: str,
+                                     file_hash: str, comp_original: Dict) -> Dict:
+        """Comprobante marcado como duplicado de otro en la misma operación"""
+        logger.warning(f"[NetCash] ⚠️ COMPROBANTE DUPLICADO LOCAL detectado: {nombre_archivo}")
+        logger.warning(f"[NetCash] Hash duplicado: {file_hash}")
+        logger.warning(f"[NetCash] Original: {comp_original.get('nombre_archivo')}")
+        
+        return {
+            "archivo_url": archivo_url,
+            "nombre_archivo": nombre_archivo,
+            "archivo_hash": file_hash,
+            "es_valido": False,
+            "es_duplicado": True,
+            "tipo_duplicado": "local",
+            "duplicado_de": comp_original.get("nombre_archivo"),
+            "validacion_detalle": {
+                "razon": f"Comprobante duplicado de '{comp_original.get('nombre_archivo')}' en esta operación",
+            },
+            "cuenta_detectada": None,
+            "monto_detectado": None
+        }
+    
+    def _comprobante_duplicado_global(self, archivo_url: str, nombre_archivo: str,
+                                      file_hash: str, original: Dict) -> Dict:
+        """Comprobante marcado como ya utilizado en otra operación del cliente"""
+        folio_original = original["folio_mbco"]
+        
+        logger.warning(f"[NetCash] ⚠️ COMPROBANTE DUPLICADO GLOBAL detectado: {nombre_archivo}")
+        logger.warning(f"[NetCash] Ya usado en operación: {folio_original} (ID: {original['id']})")
+        logger.warning(f"[NetCash] Archivo original: {original['nombre_archivo']}")
+        
+        return {
+            "archivo_url": archivo_url,
+            "nombre_archivo": nombre_archivo,
+            "archivo_hash": file_hash,
+            "es_valido": False,
+            "es_duplicado": True,
+            "tipo_duplicado": "global",
+            "operacion_original": folio_original,
+            "id_solicitud_original": original["id"],
+            "duplicado_de": original["nombre_archivo"],
+            "validacion_detalle": {
+                "razon": f"Comprobante ya utilizado en operación {folio_original}",
+            },
+            "cuenta_detectada": None,
+            "monto_detectado": None
+        }
+    
+    async def _buscar_duplicados_globales(self, cliente_id: str, solicitud_id: str,
+                                          hashes: List[str]) -> Dict[str, Dict]:
+        """
+        Busca qué hashes ya existen en otras solicitudes del cliente (índice comprobante_fingerprints).
+        
+        Returns:
+            Dict hash -> {"id", "folio_mbco", "nombre_archivo"} de la solicitud original
+        """
+        duplicados = await comprobante_fingerprints_service.buscar_duplicados(
+            COLLECTION_NAME,
+            ambito_telegram(cliente_id),
+            TIPO_HASH,
+            hashes,
+            excluir_operacion_id=solicitud_id,  # Excluir la solicitud actual
+            estados_bloqueo=self.ESTADOS_QUE_BLOQUEAN_DUPLICADOS
+        )
+        
+        return {
+            file_hash: {
+                "id": original["id"],
+                "folio_mbco": original.get("folio_mbco") or "Sin folio",
+                "nombre_archivo": original.get("nombre_archivo")
+            }
+            for file_hash, original in duplicados.items()
+        }
+    
+    async def _analizar_comprobante_ocr(self, archivo_url: str, nombre_archivo: str,
+                                        file_hash: str, cuenta_activa: Dict,
+                                        mime_type: Optional[str] = None) -> Dict:
+        """
+        Lee el comprobante con OCR y construye el detalle a guardar en la solicitud.
+        No escribe en MongoDB.
+        
+        mime_type: tipo detectado por la firma del archivo; sin él se deduce de la extensión
+        """
+        if not mime_type or mime_type == MIME_DESCONOCIDO:
+            mime_type = "application/pdf" if archivo_url.lower().endswith(".pdf") else "image/jpeg"
+            if archivo_url.lower().endswith(".png"):
+                mime_type = "image/png"
+        
+        # LOG EXPLÍCITO - Para correlacionar con logs del validador
+        logger.info(f"[NC TELEGRAM] Procesando comprobante: {nombre_archivo}")
+        logger.info(f"[NC TELEGRAM] Cuenta activa: banco={cuenta_activa.get('banco')} clabe={cuenta_activa.get('clabe')}")
+        
+        # ⭐ Lectura escalonada: capa de texto local + parser del banco, Gemini Vision solo si no es confiable
+        datos_ocr = await lectura_comprobante_service.leer_comprobante(
+            archivo_url, mime_type, cuenta_activa, file_hash=file_hash
+        )
+        nivel_extraccion = datos_ocr.get("nivel_extraccion")
+        logger.info(f"[NetCash-OCR] Nivel de extracción: {nivel_extraccion}")
+        
+        # ⭐ DEBUG: Mostrar datos crudos del OCR
+        logger.info(f"[NetCash-OCR] 📊 Datos crudos OCR: monto={datos_ocr.get('monto')}, tipo_monto={type(datos_ocr.get('monto'))}")
+        logger.info(f"[NetCash-OCR] 📊 Banco={datos_ocr.get('banco_emisor')}, Cuenta={datos_ocr.get('cuenta_beneficiaria')}")
+        
+        # Verificar si hubo error en OCR
+        if datos_ocr.get("error"):
+            logger.warning(f"[NetCash-OCR] Error en OCR: {datos_ocr.get('error')}")
+            es_confiable = False
+            # Proveedor LLM degradado (circuit breaker abierto): directo a captura manual
+            if datos_ocr.get("codigo_error") == "llm_no_disponible":
+                motivo_fallo = "ocr_no_disponible"
             else:
-                es_confiable = True
-                motivo_fallo = None
-                advertencias = []
-            
-            # Extraer datos del OCR unificado
-            monto_detectado_raw = datos_ocr.get('monto')
-            banco_detectado = datos_ocr.get('banco_emisor')
-            clave_rastreo = datos_ocr.get('clave_rastreo')
-            cuenta_beneficiaria = datos_ocr.get('cuenta_beneficiaria')
-            nombre_beneficiario = datos_ocr.get('nombre_beneficiario')
-            fecha_operacion = datos_ocr.get('fecha')
-            referencia = datos_ocr.get('referencia')
-            
-            # ⭐ NUEVO: Detectar si hay transacciones múltiples en el documento
-            tiene_multiples_transacciones = datos_ocr.get('transacciones_multiples', False)
-            cantidad_transacciones = datos_ocr.get('cantidad_transacciones', 1)
-            montos_individuales = datos_ocr.get('montos_individuales')
-            
-            if tiene_multiples_transacciones or cantidad_transacciones > 1:
-                logger.warning(f"[NetCash-OCR] ⚠️ DOCUMENTO CON MÚLTIPLES TRANSACCIONES: {cantidad_transacciones}")
-                logger.warning(f"[NetCash-OCR] ⚠️ Montos individuales: {montos_individuales}")
+                motivo_fallo = "error_ocr"
+            advertencias = [datos_ocr.get("error")]
+        else:
+            es_confiable = True
+            motivo_fallo = None
+            advertencias = []
+        
+        # Extraer datos del OCR unificado
+        monto_detectado_raw = datos_ocr.get('monto')
+        banco_detectado = datos_ocr.get('banco_emisor')
+        clave_rastreo = datos_ocr.get('clave_rastreo')
+        cuenta_beneficiaria = datos_ocr.get('cuenta_beneficiaria')
+        nombre_beneficiario = datos_ocr.get('nombre_beneficiario')
+        fecha_operacion = datos_ocr.get('fecha')
+        referencia = datos_ocr.get('referencia')
+        
+        # ⭐ NUEVO: Detectar si hay transacciones múltiples en el documento
+        tiene_multiples_transacciones = datos_ocr.get('transacciones_multiples', False)
+        cantidad_transacciones = datos_ocr.get('cantidad_transacciones', 1)
+        montos_individuales = datos_ocr.get('montos_individuales')
+        
+        if tiene_multiples_transacciones or cantidad_transacciones > 1:
+            logger.warning(f"[NetCash-OCR] ⚠️ DOCUMENTO CON MÚLTIPLES TRANSACCIONES: {cantidad_transacciones}")
+            logger.warning(f"[NetCash-OCR] ⚠️ Montos individuales: {montos_individuales}")
+            es_confiable = False
+            motivo_fallo = "transacciones_multiples"
+            advertencias.append(f"Este documento contiene {cantidad_transacciones} transacciones. Por favor indica el monto total que deseas registrar.")
+            if montos_individuales:
+                advertencias.append(f"Montos detectados: {montos_individuales}")
+        
+        # Validar y normalizar monto - detectar valores concatenados/inválidos
+        monto_detectado = None
+        if monto_detectado_raw:
+            if isinstance(monto_detectado_raw, (int, float)):
+                monto_detectado = monto_detectado_raw
+            elif isinstance(monto_detectado_raw, list):
+                # OCR devolvió múltiples valores - marcar como no confiable
+                logger.warning(f"[NetCash-OCR] ⚠️ Monto es lista (múltiples valores detectados): {monto_detectado_raw}")
                 es_confiable = False
-                motivo_fallo = "transacciones_multiples"
-                advertencias.append(f"Este documento contiene {cantidad_transacciones} transacciones. Por favor indica el monto total que deseas registrar.")
-                if montos_individuales:
-                    advertencias.append(f"Montos detectados: {montos_individuales}")
-            
-            # Validar y normalizar monto - detectar valores concatenados/inválidos
-            monto_detectado = None
-            if monto_detectado_raw:
-                if isinstance(monto_detectado_raw, (int, float)):
-                    monto_detectado = monto_detectado_raw
-                elif isinstance(monto_detectado_raw, list):
-                    # OCR devolvió múltiples valores - marcar como no confiable
-                    logger.warning(f"[NetCash-OCR] ⚠️ Monto es lista (múltiples valores detectados): {monto_detectado_raw}")
+                motivo_fallo = "monto_multiple_valores"
+                advertencias.append(f"Se detectaron múltiples montos: {monto_detectado_raw}. Requiere revisión manual.")
+                # Calcular suma si es posible
+                try:
+                    monto_detectado = sum([float(m) for m in monto_detectado_raw if m])
+                    advertencias.append(f"Suma detectada: ${monto_detectado:,.2f}")
+                except:
+                    monto_detectado = 0
+            elif isinstance(monto_detectado_raw, str):
+                # Intentar parsear - detectar si tiene múltiples valores concatenados
+                monto_str = str(monto_detectado_raw)
+                
+                # Detectar patrones de valores concatenados:
+                # - Múltiples ".00" indica valores concatenados (ej: "500,000.00,500,000.00")
+                # - Múltiples puntos decimales (ej: "500.00.500.00")
+                es_concatenado = False
+                
+                if monto_str.count('.00') > 1:
+                    es_concatenado = True
+                    logger.warning(f"[NetCash-OCR] ⚠️ Monto tiene múltiples '.00': {monto_str}")
+                elif monto_str.count('.') > 1:
+                    es_concatenado = True
+                    logger.warning(f"[NetCash-OCR] ⚠️ Monto tiene múltiples puntos decimales: {monto_str}")
+                # Detectar patrón de valores repetidos (ej: "500000500000" o "500,000500,000")
+                elif len(monto_str) > 15:
+                    # Posiblemente valores concatenados sin separador
+                    es_concatenado = True
+                    logger.warning(f"[NetCash-OCR] ⚠️ Monto demasiado largo, posible concatenación: {monto_str}")
+                
+                if es_concatenado:
                     es_confiable = False
-                    motivo_fallo = "monto_multiple_valores"
-                    advertencias.append(f"Se detectaron múltiples montos: {monto_detectado_raw}. Requiere revisión manual.")
-                    # Calcular suma si es posible
+                    motivo_fallo = "monto_concatenado"
+                    advertencias.append(f"Formato de monto detectado: {monto_str}. Parece contener múltiples valores.")
+                    # Intentar separar y sumar
                     try:
-                        monto_detectado = sum([float(m) for m in monto_detectado_raw if m])
-                        advertencias.append(f"Suma detectada: ${monto_detectado:,.2f}")
+                        partes = monto_str.replace('$', '').split(',')
+                        # Filtrar y sumar valores que parecen montos
+                        montos_parseados = []
+                        for parte in partes:
+                            parte = parte.strip()
+                            if parte and '.' in parte:
+                                try:
+                                    m = float(parte.replace(',', ''))
+                                    if m > 1000:  # Solo considerar montos razonables
+                                        montos_parseados.append(m)
+                                except:
+                                    pass
+                        if montos_parseados:
+                            monto_detectado = sum(montos_parseados)
+                            advertencias.append(f"Suma sugerida: ${monto_detectado:,.2f} ({len(montos_parseados)} montos)")
+                        else:
+                            monto_detectado = 0
                     except:
                         monto_detectado = 0
-                elif isinstance(monto_detectado_raw, str):
-                    # Intentar parsear - detectar si tiene múltiples valores concatenados
-                    monto_str = str(monto_detectado_raw)
-                    
-                    # Detectar patrones de valores concatenados:
-                    # - Múltiples ".00" indica valores concatenados (ej: "500,000.00,500,000.00")
-                    # - Múltiples puntos decimales (ej: "500.00.500.00")
-                    es_concatenado = False
-                    
-                    if monto_str.count('.00') > 1:
-                        es_concatenado = True
-                        logger.warning(f"[NetCash-OCR] ⚠️ Monto tiene múltiples '.00': {monto_str}")
-                    elif monto_str.count('.') > 1:
-                        es_concatenado = True
-                        logger.warning(f"[NetCash-OCR] ⚠️ Monto tiene múltiples puntos decimales: {monto_str}")
-                    # Detectar patrón de valores repetidos (ej: "500000500000" o "500,000500,000")
-                    elif len(monto_str) > 15:
-                        # Posiblemente valores concatenados sin separador
-                        es_concatenado = True
-                        logger.warning(f"[NetCash-OCR] ⚠️ Monto demasiado largo, posible concatenación: {monto_str}")
-                    
-                    if es_concatenado:
+                else:
+                    try:
+                        monto_detectado = float(monto_str.replace(",", "").replace("$", "").strip())
+                    except ValueError:
+                        logger.warning(f"[NetCash-OCR] ⚠️ No se pudo parsear monto: {monto_str}")
                         es_confiable = False
-                        motivo_fallo = "monto_concatenado"
-                        advertencias.append(f"Formato de monto detectado: {monto_str}. Parece contener múltiples valores.")
-                        # Intentar separar y sumar
-                        try:
-                            partes = monto_str.replace('$', '').split(',')
-                            # Filtrar y sumar valores que parecen montos
-                            montos_parseados = []
-                            for parte in partes:
-                                parte = parte.strip()
-                                if parte and '.' in parte:
-                                    try:
-                                        m = float(parte.replace(',', ''))
-                                        if m > 1000:  # Solo considerar montos razonables
-                                            montos_parseados.append(m)
-                                    except:
-                                        pass
-                            if montos_parseados:
-                                monto_detectado = sum(montos_parseados)
-                                advertencias.append(f"Suma sugerida: ${monto_detectado:,.2f} ({len(montos_parseados)} montos)")
-                            else:
-                                monto_detectado = 0
-                        except:
-                            monto_detectado = 0
+                        motivo_fallo = "monto_no_parseable"
+                        advertencias.append(f"No se pudo interpretar el monto: {monto_str}")
+                        monto_detectado = 0
+        
+        # Validar otros campos por valores concatenados
+        if banco_detectado and isinstance(banco_detectado, str):
+            # Detectar bancos concatenados (ej: "banregiobanregio")
+            bancos_conocidos = ["bbva", "banregio", "banamex", "santander", "hsbc", "scotiabank", "banorte"]
+            banco_lower = banco_detectado.lower()
+            matches = sum(1 for b in bancos_conocidos if b in banco_lower)
+            if matches > 1 or (len(banco_detectado) > 15 and any(b in banco_lower for b in bancos_conocidos)):
+                logger.warning(f"[NetCash-OCR] ⚠️ Banco parece tener valores concatenados: {banco_detectado}")
+                es_confiable = False
+                motivo_fallo = "datos_concatenados"
+                advertencias.append(f"Datos de banco parecen inválidos: {banco_detectado}")
+        
+        logger.info(f"[NetCash-OCR] Datos extraídos: monto={monto_detectado}, banco={banco_detectado}, clave={clave_rastreo}, es_confiable={es_confiable}")
+        
+        # Validar si el comprobante es válido (CLABE coincide con cuenta activa)
+        clabe_activa = cuenta_activa.get('clabe', '')
+        es_valido = False
+        razon = "CLABE no coincide con cuenta activa"
+        
+        if cuenta_beneficiaria:
+            # Limpiar y comparar CLABEs
+            cuenta_str = str(cuenta_beneficiaria).strip()
+            cuenta_limpia = cuenta_str.replace(" ", "").replace("-", "").replace("*", "")
+            
+            # Obtener últimos 4 dígitos de la CLABE activa
+            ultimos_4_clabe = clabe_activa[-4:] if len(clabe_activa) >= 4 else clabe_activa
+            
+            logger.info(f"[NetCash-OCR] Validando cuenta: '{cuenta_str}' vs CLABE activa terminación {ultimos_4_clabe}")
+            
+            # Caso 1: CLABE completa coincide
+            if clabe_activa in cuenta_limpia or cuenta_limpia in clabe_activa:
+                es_valido = True
+                razon = "CLABE completa coincide con cuenta activa"
+                logger.info(f"[NetCash-OCR] ✅ CLABE completa coincide")
+            
+            # Caso 2: Últimos 4 dígitos de cuenta limpia coinciden
+            elif len(cuenta_limpia) >= 4 and cuenta_limpia[-4:] == ultimos_4_clabe:
+                es_valido = True
+                razon = f"Últimos 4 dígitos coinciden ({ultimos_4_clabe})"
+                logger.info(f"[NetCash-OCR] ✅ Últimos 4 dígitos coinciden: {cuenta_limpia[-4:]}")
+            
+            # Caso 3: Formato enmascarado (ej: *7228, **7228, ***7228, ****7228)
+            # Extraer solo los dígitos del final
+            elif '*' in cuenta_str:
+                # Extraer dígitos después de los asteriscos
+                import re
+                match = re.search(r'\*+(\d{3,4})$', cuenta_str)
+                if match:
+                    digitos_encontrados = match.group(1)
+                    # Comparar con los últimos N dígitos de la CLABE
+                    if clabe_activa.endswith(digitos_encontrados):
+                        es_valido = True
+                        razon = f"Terminación enmascarada coincide (*{digitos_encontrados})"
+                        logger.info(f"[NetCash-OCR] ✅ Terminación enmascarada coincide: *{digitos_encontrados}")
                     else:
-                        try:
-                            monto_detectado = float(monto_str.replace(",", "").replace("$", "").strip())
-                        except ValueError:
-                            logger.warning(f"[NetCash-OCR] ⚠️ No se pudo parsear monto: {monto_str}")
-                            es_confiable = False
-                            motivo_fallo = "monto_no_parseable"
-                            advertencias.append(f"No se pudo interpretar el monto: {monto_str}")
-                            monto_detectado = 0
-            
-            # Validar otros campos por valores concatenados
-            if banco_detectado and isinstance(banco_detectado, str):
-                # Detectar bancos concatenados (ej: "banregiobanregio")
-                bancos_conocidos = ["bbva", "banregio", "banamex", "santander", "hsbc", "scotiabank", "banorte"]
-                banco_lower = banco_detectado.lower()
-                matches = sum(1 for b in bancos_conocidos if b in banco_lower)
-                if matches > 1 or (len(banco_detectado) > 15 and any(b in banco_lower for b in bancos_conocidos)):
-                    logger.warning(f"[NetCash-OCR] ⚠️ Banco parece tener valores concatenados: {banco_detectado}")
-                    es_confiable = False
-                    motivo_fallo = "datos_concatenados"
-                    advertencias.append(f"Datos de banco parecen inválidos: {banco_detectado}")
-            
-            logger.info(f"[NetCash-OCR] Datos extraídos: monto={monto_detectado}, banco={banco_detectado}, clave={clave_rastreo}, es_confiable={es_confiable}")
-            
-            # Validar si el comprobante es válido (CLABE coincide con cuenta activa)
-            clabe_activa = cuenta_activa.get('clabe', '')
-            es_valido = False
-            razon = "CLABE no coincide con cuenta activa"
+                        logger.warning(f"[NetCash-OCR] ❌ Terminación enmascarada NO coincide: *{digitos_encontrados} vs {ultimos_4_clabe}")
+                else:
+                    logger.warning(f"[NetCash-OCR] ❌ No se pudo extraer dígitos de cuenta enmascarada: {cuenta_str}")
             
-            if cuenta_beneficiaria:
-                # Limpiar y comparar CLABEs
-                cuenta_str = str(cuenta_beneficiaria).strip()
-                cuenta_limpia = cuenta_str.replace(" ", "").replace("-", "").replace("*", "")
-                
-                # Obtener últimos 4 dígitos de la CLABE activa
-                ultimos_4_clabe = clabe_activa[-4:] if len(clabe_activa) >= 4 else clabe_activa
-                
-                logger.info(f"[NetCash-OCR] Validando cuenta: '{cuenta_str}' vs CLABE activa terminación {ultimos_4_clabe}")
-                
-                # Caso 1: CLABE completa coincide
-                if clabe_activa in cuenta_limpia or cuenta_limpia in clabe_activa:
-                    es_valido = True
-                    razon = "CLABE completa coincide con cuenta activa"
-                    logger.info(f"[NetCash-OCR] ✅ CLABE completa coincide")
-                
-                # Caso 2: Últimos 4 dígitos de cuenta limpia coinciden
-                elif len(cuenta_limpia) >= 4 and cuenta_limpia[-4:] == ultimos_4_clabe:
+            # Caso 4: Verificar si los dígitos de la cuenta están contenidos en la CLABE
+            elif len(cuenta_limpia) >= 3:
+                # Si la cuenta limpia es corta (3-6 dígitos), verificar si coincide con terminación
+                if len(cuenta_limpia) <= 6 and clabe_activa.endswith(cuenta_limpia):
                     es_valido = True
-                    razon = f"Últimos 4 dígitos coinciden ({ultimos_4_clabe})"
-                    logger.info(f"[NetCash-OCR] ✅ Últimos 4 dígitos coinciden: {cuenta_limpia[-4:]}")
-                
-                # Caso 3: Formato enmascarado (ej: *7228, **7228, ***7228, ****7228)
-                # Extraer solo los dígitos del final
-                elif '*' in cuenta_str:
-                    # Extraer dígitos después de los asteriscos
-                    import re
-                    match = re.search(r'\*+(\d{3,4})$', cuenta_str)
-                    if match:
-                        digitos_encontrados = match.group(1)
-                        # Comparar con los últimos N dígitos de la CLABE
-                        if clabe_activa.endswith(digitos_encontrados):
-                            es_valido = True
-                            razon = f"Terminación enmascarada coincide (*{digitos_encontrados})"
-                            logger.info(f"[NetCash-OCR] ✅ Terminación enmascarada coincide: *{digitos_encontrados}")
-                        else:
-                            logger.warning(f"[NetCash-OCR] ❌ Terminación enmascarada NO coincide: *{digitos_encontrados} vs {ultimos_4_clabe}")
-                    else:
-                        logger.warning(f"[NetCash-OCR] ❌ No se pudo extraer dígitos de cuenta enmascarada: {cuenta_str}")
-                
-                # Caso 4: Verificar si los dígitos de la cuenta están contenidos en la CLABE
-                elif len(cuenta_limpia) >= 3:
-                    # Si la cuenta limpia es corta (3-6 dígitos), verificar si coincide con terminación
-                    if len(cuenta_limpia) <= 6 and clabe_activa.endswith(cuenta_limpia):
-                        es_valido = True
-                        razon = f"Terminación parcial coincide ({cuenta_limpia})"
-                        logger.info(f"[NetCash-OCR] ✅ Terminación parcial coincide: {cuenta_limpia}")
-                
-                if not es_valido:
-                    logger.warning(f"[NetCash-OCR] ❌ Cuenta '{cuenta_str}' NO coincide con CLABE activa (termina en {ultimos_4_clabe})")
+                    razon = f"Terminación parcial coincide ({cuenta_limpia})"
+                    logger.info(f"[NetCash-OCR] ✅ Terminación parcial coincide: {cuenta_limpia}")
             
-            # Si no se detectó monto, marcar como no confiable
-            if not monto_detectado or monto_detectado == 0:
-                es_confiable = False
+            if not es_valido:
+                logger.warning(f"[NetCash-OCR] ❌ Cuenta '{cuenta_str}' NO coincide con CLABE activa (termina en {ultimos_4_clabe})")
+        
+        # Si no se detectó monto, marcar como no confiable
+        if not monto_detectado or monto_detectado == 0:
+            es_confiable = False
+            if motivo_fallo != "ocr_no_disponible":
                 motivo_fallo = "sin_monto_detectado"
-                advertencias.append("No se pudo detectar el monto del comprobante")
-            
-            cuenta_detectada = {
-                "clabe": cuenta_beneficiaria,
-                "beneficiario": nombre_beneficiario
-            } if cuenta_beneficiaria else None
-            
-            # Crear detalle del comprobante (con hash para detección de duplicados)
-            # ⭐ UNIFICADO: Misma estructura que comprobantes Web
-            comprobante_detalle = {
-                "archivo_url": archivo_url,
-                "file_url": archivo_url,  # Alias para compatibilidad con frontend
-                "nombre_archivo": nombre_archivo,
-                "archivo_hash": file_hash,  # Hash SHA-256 para detección de duplicados
-                "es_valido": es_valido,
-                "es_duplicado": False,  # Este NO es duplicado
-                # Datos extraídos por OCR (igual que Web)
-                "monto": monto_detectado,
-                "monto_detectado": monto_detectado,  # Mantener por compatibilidad
-                "banco_origen": banco_detectado,
-                "clave_rastreo": clave_rastreo,
-                "cuenta_origen": cuenta_beneficiaria,
-                "nombre_beneficiario": nombre_beneficiario,
-                "fecha_operacion": fecha_operacion,
-                "referencia": referencia,
-                # Datos de validación
-                "validacion_detalle": {
-                    "razon": razon,
-                    "cuenta_activa_esperada": cuenta_activa.get('clabe'),
-                },
-                "cuenta_detectada": cuenta_detectada,
-                # Datos de validación OCR
-                "ocr_data": {
-                    "banco_detectado": banco_detectado,
-                    "es_confiable": es_confiable,
-                    "motivo_fallo": motivo_fallo if not es_confiable else None,
-                    "advertencias": advertencias,
-                    "datos_completos": datos_ocr  # Guardar respuesta completa de OCR
-                }
+            advertencias.append("No se pudo detectar el monto del comprobante")
+        
+        cuenta_detectada = {
+            "clabe": cuenta_beneficiaria,
+            "beneficiario": nombre_beneficiario
+        } if cuenta_beneficiaria else None
+        
+        # Crear detalle del comprobante (con hash para detección de duplicados)
+        # ⭐ UNIFICADO: Misma estructura que comprobantes Web
+        comprobante_detalle = {
+            "archivo_url": archivo_url,
+            "file_url": archivo_url,  # Alias para compatibilidad con frontend
+            "nombre_archivo": nombre_archivo,
+            "archivo_hash": file_hash,  # Hash SHA-256 para detección de duplicados
+            "es_valido": es_valido,
+            "es_duplicado": False,  # Este NO es duplicado
+            # Datos extraídos por OCR (igual que Web)
+            "monto": monto_detectado,
+            "monto_detectado": monto_detectado,  # Mantener por compatibilidad
+            "banco_origen": banco_detectado,
+            "clave_rastreo": clave_rastreo,
+            "cuenta_origen": cuenta_beneficiaria,
+            "nombre_beneficiario": nombre_beneficiario,
+            "fecha_operacion": fecha_operacion,
+            "referencia": referencia,
+            # Datos de validación
+            "validacion_detalle": {
+                "razon": razon,
+                "cuenta_activa_esperada": cuenta_activa.get('clabe'),
+            },
+            "cuenta_detectada": cuenta_detectada,
+            # Datos de validación OCR
+            "ocr_data": {
+                "banco_detectado": banco_detectado,
+                "es_confiable": es_confiable,
+                "motivo_fallo": motivo_fallo if not es_confiable else None,
+                "advertencias": advertencias,
+                "nivel_extraccion": nivel_extraccion,
+                "datos_completos": datos_ocr  # Guardar respuesta completa de OCR
             }
-            
-            # ⭐ NUEVO: Determinar si requiere captura manual
-            # Si algún comprobante tiene OCR no confiable, marcar la solicitud
-            update_fields = {
-                "updated_at": datetime.now(timezone.utc),
-                "monto_depositado_cliente": monto_detectado  # Actualizar monto si se detectó
+        }
+        
+        return comprobante_detalle
+    
+    def _campos_update_comprobante(self, comprobante_detalle: Dict, es_primero: bool) -> Dict:
+        """Campos $set de la solicitud al agregar un comprobante leído por OCR"""
+        ocr_data = comprobante_detalle["ocr_data"]
+        es_confiable = ocr_data["es_confiable"]
+        
+        # ⭐ NUEVO: Determinar si requiere captura manual
+        # Si algún comprobante tiene OCR no confiable, marcar la solicitud
+        update_fields = {
+            "updated_at": datetime.now(timezone.utc),
+            "monto_depositado_cliente": comprobante_detalle["monto_detectado"]  # Actualizar monto si se detectó
+        }
+        
+        # Si este es el primer comprobante y el OCR no es confiable, activar modo manual
+        if not es_confiable and es_primero:
+            logger.warning(f"[NetCash-OCR] ⚠️ Activando modo captura manual")
+            update_fields["modo_captura"] = "manual_por_fallo_ocr"
+            update_fields["origen_montos"] = "pendiente_manual"  # Se actualizará cuando el usuario responda
+            update_fields["validacion_ocr"] = {
+                "es_confiable": es_confiable,
+                "motivo_fallo": ocr_data["motivo_fallo"],
+                "advertencias": ocr_data["advertencias"],
+                "banco_detectado": ocr_data["banco_detectado"]
             }
-            
-            # Si este es el primer comprobante y el OCR no es confiable, activar modo manual
-            if not es_confiable and len(comprobantes_existentes) == 0:
-                logger.warning(f"[NetCash-OCR] ⚠️ Activando modo captura manual")
-                update_fields["modo_captura"] = "manual_por_fallo_ocr"
-                update_fields["origen_montos"] = "pendiente_manual"  # Se actualizará cuando el usuario responda
-                update_fields["validacion_ocr"] = {
-                    "es_confiable": es_confiable,
-                    "motivo_fallo": motivo_fallo,
-                    "advertencias": advertencias,
-                    "banco_detectado": datos_parseados.get('banco')
-                }
-            
-            # Agregar a la solicitud
-            result = await db[COLLECTION_NAME].update_one(
-                {"id": solicitud_id},
-                {
-                    "$push": {"comprobantes": comprobante_detalle},
-                    "$set": update_fields
-                }
-            )
-            
-            logger.info(f"[NetCash] ✅ Comprobante agregado: válido={es_valido}, monto={monto_detectado}, ocr_confiable={es_confiable}")
-            
-            # Retornar información adicional para que el bot pueda actuar
-            # CORREGIDO: Activar captura manual siempre que OCR no sea confiable (no solo en primer comprobante)
-            razon_retorno = None
-            if not es_confiable:
-                razon_retorno = "requiere_captura_manual"
-                logger.info(f"[NetCash] ⚠️ OCR no confiable - activando captura manual. Motivo: {motivo_fallo}")
-            
-            return True, razon_retorno
-            
-        except Exception as e:
-            logger.error(f"[NetCash] Error agregando comprobante: {str(e)}")
-            return False, "error"
+        
+        return update_fields
+    
+    def _razon_retorno(self, comprobante_detalle: Dict) -> Optional[str]:
+        ocr_data = comprobante_detalle["ocr_data"]
+        if not ocr_data["es_confiable"]:
+            logger.info(f"[NetCash] ⚠️ OCR no confiable - activando captura manual. Motivo: {ocr_data['motivo_fallo']}")
+            return "requiere_captura_manual"
+        return None
+    
+    async def _push_comprobantes(self, solicitud_id: str, comprobantes: List[Dict],
+                                 update_fields: Optional[Dict] = None, cliente_id: Optional[str] = None,
+                                 devolver_solicitud: bool = False) -> Optional[Dict]:
+        """
+        Agrega uno o varios comprobantes a la solicitud en una sola escritura.
+        Con cliente_id registra sus huellas de duplicado en la misma transacción.
+        El payload OCR crudo se guarda en comprobante_ocr_raw, no en la solicitud.
+        
+        Returns:
+            Con devolver_solicitud, la solicitud ya con los comprobantes (post-imagen)
+        """
+        comprobantes, payloads_ocr = comprobante_ocr_raw_service.separar_comprobantes(
+            COLLECTION_NAME, solicitud_id, comprobantes
+        )
+        unidad = UnidadDeTrabajo()
+        unidad.set(solicitud_id, {"updated_at": datetime.now(timezone.utc), **(update_fields or {})})
+        unidad.push(solicitud_id, "comprobantes", *comprobantes)
+        huellas = comprobante_fingerprints_service.huellas(
+            COLLECTION_NAME, {"id": solicitud_id, "cliente_id": cliente_id}, comprobantes
+        ) if cliente_id else []
+        
+        async def escribir(session):
+            solicitud = await unidad.confirmar(devolver_documento=devolver_solicitud, session=session)
+            await comprobante_fingerprints_service.registrar(huellas, session=session)
+            await comprobante_ocr_raw_service.guardar(payloads_ocr, session=session)
+            return solicitud
+        
+        return await comprobante_fingerprints_service.en_transaccion(escribir)
     
     async def procesar_archivo_zip(self, solicitud_id: str, archivo_zip_path: str, 
-                                   nombre_zip: str) -> Dict:
+                                   nombre_zip: str, progreso: Optional[Progreso] = None) -> Dict:
         """
         Procesa un archivo ZIP extrayendo y validando cada comprobante interno.
         
+        Pipeline por etapas: hash de todos los archivos, deduplicación en bloque
+        (local + global en una sola consulta), OCR concurrente acotado por
+        ZIP_OCR_CONCURRENCIA y un solo $push con todos los comprobantes.
+        El orden de los comprobantes y del reporte es el orden del ZIP.
+        
         Args:
             solicitud_id: ID de la solicitud
             archivo_zip_path: Ruta al archivo ZIP
             nombre_zip: Nombre original del archivo ZIP
+            progreso: callback opcional por etapa: "extraido" (total), "hash",
+                      "archivo" (listos/total, uno por comprobante leído), "validado"
         
         Returns:
             Dict con estadísticas del procesamiento:
@@ -725,93 +848,194 @@ class NetCashService:
             # Extensiones soportadas
             extensiones_soportadas = {'.pdf', '.jpg', '.jpeg', '.png'}
             
-            # Procesar cada archivo en el ZIP
-            for archivo_interno in Path(temp_dir).rglob('*'):
-                if archivo_interno.is_file():
-                    resultado["total_archivos"] += 1
-                    nombre_interno = archivo_interno.name
-                    extension = archivo_interno.suffix.lower()
+            archivos = [a for a in Path(temp_dir).rglob('*') if a.is_file()]
+            resultado["total_archivos"] = len(archivos)
+            
+            # ETAPA 1: Filtrar extensiones y calcular hashes (en paralelo, fuera del event loop)
+            soportados = []
+            for archivo_interno in archivos:
+                extension = archivo_interno.suffix.lower()
+                if extension in extensiones_soportadas:
+                    soportados.append(archivo_interno)
+                else:
+                    logger.warning(f"[NetCash ZIP] Extensión no soportada: {archivo_interno.name} ({extension})")
+            
+            await self._avisar_progreso(progreso, "extraido", total=len(archivos), soportados=len(soportados))
+            
+            hashes = await asyncio.gather(*[
+                asyncio.to_thread(self._calcular_hash_archivo, str(a)) for a in soportados
+            ])
+            hash_por_archivo = dict(zip(soportados, hashes))
+            await self._avisar_progreso(progreso, "hash")
+            
+            # ETAPA 2: Deduplicar en bloque (una lectura de la solicitud + una consulta global)
+            # salida: archivo -> (agregado, razon, comprobante a guardar o None)
+            salidas: Dict = {}
+            
+            solicitud = await db[COLLECTION_NAME].find_one(
+                {"id": solicitud_id},
+                {"_id": 0, "cliente_id": 1, "comprobantes.archivo_hash": 1, "comprobantes.nombre_archivo": 1}
+            )
+            if not solicitud:
+                logger.error(f"[NetCash ZIP] Solicitud {solicitud_id} no encontrada")
+                for archivo_interno in soportados:
+                    salidas[archivo_interno] = (False, "solicitud_no_encontrada", None)
+                solicitud = {}
+            
+            comprobantes_existentes = solicitud.get("comprobantes", [])
+            vistos: Dict[str, Dict] = {}
+            for comp in comprobantes_existentes:
+                vistos.setdefault(comp.get("archivo_hash"), comp)
+            
+            primeros = []  # Primer archivo con cada hash, candidatos a duplicado global / OCR
+            for archivo_interno in soportados:
+                if archivo_interno in salidas:
+                    continue
+                
+                file_hash = hash_por_archivo[archivo_interno]
+                nombre_archivo = f"{nombre_zip}/{archivo_interno.name}"  # Prefijo con nombre del ZIP
+                
+                if file_hash in vistos:
+                    comprobante = self._comprobante_duplicado_local(
+                        str(archivo_interno), nombre_archivo, file_hash, vistos[file_hash]
+                    )
+                    salidas[archivo_interno] = (False, "duplicado_local", comprobante)
+                else:
+                    vistos[file_hash] = {"nombre_archivo": nombre_archivo}
+                    primeros.append(archivo_interno)
+            
+            duplicados_globales = await self._buscar_duplicados_globales(
+                solicitud.get("cliente_id"), solicitud_id, [hash_por_archivo[a] for a in primeros]
+            ) if primeros else {}
+            
+            pendientes_ocr = []
+            for archivo_interno in primeros:
+                file_hash = hash_por_archivo[archivo_interno]
+                if file_hash in duplicados_globales:
+                    original = duplicados_globales[file_hash]
+                    comprobante = self._comprobante_duplicado_global(
+                        str(archivo_interno), f"{nombre_zip}/{archivo_interno.name}", file_hash, original
+                    )
+                    salidas[archivo_interno] = (False, f"duplicado_global:{original['folio_mbco']}", comprobante)
+                else:
+                    pendientes_ocr.append(archivo_interno)
+            
+            # ETAPA 3: OCR concurrente acotado
+            if pendientes_ocr:
+                cuenta_activa = await cuenta_deposito_service.obtener_cuenta_activa()
+                
+                if not cuenta_activa:
+                    logger.error(f"[NetCash ZIP] No hay cuenta concertadora activa")
+                    for archivo_interno in pendientes_ocr:
+                        salidas[archivo_interno] = (False, "sin_cuenta_activa", None)
+                else:
+                    logger.info(f"[NetCash ZIP] OCR de {len(pendientes_ocr)} archivo(s), concurrencia {self.zip_ocr_concurrencia}")
+                    semaforo = asyncio.Semaphore(self.zip_ocr_concurrencia)
+                    # Los duplicados ya quedaron resueltos; el avance cuenta los leídos por OCR
+                    avance = {"listos": len(soportados) - len(pendientes_ocr)}
                     
-                    logger.info(f"[NetCash ZIP] Procesando archivo interno: {nombre_interno}")
+                    async def _ocr(archivo_interno):
+                        async with semaforo:
+                            try:
+                                return await self._analizar_comprobante_ocr(
+                                    str(archivo_interno),
+                                    f"{nombre_zip}/{archivo_interno.name}",
+                                    hash_por_archivo[archivo_interno],
+                                    cuenta_activa
+                                )
+                            finally:
+                                avance["listos"] += 1
+                                await self._avisar_progreso(
+                                    progreso, "archivo", listos=avance["listos"], total=len(soportados),
+                                    nombre=archivo_interno.name
+                                )
                     
-                    # Verificar si la extensión es soportada
-                    if extension not in extensiones_soportadas:
-                        logger.warning(f"[NetCash ZIP] Extensión no soportada: {nombre_interno} ({extension})")
-                        resultado["no_legibles"] += 1
+                    detalles = await asyncio.gather(*[_ocr(a) for a in pendientes_ocr], return_exceptions=True)
+                    
+                    for archivo_interno, detalle in zip(pendientes_ocr, detalles):
+                        if isinstance(detalle, Exception):
+                            logger.error(f"[NetCash ZIP] Error procesando {archivo_interno.name}: {str(detalle)}")
+                            salidas[archivo_interno] = (False, "error", detalle)
+                        else:
+                            salidas[archivo_interno] = (True, self._razon_retorno(detalle), detalle)
+            
+            # ETAPA 4: Una sola escritura con todos los comprobantes, en el orden del ZIP
+            nuevos = []
+            update_fields = {}
+            for archivo_interno in soportados:
+                agregado, _, comprobante = salidas[archivo_interno]
+                if comprobante is None or isinstance(comprobante, Exception):
+                    continue
+                if agregado:
+                    # Mismo efecto que agregarlos uno a uno: el último monto gana,
+                    # el modo manual solo lo activa el primer comprobante de la solicitud
+                    es_primero = not comprobantes_existentes and not nuevos
+                    update_fields.update(self._campos_update_comprobante(comprobante, es_primero=es_primero))
+                nuevos.append(comprobante)
+            
+            if nuevos:
+                await self._push_comprobantes(solicitud_id, nuevos, update_fields, cliente_id=solicitud.get("cliente_id"))
+                logger.info(f"[NetCash ZIP] {len(nuevos)} comprobante(s) agregados en una sola escritura")
+            await self._avisar_progreso(progreso, "validado")
+            
+            # ETAPA 5: Reporte por archivo (mismo orden que el ZIP)
+            for archivo_interno in archivos:
+                nombre_interno = archivo_interno.name
+                
+                if archivo_interno not in hash_por_archivo:
+                    resultado["no_legibles"] += 1
+                    resultado["archivos_procesados"].append({
+                        "nombre": nombre_interno,
+                        "estado": "no_soportado",
+                        "razon": f"Extensión {archivo_interno.suffix.lower()} no soportada"
+                    })
+                    continue
+                
+                agregado, razon, comprobante = salidas[archivo_interno]
+                
+                if isinstance(comprobante, Exception):
+                    resultado["no_legibles"] += 1
+                    resultado["archivos_procesados"].append({
+                        "nombre": nombre_interno,
+                        "estado": "error",
+                        "razon": str(comprobante)
+                    })
+                elif agregado:
+                    # Agregado exitosamente (puede ser válido o inválido)
+                    if comprobante.get("es_valido"):
+                        resultado["validos"] += 1
                         resultado["archivos_procesados"].append({
                             "nombre": nombre_interno,
-                            "estado": "no_soportado",
-                            "razon": f"Extensión {extension} no soportada"
+                            "estado": "valido",
+                            "monto": comprobante.get("monto_detectado")
                         })
-                        continue
-                    
-                    # Intentar agregar el comprobante usando la lógica existente
-                    try:
-                        agregado, razon = await self.agregar_comprobante(
-                            solicitud_id,
-                            str(archivo_interno),
-                            f"{nombre_zip}/{nombre_interno}"  # Prefijo con nombre del ZIP
-                        )
+                    else:
+                        # Clasificar por tipo de error
+                        razon_invalido = comprobante.get("validacion_detalle", {}).get("razon")
                         
-                        if agregado:
-                            # Agregado exitosamente (puede ser válido o inválido)
-                            # Verificar si es válido consultando la solicitud
-                            solicitud = await db[COLLECTION_NAME].find_one(
-                                {"id": solicitud_id},
-                                {"_id": 0, "comprobantes": 1}
-                            )
-                            
-                            # Buscar el comprobante recién agregado
-                            comprobantes = solicitud.get("comprobantes", [])
-                            comprobante_agregado = None
-                            for comp in reversed(comprobantes):  # Buscar desde el final (más reciente)
-                                if comp.get("nombre_archivo") == f"{nombre_zip}/{nombre_interno}":
-                                    comprobante_agregado = comp
-                                    break
-                            
-                            if comprobante_agregado and comprobante_agregado.get("es_valido"):
-                                resultado["validos"] += 1
-                                resultado["archivos_procesados"].append({
-                                    "nombre": nombre_interno,
-                                    "estado": "valido",
-                                    "monto": comprobante_agregado.get("monto_detectado")
-                                })
-                            else:
-                                # Clasificar por tipo de error
-                                razon_invalido = comprobante_agregado.get("validacion_detalle", {}).get("razon") if comprobante_agregado else "No se pudo validar"
-                                
-                                if razon_invalido == "pdf_sin_texto_legible":
-                                    resultado["sin_texto_legible"] += 1
-                                    resultado["archivos_procesados"].append({
-                                        "nombre": nombre_interno,
-                                        "estado": "sin_texto_legible",
-                                        "razon": "PDF/imagen sin texto seleccionable"
-                                    })
-                                else:
-                                    resultado["invalidos"] += 1
-                                    resultado["archivos_procesados"].append({
-                                        "nombre": nombre_interno,
-                                        "estado": "invalido",
-                                        "razon": razon_invalido
-                                    })
+                        if razon_invalido == "pdf_sin_texto_legible":
+                            resultado["sin_texto_legible"] += 1
+                            resultado["archivos_procesados"].append({
+                                "nombre": nombre_interno,
+                                "estado": "sin_texto_legible",
+                                "razon": "PDF/imagen sin texto seleccionable"
+                            })
                         else:
-                            # No agregado (duplicado)
-                            resultado["duplicados"] += 1
-                            tipo_duplicado = "local" if razon == "duplicado_local" else "global"
+                            resultado["invalidos"] += 1
                             resultado["archivos_procesados"].append({
                                 "nombre": nombre_interno,
-                                "estado": "duplicado",
-                                "tipo": tipo_duplicado
+                                "estado": "invalido",
+                                "razon": razon_invalido
                             })
-                            
-                    except Exception as e:
-                        logger.error(f"[NetCash ZIP] Error procesando {nombre_interno}: {str(e)}")
-                        resultado["no_legibles"] += 1
-                        resultado["archivos_procesados"].append({
-                            "nombre": nombre_interno,
-                            "estado": "error",
-                            "razon": str(e)
-                        })
+                else:
+                    # No agregado (duplicado)
+                    resultado["duplicados"] += 1
+                    tipo_duplicado = "local" if razon == "duplicado_local" else "global"
+                    resultado["archivos_procesados"].append({
+                        "nombre": nombre_interno,
+                        "estado": "duplicado",
+                        "tipo": tipo_duplicado
+                    })
             
             logger.info(f"[NetCash ZIP] Procesamiento completado: {resultado}")
             return resultado
@@ -884,6 +1108,7 @@ class NetCashService:
                 {"id": solicitud_id},
                 {"$set": update_data}
             )
+            operaciones_stats_service.invalidar()
             
             if result.modified_count > 0:
                 logger.info(f"[NetCash-Manual] ✅ Datos guardados correctamente")
@@ -963,7 +1188,8 @@ class NetCashService:
     
     # ==================== VALIDACIONES (REGLAS DURAS) ====================
     
-    async def validar_solicitud_completa(self, solicitud_id: str) -> Tuple[bool, Dict]:
+    async def validar_solicitud_completa(self, solicitud_id: str, unidad: Optional[UnidadDeTrabajo] = None,
+                                         solicitud: Optional[Dict] = None) -> Tuple[bool, Dict]:
         """
         Aplica TODAS las reglas duras a una solicitud.
         
@@ -976,6 +1202,9 @@ class NetCashService:
         
         Args:
             solicitud_id: ID de la solicitud
+            unidad: Si se pasa, las validaciones se agregan a la unidad de trabajo
+                    en lugar de escribirse
+            solicitud: Solicitud ya leída por quien llama
         
         Returns:
             Tupla (todas_validas: bool, validaciones: dict)
@@ -984,7 +1213,8 @@ class NetCashService:
         logger.info(f"[NetCash] Solicitud: {solicitud_id}")
         
         # Obtener solicitud
-        solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id}, {"_id": 0})
+        if solicitud is None:
+            solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id}, {"_id": 0})
         if not solicitud:
             logger.error(f"[NetCash] Solicitud {solicitud_id} no encontrada")
             return False, {}
@@ -1016,14 +1246,15 @@ class NetCashService:
             solicitud.get("comprobantes", [])
         )
         
-        # Actualizar validaciones en BD
-        await db[COLLECTION_NAME].update_one(
-            {"id": solicitud_id},
-            {"$set": {
-                "validacion": validaciones,
-                "updated_at": datetime.now(timezone.utc)
-            }}
-        )
+        # Actualizar validaciones en BD (o en la unidad de trabajo de quien llama)
+        propia = unidad is None
+        unidad = unidad or UnidadDeTrabajo()
+        unidad.set(solicitud_id, {
+            "validacion": validaciones,
+            "updated_at": datetime.now(timezone.utc)
+        })
+        if propia:
+            await unidad.confirmar()
         
         # Verificar si TODAS son válidas
         todas_validas = all(v.get("valido", False) for v in validaciones.values())
@@ -1131,7 +1362,8 @@ class NetCashService:
     # ==================== GESTIÓN DE ESTADOS ====================
     
     async def cambiar_estado(self, solicitud_id: str, nuevo_estado: EstadoSolicitud,
-                            notas: Optional[str] = None) -> bool:
+                            notas: Optional[str] = None, unidad: Optional[UnidadDeTrabajo] = None,
+                            solicitud: Optional[Dict] = None) -> bool:
         """
         Cambia el estado de una solicitud.
         Si el nuevo estado es LISTA_PARA_MBC y no tiene folio, lo genera.
@@ -1140,12 +1372,16 @@ class NetCashService:
             solicitud_id: ID de la solicitud
             nuevo_estado: Nuevo estado
             notas: Notas opcionales sobre el cambio
+            unidad: Si se pasa, el cambio se agrega a la unidad de trabajo y lo
+                    escribe (e invalida estadísticas) quien la confirma
+            solicitud: Solicitud ya leída por quien llama
         
         Returns:
             True si se cambió correctamente
         """
         try:
-            solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id})
+            if solicitud is None:
+                solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id})
             if not solicitud:
                 logger.error(f"[NetCash] Solicitud {solicitud_id} no encontrada")
                 return False
@@ -1162,7 +1398,7 @@ class NetCashService:
             
             # Si pasa a LISTA_PARA_MBC y no tiene folio, generar
             if nuevo_estado == EstadoSolicitud.LISTA_PARA_MBC and not solicitud.get("folio_mbco"):
-                folio = await self._generar_folio_mbco()
+                folio = await folio_mbco_service.siguiente()
                 update_data["folio_mbco"] = folio
                 logger.info(f"[NetCash] Folio generado: {folio}")
             
@@ -1174,13 +1410,15 @@ class NetCashService:
                 "notas": notas or f"Cambio automático a {nuevo_estado.value}"
             }
             
-            await db[COLLECTION_NAME].update_one(
-                {"id": solicitud_id},
-                {
-                    "$set": update_data,
-                    "$push": {"estado_historico": historico_entry}
-                }
-            )
+            propia = unidad is None
+            unidad = unidad or UnidadDeTrabajo()
+            unidad.set(solicitud_id, update_data)
+            unidad.push(solicitud_id, "estado_historico", historico_entry)
+            if not propia:
+                return True
+            
+            await unidad.confirmar()
+            operaciones_stats_service.invalidar()
             
             logger.info(f"[NetCash] ✅ Estado actualizado a {nuevo_estado.value}")
             return True
@@ -1204,13 +1442,16 @@ class NetCashService:
         """
         logger.info(f"[NetCash] Procesando solicitud automáticamente: {solicitud_id}")
         
+        # Una lectura y una escritura: validaciones, totales, estado e histórico van en la misma unidad
+        solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id}, {"_id": 0})
+        unidad = UnidadDeTrabajo()
+        
         # Validar completamente
-        todas_validas, validaciones = await self.validar_solicitud_completa(solicitud_id)
+        todas_validas, validaciones = await self.validar_solicitud_completa(
+            solicitud_id, unidad=unidad, solicitud=solicitud
+        )
         
         if todas_validas:
-            # Obtener solicitud para calcular totales
-            solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id}, {"_id": 0})
-            
             # Calcular suma de todos los comprobantes válidos
             comprobantes = solicitud.get("comprobantes", [])
             comprobantes_validos = [c for c in comprobantes if c.get("es_valido", False)]
@@ -1267,23 +1508,23 @@ class NetCashService:
                 "updated_at": datetime.now(timezone.utc)
             }
             
-            await db[COLLECTION_NAME].update_one(
-                {"id": solicitud_id},
-                {"$set": update_data}
-            )
-            
-            logger.info(f"[NetCash] Totales calculados y guardados: total=${total_comprobantes_validos:,.2f}, comisión=${comision_cliente:,.2f}, monto_ligas=${monto_ligas:,.2f}")
+            unidad.set(solicitud_id, update_data)
             
             # TODO OK -> LISTA_PARA_MBC
             await self.cambiar_estado(
                 solicitud_id,
                 EstadoSolicitud.LISTA_PARA_MBC,
-                "Todas las validaciones pasaron"
+                "Todas las validaciones pasaron",
+                unidad=unidad,
+                solicitud=solicitud
             )
             
+            # La post-imagen de la escritura es la solicitud actualizada para notificar a Ana
+            solicitud_actualizada = await unidad.confirmar(devolver_documento=True)
+            operaciones_stats_service.invalidar()
+            logger.info(f"[NetCash] Totales calculados y guardados: total=${total_comprobantes_validos:,.2f}, comisión=${comision_cliente:,.2f}, monto_ligas=${monto_ligas:,.2f}")
+            
             # Notificar a Ana que hay una nueva solicitud lista para MBco
-            logger.info(f"[NetCash] Obteniendo solicitud actualizada para notificar a Ana...")
-            solicitud_actualizada = await db[COLLECTION_NAME].find_one({"id": solicitud_id}, {"_id": 0})
             logger.info(f"[NetCash] Llamando a _notificar_ana_solicitud_lista() para solicitud {solicitud_id}")
             await self._notificar_ana_solicitud_lista(solicitud_actualizada)
             logger.info(f"[NetCash] Notificación a Ana completada (o fallida, ver logs [NOTIF_ANA])")
@@ -1298,8 +1539,12 @@ class NetCashService:
             await self.cambiar_estado(
                 solicitud_id,
                 EstadoSolicitud.RECHAZADA,
-                f"Validaciones fallidas: {'; '.join(errores)}"
+                f"Validaciones fallidas: {'; '.join(errores)}",
+                unidad=unidad,
+                solicitud=solicitud
             )
+            await unidad.confirmar()
+            operaciones_stats_service.invalidar()
             return False, f"Solicitud rechazada: {'; '.join(errores)}"
     
     # ==================== GENERACIÓN DE RESÚMENES ====================
@@ -1385,40 +1630,6 @@ class NetCashService:
     
     # ==================== UTILIDADES ====================
     
-    async def _generar_folio_mbco(self) -> str:
-        """
-        Genera un folio NetCash secuencial (NC-000001, NC-000002, ...)
-        
-        Returns:
-            Folio en formato NC-XXXXXX
-        """
-        try:
-            # Buscar el último folio generado
-            ultima_solicitud = await db[COLLECTION_NAME].find_one(
-                {"folio_mbco": {"$exists": True, "$ne": None}},
-                {"folio_mbco": 1},
-                sort=[("folio_mbco", -1)]
-            )
-            
-            if ultima_solicitud and ultima_solicitud.get("folio_mbco"):
-                ultimo_folio = ultima_solicitud.get("folio_mbco")
-                # Extraer número (NC-000048 -> 48)
-                numero = int(ultimo_folio.split("-")[1])
-                nuevo_numero = numero + 1
-            else:
-                # Primera solicitud
-                nuevo_numero = 1
-            
-            folio = f"NC-{nuevo_numero:06d}"
-            logger.info(f"[NetCash] Folio generado: {folio}")
-            return folio
-            
-        except Exception as e:
-            logger.error(f"[NetCash] Error generando folio: {str(e)}")
-            # Fallback: usar timestamp
-            timestamp = int(datetime.now(timezone.utc).timestamp())
-            return f"NC-{timestamp}"
-    
     def _extraer_clabes_del_texto(self, texto: str) -> List[str]:
         """Extrae CLABEs (18 dígitos) del texto"""
         if not texto:
@@ -1451,9 +1662,14 @@ class NetCashService:
     
     # ==================== CONSULTAS ====================
     
-    async def obtener_solicitud(self, solicitud_id: str) -> Optional[Dict]:
-        """Obtiene una solicitud por ID"""
+    async def obtener_solicitud(self, solicitud_id: str, incluir_ocr_raw: bool = False) -> Optional[Dict]:
+        """
+        Obtiene una solicitud por ID.
+        Con incluir_ocr_raw agrega a cada comprobante su ocr_data.datos_completos.
+        """
         solicitud = await db[COLLECTION_NAME].find_one({"id": solicitud_id}, {"_id": 0})
+        if solicitud and incluir_ocr_raw:
+            await comprobante_ocr_raw_service.adjuntar(solicitud)
         return solicitud
     
     async def listar_solicitudes_cliente(self, cliente_id: str, 
@@ -1568,6 +1784,7 @@ class NetCashService:
                 {"id": solicitud_id},
                 {"$set": update_data}
             )
+            operaciones_stats_service.invalidar()
             
             logger.info(f"[NetCash] Folio MBco asignado: {folio_mbco}")
             
@@ -3,16 +3,10 @@
 import os
 import logging
 from typing import Dict, List
-from motor.motor_asyncio import AsyncIOMotorClient
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión a MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 # SMTP service (reemplaza Gmail OAuth que expira)
 try:
     from smtp_service import smtp_service
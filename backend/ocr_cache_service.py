@@ -0,0 +1,209 @@
+"""Caché de resultados OCR por contenido de archivo
+
+Evita volver a enviar a Gemini un comprobante que ya fue leído
+(re-subidas, reintentos /reocr, ZIPs reenviados).
+
+La llave es el hash SHA-256 del archivo + la versión del prompt OCR,
+así un cambio de prompt o de modelo invalida automáticamente lo anterior.
+
+Niveles:
+1. LRU en memoria del proceso (acotado por OCR_CACHE_MAX_MEMORIA)
+2. Colección MongoDB 'ocr_cache' (persistente, con índice TTL sobre expira_en)
+
+Solo se guardan lecturas exitosas: un resultado con "error" nunca se cachea.
+"""
+
+import copy
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Optional, Any
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'ocr_cache'
+
+
+class OCRCacheService:
+    """Caché de dos niveles (memoria + MongoDB) para respuestas OCR"""
+
+    def __init__(self):
+        self.habilitado = os.getenv('OCR_CACHE_HABILITADO', 'true').lower() != 'false'
+        self.ttl = timedelta(hours=int(os.getenv('OCR_CACHE_TTL_HORAS', '720')))  # 30 días
+        self.max_memoria = int(os.getenv('OCR_CACHE_MAX_MEMORIA', '500'))
+
+        # llave -> (expira_en, datos)
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()
+        self._indices_creados = False
+
+        self.estadisticas = {
+            "hits_memoria": 0,
+            "hits_mongo": 0,
+            "misses": 0,
+            "escrituras": 0,
+            "evicciones": 0,
+            "errores": 0
+        }
+
+    @staticmethod
+    def _llave(file_hash: str, version_prompt: str) -> str:
+        return f"{file_hash}:{version_prompt}"
+
+    @staticmethod
+    def _ahora() -> datetime:
+        return datetime.now(timezone.utc)
+
+    @staticmethod
+    def _como_utc(fecha: datetime) -> datetime:
+        """Mongo regresa datetimes naive (UTC); normalizarlos para comparar"""
+        if fecha.tzinfo is None:
+            return fecha.replace(tzinfo=timezone.utc)
+        return fecha
+
+    async def _asegurar_indices(self):
+        """Crea el índice TTL una sola vez por proceso"""
+        if self._indices_creados:
+            return
+        try:
+            await db[COLLECTION_NAME].create_index("expira_en", expireAfterSeconds=0)
+            self._indices_creados = True
+        except Exception as e:
+            logger.warning(f"[OCR-Cache] No se pudo crear índice TTL: {str(e)}")
+
+    # ==================== MEMORIA (LRU) ====================
+
+    def _leer_memoria(self, llave: str) -> Optional[Dict[str, Any]]:
+        entrada = self._memoria.get(llave)
+        if entrada is None:
+            return None
+
+        expira_en, datos = entrada
+        if expira_en <= self._ahora():
+            del self._memoria[llave]
+            return None
+
+        self._memoria.move_to_end(llave)
+        return datos
+
+    def _escribir_memoria(self, llave: str, datos: Dict[str, Any], expira_en: datetime):
+        self._memoria[llave] = (expira_en, datos)
+        self._memoria.move_to_end(llave)
+
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+            self.estadisticas["evicciones"] += 1
+
+    # ==================== API PÚBLICA ====================
+
+    async def obtener(self, file_hash: str, version_prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca un resultado OCR previo para el archivo.
+
+        Args:
+            file_hash: Hash SHA-256 del contenido del archivo
+            version_prompt: Versión del prompt/modelo OCR usado
+
+        Returns:
+            Copia de los datos OCR cacheados o None si no hay entrada vigente
+        """
+        if not self.habilitado or not file_hash:
+            return None
+
+        llave = self._llave(file_hash, version_prompt)
+
+        datos = self._leer_memoria(llave)
+        if datos is not None:
+            self.estadisticas["hits_memoria"] += 1
+            logger.info(f"[OCR-Cache] HIT memoria: {file_hash[:16]}...")
+            return copy.deepcopy(datos)
+
+        try:
+            doc = await db[COLLECTION_NAME].find_one({"_id": llave})
+        except Exception as e:
+            self.estadisticas["errores"] += 1
+            logger.warning(f"[OCR-Cache] Error leyendo caché persistente: {str(e)}")
+            return None
+
+        # El monitor TTL de Mongo corre cada ~60s, revisar expiración aquí también
+        if not doc or self._como_utc(doc["expira_en"]) <= self._ahora():
+            self.estadisticas["misses"] += 1
+            return None
+
+        self.estadisticas["hits_mongo"] += 1
+        logger.info(f"[OCR-Cache] HIT mongo: {file_hash[:16]}...")
+
+        self._escribir_memoria(llave, doc["datos"], self._como_utc(doc["expira_en"]))
+        return copy.deepcopy(doc["datos"])
+
+    async def guardar(self, file_hash: str, version_prompt: str,
+                      datos: Dict[str, Any], mime_type: Optional[str] = None) -> bool:
+        """
+        Guarda un resultado OCR exitoso en ambos niveles.
+
+        Returns:
+            True si se guardó (False si el caché está deshabilitado o el resultado es un error)
+        """
+        if not self.habilitado or not file_hash or not datos or "error" in datos:
+            return False
+
+        llave = self._llave(file_hash, version_prompt)
+        ahora = self._ahora()
+        expira_en = ahora + self.ttl
+
+        self._escribir_memoria(llave, copy.deepcopy(datos), expira_en)
+        self.estadisticas["escrituras"] += 1
+
+        try:
+            await self._asegurar_indices()
+            await db[COLLECTION_NAME].update_one(
+                {"_id": llave},
+                {"$set": {
+                    "file_hash": file_hash,
+                    "version_prompt": version_prompt,
+                    "mime_type": mime_type,
+                    "datos": datos,
+                    "creado_en": ahora,
+                    "expira_en": expira_en
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            self.estadisticas["errores"] += 1
+            logger.warning(f"[OCR-Cache] Error guardando caché persistente: {str(e)}")
+
+        return True
+
+    async def invalidar(self, file_hash: str, version_prompt: Optional[str] = None):
+        """
+        Elimina las entradas de un archivo (de una versión o de todas).
+        """
+        prefijo = f"{file_hash}:"
+        for llave in [k for k in self._memoria if k.startswith(prefijo)]:
+            if version_prompt is None or llave == self._llave(file_hash, version_prompt):
+                del self._memoria[llave]
+
+        filtro = {"file_hash": file_hash}
+        if version_prompt is not None:
+            filtro["version_prompt"] = version_prompt
+
+        try:
+            await db[COLLECTION_NAME].delete_many(filtro)
+        except Exception as e:
+            self.estadisticas["errores"] += 1
+            logger.warning(f"[OCR-Cache] Error invalidando caché: {str(e)}")
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """Estadísticas de uso del caché para monitoreo"""
+        hits = self.estadisticas["hits_memoria"] + self.estadisticas["hits_mongo"]
+        consultas = hits + self.estadisticas["misses"]
+        return {
+            **self.estadisticas,
+            "entradas_memoria": len(self._memoria),
+            "hit_rate": round(hits / consultas, 4) if consultas else 0.0
+        }
+
+
+# Instancia global del servicio
+ocr_cache_service = OCRCacheService()
@@ -0,0 +1,266 @@
+"""Cola de trabajos OCR/validación respaldada en MongoDB
+
+Los endpoints de carga de comprobantes esperan a que termine Gemini OCR y la
+validación antes de responder, ocupando un worker HTTP por cada archivo.
+En modo asíncrono el endpoint solo guarda el archivo, encola un trabajo y
+responde con su id; un pool de workers dentro de la app procesa la cola.
+
+Colección MongoDB: ocr_jobs
+- estado: pendiente → procesando → completado | error
+- progreso: {"etapa", "porcentaje"} para consulta / SSE
+- intentos / max_intentos con backoff exponencial entre reintentos
+- bloqueado_hasta: si un worker muere a medio trabajo, otro lo retoma al vencer
+
+Cada tipo de trabajo se procesa con un handler registrado:
+    async def handler(job: Dict, progreso) -> Dict
+donde progreso(etapa, porcentaje) es una corrutina para reportar avance.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'ocr_jobs'
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_PROCESANDO = "procesando"
+ESTADO_COMPLETADO = "completado"
+ESTADO_ERROR = "error"
+ESTADOS_FINALES = {ESTADO_COMPLETADO, ESTADO_ERROR}
+
+HandlerJob = Callable[[Dict[str, Any], Callable[[str, int], Awaitable[None]]], Awaitable[Dict[str, Any]]]
+
+
+class OCRJobsService:
+    """Cola de trabajos en MongoDB + pool de workers asyncio"""
+
+    def __init__(self):
+        self.workers = int(os.getenv('OCR_JOBS_WORKERS', '2'))
+        self.max_intentos = int(os.getenv('OCR_JOBS_MAX_INTENTOS', '3'))
+        self.backoff_base_seg = float(os.getenv('OCR_JOBS_BACKOFF_SEG', '5'))
+        self.backoff_max_seg = float(os.getenv('OCR_JOBS_BACKOFF_MAX_SEG', '300'))
+        # Tiempo máximo que un worker retiene un trabajo antes de que otro pueda retomarlo
+        self.lease_seg = float(os.getenv('OCR_JOBS_LEASE_SEG', '600'))
+        self.intervalo_sondeo_seg = float(os.getenv('OCR_JOBS_SONDEO_SEG', '2'))
+
+        self._handlers: Dict[str, HandlerJob] = {}
+        self._tareas: List[asyncio.Task] = []
+        self._hay_trabajo: Optional[asyncio.Event] = None
+        self._detenido = False
+        self._indices_creados = False
+
+    @staticmethod
+    def _ahora() -> datetime:
+        return datetime.now(timezone.utc)
+
+    def registrar_handler(self, tipo: str, handler: HandlerJob):
+        """Registra la corrutina que procesa los trabajos de un tipo"""
+        self._handlers[tipo] = handler
+
+    async def _asegurar_indices(self):
+        if self._indices_creados:
+            return
+        try:
+            await db[COLLECTION_NAME].create_index("id", unique=True)
+            await db[COLLECTION_NAME].create_index([("estado", 1), ("disponible_en", 1)])
+            self._indices_creados = True
+        except Exception as e:
+            logger.warning(f"[OCR-Jobs] No se pudieron crear índices: {str(e)}")
+
+    # ==================== PRODUCTOR ====================
+
+    async def encolar(self, tipo: str, payload: Dict[str, Any], referencia: Optional[str] = None) -> str:
+        """
+        Encola un trabajo.
+
+        Args:
+            tipo: Tipo de trabajo (debe tener handler registrado)
+            payload: Datos que recibe el handler (ruta del archivo, ids, etc.)
+            referencia: Id de la operación/solicitud, para consultas
+
+        Returns:
+            job_id
+        """
+        if tipo not in self._handlers:
+            raise ValueError(f"Tipo de trabajo sin handler: {tipo}")
+
+        await self._asegurar_indices()
+
+        ahora = self._ahora()
+        job_id = str(uuid.uuid4())
+        await db[COLLECTION_NAME].insert_one({
+            "id": job_id,
+            "tipo": tipo,
+            "referencia": referencia,
+            "payload": payload,
+            "estado": ESTADO_PENDIENTE,
+            "progreso": {"etapa": "en_cola", "porcentaje": 0},
+            "resultado": None,
+            "error": None,
+            "intentos": 0,
+            "max_intentos": self.max_intentos,
+            "disponible_en": ahora,
+            "bloqueado_hasta": None,
+            "created_at": ahora,
+            "updated_at": ahora
+        })
+
+        if self._hay_trabajo is not None:
+            self._hay_trabajo.set()
+
+        logger.info(f"[OCR-Jobs] Trabajo encolado: {job_id} ({tipo}, ref={referencia})")
+        return job_id
+
+    async def obtener(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado público de un trabajo (sin payload)"""
+        return await db[COLLECTION_NAME].find_one(
+            {"id": job_id},
+            {"_id": 0, "payload": 0, "bloqueado_hasta": 0}
+        )
+
+    # ==================== CONSUMIDOR ====================
+
+    async def _tomar_trabajo(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Reclama atómicamente el siguiente trabajo disponible (o uno abandonado)"""
+        ahora = self._ahora()
+        return await db[COLLECTION_NAME].find_one_and_update(
+            {
+                "tipo": {"$in": list(self._handlers)},
+                "$or": [
+                    {"estado": ESTADO_PENDIENTE, "disponible_en": {"$lte": ahora}},
+                    {"estado": ESTADO_PROCESANDO, "bloqueado_hasta": {"$lte": ahora}}
+                ]
+            },
+            {
+                "$set": {
+                    "estado": ESTADO_PROCESANDO,
+                    "worker_id": worker_id,
+                    "bloqueado_hasta": ahora + timedelta(seconds=self.lease_seg),
+                    "progreso": {"etapa": "iniciando", "porcentaje": 5},
+                    "updated_at": ahora
+                },
+                "$inc": {"intentos": 1}
+            },
+            sort=[("disponible_en", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _backoff(self, intentos: int) -> float:
+        return min(self.backoff_base_seg * (2 ** max(intentos - 1, 0)), self.backoff_max_seg)
+
+    async def _ejecutar_trabajo(self, job: Dict[str, Any]):
+        job_id = job["id"]
+
+        async def progreso(etapa: str, porcentaje: int):
+            await db[COLLECTION_NAME].update_one(
+                {"id": job_id},
+                {"$set": {
+                    "progreso": {"etapa": etapa, "porcentaje": porcentaje},
+                    "updated_at": self._ahora()
+                }}
+            )
+
+        try:
+            resultado = await self._handlers[job["tipo"]](job, progreso)
+        except asyncio.CancelledError:
+            # Apagado del servidor: liberar el trabajo para que se retome
+            await db[COLLECTION_NAME].update_one(
+                {"id": job_id},
+                {"$set": {"estado": ESTADO_PENDIENTE, "disponible_en": self._ahora(), "updated_at": self._ahora()},
+                 "$inc": {"intentos": -1}}
+            )
+            raise
+        except Exception as e:
+            intentos = job.get("intentos", 1)
+            ahora = self._ahora()
+
+            if intentos < job.get("max_intentos", self.max_intentos):
+                espera = self._backoff(intentos)
+                logger.warning(f"[OCR-Jobs] Trabajo {job_id} falló (intento {intentos}), reintento en {espera:.0f}s: {str(e)}")
+                await db[COLLECTION_NAME].update_one(
+                    {"id": job_id},
+                    {"$set": {
+                        "estado": ESTADO_PENDIENTE,
+                        "disponible_en": ahora + timedelta(seconds=espera),
+                        "error": str(e),
+                        "progreso": {"etapa": "reintento_pendiente", "porcentaje": 0},
+                        "updated_at": ahora
+                    }}
+                )
+            else:
+                logger.error(f"[OCR-Jobs] Trabajo {job_id} falló definitivamente tras {intentos} intento(s): {str(e)}")
+                await db[COLLECTION_NAME].update_one(
+                    {"id": job_id},
+                    {"$set": {
+                        "estado": ESTADO_ERROR,
+                        "error": str(e),
+                        "progreso": {"etapa": "error", "porcentaje": 100},
+                        "updated_at": ahora
+                    }}
+                )
+            return
+
+        await db[COLLECTION_NAME].update_one(
+            {"id": job_id},
+            {"$set": {
+                "estado": ESTADO_COMPLETADO,
+                "resultado": resultado,
+                "error": None,
+                "progreso": {"etapa": "completado", "porcentaje": 100},
+                "updated_at": self._ahora()
+            }}
+        )
+        logger.info(f"[OCR-Jobs] ✅ Trabajo completado: {job_id}")
+
+    async def _worker(self, worker_id: str):
+        logger.info(f"[OCR-Jobs] Worker {worker_id} iniciado")
+        while not self._detenido:
+            try:
+                job = await self._tomar_trabajo(worker_id)
+            except Exception as e:
+                logger.error(f"[OCR-Jobs] Error leyendo la cola: {str(e)}")
+                job = None
+
+            if job is not None:
+                await self._ejecutar_trabajo(job)
+                continue
+
+            # Cola vacía: esperar aviso local o el siguiente sondeo (otros procesos / reintentos)
+            self._hay_trabajo.clear()
+            try:
+                await asyncio.wait_for(self._hay_trabajo.wait(), timeout=self.intervalo_sondeo_seg)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Inicia el pool de workers (llamar desde el startup de la app)"""
+        if self._tareas:
+            return
+        self._detenido = False
+        self._hay_trabajo = asyncio.Event()
+        self._tareas = [
+            asyncio.create_task(self._worker(f"{os.getpid()}-{i}"))
+            for i in range(self.workers)
+        ]
+        logger.info(f"[OCR-Jobs] Pool iniciado con {self.workers} worker(s)")
+
+    async def stop(self):
+        """Detiene los workers; los trabajos en curso vuelven a la cola"""
+        self._detenido = True
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        logger.info("[OCR-Jobs] Pool detenido")
+
+
+# Instancia global del servicio
+ocr_jobs_service = OCRJobsService()
@@ -1,37 +1,33 @@
 import os
 import base64
-from typing import Dict, Any, Optional, List
+import hashlib
+import json
+import time
+import uuid
+from typing import Dict, Any, Optional, List, Tuple
 from emergentintegrations.llm.chat import LlmChat, UserMessage, FileContentWithMimeType
 import asyncio
 from dotenv import load_dotenv
 import logging
 
+from ocr_cache_service import ocr_cache_service
+from llm_gateway_service import llm_gateway, LLMNoDisponible
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Modelo usado para OCR de comprobantes
+OCR_MODELO_PROVEEDOR = "gemini"
+OCR_MODELO = "gemini-2.0-flash"
 
-class OCRService:
-    def __init__(self):
-        self.api_key = os.getenv("EMERGENT_LLM_KEY")
-        if not self.api_key:
-            logger.warning("EMERGENT_LLM_KEY no está configurada")
-    
-    async def leer_comprobante(self, archivo_path: str, mime_type: str) -> Dict[str, Any]:
-        """
-        Lee un comprobante de depósito usando OCR con OpenAI GPT-5.1 visión.
-        
-        Args:
-            archivo_path: Ruta al archivo del comprobante
-            mime_type: Tipo MIME del archivo
-            
-        Returns:
-            Diccionario con los datos extraídos del comprobante
-        """
-        try:
-            # Preparar el mensaje con el archivo
-            prompt = """Analiza este comprobante de depósito bancario y extrae la siguiente información en formato JSON:
+# codigo_error del resultado cuando el gateway rechaza la llamada (proveedor degradado)
+CODIGO_LLM_NO_DISPONIBLE = "llm_no_disponible"
+
+# Versión del prompt OCR - Incrementar al cambiar el prompt para invalidar el caché
+OCR_PROMPT_VERSION = f"v1-{OCR_MODELO}"
 
-{
+# Campos que se extraen de cada comprobante
+ESQUEMA_OCR = """{
   "monto": [monto numérico del depósito como número, ejemplo: 500000.00],
   "fecha": [fecha del depósito en formato YYYY-MM-DD],
   "banco_emisor": [nombre del banco que emite el comprobante - solo UNO],
@@ -42,9 +38,9 @@ class OCRService:
   "transacciones_multiples": [true si el documento contiene MÁS DE UNA transacción/depósito, false si es una sola],
   "cantidad_transacciones": [número de transacciones detectadas en el documento, ejemplo: 1, 2, 3],
   "montos_individuales": [si hay múltiples transacciones, lista de montos individuales, ejemplo: [500000.00, 500000.00, 500000.00]]
-}
+}"""
 
-IMPORTANTE:
+INSTRUCCIONES_OCR = """IMPORTANTE:
 - Si el documento contiene MÚLTIPLES transacciones o depósitos (por ejemplo, 3 depósitos de $500,000 cada uno), indica:
   - transacciones_multiples: true
   - cantidad_transacciones: 3
@@ -53,18 +49,120 @@ IMPORTANTE:
 - Si es UNA SOLA transacción:
   - transacciones_multiples: false
   - cantidad_transacciones: 1
-  - montos_individuales: null
+  - montos_individuales: null"""
+
+PROMPT_OCR = f"""Analiza este comprobante de depósito bancario y extrae la siguiente información en formato JSON:
+
+{ESQUEMA_OCR}
+
+{INSTRUCCIONES_OCR}
 
 Responde ÚNICAMENTE con el JSON, sin explicaciones adicionales. Si algún campo no está visible, usa null."""
+
+# Mismo esquema y modelo que PROMPT_OCR: los resultados comparten la entrada de caché
+PROMPT_OCR_LOTE = ("""Recibirás {cantidad} comprobantes de depósito bancario distintos, adjuntos en orden (documento 1 a {cantidad}).
+Analiza CADA documento por separado, sin mezclar datos entre documentos, y extrae de cada uno la siguiente información:
+
+""" + ESQUEMA_OCR.replace("{", "{{").replace("}", "}}") + """
+
+""" + INSTRUCCIONES_OCR + """
+
+Responde ÚNICAMENTE con un arreglo JSON de exactamente {cantidad} objetos, uno por documento y en el mismo orden,
+cada uno con el campo "documento" (1 a {cantidad}) además de los campos anteriores.
+Sin explicaciones adicionales. Si algún campo no está visible, usa null.""")
+
+
+class OCRService:
+    def __init__(self):
+        self.api_key = os.getenv("EMERGENT_LLM_KEY")
+        if not self.api_key:
+            logger.warning("EMERGENT_LLM_KEY no está configurada")
+        
+        self.estadisticas_lote = {
+            "lotes_enviados": 0,
+            "lotes_fallidos": 0,
+            "documentos_en_lote": 0,
+            "solicitudes_individuales": 0,
+            "latencia_lotes_seg": 0.0,
+            "latencia_individual_seg": 0.0
+        }
+    
+    def _calcular_hash_archivo(self, archivo_path: str) -> Optional[str]:
+        """Calcula hash SHA-256 del archivo (None si no se puede leer)"""
+        try:
+            file_hash = hashlib.sha256()
+            with open(archivo_path, 'rb') as f:
+                while chunk := f.read(65536):
+                    file_hash.update(chunk)
+            return file_hash.hexdigest()
+        except Exception as e:
+            logger.warning(f"[OCR] No se pudo calcular hash de {archivo_path}: {str(e)}")
+            return None
+    
+    async def leer_comprobante(self, archivo_path: str, mime_type: str,
+                               file_hash: Optional[str] = None,
+                               ignorar_cache: bool = False) -> Dict[str, Any]:
+        """
+        Lee un comprobante de depósito usando OCR, reutilizando resultados previos
+        del mismo archivo (caché por hash SHA-256 + versión del prompt).
+        
+        Args:
+            archivo_path: Ruta al archivo del comprobante
+            mime_type: Tipo MIME del archivo
+            file_hash: Hash SHA-256 ya calculado por el llamador (se calcula si falta)
+            ignorar_cache: Si True, no lee del caché (ej: /reocr). El resultado nuevo
+                sí se guarda y reemplaza la entrada anterior.
             
-            # Crear chat con emergentintegrations usando Emergent LLM Key
-            # IMPORTANTE: Para análisis de archivos/imágenes se debe usar Gemini
-            chat = LlmChat(
-                api_key=self.api_key,
-                session_id=f"ocr_{os.path.basename(archivo_path)}",
-                system_message="Eres un asistente experto en leer y extraer información de comprobantes bancarios en español."
-            ).with_model("gemini", "gemini-2.0-flash")
+        Returns:
+            Diccionario con los datos extraídos del comprobante
+        """
+        if not file_hash:
+            file_hash = self._calcular_hash_archivo(archivo_path)
+        
+        if file_hash and not ignorar_cache:
+            datos_cache = await ocr_cache_service.obtener(file_hash, OCR_PROMPT_VERSION)
+            if datos_cache is not None:
+                logger.info(f"OCR obtenido de caché para {archivo_path}")
+                return datos_cache
+        
+        datos = await self._leer_comprobante_llm(archivo_path, mime_type)
+        
+        if file_hash and "error" not in datos:
+            await ocr_cache_service.guardar(file_hash, OCR_PROMPT_VERSION, datos, mime_type)
+        
+        return datos
+    
+    def _crear_chat(self, session_id: str) -> LlmChat:
+        # Crear chat con emergentintegrations usando Emergent LLM Key
+        # IMPORTANTE: Para análisis de archivos/imágenes se debe usar Gemini
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message="Eres un asistente experto en leer y extraer información de comprobantes bancarios en español."
+        ).with_model(OCR_MODELO_PROVEEDOR, OCR_MODELO)
+    
+    @staticmethod
+    def _limpiar_respuesta_json(respuesta_texto: str) -> str:
+        """Quita el bloque markdown (```json ... ```) si el modelo lo incluyó"""
+        if "```json" in respuesta_texto:
+            respuesta_texto = respuesta_texto.split("```json")[1].split("```")[0]
+        elif "```" in respuesta_texto:
+            respuesta_texto = respuesta_texto.split("```")[1].split("```")[0]
+        return respuesta_texto.strip()
+    
+    async def _leer_comprobante_llm(self, archivo_path: str, mime_type: str) -> Dict[str, Any]:
+        """
+        Lee un comprobante de depósito usando OCR con Gemini visión (sin caché).
+        
+        Args:
+            archivo_path: Ruta al archivo del comprobante
+            mime_type: Tipo MIME del archivo
             
+        Returns:
+            Diccionario con los datos extraídos del comprobante
+        """
+        inicio = time.perf_counter()
+        try:
             # Para imágenes y PDFs, crear FileContentWithMimeType correctamente
             # El constructor acepta: mime_type y file_path
             file_content = FileContentWithMimeType(
@@ -74,32 +172,202 @@ Responde ÚNICAMENTE con el JSON, sin explicaciones adicionales. Si algún campo
             
             # Crear mensaje con archivo
             user_message = UserMessage(
-                text=prompt,
+                text=PROMPT_OCR,
                 file_contents=[file_content]
             )
             
-            # Enviar y obtener respuesta
-            respuesta_texto, _ = await chat.send_message_multimodal_response(user_message)
-            
-            # Parsear respuesta JSON
-            import json
-            
-            # Limpiar respuesta si tiene markdown
-            if "```json" in respuesta_texto:
-                respuesta_texto = respuesta_texto.split("```json")[1].split("```")[0]
-            elif "```" in respuesta_texto:
-                respuesta_texto = respuesta_texto.split("```")[1].split("```")[0]
+            # Enviar a través del gateway (límites, reintentos, circuit breaker).
+            # Chat nuevo por intento para no arrastrar historial de un intento fallido.
+            session_id = f"ocr_{os.path.basename(archivo_path)}"
+            respuesta_texto, _ = await llm_gateway.ejecutar(
+                lambda: self._crear_chat(session_id).send_message_multimodal_response(user_message),
+                nombre=f"OCR {os.path.basename(archivo_path)}"
+            )
             
-            datos = json.loads(respuesta_texto.strip())
+            datos = json.loads(self._limpiar_respuesta_json(respuesta_texto))
             
             logger.info(f"OCR completado exitosamente para {archivo_path}")
             return datos
             
+        except LLMNoDisponible as e:
+            logger.error(f"OCR no disponible: {str(e)}")
+            return {
+                "error": f"OCR no disponible temporalmente: {str(e)}",
+                "codigo_error": CODIGO_LLM_NO_DISPONIBLE
+            }
         except Exception as e:
             logger.error(f"Error en OCR: {str(e)}")
             return {
                 "error": f"Error al procesar comprobante: {str(e)}"
             }
+        finally:
+            self.estadisticas_lote["solicitudes_individuales"] += 1
+            self.estadisticas_lote["latencia_individual_seg"] += time.perf_counter() - inicio
+    
+    # ==================== OCR POR LOTES ====================
+    
+    async def leer_comprobantes_lote(self, archivos: List[Tuple[str, str, Optional[str]]],
+                                     concurrencia: int = 2) -> List[Dict[str, Any]]:
+        """
+        Lee varios comprobantes agrupándolos en pocas solicitudes multimodales.
+        
+        Los archivos con resultado en caché no se envían. El resto se agrupa en
+        lotes acotados por OCR_LOTE_MAX_ARCHIVOS y OCR_LOTE_MAX_BYTES; si la
+        respuesta de un lote no se puede interpretar, sus archivos se leen uno por uno.
+        
+        Args:
+            archivos: Lista de (archivo_path, mime_type, file_hash)
+            concurrencia: Lotes enviados al mismo tiempo
+            
+        Returns:
+            Resultados en el mismo orden que archivos (mismo formato que leer_comprobante)
+        """
+        resultados: List[Optional[Dict[str, Any]]] = [None] * len(archivos)
+        pendientes = []
+        
+        for i, (archivo_path, mime_type, file_hash) in enumerate(archivos):
+            file_hash = file_hash or self._calcular_hash_archivo(archivo_path)
+            if file_hash:
+                datos_cache = await ocr_cache_service.obtener(file_hash, OCR_PROMPT_VERSION)
+                if datos_cache is not None:
+                    resultados[i] = datos_cache
+                    continue
+            pendientes.append((i, archivo_path, mime_type, file_hash))
+        
+        lotes = self._agrupar_en_lotes(pendientes)
+        logger.info(f"[OCR-Lote] {len(archivos)} archivo(s): {len(archivos) - len(pendientes)} en caché, "
+                    f"{len(pendientes)} en {len(lotes)} solicitud(es)")
+        
+        semaforo = asyncio.Semaphore(concurrencia)
+        
+        async def _procesar_lote(lote):
+            async with semaforo:
+                if len(lote) == 1:
+                    _, archivo_path, mime_type, _ = lote[0]
+                    lecturas = [await self._leer_comprobante_llm(archivo_path, mime_type)]
+                else:
+                    lecturas = await self._leer_lote_llm(lote)
+            
+            for (i, _, mime_type, file_hash), datos in zip(lote, lecturas):
+                resultados[i] = datos
+                if file_hash and "error" not in datos:
+                    await ocr_cache_service.guardar(file_hash, OCR_PROMPT_VERSION, datos, mime_type)
+        
+        await asyncio.gather(*[_procesar_lote(lote) for lote in lotes])
+        return resultados
+    
+    def _agrupar_en_lotes(self, pendientes: List[Tuple]) -> List[List[Tuple]]:
+        """Agrupa (indice, path, mime, hash) respetando el máximo de archivos y de bytes por solicitud"""
+        max_archivos = int(os.getenv('OCR_LOTE_MAX_ARCHIVOS', '5'))
+        max_bytes = int(float(os.getenv('OCR_LOTE_MAX_MB', '12')) * 1024 * 1024)
+        
+        lotes = []
+        lote_actual = []
+        bytes_actual = 0
+        for pendiente in pendientes:
+            try:
+                tamano = os.path.getsize(pendiente[1])
+            except OSError:
+                tamano = 0
+            
+            if lote_actual and (len(lote_actual) >= max_archivos or bytes_actual + tamano > max_bytes):
+                lotes.append(lote_actual)
+                lote_actual = []
+                bytes_actual = 0
+            
+            lote_actual.append(pendiente)
+            bytes_actual += tamano
+        
+        if lote_actual:
+            lotes.append(lote_actual)
+        return lotes
+    
+    async def _leer_lote_llm(self, lote: List[Tuple]) -> List[Dict[str, Any]]:
+        """
+        Envía un lote en una sola solicitud; si falla o la respuesta no corresponde
+        documento a documento, lee cada archivo por separado.
+        """
+        inicio = time.perf_counter()
+        try:
+            session_id = f"ocr_lote_{uuid.uuid4().hex[:12]}"
+            user_message = UserMessage(
+                text=PROMPT_OCR_LOTE.format(cantidad=len(lote)),
+                file_contents=[
+                    FileContentWithMimeType(mime_type=mime_type, file_path=archivo_path)
+                    for _, archivo_path, mime_type, _ in lote
+                ]
+            )
+            respuesta_texto, _ = await llm_gateway.ejecutar(
+                lambda: self._crear_chat(session_id).send_message_multimodal_response(user_message),
+                nombre=f"OCR lote de {len(lote)}"
+            )
+            lecturas = self._parsear_respuesta_lote(respuesta_texto, len(lote))
+            
+            latencia = time.perf_counter() - inicio
+            self.estadisticas_lote["lotes_enviados"] += 1
+            self.estadisticas_lote["documentos_en_lote"] += len(lote)
+            self.estadisticas_lote["latencia_lotes_seg"] += latencia
+            logger.info(f"[OCR-Lote] ✅ {len(lote)} comprobantes en una solicitud ({latencia:.1f}s)")
+            return lecturas
+            
+        except LLMNoDisponible as e:
+            # Con el proveedor degradado no tiene caso reintentar archivo por archivo
+            logger.error(f"[OCR-Lote] OCR no disponible: {str(e)}")
+            return [
+                {"error": f"OCR no disponible temporalmente: {str(e)}", "codigo_error": CODIGO_LLM_NO_DISPONIBLE}
+                for _ in lote
+            ]
+        except Exception as e:
+            self.estadisticas_lote["lotes_fallidos"] += 1
+            logger.warning(f"[OCR-Lote] Lote de {len(lote)} falló ({str(e)}), leyendo uno por uno")
+            return list(await asyncio.gather(*[
+                self._leer_comprobante_llm(archivo_path, mime_type)
+                for _, archivo_path, mime_type, _ in lote
+            ]))
+    
+    def _parsear_respuesta_lote(self, respuesta_texto: str, cantidad: int) -> List[Dict[str, Any]]:
+        """
+        Convierte el arreglo JSON del lote en un resultado por documento.
+        
+        Raises:
+            ValueError si la respuesta no trae exactamente un objeto por documento
+        """
+        datos = json.loads(self._limpiar_respuesta_json(respuesta_texto))
+        
+        if not isinstance(datos, list) or len(datos) != cantidad:
+            raise ValueError(f"se esperaban {cantidad} documentos en la respuesta")
+        if not all(isinstance(d, dict) for d in datos):
+            raise ValueError("la respuesta contiene elementos que no son objetos")
+        
+        # Reordenar por el número de documento si el modelo lo devolvió desordenado
+        numeros = [d.get("documento") for d in datos]
+        if sorted(n for n in numeros if isinstance(n, int)) == list(range(1, cantidad + 1)):
+            datos = sorted(datos, key=lambda d: d["documento"])
+        elif any(n is not None for n in numeros):
+            raise ValueError(f"números de documento inválidos: {numeros}")
+        
+        return [{k: v for k, v in d.items() if k != "documento"} for d in datos]
+    
+    def obtener_estadisticas_lote(self) -> Dict[str, Any]:
+        """Solicitudes hechas y latencia ahorrada por el OCR en lotes"""
+        stats = self.estadisticas_lote
+        individuales = stats["solicitudes_individuales"]
+        latencia_media_individual = stats["latencia_individual_seg"] / individuales if individuales else None
+        
+        ahorradas = stats["documentos_en_lote"] - stats["lotes_enviados"]
+        latencia_ahorrada = None
+        if latencia_media_individual is not None:
+            latencia_ahorrada = round(
+                stats["documentos_en_lote"] * latencia_media_individual - stats["latencia_lotes_seg"], 3
+            )
+        
+        return {
+            **stats,
+            "solicitudes_totales": individuales + stats["lotes_enviados"] + stats["lotes_fallidos"],
+            "solicitudes_ahorradas": ahorradas,
+            "latencia_media_individual_seg": round(latencia_media_individual, 3) if latencia_media_individual else None,
+            "latencia_ahorrada_estimada_seg": latencia_ahorrada
+        }
     
     def validar_cuenta_beneficiaria(self, cuenta_leida: str, cuenta_esperada: str) -> bool:
         """
@@ -0,0 +1,234 @@
+"""Estadísticas del tablero de operaciones (web + Telegram)
+
+El Dashboard descargaba todas las operaciones de GET /api/operaciones solo para
+contar cuántas hay por estado. GET /api/operaciones/stats calcula con una sola
+agregación sobre operaciones + solicitudes_netcash ($unionWith):
+
+- total de operaciones, monto depositado y comisión cobrada
+- por_estado: cantidad, monto y comisión por estado de operación (los estados de
+  Telegram se traducen a los web, igual que en el listado)
+- por_origen: cantidad web / telegram
+- por_etapa: pendientes, en_proceso y completadas (las tarjetas del Dashboard)
+
+Filtros: cliente_id y rango de fecha de creación desde/hasta.
+
+Los resultados se guardan en memoria por filtro durante
+OPERACIONES_STATS_CACHE_SEG segundos (default 15). invalidar() vacía el
+caché; lo llaman las escrituras que cambian estado, montos o comisión (alta y
+borrado de operaciones, comprobantes agregados, eliminados, re-OCR y captura
+manual) y, con replica set, cada evento del change stream de operaciones_view.
+Sin replica set esas llamadas son las que evitan servir datos viejos.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import db
+from operaciones_unificadas_service import (
+    COLECCION_TELEGRAM, COLECCION_WEB, ESTADO_OPERACION_DEFAULT, ESTADOS_SOLICITUD_A_OPERACION,
+    ORIGEN_TELEGRAM, ORIGEN_WEB, _a_utc, _iso_segundo
+)
+
+logger = logging.getLogger(__name__)
+
+# Tarjetas del Dashboard: estados de operación que cuenta cada etapa
+ETAPAS = {
+    "pendientes": ["ESPERANDO_COMPROBANTES"],
+    "en_proceso": ["VALIDANDO_COMPROBANTES", "ESPERANDO_DATOS_TITULAR", "ESPERANDO_CONFIRMACION_CLIENTE",
+                   "ESPERANDO_CODIGO_SISTEMA", "PENDIENTE_PAGO_PROVEEDOR", "ESPERANDO_TESORERIA",
+                   "ESPERANDO_PROVEEDOR", "LISTO_PARA_ENTREGAR"],
+    "completadas": ["COMPLETADO"],
+}
+
+
+def _mayor_que_cero(valor: str) -> Dict:
+    return {"$gt": [{"$ifNull": [valor, 0]}, 0]}
+
+
+def _estado_telegram_a_web() -> Dict:
+    """$switch equivalente a mapear_estado_solicitud"""
+    por_estado_web: Dict[str, List[str]] = {}
+    for estado_telegram, estado_web in ESTADOS_SOLICITUD_A_OPERACION.items():
+        por_estado_web.setdefault(estado_web, []).append(estado_telegram)
+    return {"$switch": {
+        "branches": [
+            {"case": {"$in": ["$estado", sorted(estados)]}, "then": estado_web}
+            for estado_web, estados in sorted(por_estado_web.items())
+        ],
+        "default": ESTADO_OPERACION_DEFAULT,
+    }}
+
+
+# Monto de una solicitud sin monto_depositado_cliente: suma de comprobantes válidos no duplicados
+_MONTO_COMPROBANTES = {"$sum": {"$map": {
+    "input": {"$filter": {
+        "input": {"$ifNull": ["$comprobantes", []]},
+        "cond": {"$and": [{"$eq": ["$$this.es_valido", True]}, {"$ne": ["$$this.es_duplicado", True]}]},
+    }},
+    "in": {"$cond": [_mayor_que_cero("$$this.monto"), "$$this.monto",
+                     {"$ifNull": ["$$this.monto_detectado", 0]}]},
+}}}
+
+
+class OperacionesStatsService:
+    """Agregación de estadísticas con caché corto por filtro"""
+
+    def __init__(self):
+        self.cache_segundos = float(os.environ.get('OPERACIONES_STATS_CACHE_SEG', '15'))
+        self._cache: Dict[Tuple, Tuple[float, Dict]] = {}
+        # Cambia en cada invalidación; un cálculo que empezó antes no se guarda
+        self._generacion = 0
+        self._aciertos = 0
+        self._calculos = 0
+        self._invalidaciones = 0
+
+    def _rama_web(self, filtros: Dict) -> List[Dict]:
+        """fecha_creacion es texto ISO: cota de texto con índice y comparación exacta sobre la fecha convertida"""
+        previo, exacto = {}, {}
+        if filtros.get("cliente_id"):
+            # Las operaciones web guardan el cliente en id_cliente (OperacionNetCash)
+            previo["id_cliente"] = filtros["cliente_id"]
+        cotas = {}
+        if filtros.get("desde"):
+            cotas["$gte"] = _iso_segundo(filtros["desde"])
+            exacto["$gte"] = filtros["desde"]
+        if filtros.get("hasta"):
+            cotas["$lt"] = _iso_segundo(filtros["hasta"] + timedelta(seconds=1))
+            exacto["$lte"] = filtros["hasta"]
+        if cotas:
+            previo["fecha_creacion"] = cotas
+
+        etapas = [{"$match": previo}]
+        if exacto:
+            etapas.extend([
+                {"$addFields": {"_fecha": {"$convert": {"input": "$fecha_creacion", "to": "date",
+                                                        "onError": None, "onNull": None}}}},
+                {"$match": {"_fecha": exacto}},
+            ])
+        etapas.append({"$project": {
+            "_id": 0,
+            "origen": ORIGEN_WEB,
+            "estado": {"$ifNull": ["$estado", ESTADO_OPERACION_DEFAULT]},
+            "monto": {"$ifNull": ["$monto_depositado_cliente", 0]},
+            "comision": {"$ifNull": ["$comision_cobrada", 0]},
+        }})
+        return etapas
+
+    def _rama_telegram(self, filtros: Dict) -> List[Dict]:
+        filtro = {}
+        if filtros.get("cliente_id"):
+            filtro["cliente_id"] = filtros["cliente_id"]
+        rango = {}
+        if filtros.get("desde"):
+            rango["$gte"] = filtros["desde"]
+        if filtros.get("hasta"):
+            rango["$lte"] = filtros["hasta"]
+        if rango:
+            filtro["created_at"] = rango
+
+        return [
+            {"$match": filtro},
+            {"$project": {
+                "_id": 0,
+                "origen": ORIGEN_TELEGRAM,
+                "estado": _estado_telegram_a_web(),
+                # Mismas reglas que normalizar_solicitud_telegram
+                "monto": {"$cond": [_mayor_que_cero("$monto_depositado_cliente"),
+                                    "$monto_depositado_cliente", _MONTO_COMPROBANTES]},
+                "comision": {"$cond": [_mayor_que_cero("$comision_cliente"), "$comision_cliente",
+                                       {"$ifNull": ["$comision_cobrada", 0]}]},
+            }},
+        ]
+
+    def construir_pipeline(self, filtros: Dict) -> Tuple[str, List[Dict]]:
+        """Returns: (colección base, pipeline) con un documento por (estado, origen)"""
+        return COLECCION_WEB, [
+            *self._rama_web(filtros),
+            {"$unionWith": {"coll": COLECCION_TELEGRAM, "pipeline": self._rama_telegram(filtros)}},
+            {"$group": {
+                "_id": {"estado": "$estado", "origen": "$origen"},
+                "cantidad": {"$sum": 1},
+                "monto_depositado": {"$sum": "$monto"},
+                "comision": {"$sum": "$comision"},
+            }},
+        ]
+
+    def _resumir(self, grupos: List[Dict]) -> Dict[str, Any]:
+        por_estado: Dict[str, Dict[str, Any]] = {}
+        por_origen = {ORIGEN_WEB: 0, ORIGEN_TELEGRAM: 0}
+        for grupo in grupos:
+            estado = grupo["_id"]["estado"]
+            acumulado = por_estado.setdefault(estado, {"cantidad": 0, "monto_depositado": 0.0, "comision": 0.0})
+            acumulado["cantidad"] += grupo["cantidad"]
+            acumulado["monto_depositado"] += grupo["monto_depositado"] or 0
+            acumulado["comision"] += grupo["comision"] or 0
+            por_origen[grupo["_id"]["origen"]] += grupo["cantidad"]
+
+        return {
+            "total": sum(e["cantidad"] for e in por_estado.values()),
+            "monto_depositado": round(sum(e["monto_depositado"] for e in por_estado.values()), 2),
+            "comision": round(sum(e["comision"] for e in por_estado.values()), 2),
+            "por_estado": {
+                estado: {**valores, "monto_depositado": round(valores["monto_depositado"], 2),
+                         "comision": round(valores["comision"], 2)}
+                for estado, valores in sorted(por_estado.items())
+            },
+            "por_origen": por_origen,
+            "por_etapa": {
+                etapa: sum(por_estado.get(estado, {}).get("cantidad", 0) for estado in estados)
+                for etapa, estados in ETAPAS.items()
+            },
+        }
+
+    async def obtener(self, cliente_id: Optional[str] = None, desde: Optional[datetime] = None,
+                      hasta: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Estadísticas de las operaciones que cumplen los filtros.
+
+        Returns:
+            {"total", "monto_depositado", "comision", "por_estado", "por_origen",
+             "por_etapa", "calculado_en", "desde_cache"}
+        """
+        filtros = {
+            "cliente_id": cliente_id,
+            "desde": _a_utc(desde) if desde else None,
+            "hasta": _a_utc(hasta) if hasta else None,
+        }
+        clave = (filtros["cliente_id"], filtros["desde"], filtros["hasta"])
+
+        guardado = self._cache.get(clave)
+        if guardado and time.monotonic() - guardado[0] < self.cache_segundos:
+            self._aciertos += 1
+            return {**guardado[1], "desde_cache": True}
+
+        generacion = self._generacion
+        coleccion, pipeline = self.construir_pipeline(filtros)
+        grupos = await db[coleccion].aggregate(pipeline).to_list(None)
+        self._calculos += 1
+
+        resultado = {**self._resumir(grupos), "calculado_en": datetime.now(timezone.utc)}
+        if generacion == self._generacion:
+            self._cache[clave] = (time.monotonic(), resultado)
+        return {**resultado, "desde_cache": False}
+
+    def invalidar(self):
+        """Descarta las estadísticas en caché (una operación cambió)"""
+        self._generacion += 1
+        self._invalidaciones += 1
+        self._cache.clear()
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        return {
+            "cache_segundos": self.cache_segundos,
+            "entradas_cache": len(self._cache),
+            "aciertos": self._aciertos,
+            "calculos": self._calculos,
+            "invalidaciones": self._invalidaciones,
+        }
+
+
+# Instancia global del servicio
+operaciones_stats_service = OperacionesStatsService()
@@ -0,0 +1,417 @@
+"""Listado unificado de operaciones (web + Telegram) paginado por cursor
+
+GET /api/operaciones antes leía hasta 1000 documentos de cada colección con
+todos sus campos (incluido ocr_data de cada comprobante), los normalizaba y
+ordenaba en Python, y cortaba sin aviso a partir de 1000.
+
+Ahora una sola agregación sobre operaciones hace la unión con
+solicitudes_netcash ($unionWith), el orden por fecha de creación y el límite;
+cada rama filtra y ordena con su propio índice y solo aporta limite + 1
+documentos. En Python solo se normaliza la página devuelta.
+
+- Orden: fecha de creación descendente, desempate por id
+- Cursor: base64 de {"f": fecha ISO | null, "id"} del último elemento de la página
+- Filtros: estado (estados de operación web; se traducen a los de Telegram),
+  origen ("web" | "telegram"), cliente_id, rango de fechas desde/hasta
+- Vistas: "completa" (todos los campos) | "lista" (campos que usan los listados)
+"""
+
+import base64
+import binascii
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COLECCION_WEB = 'operaciones'
+COLECCION_TELEGRAM = 'solicitudes_netcash'
+
+ORIGEN_WEB = "web"
+ORIGEN_TELEGRAM = "telegram"
+
+LIMITE_DEFAULT = 50
+LIMITE_MAXIMO = 200
+
+VISTA_COMPLETA = "completa"
+VISTA_LISTA = "lista"
+
+ESTADO_OPERACION_DEFAULT = "ESPERANDO_COMPROBANTES"
+
+# Estados de solicitud Telegram -> estados de operación web
+ESTADOS_SOLICITUD_A_OPERACION = {
+    "borrador": "ESPERANDO_COMPROBANTES",
+    "pendiente_comprobantes": "ESPERANDO_COMPROBANTES",
+    "pendiente_datos": "ESPERANDO_DATOS_TITULAR",
+    "pendiente_confirmacion": "ESPERANDO_CONFIRMACION_CLIENTE",
+    "pendiente_validacion_admin": "VALIDANDO_COMPROBANTES",
+    "lista_para_mbco": "ESPERANDO_CODIGO_SISTEMA",
+    "enviada_tesoreria": "ESPERANDO_TESORERIA",
+    "completada": "COMPLETADO",
+    "rechazada": "CANCELADA_POR_INACTIVIDAD",
+    "cancelada": "CANCELADA_POR_INACTIVIDAD",
+    # Estados adicionales del bot de Telegram
+    "esperando_validacion_ana": "VALIDANDO_COMPROBANTES",
+    "ESPERANDO_VALIDACION_ANA": "VALIDANDO_COMPROBANTES",
+    "lista_para_confirmacion": "ESPERANDO_CONFIRMACION_CLIENTE",
+    "LISTA_PARA_CONFIRMACION": "ESPERANDO_CONFIRMACION_CLIENTE",
+    "lista_para_mbc": "DATOS_COMPLETOS",
+    "LISTA_PARA_MBC": "DATOS_COMPLETOS",
+    "enviado_a_tesoreria": "ESPERANDO_TESORERIA",
+    "ENVIADO_A_TESORERIA": "ESPERANDO_TESORERIA",
+    "orden_interna_generada": "ESPERANDO_CODIGO_SISTEMA",
+    "ORDEN_INTERNA_GENERADA": "ESPERANDO_CODIGO_SISTEMA",
+    "dispersada_proveedor": "COMPLETADO",
+    "DISPERSADA_PROVEEDOR": "COMPLETADO",
+}
+
+TIMESTAMPS_WEB = ['timestamp_confirmacion_cliente', 'timestamp_codigo_sistema',
+                  'timestamp_pago_proveedor', 'timestamp_ligas_recibidas',
+                  'timestamp_entrega_cliente']
+
+# Campos de comprobante que usan los listados (Dashboard, PendientesMBControl, ComprobantesModal);
+# sin ocr_data, que es la mayor parte del documento
+_CAMPOS_COMPROBANTE_LISTA = ["es_valido", "es_duplicado", "mensaje_validacion", "monto", "monto_detectado",
+                             "fecha", "banco_emisor", "cuenta_beneficiaria", "nombre_beneficiario",
+                             "clave_rastreo", "nombre_archivo", "archivo_original", "file_url", "archivo_url"]
+
+PROYECCION_LISTA_WEB = {
+    "_id": 0,
+    **{campo: 1 for campo in [
+        "id", "folio_mbco", "id_cliente", "cliente_nombre", "titular_nombre_completo", "titular_idmex",
+        "numero_ligas", "nombre_ligas", "cantidad_ligas", "estado", "fecha_creacion",
+        "monto_depositado_cliente", "monto_total_comprobantes", "comision_cobrada", "porcentaje_comision_usado",
+        "capital_netcash", "calculos", "codigo_operacion_sistema", "clave_operacion_mbcontrol",
+        "modo_captura", "origen",
+    ]},
+    **{f"comprobantes.{campo}": 1 for campo in _CAMPOS_COMPROBANTE_LISTA},
+}
+
+PROYECCION_LISTA_TELEGRAM = {
+    "_id": 0,
+    **{campo: 1 for campo in [
+        "id", "folio_mbco", "cliente_id", "cliente_nombre", "beneficiario_reportado", "idmex_reportado",
+        "cantidad_ligas_reportada", "estado", "created_at", "monto_depositado_cliente",
+        "comision_cliente", "comision_cobrada", "comision_cliente_porcentaje", "porcentaje_comision_usado",
+        "modo_captura", "telegram_id", "idmex_beneficiario_declarado", "capital_netcash",
+        "costo_proveedor_monto", "costo_proveedor_pct", "total_egreso", "calculos",
+    ]},
+    **{f"comprobantes.{campo}": 1 for campo in _CAMPOS_COMPROBANTE_LISTA},
+}
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se pudo decodificar"""
+
+
+def mapear_estado_solicitud(estado_telegram: str) -> str:
+    """Mapea estados de solicitud Telegram a estados de operación web"""
+    return ESTADOS_SOLICITUD_A_OPERACION.get(estado_telegram, ESTADO_OPERACION_DEFAULT)
+
+
+def condicion_estado_telegram(estados: List[str]) -> Dict[str, Any]:
+    """
+    Condición sobre solicitudes_netcash.estado equivalente a un filtro por estados web.
+
+    Los estados de Telegram desconocidos (o ausentes) se muestran como
+    ESPERANDO_COMPROBANTES, así que ese estado se expresa por exclusión.
+    """
+    if ESTADO_OPERACION_DEFAULT in estados:
+        return {"$nin": sorted(e for e, web in ESTADOS_SOLICITUD_A_OPERACION.items() if web not in estados)}
+    return {"$in": sorted(e for e, web in ESTADOS_SOLICITUD_A_OPERACION.items() if web in estados)}
+
+
+def _a_utc(fecha: datetime) -> datetime:
+    return fecha.replace(tzinfo=timezone.utc) if fecha.tzinfo is None else fecha.astimezone(timezone.utc)
+
+
+def _iso_segundo(fecha: datetime) -> str:
+    """Prefijo ISO hasta segundos; compara bien contra fecha_creacion guardada con isoformat() en UTC"""
+    return _a_utc(fecha).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def codificar_cursor(fecha: Optional[datetime], operacion_id: str) -> str:
+    datos = {"f": _a_utc(fecha).isoformat() if fecha else None, "id": operacion_id}
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode()
+
+
+def decodificar_cursor(cursor: str):
+    """Returns: (fecha UTC | None, id)"""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        fecha = datetime.fromisoformat(datos["f"]) if datos["f"] else None
+        return fecha, str(datos["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise CursorInvalido(f"Cursor inválido: {cursor}") from e
+
+
+def _normalizar_url_archivo(archivo_path: str) -> str:
+    # Convertir ruta absoluta del servidor a URL relativa accesible
+    if archivo_path.startswith("/app/backend/uploads/"):
+        return archivo_path.replace("/app/backend/uploads/", "/api/uploads/")
+    if archivo_path.startswith("/uploads/"):
+        return "/api" + archivo_path
+    return archivo_path
+
+
+def normalizar_operacion_web(op: Dict) -> Dict:
+    """Operación manual (web): timestamps ISO a datetime, origen y cliente_id (como en Telegram)"""
+    if op.get('id_cliente') and not op.get('cliente_id'):
+        op['cliente_id'] = op['id_cliente']
+    if isinstance(op.get('fecha_creacion'), str):
+        op['fecha_creacion'] = datetime.fromisoformat(op['fecha_creacion'])
+    for field in TIMESTAMPS_WEB:
+        if op.get(field) and isinstance(op[field], str):
+            op[field] = datetime.fromisoformat(op[field])
+    op['origen'] = op.get('origen', ORIGEN_WEB)
+    return op
+
+
+def normalizar_solicitud_telegram(sol: Dict, detalle: bool = False, cliente: Optional[Dict] = None) -> Dict:
+    """
+    Mapea una solicitud de Telegram a la estructura de operación que usa el frontend.
+
+    Args:
+        detalle: Agrega los campos de la vista de detalle (datos del cliente
+                 desde el catálogo, captura manual)
+        cliente: Documento del cliente en el catálogo (solo con detalle)
+    """
+    comprobantes_normalizados = []
+    for comp in sol.get("comprobantes", []):
+        comp_normalizado = dict(comp)
+        # Mapear monto_detectado a monto para que el frontend lo encuentre
+        if "monto_detectado" in comp_normalizado and "monto" not in comp_normalizado:
+            comp_normalizado["monto"] = comp_normalizado.get("monto_detectado", 0)
+        # Normalizar archivo_url/file_url para que sea accesible desde el frontend
+        archivo_path = comp_normalizado.get("archivo_url") or comp_normalizado.get("file_url")
+        if archivo_path:
+            archivo_path = _normalizar_url_archivo(archivo_path)
+            comp_normalizado["file_url"] = archivo_path
+            comp_normalizado["archivo_url"] = archivo_path
+        comprobantes_normalizados.append(comp_normalizado)
+
+    operacion_normalizada = {
+        "id": sol.get("id"),
+        "folio_mbco": sol.get("folio_mbco"),
+        "cliente_id": sol.get("cliente_id"),
+        "cliente_nombre": sol.get("cliente_nombre"),
+        "titular_nombre_completo": sol.get("beneficiario_reportado"),
+        "titular_idmex": sol.get("idmex_reportado") or sol.get("idmex_beneficiario_declarado"),
+        "numero_ligas": sol.get("cantidad_ligas_reportada", 0),
+        "comprobantes": comprobantes_normalizados,
+        "estado": mapear_estado_solicitud(sol.get("estado", "borrador")),
+        "fecha_creacion": sol.get("created_at"),
+        "monto_depositado_cliente": sol.get("monto_depositado_cliente", 0),
+        "monto_total_comprobantes": sol.get("monto_depositado_cliente", 0),
+        "comision_cobrada": sol.get("comision_cliente", 0) or sol.get("comision_cobrada", 0),
+        "porcentaje_comision_usado": sol.get("comision_cliente_porcentaje", 1.0) or sol.get("porcentaje_comision_usado", 1.0),
+        "origen": ORIGEN_TELEGRAM,
+        "modo_captura": sol.get("modo_captura", "ocr_ok"),
+        # Campos adicionales de Telegram
+        "telegram_id": sol.get("telegram_id"),
+        "idmex_beneficiario_declarado": sol.get("idmex_beneficiario_declarado"),
+        # Campos de cálculos para compatibilidad con frontend
+        "capital_netcash": sol.get("capital_netcash"),
+        "costo_proveedor_monto": sol.get("costo_proveedor_monto"),
+        "costo_proveedor_pct": sol.get("costo_proveedor_pct"),
+        "total_egreso": sol.get("total_egreso"),
+        "calculos": sol.get("calculos"),
+    }
+
+    if detalle:
+        cliente = cliente or {}
+        operacion_normalizada.update({
+            # Datos del cliente desde catálogo
+            "propietario": cliente.get("propietario"),
+            "cliente_email": cliente.get("email"),
+            "cliente_telegram_id": cliente.get("telegram_id"),
+            "cliente_telefono_completo": cliente.get("telefono_completo"),
+            "porcentaje_comision_cliente": cliente.get("porcentaje_comision_cliente", 1.0),
+            "origen_operacion": ORIGEN_TELEGRAM,
+            # Datos de captura manual (cuando OCR falla)
+            "captura_manual": {
+                "origen_montos": sol.get("origen_montos"),
+                "num_comprobantes_declarado": sol.get("num_comprobantes_declarado"),
+                "monto_total_declarado": sol.get("monto_total_declarado"),
+                "beneficiario_declarado": sol.get("beneficiario_declarado"),
+            } if sol.get("modo_captura") == "manual_por_fallo_ocr" else None,
+        })
+
+    # Calcular monto si hay comprobantes válidos
+    if not operacion_normalizada["monto_depositado_cliente"]:
+        monto_total = sum(
+            c.get("monto", 0) or c.get("monto_detectado", 0)
+            for c in comprobantes_normalizados
+            if c.get("es_valido") and not c.get("es_duplicado")
+        )
+        operacion_normalizada["monto_depositado_cliente"] = monto_total
+        operacion_normalizada["monto_total_comprobantes"] = monto_total
+
+    return operacion_normalizada
+
+
+class OperacionesUnificadasService:
+    """Construye y ejecuta la agregación del listado unificado"""
+
+    def _condicion_despues_de(self, campo: str, fecha: Optional[datetime], operacion_id: str) -> Dict:
+        """Elementos posteriores al cursor en orden (campo desc, id desc); las fechas nulas van al final"""
+        if fecha is None:
+            return {campo: None, "id": {"$lt": operacion_id}}
+        return {"$or": [
+            {campo: {"$lt": fecha}},
+            {campo: fecha, "id": {"$lt": operacion_id}},
+            {campo: None},
+        ]}
+
+    def _rango(self, campo: str, desde: Optional[datetime], hasta: Optional[datetime]) -> Dict:
+        rango = {}
+        if desde:
+            rango["$gte"] = desde
+        if hasta:
+            rango["$lte"] = hasta
+        return {campo: rango} if rango else {}
+
+    def _rama_web(self, filtros: Dict, limite: int, cursor, vista: str) -> List[Dict]:
+        """
+        fecha_creacion se guarda como texto ISO: el $match previo usa el índice con
+        cotas de texto al segundo (superconjunto) y el exacto se aplica sobre la fecha convertida.
+        """
+        previo, exacto = {}, {}
+        if filtros.get("estados"):
+            previo["estado"] = {"$in": filtros["estados"]}
+        if filtros.get("cliente_id"):
+            # Las operaciones web guardan el cliente en id_cliente (OperacionNetCash)
+            previo["id_cliente"] = filtros["cliente_id"]
+
+        cotas, superiores = {}, []
+        if filtros.get("desde"):
+            cotas["$gte"] = _iso_segundo(filtros["desde"])
+        if filtros.get("hasta"):
+            superiores.append(_iso_segundo(filtros["hasta"] + timedelta(seconds=1)))
+        exacto.update(self._rango("_fecha", filtros.get("desde"), filtros.get("hasta")))
+
+        if cursor:
+            fecha, operacion_id = cursor
+            if fecha is not None:
+                superiores.append(_iso_segundo(fecha + timedelta(seconds=1)))
+            exacto.update(self._condicion_despues_de("_fecha", fecha, operacion_id))
+        if superiores:
+            cotas["$lt"] = min(superiores)
+
+        if cotas:
+            if filtros.get("desde") or filtros.get("hasta"):
+                previo["fecha_creacion"] = cotas
+            else:
+                # Solo cursor: las operaciones sin fecha van al final y siguen en la página
+                previo["$or"] = [{"fecha_creacion": cotas}, {"fecha_creacion": None}]
+
+        etapas = [
+            {"$match": previo},
+            {"$sort": {"fecha_creacion": -1, "id": -1}},
+            {"$project": PROYECCION_LISTA_WEB if vista == VISTA_LISTA else {"_id": 0}},
+            {"$addFields": {
+                "_origen": ORIGEN_WEB,
+                "_fecha": {"$convert": {"input": "$fecha_creacion", "to": "date", "onError": None, "onNull": None}},
+            }},
+        ]
+        if exacto:
+            etapas.append({"$match": exacto})
+        etapas.append({"$limit": limite + 1})
+        return etapas
+
+    def _rama_telegram(self, filtros: Dict, limite: int, cursor, vista: str) -> List[Dict]:
+        filtro = {}
+        if filtros.get("estados"):
+            filtro["estado"] = condicion_estado_telegram(filtros["estados"])
+        if filtros.get("cliente_id"):
+            filtro["cliente_id"] = filtros["cliente_id"]
+        filtro.update(self._rango("created_at", filtros.get("desde"), filtros.get("hasta")))
+        if cursor:
+            filtro.setdefault("$and", []).append(self._condicion_despues_de("created_at", *cursor))
+
+        return [
+            {"$match": filtro},
+            {"$sort": {"created_at": -1, "id": -1}},
+            {"$limit": limite + 1},
+            {"$project": PROYECCION_LISTA_TELEGRAM if vista == VISTA_LISTA else {"_id": 0}},
+            {"$addFields": {"_origen": ORIGEN_TELEGRAM, "_fecha": "$created_at"}},
+        ]
+
+    def construir_pipeline(self, filtros: Dict, limite: int, cursor=None, vista: str = VISTA_COMPLETA):
+        """
+        Returns:
+            (colección base, pipeline). Cada rama aporta como máximo limite + 1
+            documentos; el + 1 indica si hay otra página.
+        """
+        origen = filtros.get("origen")
+        ramas = []
+        if origen in (None, ORIGEN_WEB):
+            ramas.append((COLECCION_WEB, self._rama_web(filtros, limite, cursor, vista)))
+        if origen in (None, ORIGEN_TELEGRAM):
+            ramas.append((COLECCION_TELEGRAM, self._rama_telegram(filtros, limite, cursor, vista)))
+
+        (coleccion_base, pipeline), *otras = ramas
+        pipeline = list(pipeline)
+        for coleccion, rama in otras:
+            pipeline.append({"$unionWith": {"coll": coleccion, "pipeline": rama}})
+        if otras:
+            pipeline.extend([
+                {"$sort": {"_fecha": -1, "id": -1}},
+                {"$limit": limite + 1},
+            ])
+        return coleccion_base, pipeline
+
+    async def listar(self, estados: Optional[List[str]] = None, origen: Optional[str] = None,
+                     cliente_id: Optional[str] = None, desde: Optional[datetime] = None,
+                     hasta: Optional[datetime] = None, limite: int = LIMITE_DEFAULT,
+                     cursor: Optional[str] = None, vista: str = VISTA_COMPLETA) -> Dict[str, Any]:
+        """
+        Una página del listado unificado, de la operación más reciente a la más antigua.
+
+        Raises:
+            CursorInvalido, ValueError (origen/vista desconocidos)
+
+        Returns:
+            {"operaciones": [...], "siguiente_cursor": str | None}
+        """
+        if origen not in (None, ORIGEN_WEB, ORIGEN_TELEGRAM):
+            raise ValueError(f"Origen desconocido: {origen}")
+        if vista not in (VISTA_COMPLETA, VISTA_LISTA):
+            raise ValueError(f"Vista desconocida: {vista}")
+        limite = max(1, min(limite, LIMITE_MAXIMO))
+        filtros = {
+            "estados": estados or None,
+            "origen": origen,
+            "cliente_id": cliente_id,
+            "desde": _a_utc(desde) if desde else None,
+            "hasta": _a_utc(hasta) if hasta else None,
+        }
+        posicion = decodificar_cursor(cursor) if cursor else None
+
+        coleccion, pipeline = self.construir_pipeline(filtros, limite, posicion, vista)
+        documentos = await db[coleccion].aggregate(pipeline).to_list(limite + 1)
+
+        hay_mas = len(documentos) > limite
+        pagina = documentos[:limite]
+        siguiente_cursor = None
+        if hay_mas:
+            ultimo = pagina[-1]
+            siguiente_cursor = codificar_cursor(ultimo.get("_fecha"), ultimo["id"])
+
+        operaciones = []
+        for documento in pagina:
+            origen_documento = documento.pop("_origen")
+            documento.pop("_fecha", None)
+            if origen_documento == ORIGEN_TELEGRAM:
+                operaciones.append(normalizar_solicitud_telegram(documento))
+            else:
+                operaciones.append(normalizar_operacion_web(documento))
+
+        return {"operaciones": operaciones, "siguiente_cursor": siguiente_cursor}
+
+
+# Instancia global del servicio
+operaciones_unificadas_service = OperacionesUnificadasService()
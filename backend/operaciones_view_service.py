@@ -0,0 +1,470 @@
+"""Vista materializada operaciones_view (operaciones web + solicitudes Telegram ya normalizadas)
+
+El listado y el detalle de operaciones repetían en cada lectura la
+normalización de Telegram a la estructura web (estado, URLs de comprobantes,
+suma de montos, datos del cliente). La vista guarda el documento ya
+normalizado, así que ambos endpoints son una sola lectura por índice.
+
+Colección MongoDB: operaciones_view
+- _id: el mismo _id del documento de origen (los eventos de borrado solo traen _id)
+- la estructura normalizada del detalle (normalizar_operacion_web /
+  normalizar_solicitud_telegram con detalle=True)
+- coleccion_origen: "operaciones" | "solicitudes_netcash"
+- fecha_orden: fecha de creación como fecha (orden y cursor del listado)
+- cliente_id: en operaciones web se copia de id_cliente, así el filtro por
+  cliente y su índice sirven para ambos orígenes
+
+Mantenimiento: un change stream sobre operaciones, solicitudes_netcash y clientes
+(los datos del cliente se copian en las solicitudes). El resume token se guarda
+en operaciones_view_estado; sin token (o si el oplog ya no lo tiene) se
+reconstruye la vista completa; también cuando cambia VERSION_VISTA (la
+estructura del documento de la vista). Los change streams requieren replica set: en un
+servidor standalone la vista no se mantiene y los endpoints leen directo de
+las colecciones de origen (activa = False).
+
+Uso manual:
+    python operaciones_view_service.py --reconstruir
+    python operaciones_view_service.py --verificar   # código de salida 1 si hay diferencias
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import bson
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from database import db
+from comprobante_ocr_raw_service import sin_ocr_raw
+from operaciones_stats_service import operaciones_stats_service
+from operaciones_unificadas_service import (
+    COLECCION_TELEGRAM, COLECCION_WEB, LIMITE_DEFAULT, LIMITE_MAXIMO, ORIGEN_TELEGRAM, ORIGEN_WEB,
+    PROYECCION_LISTA_WEB, TIMESTAMPS_WEB, VISTA_COMPLETA, VISTA_LISTA,
+    codificar_cursor, decodificar_cursor, normalizar_operacion_web, normalizar_solicitud_telegram
+)
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'operaciones_view'
+COLECCION_ESTADO = 'operaciones_view_estado'
+COLECCION_CLIENTES = 'clientes'
+
+ID_ESTADO = "change_stream"
+# Subir al cambiar la estructura de los documentos de la vista: fuerza una reconstrucción
+# 2: cliente_id normalizado en operaciones web
+VERSION_VISTA = 2
+
+# "The $changeStream stage is only supported on replica sets"
+CODIGO_SIN_CHANGE_STREAMS = 40573
+# El resume token ya no está en el oplog
+CODIGOS_TOKEN_PERDIDO = {260, 280, 286}
+
+CAMPOS_CONTROL = ["coleccion_origen", "fecha_orden"]
+
+# Campos de la vista que usa el listado (vista="lista"): la estructura ya normalizada
+PROYECCION_LISTA_VISTA = {
+    "_id": 0,
+    **{campo: 1 for campo in PROYECCION_LISTA_WEB if campo != "_id"},
+    **{campo: 1 for campo in ["cliente_id", "telegram_id", "idmex_beneficiario_declarado", "costo_proveedor_monto",
+                              "costo_proveedor_pct", "total_egreso"]},
+    "fecha_orden": 1,
+}
+PROYECCION_COMPLETA_VISTA = {"_id": 0, "coleccion_origen": 0}
+PROYECCION_DETALLE_VISTA = {"_id": 0, **{campo: 0 for campo in CAMPOS_CONTROL}}
+
+# Lo que se lee del catálogo de clientes para el detalle de una solicitud
+PROYECCION_CLIENTE = {"_id": 0, "id": 1, "propietario": 1, "email": 1, "telegram_id": 1,
+                      "telefono_completo": 1, "porcentaje_comision_cliente": 1}
+
+TAMANO_LOTE = 500
+
+
+def _fecha_orden(valor: Any) -> Optional[datetime]:
+    if isinstance(valor, str):
+        try:
+            valor = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(valor, datetime):
+        return None
+    return valor.replace(tzinfo=timezone.utc) if valor.tzinfo is None else valor
+
+
+def documento_vista(coleccion: str, origen: Dict, cliente: Optional[Dict] = None) -> Dict:
+    """Documento de operaciones_view a partir del documento de origen (con su _id)"""
+    _id = origen["_id"]
+    datos = {k: v for k, v in origen.items() if k != "_id"}
+    if datos.get("comprobantes"):
+        # El payload OCR crudo solo se entrega con include=ocr_raw
+        datos["comprobantes"] = sin_ocr_raw(datos["comprobantes"])
+    if coleccion == COLECCION_WEB:
+        normalizado = normalizar_operacion_web(datos)
+        fecha = normalizado.get("fecha_creacion")
+    else:
+        normalizado = normalizar_solicitud_telegram(datos, detalle=True, cliente=cliente)
+        fecha = datos.get("created_at")
+    return {
+        "_id": _id,
+        **normalizado,
+        "coleccion_origen": coleccion,
+        "fecha_orden": _fecha_orden(fecha),
+    }
+
+
+def _fechas_web_con_zona(documento: Dict) -> Dict:
+    """
+    MongoDB devuelve las fechas sin zona; las de operaciones web se entregaban
+    con zona (venían de texto ISO en UTC), así que se les vuelve a poner.
+    """
+    if documento.get("origen") != ORIGEN_TELEGRAM:
+        for campo in ["fecha_creacion", *TIMESTAMPS_WEB]:
+            valor = documento.get(campo)
+            if isinstance(valor, datetime) and valor.tzinfo is None:
+                documento[campo] = valor.replace(tzinfo=timezone.utc)
+    return documento
+
+
+def _como_bson(documento: Dict) -> Dict:
+    """Ida y vuelta por BSON: fechas a UTC sin zona y precisión de milisegundos, como se leen de MongoDB"""
+    return bson.decode(bson.encode(documento))
+
+
+class OperacionesViewService:
+    """Mantiene operaciones_view con un change stream y la consulta"""
+
+    def __init__(self):
+        self.habilitada = os.getenv('OPERACIONES_VIEW_HABILITADA', 'true').lower() not in ('0', 'false', 'no')
+        self.max_espera_ms = int(os.getenv('OPERACIONES_VIEW_ESPERA_MS', '1000'))
+        self.reintento_seg = float(os.getenv('OPERACIONES_VIEW_REINTENTO_SEG', '10'))
+
+        # True cuando la vista está completa y el change stream la mantiene
+        self.activa = False
+        self._tarea: Optional[asyncio.Task] = None
+        self._stats = {
+            "eventos": 0,
+            "errores": 0,
+            "reconstrucciones": 0,
+            "ultima_reconstruccion": None,
+            "modo": "detenida"
+        }
+
+    # ==================== MATERIALIZACIÓN ====================
+
+    async def _cliente(self, cliente_id: Optional[str]) -> Optional[Dict]:
+        if not cliente_id:
+            return None
+        return await db[COLECCION_CLIENTES].find_one({"id": cliente_id}, PROYECCION_CLIENTE)
+
+    async def materializar(self, coleccion: str, origen: Dict):
+        """Inserta o reemplaza el documento de la vista de un documento de origen"""
+        cliente = None
+        if coleccion == COLECCION_TELEGRAM:
+            cliente = await self._cliente(origen.get("cliente_id"))
+        documento = documento_vista(coleccion, origen, cliente)
+        await db[COLLECTION_NAME].replace_one({"_id": documento["_id"]}, documento, upsert=True)
+
+    async def materializar_cliente(self, cliente_id: str) -> int:
+        """Vuelve a materializar las solicitudes de un cliente (cambió su ficha en el catálogo)"""
+        cliente = await self._cliente(cliente_id)
+        operaciones = []
+        async for solicitud in db[COLECCION_TELEGRAM].find({"cliente_id": cliente_id}):
+            documento = documento_vista(COLECCION_TELEGRAM, solicitud, cliente)
+            operaciones.append(ReplaceOne({"_id": documento["_id"]}, documento, upsert=True))
+        if operaciones:
+            await db[COLLECTION_NAME].bulk_write(operaciones, ordered=False)
+        return len(operaciones)
+
+    async def aplicar_cambio(self, cambio: Dict):
+        """Aplica un evento del change stream (idempotente)"""
+        coleccion = cambio["ns"]["coll"]
+        tipo = cambio["operationType"]
+        documento = cambio.get("fullDocument")
+
+        if coleccion == COLECCION_CLIENTES:
+            if documento and documento.get("id"):
+                await self.materializar_cliente(documento["id"])
+            return
+
+        if tipo == "delete" or (tipo in ("insert", "update", "replace") and documento is None):
+            # updateLookup devuelve None si el documento se borró después del evento
+            await db[COLLECTION_NAME].delete_one({"_id": cambio["documentKey"]["_id"]})
+        elif documento is not None:
+            await self.materializar(coleccion, documento)
+        # Cualquier cambio en una operación puede mover las estadísticas del tablero
+        operaciones_stats_service.invalidar()
+
+    async def _clientes_por_id(self) -> Dict[str, Dict]:
+        clientes = await db[COLECCION_CLIENTES].find({}, PROYECCION_CLIENTE).to_list(None)
+        return {c["id"]: c for c in clientes if c.get("id")}
+
+    async def _documentos_esperados(self):
+        """Genera (coleccion, documento de vista) para todos los documentos de origen"""
+        clientes = await self._clientes_por_id()
+        for coleccion in (COLECCION_WEB, COLECCION_TELEGRAM):
+            async for origen in db[coleccion].find({}):
+                cliente = clientes.get(origen.get("cliente_id")) if coleccion == COLECCION_TELEGRAM else None
+                yield documento_vista(coleccion, origen, cliente)
+
+    async def reconstruir(self) -> Dict[str, int]:
+        """
+        Reconstruye la vista completa desde operaciones y solicitudes_netcash (idempotente).
+        Quita de la vista los documentos cuyo origen ya no existe.
+        """
+        resumen = {"materializadas": 0, "eliminadas": 0}
+        vistos = set()
+        lote = []
+        async for documento in self._documentos_esperados():
+            vistos.add(documento["_id"])
+            lote.append(ReplaceOne({"_id": documento["_id"]}, documento, upsert=True))
+            if len(lote) >= TAMANO_LOTE:
+                await db[COLLECTION_NAME].bulk_write(lote, ordered=False)
+                resumen["materializadas"] += len(lote)
+                lote = []
+        if lote:
+            await db[COLLECTION_NAME].bulk_write(lote, ordered=False)
+            resumen["materializadas"] += len(lote)
+
+        existentes = await db[COLLECTION_NAME].distinct("_id")
+        sobrantes = [i for i in existentes if i not in vistos]
+        if sobrantes:
+            resultado = await db[COLLECTION_NAME].delete_many({"_id": {"$in": sobrantes}})
+            resumen["eliminadas"] = resultado.deleted_count
+
+        self._stats["reconstrucciones"] += 1
+        self._stats["ultima_reconstruccion"] = datetime.now(timezone.utc).isoformat()
+        logger.info(f"[OperacionesView] ✅ Reconstruida: {resumen['materializadas']} operaciones, "
+                    f"{resumen['eliminadas']} eliminadas")
+        return resumen
+
+    async def verificar_consistencia(self, max_ejemplos: int = 20) -> Dict[str, Any]:
+        """
+        Compara la vista contra lo que produce la normalización de los documentos de origen.
+
+        Returns:
+            {"revisadas", "faltantes", "sobrantes", "diferentes", "consistente", "ejemplos": {...}}
+        """
+        vista = {d["_id"]: d for d in await db[COLLECTION_NAME].find({}).to_list(None)}
+        resultado = {"revisadas": 0, "faltantes": 0, "sobrantes": 0, "diferentes": 0,
+                     "ejemplos": {"faltantes": [], "sobrantes": [], "diferentes": []}}
+
+        def anotar(tipo: str, documento: Dict, campos: Optional[List[str]] = None):
+            resultado[tipo] += 1
+            if len(resultado["ejemplos"][tipo]) < max_ejemplos:
+                ejemplo = {"id": documento.get("id"), "coleccion_origen": documento.get("coleccion_origen")}
+                if campos is not None:
+                    ejemplo["campos"] = campos
+                resultado["ejemplos"][tipo].append(ejemplo)
+
+        async for esperado in self._documentos_esperados():
+            resultado["revisadas"] += 1
+            actual = vista.pop(esperado["_id"], None)
+            if actual is None:
+                anotar("faltantes", esperado)
+                continue
+            esperado = _como_bson(esperado)
+            campos = sorted(k for k in set(esperado) | set(actual) if esperado.get(k) != actual.get(k))
+            if campos:
+                anotar("diferentes", esperado, campos)
+
+        for documento in vista.values():
+            anotar("sobrantes", documento)
+
+        resultado["consistente"] = not (resultado["faltantes"] or resultado["sobrantes"] or resultado["diferentes"])
+        nivel = logging.INFO if resultado["consistente"] else logging.WARNING
+        logger.log(nivel, f"[OperacionesView] Verificación: {resultado['revisadas']} revisadas, "
+                          f"{resultado['faltantes']} faltantes, {resultado['sobrantes']} sobrantes, "
+                          f"{resultado['diferentes']} diferentes")
+        return resultado
+
+    # ==================== CHANGE STREAM ====================
+
+    async def _token_guardado(self) -> Optional[Dict]:
+        estado = await db[COLECCION_ESTADO].find_one({"_id": ID_ESTADO})
+        if not estado:
+            return None
+        if estado.get("version") != VERSION_VISTA:
+            logger.info(f"[OperacionesView] Vista en versión {estado.get('version')}, se reconstruye "
+                        f"a la versión {VERSION_VISTA}")
+            return None
+        return estado.get("resume_token")
+
+    async def _guardar_token(self, token: Optional[Dict]):
+        if token is None:
+            return
+        await db[COLECCION_ESTADO].update_one(
+            {"_id": ID_ESTADO},
+            {"$set": {"resume_token": token, "version": VERSION_VISTA, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    def _abrir_stream(self, token: Optional[Dict]):
+        pipeline = [{"$match": {"ns.coll": {"$in": [COLECCION_WEB, COLECCION_TELEGRAM, COLECCION_CLIENTES]}}}]
+        return db.watch(pipeline, full_document="updateLookup", resume_after=token,
+                        max_await_time_ms=self.max_espera_ms)
+
+    async def _sincronizar(self):
+        """Abre el change stream (reconstruye si no hay token) y aplica los eventos"""
+        token = await self._token_guardado()
+        async with self._abrir_stream(token) as stream:
+            if token is None:
+                # El stream ya está abierto: lo que cambie durante la reconstrucción llega como evento
+                await self.reconstruir()
+                await self._guardar_token(stream.resume_token)
+            self.activa = True
+            self._stats["modo"] = "change_stream"
+            logger.info("[OperacionesView] Vista activa (change stream)")
+
+            pendientes = 0
+            while True:
+                cambio = await stream.try_next()
+                if cambio is None:
+                    if pendientes:
+                        await self._guardar_token(stream.resume_token)
+                        pendientes = 0
+                    continue
+                try:
+                    await self.aplicar_cambio(cambio)
+                    self._stats["eventos"] += 1
+                except PyMongoError as e:
+                    self._stats["errores"] += 1
+                    logger.error(f"[OperacionesView] Error aplicando {cambio.get('operationType')} "
+                                 f"de {cambio.get('ns', {}).get('coll')}: {str(e)}")
+                pendientes += 1
+                if pendientes >= 100:
+                    await self._guardar_token(stream.resume_token)
+                    pendientes = 0
+
+    async def _ejecutar(self):
+        while True:
+            try:
+                await self._sincronizar()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                self.activa = False
+                if e.code == CODIGO_SIN_CHANGE_STREAMS:
+                    self._stats["modo"] = "lectura_directa"
+                    logger.warning("[OperacionesView] El servidor no soporta change streams; "
+                                   "los endpoints leen directo de las colecciones de origen")
+                    return
+                if e.code in CODIGOS_TOKEN_PERDIDO:
+                    logger.warning("[OperacionesView] Resume token perdido; se reconstruye la vista")
+                    await db[COLECCION_ESTADO].delete_one({"_id": ID_ESTADO})
+                    continue
+                self._stats["errores"] += 1
+                logger.error(f"[OperacionesView] Error en el change stream: {str(e)}")
+            except Exception as e:
+                self.activa = False
+                self._stats["errores"] += 1
+                logger.error(f"[OperacionesView] Error en el change stream: {str(e)}")
+            await asyncio.sleep(self.reintento_seg)
+
+    def start(self):
+        """Inicia el mantenimiento de la vista (llamar desde el startup de la app)"""
+        if not self.habilitada:
+            self._stats["modo"] = "deshabilitada"
+            logger.info("[OperacionesView] Deshabilitada (OPERACIONES_VIEW_HABILITADA)")
+            return
+        if self._tarea is None:
+            self._tarea = asyncio.create_task(self._ejecutar())
+
+    async def stop(self):
+        self.activa = False
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+        self._stats["modo"] = "detenida"
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        return {"activa": self.activa, **self._stats}
+
+    # ==================== LECTURA ====================
+
+    async def obtener(self, operacion_id: str) -> Optional[Dict]:
+        """Detalle de una operación desde la vista (None si no está materializada)"""
+        documento = await db[COLLECTION_NAME].find_one({"id": operacion_id}, PROYECCION_DETALLE_VISTA)
+        return _fechas_web_con_zona(documento) if documento else None
+
+    async def listar(self, estados: Optional[List[str]] = None, origen: Optional[str] = None,
+                     cliente_id: Optional[str] = None, desde: Optional[datetime] = None,
+                     hasta: Optional[datetime] = None, limite: int = LIMITE_DEFAULT,
+                     cursor: Optional[str] = None, vista: str = VISTA_COMPLETA) -> Dict[str, Any]:
+        """Mismo contrato que OperacionesUnificadasService.listar, con una sola consulta a la vista"""
+        if origen not in (None, ORIGEN_WEB, ORIGEN_TELEGRAM):
+            raise ValueError(f"Origen desconocido: {origen}")
+        if vista not in (VISTA_COMPLETA, VISTA_LISTA):
+            raise ValueError(f"Vista desconocida: {vista}")
+        limite = max(1, min(limite, LIMITE_MAXIMO))
+
+        filtro: Dict[str, Any] = {}
+        if estados:
+            filtro["estado"] = {"$in": estados}
+        if origen:
+            filtro["coleccion_origen"] = COLECCION_WEB if origen == ORIGEN_WEB else COLECCION_TELEGRAM
+        if cliente_id:
+            filtro["cliente_id"] = cliente_id
+        rango = {}
+        if desde:
+            rango["$gte"] = desde
+        if hasta:
+            rango["$lte"] = hasta
+        if rango:
+            filtro["fecha_orden"] = rango
+        if cursor:
+            fecha, operacion_id = decodificar_cursor(cursor)
+            if fecha is None:
+                filtro["$and"] = [{"fecha_orden": None, "id": {"$lt": operacion_id}}]
+            else:
+                filtro["$and"] = [{"$or": [
+                    {"fecha_orden": {"$lt": fecha}},
+                    {"fecha_orden": fecha, "id": {"$lt": operacion_id}},
+                    {"fecha_orden": None},
+                ]}]
+
+        proyeccion = PROYECCION_LISTA_VISTA if vista == VISTA_LISTA else PROYECCION_COMPLETA_VISTA
+        documentos = await db[COLLECTION_NAME].find(filtro, proyeccion).sort(
+            [("fecha_orden", -1), ("id", -1)]
+        ).limit(limite + 1).to_list(limite + 1)
+
+        siguiente_cursor = None
+        if len(documentos) > limite:
+            documentos = documentos[:limite]
+            siguiente_cursor = codificar_cursor(documentos[-1].get("fecha_orden"), documentos[-1]["id"])
+        for documento in documentos:
+            documento.pop("fecha_orden", None)
+            _fechas_web_con_zona(documento)
+        return {"operaciones": documentos, "siguiente_cursor": siguiente_cursor}
+
+
+# Instancia global del servicio
+operaciones_view_service = OperacionesViewService()
+
+
+async def main(argv: List[str]) -> int:
+    if "--reconstruir" in argv:
+        from indices_service import aplicar_indices
+        await aplicar_indices()
+        resumen = await operaciones_view_service.reconstruir()
+        print(f"Materializadas: {resumen['materializadas']}")
+        print(f"Eliminadas: {resumen['eliminadas']}")
+        return 0
+    if "--verificar" in argv:
+        resultado = await operaciones_view_service.verificar_consistencia()
+        print(f"Revisadas: {resultado['revisadas']}")
+        for tipo in ("faltantes", "sobrantes", "diferentes"):
+            print(f"{tipo.capitalize()}: {resultado[tipo]}")
+            for ejemplo in resultado["ejemplos"][tipo]:
+                print(f"  - {ejemplo}")
+        return 0 if resultado["consistente"] else 1
+    print("Uso: python operaciones_view_service.py --reconstruir | --verificar")
+    return 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
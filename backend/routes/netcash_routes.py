@@ -7,7 +7,7 @@ Rutas principales:
 - POST /api/netcash/solicitudes - Crear solicitud
 - GET /api/netcash/solicitudes/{id} - Consultar solicitud
 - PUT /api/netcash/solicitudes/{id} - Actualizar solicitud
-- POST /api/netcash/solicitudes/{id}/comprobante - Agregar comprobante
+- POST /api/netcash/solicitudes/{id}/comprobante - Agregar comprobante (?asincrono=true encola el OCR)
 - POST /api/netcash/solicitudes/{id}/validar - Validar y procesar
 - GET /api/netcash/solicitudes/cliente/{cliente_id} - Listar por cliente
 """
@@ -23,12 +23,17 @@ from netcash_models import (
     EstadoSolicitud, CanalOrigen
 )
 from netcash_service import netcash_service
+from comprobante_ocr_raw_service import incluye_ocr_raw
+from ocr_jobs_service import ocr_jobs_service
 from config_cuentas_service import config_cuentas_service, TipoCuenta
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/netcash", tags=["NetCash"])
 
+# Tipo de trabajo en la cola OCR para comprobantes de solicitudes NetCash
+TIPO_JOB_COMPROBANTE_NETCASH = "comprobante_netcash"
+
 
 # ==================== SOLICITUDES ====================
 
@@ -57,10 +62,15 @@ async def crear_solicitud(datos: SolicitudCreate):
 
 
 @router.get("/solicitudes/{solicitud_id}")
-async def obtener_solicitud(solicitud_id: str):
-    """Obtiene el detalle completo de una solicitud"""
+async def obtener_solicitud(solicitud_id: str, include: Optional[str] = None):
+    """
+    Obtiene el detalle completo de una solicitud.
+    Con include=ocr_raw agrega el payload OCR crudo de cada comprobante.
+    """
     try:
-        solicitud = await netcash_service.obtener_solicitud(solicitud_id)
+        solicitud = await netcash_service.obtener_solicitud(
+            solicitud_id, incluir_ocr_raw=incluye_ocr_raw(include)
+        )
         
         if not solicitud:
             raise HTTPException(status_code=404, detail="Solicitud no encontrada")
@@ -98,11 +108,15 @@ async def actualizar_solicitud(solicitud_id: str, datos: SolicitudUpdate):
 @router.post("/solicitudes/{solicitud_id}/comprobante")
 async def agregar_comprobante(
     solicitud_id: str,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    asincrono: bool = False
 ):
     """
     Agrega un comprobante a una solicitud.
     El comprobante se valida automáticamente contra la cuenta concertadora activa.
+    
+    Con ?asincrono=true solo guarda el archivo y encola el OCR/validación;
+    responde con job_id para consultar /api/ocr-jobs/{job_id}.
     """
     try:
         # Guardar archivo
@@ -117,6 +131,21 @@ async def agregar_comprobante(
             content = await file.read()
             f.write(content)
         
+        if asincrono:
+            job_id = await ocr_jobs_service.encolar(
+                TIPO_JOB_COMPROBANTE_NETCASH,
+                {"solicitud_id": solicitud_id, "file_path": str(file_path), "nombre_archivo": file.filename},
+                referencia=solicitud_id
+            )
+            return {
+                "success": True,
+                "job_id": job_id,
+                "estado": "pendiente",
+                "status_url": f"/api/ocr-jobs/{job_id}",
+                "eventos_url": f"/api/ocr-jobs/{job_id}/eventos",
+                "message": "Comprobante recibido, validación en proceso"
+            }
+        
         # Agregar a solicitud
         agregado = await netcash_service.agregar_comprobante(
             solicitud_id,
@@ -144,6 +173,37 @@ async def agregar_comprobante(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _job_comprobante_netcash(job: dict, progreso) -> dict:
+    """Handler de la cola OCR para comprobantes subidos con ?asincrono=true"""
+    payload = job["payload"]
+    
+    await progreso("ocr", 20)
+    agregado, razon, solicitud = await netcash_service.agregar_comprobante_detallado(
+        payload["solicitud_id"],
+        payload["file_path"],
+        payload["nombre_archivo"]
+    )
+    # Duplicados / solicitud inexistente son resultados definitivos; solo el error técnico se reintenta
+    if not agregado:
+        if razon == "error":
+            raise RuntimeError("Error agregando comprobante")
+        return {"agregado": False, "razon": razon, "comprobante": None}
+    
+    await progreso("guardando", 90)
+    # De la post-imagen, el comprobante de este archivo: con otros trabajos sobre la
+    # misma solicitud el último del arreglo puede ser de otro
+    comprobante = next(
+        (c for c in reversed((solicitud or {}).get("comprobantes", []))
+         if c.get("archivo_url") == payload["file_path"]),
+        None
+    )
+    
+    return {"agregado": True, "razon": razon, "comprobante": comprobante}
+
+
+ocr_jobs_service.registrar_handler(TIPO_JOB_COMPROBANTE_NETCASH, _job_comprobante_netcash)
+
+
 @router.post("/solicitudes/{solicitud_id}/validar")
 async def validar_y_procesar(solicitud_id: str):
     """
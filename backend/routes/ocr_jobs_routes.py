@@ -0,0 +1,80 @@
+"""Endpoints de consulta de la cola OCR
+
+Rutas:
+- GET /api/ocr-jobs/{job_id} - Estado, progreso y resultado de un trabajo
+- GET /api/ocr-jobs/{job_id}/eventos - Server-sent events con cada cambio hasta terminar
+"""
+
+import asyncio
+import json
+import logging
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from ocr_jobs_service import ocr_jobs_service, ESTADOS_FINALES
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/ocr-jobs", tags=["OCR Jobs"])
+
+# Intervalo de consulta a MongoDB mientras el stream está abierto
+INTERVALO_EVENTOS_SEG = 0.5
+# Comentario keep-alive para proxies que cierran conexiones inactivas
+INTERVALO_KEEPALIVE_SEG = 15
+
+
+@router.get("/{job_id}")
+async def obtener_job(job_id: str):
+    """Estado actual de un trabajo OCR"""
+    job = await ocr_jobs_service.obtener(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return {"success": True, "job": job}
+
+
+def _evento(nombre: str, datos: dict) -> str:
+    return f"event: {nombre}\ndata: {json.dumps(datos, default=str, ensure_ascii=False)}\n\n"
+
+
+@router.get("/{job_id}/eventos")
+async def eventos_job(job_id: str):
+    """Stream SSE: un evento 'progreso' por cada cambio y un evento final 'completado' o 'error'"""
+    job = await ocr_jobs_service.obtener(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def generar():
+        ultimo_cambio = None
+        sin_cambios_seg = 0.0
+        actual = job
+
+        while True:
+            if actual["updated_at"] != ultimo_cambio:
+                ultimo_cambio = actual["updated_at"]
+                sin_cambios_seg = 0.0
+
+                if actual["estado"] in ESTADOS_FINALES:
+                    yield _evento(actual["estado"], actual)
+                    return
+                yield _evento("progreso", {
+                    "estado": actual["estado"],
+                    "progreso": actual["progreso"],
+                    "intentos": actual["intentos"]
+                })
+            elif sin_cambios_seg >= INTERVALO_KEEPALIVE_SEG:
+                sin_cambios_seg = 0.0
+                yield ": keep-alive\n\n"
+
+            await asyncio.sleep(INTERVALO_EVENTOS_SEG)
+            sin_cambios_seg += INTERVALO_EVENTOS_SEG
+
+            actual = await ocr_jobs_service.obtener(job_id)
+            if not actual:
+                return
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -29,13 +29,7 @@ class TesoreriaScheduler:
             logger.info("[Scheduler Tesorería] ========== RECORDATORIO PENDIENTES ==========")
             logger.info(f"[Scheduler Tesorería] Hora: {datetime.now()}")
             
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
-            
-            mongo_url = os.getenv('MONGO_URL')
-            db_name = os.getenv('DB_NAME', 'netcash_mbco')
-            client = AsyncIOMotorClient(mongo_url)
-            db = client[db_name]
+            from database import db
             
             # Buscar operaciones en estado enviado_a_tesoreria sin comprobantes de dispersión
             pendientes = await db.solicitudes_netcash.find(
@@ -46,8 +40,6 @@ class TesoreriaScheduler:
                 {'_id': 0, 'id': 1, 'folio_mbco': 1, 'cliente_nombre': 1, 'total_comprobantes_validos': 1}
             ).to_list(100)
             
-            client.close()
-            
             if not pendientes:
                 logger.info("[Scheduler Tesorería] ✅ No hay operaciones pendientes de dispersar")
                 logger.info("[Scheduler Tesorería] ========== FIN RECORDATORIO ==========")
@@ -4,14 +4,14 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 import logging
 from pathlib import Path
 from typing import List, Optional
-import shutil
 from datetime import datetime, timezone
 import hashlib
+from pymongo import ReturnDocument
 
 from models import (
     OperacionNetCash,
@@ -30,15 +30,35 @@ from plataformas_config import consejero_plataformas
 from zip_handler import zip_handler
 from gmail_service import gmail_service
 from cuenta_deposito_service import cuenta_deposito_service
+from ocr_jobs_service import ocr_jobs_service
+from database import db, cerrar_cliente, estadisticas_pool
+from operaciones_unificadas_service import (
+    operaciones_unificadas_service, normalizar_solicitud_telegram, LIMITE_DEFAULT, VISTA_COMPLETA
+)
+from operaciones_view_service import operaciones_view_service
+from operaciones_stats_service import operaciones_stats_service
+from folio_mbco_service import folio_mbco_service
+from identidad_cache_service import identidad_cache
+from ingesta_archivos_service import MIME_DESCONOCIDO, ArchivoDemasiadoGrande, ingesta_archivos_service
+from clientes_busqueda_service import (
+    LIMITE_DEFAULT as LIMITE_BUSQUEDA_CLIENTES, PROYECCION_CLIENTE, campos_busqueda, clientes_busqueda_service
+)
+from comprobante_fingerprints_service import (
+    comprobante_fingerprints_service, AMBITO_WEB, COLECCION_WEB, TIPO_CLAVE_RASTREO, TIPO_HASH
+)
+from comprobante_ocr_raw_service import (
+    comprobante_ocr_raw_service, incluye_ocr_raw, PROYECCION_SIN_OCR_RAW
+)
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'netcash_mbco')]
+# OCR simultáneos al procesar un ZIP de comprobantes
+ZIP_OCR_CONCURRENCIA = int(os.environ.get('ZIP_OCR_CONCURRENCIA', '4'))
+
+# Tipo de trabajo en la cola OCR para comprobantes de operaciones Web
+TIPO_JOB_COMPROBANTE_OPERACION = "comprobante_operacion"
 
 # Create the main app
 app = FastAPI(title="Asistente NetCash MBco API")
@@ -79,90 +99,107 @@ async def procesar_zip_comprobantes(operacion_id: str, zip_path: Path, operacion
                 "errores": errores
             }
         
-        # Procesar cada archivo válido
-        comprobantes_procesados = []
-        comprobantes_con_error = []
+        # ETAPA 1: Hash de todos los archivos (en hilos, fuera del event loop)
+        hashes = await asyncio.gather(*[
+            asyncio.to_thread(calcular_hash_archivo, Path(archivo_info["path"]))
+            for archivo_info in archivos_validos
+        ], return_exceptions=True)
         
-        for archivo_info in archivos_validos:
-            try:
-                # Calcular hash del archivo extraído
-                file_hash = calcular_hash_archivo(Path(archivo_info["path"]))
-                
-                # Verificar duplicado
-                resultado_duplicado = await verificar_duplicado_por_hash(file_hash)
-                if resultado_duplicado["es_duplicado"]:
-                    logger.warning(f"Archivo {archivo_info['nombre']} del ZIP es duplicado")
-                    comprobantes_con_error.append(f"{archivo_info['nombre']} (duplicado en {resultado_duplicado['folio_mbco']})")
-                    continue
-                
-                # Procesar con OCR
-                datos_ocr = await ocr_service.leer_comprobante(
-                    archivo_info["path"],
-                    archivo_info["mime_type"]
+        # ETAPA 2: Deduplicación en bloque (una sola consulta)
+        duplicados = await verificar_duplicados_por_hash([h for h in hashes if isinstance(h, str)])
+        
+        # ETAPA 3: OCR en lotes (varios comprobantes por solicitud, lotes concurrentes acotados)
+        def _procesar_archivo(archivo_info: dict, file_hash: str, datos_ocr: dict) -> dict:
+            # Construir file_url relativa
+            file_url = f"/uploads/comprobantes/extracted_{operacion_id}/{archivo_info['nombre']}"
+            
+            # Validar
+            es_valido = False
+            mensaje_validacion = ""
+            
+            if "error" in datos_ocr:
+                mensaje_validacion = datos_ocr["error"]
+            else:
+                # Validar cuenta y beneficiario
+                cuenta_valida = ocr_service.validar_cuenta_beneficiaria(
+                    datos_ocr.get("cuenta_beneficiaria", ""),
+                    CUENTA_DEPOSITO_CLIENTE["clabe"]
+                )
+                nombre_valido = ocr_service.validar_nombre_beneficiario(
+                    datos_ocr.get("nombre_beneficiario", ""),
+                    CUENTA_DEPOSITO_CLIENTE["razon_social"]
                 )
                 
-                # Construir file_url relativa
-                file_url = f"/uploads/comprobantes/extracted_{operacion_id}/{archivo_info['nombre']}"
-                
-                # Validar
-                es_valido = False
-                mensaje_validacion = ""
-                
-                if "error" in datos_ocr:
-                    mensaje_validacion = datos_ocr["error"]
+                if cuenta_valida and nombre_valido:
+                    es_valido = True
+                    mensaje_validacion = "Comprobante válido"
                 else:
-                    # Validar cuenta y beneficiario
-                    cuenta_valida = ocr_service.validar_cuenta_beneficiaria(
-                        datos_ocr.get("cuenta_beneficiaria", ""),
-                        CUENTA_DEPOSITO_CLIENTE["clabe"]
-                    )
-                    nombre_valido = ocr_service.validar_nombre_beneficiario(
-                        datos_ocr.get("nombre_beneficiario", ""),
-                        CUENTA_DEPOSITO_CLIENTE["razon_social"]
-                    )
-                    
-                    if cuenta_valida and nombre_valido:
-                        es_valido = True
-                        mensaje_validacion = "Comprobante válido"
-                    else:
-                        mensaje_validacion = "La cuenta o el beneficiario no coinciden"
-                
-                # Crear comprobante con hash
-                comprobante_dict = {
-                    **datos_ocr,
-                    "archivo_original": archivo_info["nombre"],
-                    "nombre_archivo": archivo_info["nombre"],
-                    "file_url": file_url,
-                    "file_path": archivo_info["path"],
-                    "file_hash": file_hash,
-                    "es_valido": es_valido,
-                    "es_duplicado": False,
-                    "mensaje_validacion": mensaje_validacion
-                }
-                
-                comprobantes_procesados.append(comprobante_dict)
-                
+                    mensaje_validacion = "La cuenta o el beneficiario no coinciden"
+            
+            # Crear comprobante con hash
+            return {
+                **datos_ocr,
+                "archivo_original": archivo_info["nombre"],
+                "nombre_archivo": archivo_info["nombre"],
+                "file_url": file_url,
+                "file_path": archivo_info["path"],
+                "file_hash": file_hash,
+                "es_valido": es_valido,
+                "es_duplicado": False,
+                "mensaje_validacion": mensaje_validacion
+            }
+        
+        indices_ocr = [
+            i for i, file_hash in enumerate(hashes)
+            if isinstance(file_hash, str) and file_hash not in duplicados
+        ]
+        lecturas = await ocr_service.leer_comprobantes_lote(
+            [(archivos_validos[i]["path"], archivos_validos[i]["mime_type"], hashes[i]) for i in indices_ocr],
+            concurrencia=ZIP_OCR_CONCURRENCIA
+        )
+        resultados_ocr = {}
+        for i, datos_ocr in zip(indices_ocr, lecturas):
+            try:
+                resultados_ocr[i] = _procesar_archivo(archivos_validos[i], hashes[i], datos_ocr)
             except Exception as e:
-                logger.error(f"Error procesando {archivo_info['nombre']}: {str(e)}")
+                resultados_ocr[i] = e
+        
+        # Reporte en el orden del ZIP
+        comprobantes_procesados = []
+        comprobantes_con_error = []
+        
+        for i, (archivo_info, file_hash) in enumerate(zip(archivos_validos, hashes)):
+            if isinstance(file_hash, Exception):
+                logger.error(f"Error procesando {archivo_info['nombre']}: {str(file_hash)}")
+                comprobantes_con_error.append(archivo_info["nombre"])
+            elif file_hash in duplicados:
+                logger.warning(f"Archivo {archivo_info['nombre']} del ZIP es duplicado")
+                comprobantes_con_error.append(f"{archivo_info['nombre']} (duplicado en {duplicados[file_hash]['folio_mbco']})")
+            elif isinstance(resultados_ocr[i], Exception):
+                logger.error(f"Error procesando {archivo_info['nombre']}: {str(resultados_ocr[i])}")
                 comprobantes_con_error.append(archivo_info["nombre"])
+            else:
+                comprobantes_procesados.append(resultados_ocr[i])
         
-        # Actualizar operación con todos los comprobantes
+        # ETAPA 4: Actualizar operación con todos los comprobantes en una sola escritura
         if comprobantes_procesados:
-            comprobantes_existentes = operacion.get("comprobantes", [])
-            comprobantes_existentes.extend(comprobantes_procesados)
-            
             comprobantes_validos = [c for c in comprobantes_procesados if c.get("es_valido")]
             nuevo_estado = EstadoOperacion.ESPERANDO_DATOS_TITULAR if comprobantes_validos else EstadoOperacion.ESPERANDO_COMPROBANTES
+            huellas = comprobante_fingerprints_service.huellas(COLECCION_WEB, operacion, comprobantes_procesados)
             
-            await db.operaciones.update_one(
-                {"id": operacion_id},
-                {
-                    "$set": {
-                        "comprobantes": comprobantes_existentes,
-                        "estado": nuevo_estado
-                    }
-                }
-            )
+            async def guardar(session):
+                await db.operaciones.update_one(
+                    {"id": operacion_id},
+                    {
+                        "$push": {"comprobantes": {"$each": comprobantes_procesados}},
+                        "$set": {"estado": nuevo_estado}
+                    },
+                    session=session
+                )
+                await comprobante_fingerprints_service.registrar(huellas, session=session)
+            
+            await comprobante_fingerprints_service.en_transaccion(guardar)
+            operaciones_stats_service.invalidar()
         
         # Construir mensaje de respuesta
         mensaje = f"Procesé {len(comprobantes_procesados)} comprobantes del ZIP."
@@ -203,62 +240,29 @@ async def verificar_duplicado_por_hash(file_hash: str) -> dict:
     Verifica si un comprobante con el mismo hash ya existe.
     Returns: dict con 'es_duplicado', 'operacion_id', 'folio_mbco', 'estado'
     """
-    # Buscar en todas las operaciones si existe un comprobante con este hash
-    operacion_existente = await db.operaciones.find_one(
-        {"comprobantes.file_hash": file_hash},
-        {"_id": 0, "id": 1, "folio_mbco": 1, "cliente_nombre": 1, "estado": 1}
-    )
-    
-    if operacion_existente:
-        return {
-            "es_duplicado": True,
-            "operacion_id": operacion_existente.get("id"),
-            "folio_mbco": operacion_existente.get("folio_mbco", "N/A"),
-            "cliente_nombre": operacion_existente.get("cliente_nombre", "N/A"),
-            "estado": operacion_existente.get("estado", "DESCONOCIDO")
-        }
-    
-    return {"es_duplicado": False}
+    duplicados = await verificar_duplicados_por_hash([file_hash])
+    return duplicados.get(file_hash, {"es_duplicado": False})
+
+
+def _info_duplicado(original: dict) -> dict:
+    return {
+        "es_duplicado": True,
+        "operacion_id": original["id"],
+        "folio_mbco": original.get("folio_mbco") or "N/A",
+        "cliente_nombre": original.get("cliente_nombre") or "N/A",
+        "estado": original.get("estado") or "DESCONOCIDO"
+    }
 
 
-async def generar_folio_mbco() -> str:
+async def verificar_duplicados_por_hash(file_hashes: List[str]) -> dict:
     """
-    Genera un folio secuencial para operaciones NetCash (ej: NC-000123).
-    Busca en AMBAS colecciones para mantener secuencia global.
+    Versión en bloque de verificar_duplicado_por_hash (índice comprobante_fingerprints).
+    Returns: dict hash -> info de la operación existente (solo para los hashes duplicados)
     """
-    ultimo_numero = 0
-    
-    # Buscar el último folio en operaciones (web)
-    ultima_web = await db.operaciones.find_one(
-        {"folio_mbco": {"$exists": True, "$ne": None}},
-        {"_id": 0, "folio_mbco": 1},
-        sort=[("folio_mbco", -1)]
-    )
-    
-    if ultima_web and ultima_web.get("folio_mbco"):
-        try:
-            num_web = int(ultima_web["folio_mbco"].split("-")[1])
-            ultimo_numero = max(ultimo_numero, num_web)
-        except (IndexError, ValueError):
-            pass
-    
-    # Buscar el último folio en solicitudes_netcash (Telegram)
-    ultima_telegram = await db.solicitudes_netcash.find_one(
-        {"folio_mbco": {"$exists": True, "$ne": None}},
-        {"_id": 0, "folio_mbco": 1},
-        sort=[("folio_mbco", -1)]
+    duplicados = await comprobante_fingerprints_service.buscar_duplicados(
+        COLECCION_WEB, AMBITO_WEB, TIPO_HASH, file_hashes
     )
-    
-    if ultima_telegram and ultima_telegram.get("folio_mbco"):
-        try:
-            num_telegram = int(ultima_telegram["folio_mbco"].split("-")[1])
-            ultimo_numero = max(ultimo_numero, num_telegram)
-        except (IndexError, ValueError):
-            pass
-    
-    # Generar nuevo folio
-    nuevo_numero = ultimo_numero + 1
-    return f"NC-{nuevo_numero:06d}"
+    return {file_hash: _info_duplicado(original) for file_hash, original in duplicados.items()}
 
 
 # ============================================
@@ -274,242 +278,152 @@ async def root():
     }
 
 
-@api_router.get("/operaciones")
-async def obtener_operaciones():
-    """
-    Obtiene todas las operaciones NetCash UNIFICADAS.
-    Combina operaciones manuales (web) y solicitudes de Telegram.
-    Retorna lista de diccionarios sin validación estricta de modelo.
-    """
-    operaciones_unificadas = []
-    
-    # 1. Obtener operaciones manuales (web)
-    operaciones_web = await db.operaciones.find({}, {"_id": 0}).to_list(1000)
-    
-    for op in operaciones_web:
-        # Convertir timestamps ISO a datetime
-        if isinstance(op.get('fecha_creacion'), str):
-            op['fecha_creacion'] = datetime.fromisoformat(op['fecha_creacion'])
-        for field in ['timestamp_confirmacion_cliente', 'timestamp_codigo_sistema', 
-                      'timestamp_pago_proveedor', 'timestamp_ligas_recibidas', 
-                      'timestamp_entrega_cliente']:
-            if op.get(field) and isinstance(op[field], str):
-                op[field] = datetime.fromisoformat(op[field])
-        
-        # Marcar origen
-        op['origen'] = op.get('origen', 'web')
-        operaciones_unificadas.append(op)
-    
-    # 2. Obtener solicitudes de Telegram
-    solicitudes_telegram = await db.solicitudes_netcash.find({}, {"_id": 0}).to_list(1000)
-    
-    for sol in solicitudes_telegram:
-        # Normalizar comprobantes: mapear campos para compatibilidad con frontend
-        comprobantes_normalizados = []
-        for comp in sol.get("comprobantes", []):
-            comp_normalizado = dict(comp)
-            # Mapear monto_detectado a monto para que el frontend lo encuentre
-            if "monto_detectado" in comp_normalizado and "monto" not in comp_normalizado:
-                comp_normalizado["monto"] = comp_normalizado.get("monto_detectado", 0)
-            # Normalizar archivo_url/file_url para que sea accesible desde el frontend
-            archivo_path = comp_normalizado.get("archivo_url") or comp_normalizado.get("file_url")
-            if archivo_path:
-                # Convertir ruta absoluta del servidor a URL relativa accesible
-                if archivo_path.startswith("/app/backend/uploads/"):
-                    archivo_path = archivo_path.replace("/app/backend/uploads/", "/api/uploads/")
-                elif archivo_path.startswith("/uploads/"):
-                    archivo_path = "/api" + archivo_path
-                comp_normalizado["file_url"] = archivo_path
-                comp_normalizado["archivo_url"] = archivo_path
-            comprobantes_normalizados.append(comp_normalizado)
-        
-        # Mapear campos de solicitud a estructura de operación
-        operacion_normalizada = {
-            "id": sol.get("id"),
-            "folio_mbco": sol.get("folio_mbco"),
-            "cliente_id": sol.get("cliente_id"),
-            "cliente_nombre": sol.get("cliente_nombre"),
-            "titular_nombre_completo": sol.get("beneficiario_reportado"),
-            "titular_idmex": sol.get("idmex_reportado"),
-            "numero_ligas": sol.get("cantidad_ligas_reportada", 0),
-            "comprobantes": comprobantes_normalizados,
-            "estado": _mapear_estado_solicitud(sol.get("estado", "borrador")),
-            "fecha_creacion": sol.get("created_at"),
-            "monto_depositado_cliente": sol.get("monto_depositado_cliente", 0),
-            "monto_total_comprobantes": sol.get("monto_depositado_cliente", 0),
-            "comision_cobrada": sol.get("comision_cliente", 0) or sol.get("comision_cobrada", 0),
-            "porcentaje_comision_usado": sol.get("comision_cliente_porcentaje", 1.0) or sol.get("porcentaje_comision_usado", 1.0),
-            "origen": "telegram",
-            "modo_captura": sol.get("modo_captura", "ocr_ok"),
-            # Campos adicionales de Telegram
-            "telegram_id": sol.get("telegram_id"),
-            "idmex_beneficiario_declarado": sol.get("idmex_beneficiario_declarado"),
-            # Campos de cálculos para compatibilidad con frontend
-            "capital_netcash": sol.get("capital_netcash"),
-            "costo_proveedor_monto": sol.get("costo_proveedor_monto"),
-            "costo_proveedor_pct": sol.get("costo_proveedor_pct"),
-            "total_egreso": sol.get("total_egreso"),
-            "calculos": sol.get("calculos"),
-        }
-        
-        # Calcular monto si hay comprobantes válidos
-        if not operacion_normalizada["monto_depositado_cliente"]:
-            monto_total = sum(
-                c.get("monto", 0) or c.get("monto_detectado", 0)
-                for c in comprobantes_normalizados 
-                if c.get("es_valido") and not c.get("es_duplicado")
-            )
-            operacion_normalizada["monto_depositado_cliente"] = monto_total
-            operacion_normalizada["monto_total_comprobantes"] = monto_total
-        
-        operaciones_unificadas.append(operacion_normalizada)
+@api_router.get("/llm/metricas")
+async def metricas_llm():
+    """Métricas del gateway LLM (límites, reintentos, circuit breaker) y de los cachés OCR"""
+    from llm_gateway_service import llm_gateway
+    from ocr_cache_service import ocr_cache_service
+    from lectura_comprobante_service import lectura_comprobante_service
+    from texto_extraido_cache_service import texto_extraido_cache_service
     
-    # Función auxiliar para normalizar fechas para ordenamiento
-    def get_fecha_para_sort(x):
-        fecha = x.get('fecha_creacion')
-        if fecha is None:
-            return datetime.min.replace(tzinfo=timezone.utc)
-        if isinstance(fecha, str):
-            try:
-                fecha = datetime.fromisoformat(fecha.replace('Z', '+00:00'))
-            except:
-                return datetime.min.replace(tzinfo=timezone.utc)
-        # Si no tiene timezone, agregar UTC
-        if fecha.tzinfo is None:
-            fecha = fecha.replace(tzinfo=timezone.utc)
-        return fecha
-    
-    # Ordenar por fecha de creación (más recientes primero)
-    operaciones_unificadas.sort(key=get_fecha_para_sort, reverse=True)
-    
-    return operaciones_unificadas
-
-
-def _mapear_estado_solicitud(estado_telegram: str) -> str:
-    """Mapea estados de solicitud Telegram a estados de operación web"""
-    mapeo = {
-        "borrador": "ESPERANDO_COMPROBANTES",
-        "pendiente_comprobantes": "ESPERANDO_COMPROBANTES",
-        "pendiente_datos": "ESPERANDO_DATOS_TITULAR",
-        "pendiente_confirmacion": "ESPERANDO_CONFIRMACION_CLIENTE",
-        "pendiente_validacion_admin": "VALIDANDO_COMPROBANTES",
-        "lista_para_mbco": "ESPERANDO_CODIGO_SISTEMA",
-        "enviada_tesoreria": "ESPERANDO_TESORERIA",
-        "completada": "COMPLETADO",
-        "rechazada": "CANCELADA_POR_INACTIVIDAD",
-        "cancelada": "CANCELADA_POR_INACTIVIDAD",
-        # Estados adicionales del bot de Telegram
-        "esperando_validacion_ana": "VALIDANDO_COMPROBANTES",
-        "ESPERANDO_VALIDACION_ANA": "VALIDANDO_COMPROBANTES",
-        "lista_para_confirmacion": "ESPERANDO_CONFIRMACION_CLIENTE",
-        "LISTA_PARA_CONFIRMACION": "ESPERANDO_CONFIRMACION_CLIENTE",
-        "lista_para_mbc": "DATOS_COMPLETOS",
-        "LISTA_PARA_MBC": "DATOS_COMPLETOS",
-        "enviado_a_tesoreria": "ESPERANDO_TESORERIA",
-        "ENVIADO_A_TESORERIA": "ESPERANDO_TESORERIA",
-        "orden_interna_generada": "ESPERANDO_CODIGO_SISTEMA",
-        "ORDEN_INTERNA_GENERADA": "ESPERANDO_CODIGO_SISTEMA",
-        "dispersada_proveedor": "COMPLETADO",
-        "DISPERSADA_PROVEEDOR": "COMPLETADO",
+    return {
+        "gateway": llm_gateway.obtener_metricas(),
+        "ocr_lotes": ocr_service.obtener_estadisticas_lote(),
+        "ocr_cache": ocr_cache_service.obtener_estadisticas(),
+        "lectura_escalonada": lectura_comprobante_service.obtener_estadisticas(),
+        "texto_cache": texto_extraido_cache_service.obtener_estadisticas()
     }
-    return mapeo.get(estado_telegram, "ESPERANDO_COMPROBANTES")
+
+
+@api_router.get("/db/pool")
+async def estadisticas_pool_mongo():
+    """Uso del pool de conexiones del cliente MongoDB compartido"""
+    return estadisticas_pool()
+
+
+@api_router.get("/cache/identidad")
+async def estadisticas_cache_identidad():
+    """Aciertos del caché de identidades (usuarios de Telegram, clientes, usuarios NetCash)"""
+    return identidad_cache.obtener_estadisticas()
+
+
+@api_router.get("/db/operaciones-view")
+async def estado_operaciones_view():
+    """Estado de la vista materializada operaciones_view (change stream, eventos, reconstrucciones)"""
+    return operaciones_view_service.obtener_estadisticas()
+
+
+@api_router.get("/db/folios")
+async def estado_folios(reconciliar: bool = False):
+    """
+    Contador de folios: bloque reservado y folios emitidos.
+
+    Con ?reconciliar=true compara además el contador con los folios existentes
+    (sin ajustar); recorre operaciones y solicitudes_netcash completas.
+    """
+    estado = folio_mbco_service.obtener_estadisticas()
+    if reconciliar:
+        estado["reconciliacion"] = await folio_mbco_service.reparar()
+    return estado
+
+
+@api_router.get("/db/operaciones-stats")
+async def estado_operaciones_stats():
+    """Caché de GET /api/operaciones/stats (aciertos, cálculos, invalidaciones)"""
+    return operaciones_stats_service.obtener_estadisticas()
+
+
+@api_router.get("/operaciones")
+async def obtener_operaciones(
+    estado: Optional[str] = None,
+    origen: Optional[str] = None,
+    cliente_id: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    limite: int = LIMITE_DEFAULT,
+    cursor: Optional[str] = None,
+    vista: str = VISTA_COMPLETA
+):
+    """
+    Obtiene las operaciones NetCash UNIFICADAS, paginadas por cursor.
+    Combina operaciones manuales (web) y solicitudes de Telegram, de la más reciente a la más antigua.
+    
+    Query params:
+    - estado: uno o varios estados de operación separados por coma
+    - origen: "web" | "telegram"
+    - cliente_id, desde, hasta (fecha de creación, ISO 8601)
+    - limite (máx. 200), cursor (siguiente_cursor de la página anterior)
+    - vista: "completa" | "lista" (solo los campos de los listados)
+    
+    Returns: {"operaciones": [...], "siguiente_cursor": str | null}
+    """
+    estados = [e.strip() for e in estado.split(",") if e.strip()] if estado else None
+    # Con la vista materializada activa es una sola consulta; si no, agregación sobre las colecciones de origen
+    servicio = operaciones_view_service if operaciones_view_service.activa else operaciones_unificadas_service
+    try:
+        return await servicio.listar(
+            estados=estados, origen=origen, cliente_id=cliente_id, desde=desde, hasta=hasta,
+            limite=limite, cursor=cursor, vista=vista
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@api_router.get("/operaciones/stats")
+async def estadisticas_operaciones(
+    cliente_id: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None
+):
+    """
+    Estadísticas del tablero (web + Telegram) en una sola agregación.
+    
+    Query params: cliente_id, desde, hasta (fecha de creación, ISO 8601)
+    
+    Returns: {"total", "monto_depositado", "comision", "por_estado", "por_origen", "por_etapa", ...}
+    """
+    return await operaciones_stats_service.obtener(cliente_id=cliente_id, desde=desde, hasta=hasta)
 
 
 @api_router.get("/operaciones/{operacion_id}")
-async def obtener_operacion(operacion_id: str):
+async def obtener_operacion(operacion_id: str, include: Optional[str] = None):
     """
     Obtiene una operación específica por ID.
     Busca en ambas colecciones (web y Telegram) para vista unificada.
+    
+    Con include=ocr_raw agrega a cada comprobante su ocr_data.datos_completos
+    (payload OCR crudo, guardado en comprobante_ocr_raw).
     """
+    incluir_ocr_raw = incluye_ocr_raw(include)
+    if operaciones_view_service.activa and not incluir_ocr_raw:
+        operacion = await operaciones_view_service.obtener(operacion_id)
+        if operacion:
+            return operacion
+        # Aún no materializada (recién creada): se lee del origen
+    
+    proyeccion = {"_id": 0} if incluir_ocr_raw else PROYECCION_SIN_OCR_RAW
+    
     # Primero buscar en operaciones web
-    operacion = await db.operaciones.find_one({"id": operacion_id}, {"_id": 0})
+    operacion = await db.operaciones.find_one({"id": operacion_id}, proyeccion)
     origen = "web"
     
     if not operacion:
         # Buscar en solicitudes Telegram
-        operacion = await db.solicitudes_netcash.find_one({"id": operacion_id}, {"_id": 0})
+        operacion = await db.solicitudes_netcash.find_one({"id": operacion_id}, proyeccion)
         origen = "telegram"
         
         if operacion:
-            # Normalizar comprobantes: mapear campos para compatibilidad con frontend
-            comprobantes_normalizados = []
-            for comp in operacion.get("comprobantes", []):
-                comp_normalizado = dict(comp)
-                # Mapear monto_detectado a monto para que el frontend lo encuentre
-                if "monto_detectado" in comp_normalizado and "monto" not in comp_normalizado:
-                    comp_normalizado["monto"] = comp_normalizado.get("monto_detectado", 0)
-                # Normalizar archivo_url/file_url para que sea accesible desde el frontend
-                archivo_path = comp_normalizado.get("archivo_url") or comp_normalizado.get("file_url")
-                if archivo_path:
-                    # Convertir ruta absoluta del servidor a URL relativa accesible
-                    if archivo_path.startswith("/app/backend/uploads/"):
-                        archivo_path = archivo_path.replace("/app/backend/uploads/", "/api/uploads/")
-                    elif archivo_path.startswith("/uploads/"):
-                        archivo_path = "/api" + archivo_path
-                    comp_normalizado["file_url"] = archivo_path
-                    comp_normalizado["archivo_url"] = archivo_path
-                comprobantes_normalizados.append(comp_normalizado)
-            
-            # Obtener datos completos del cliente desde el catálogo
+            # Normalizar campos de Telegram a estructura web, con los datos del cliente desde el catálogo
             cliente_id = operacion.get("cliente_id")
             cliente_data = await db.clientes.find_one({"id": cliente_id}, {"_id": 0}) if cliente_id else None
-            
-            # Normalizar campos de Telegram a estructura web
-            operacion = {
-                "id": operacion.get("id"),
-                "folio_mbco": operacion.get("folio_mbco"),
-                "cliente_id": operacion.get("cliente_id"),
-                "cliente_nombre": operacion.get("cliente_nombre"),
-                # Datos del cliente desde catálogo
-                "propietario": cliente_data.get("propietario") if cliente_data else None,
-                "cliente_email": cliente_data.get("email") if cliente_data else None,
-                "cliente_telegram_id": cliente_data.get("telegram_id") if cliente_data else None,
-                "cliente_telefono_completo": cliente_data.get("telefono_completo") if cliente_data else None,
-                "porcentaje_comision_cliente": cliente_data.get("porcentaje_comision_cliente", 1.0) if cliente_data else 1.0,
-                # Datos del titular/beneficiario
-                "titular_nombre_completo": operacion.get("beneficiario_reportado"),
-                "titular_idmex": operacion.get("idmex_reportado") or operacion.get("idmex_beneficiario_declarado"),
-                "numero_ligas": operacion.get("cantidad_ligas_reportada", 0),
-                "comprobantes": comprobantes_normalizados,
-                "estado": _mapear_estado_solicitud(operacion.get("estado", "borrador")),
-                "fecha_creacion": operacion.get("created_at"),
-                "monto_depositado_cliente": operacion.get("monto_depositado_cliente", 0),
-                "monto_total_comprobantes": operacion.get("monto_depositado_cliente", 0),
-                "comision_cobrada": operacion.get("comision_cliente", 0),
-                "porcentaje_comision_usado": operacion.get("comision_cliente_porcentaje", 1.0),
-                "origen": "telegram",
-                "origen_operacion": "telegram",
-                "modo_captura": operacion.get("modo_captura", "ocr_ok"),
-                "telegram_id": operacion.get("telegram_id"),
-                "idmex_beneficiario_declarado": operacion.get("idmex_beneficiario_declarado"),
-                # Datos de captura manual (cuando OCR falla)
-                "captura_manual": {
-                    "origen_montos": operacion.get("origen_montos"),
-                    "num_comprobantes_declarado": operacion.get("num_comprobantes_declarado"),
-                    "monto_total_declarado": operacion.get("monto_total_declarado"),
-                    "beneficiario_declarado": operacion.get("beneficiario_declarado"),
-                } if operacion.get("modo_captura") == "manual_por_fallo_ocr" else None,
-                # Campos de cálculos (si ya se calcularon)
-                "capital_netcash": operacion.get("capital_netcash"),
-                "costo_proveedor_monto": operacion.get("costo_proveedor_monto"),
-                "costo_proveedor_pct": operacion.get("costo_proveedor_pct"),
-                "total_egreso": operacion.get("total_egreso"),
-                "calculos": operacion.get("calculos")
-            }
-            
-            # Calcular monto de comprobantes
-            if not operacion["monto_depositado_cliente"]:
-                monto_total = sum(
-                    c.get("monto", 0) or c.get("monto_detectado", 0)
-                    for c in comprobantes_normalizados 
-                    if c.get("es_valido") and not c.get("es_duplicado")
-                )
-                operacion["monto_depositado_cliente"] = monto_total
-                operacion["monto_total_comprobantes"] = monto_total
+            operacion = normalizar_solicitud_telegram(operacion, detalle=True, cliente=cliente_data)
     
     if not operacion:
         raise HTTPException(status_code=404, detail="Operación no encontrada")
     
+    if incluir_ocr_raw:
+        await comprobante_ocr_raw_service.adjuntar(operacion)
+    
     # Marcar origen
     operacion["origen"] = origen
     
@@ -549,7 +463,7 @@ async def crear_operacion(operacion_input: OperacionNetCashCreate):
         operacion_dict["porcentaje_comision_usado"] = cliente.get("porcentaje_comision_cliente", 0.65)
     
     # Generar folio MBco
-    folio = await generar_folio_mbco()
+    folio = await folio_mbco_service.siguiente()
     operacion_dict["folio_mbco"] = folio
     
     operacion = OperacionNetCash(**operacion_dict)
@@ -563,19 +477,186 @@ async def crear_operacion(operacion_input: OperacionNetCashCreate):
     doc['ultimo_mensaje_cliente'] = datetime.now(timezone.utc)
     
     await db.operaciones.insert_one(doc)
+    operaciones_stats_service.invalidar()
     
     logger.info(f"Operación creada: {operacion.id} (Folio: {folio}) para cliente {cliente.get('nombre')}")
     return operacion
 
 
+# Totales de una operación web calculados en MongoDB sobre sus comprobantes guardados
+# (monto o, si no hay, monto_detectado de los válidos no duplicados)
+_COMPROBANTES_VALIDOS = {"$filter": {"input": {"$ifNull": ["$comprobantes", []]}, "as": "c",
+                                     "cond": {"$eq": ["$$c.es_valido", True]}}}
+_MONTO_TOTAL_COMPROBANTES = {"$sum": {"$map": {
+    "input": {"$filter": {"input": _COMPROBANTES_VALIDOS, "as": "c",
+                          "cond": {"$ne": ["$$c.es_duplicado", True]}}},
+    "as": "c",
+    "in": {"$let": {
+        "vars": {"monto": {"$ifNull": ["$$c.monto", 0]}},
+        "in": {"$cond": [{"$ne": ["$$monto", 0]}, "$$monto", {"$ifNull": ["$$c.monto_detectado", 0]}]}
+    }}
+}}}
+_TOTALES_COMPROBANTES_WEB = {
+    "monto_depositado_cliente": _MONTO_TOTAL_COMPROBANTES,
+    "monto_total_comprobantes": _MONTO_TOTAL_COMPROBANTES,
+    "num_comprobantes_validos": {"$size": _COMPROBANTES_VALIDOS},
+}
+
+
+async def _procesar_comprobante_guardado(
+    operacion_id: str,
+    operacion: dict,
+    file_path: Path,
+    safe_filename: str,
+    nombre_original: str,
+    mime_type: str,
+    file_hash: str,
+    progreso=None,
+    fallar_en_error_ocr: bool = False
+) -> dict:
+    """
+    OCR, validación y registro de un comprobante ya guardado en disco.
+    Compartido por el modo síncrono y la cola de trabajos OCR (modo asíncrono).
+    
+    Args:
+        progreso: Corrutina opcional progreso(etapa, porcentaje) para reportar avance
+        fallar_en_error_ocr: Lanzar excepción si el OCR falla (la cola reintenta)
+            en lugar de registrar el comprobante con el error
+    """
+    # Construir URL pública del archivo (relativa al backend)
+    file_url = f"/uploads/comprobantes/{safe_filename}"
+    
+    # Procesar con OCR
+    logger.info(f"Procesando comprobante para operación {operacion_id}")
+    if progreso:
+        await progreso("ocr", 20)
+    datos_ocr = await ocr_service.leer_comprobante(str(file_path), mime_type, file_hash=file_hash)
+    
+    if fallar_en_error_ocr and "error" in datos_ocr:
+        raise RuntimeError(datos_ocr["error"])
+    if progreso:
+        await progreso("validacion", 60)
+    
+    # Validar cuenta beneficiaria y detectar duplicados
+    es_valido = False
+    es_duplicado = False
+    mensaje_validacion = ""
+    
+    if "error" in datos_ocr:
+        mensaje_validacion = datos_ocr["error"]
+    else:
+        # PASO 1: Verificar si es un comprobante duplicado por clave_rastreo
+        clave_rastreo = datos_ocr.get("clave_rastreo")
+        
+        if clave_rastreo:
+            # Buscar en todas las operaciones si ya existe esta clave_rastreo
+            # Incluye la operación actual: el mismo comprobante subido dos veces a ella es duplicado
+            duplicados_clave = await comprobante_fingerprints_service.buscar_duplicados(
+                COLECCION_WEB, AMBITO_WEB, TIPO_CLAVE_RASTREO, [clave_rastreo]
+            )
+            operacion_con_duplicado = duplicados_clave.get(clave_rastreo)
+            
+            if operacion_con_duplicado:
+                es_duplicado = True
+                es_valido = False
+                mensaje_validacion = f"Este comprobante ya había sido registrado anteriormente en la operación {operacion_con_duplicado['id'][:8]}... No es necesario procesarlo de nuevo."
+                logger.warning(f"Comprobante duplicado detectado: clave_rastreo={clave_rastreo}")
+        
+        # PASO 2: Si NO es duplicado, validar contra CUENTA ACTIVA
+        if not es_duplicado:
+            # Obtener cuenta activa
+            cuenta_activa = await cuenta_deposito_service.obtener_cuenta_activa()
+            
+            if not cuenta_activa:
+                es_valido = False
+                mensaje_validacion = "No hay cuenta de depósito activa configurada"
+                logger.error("[Comprobante] No hay cuenta activa configurada")
+            else:
+                logger.info(f"[Comprobante] Validando contra cuenta activa: {cuenta_activa.get('banco')} - {cuenta_activa.get('clabe')}")
+                
+                # Validar usando el servicio de validación
+                from validador_comprobantes_service import validador_comprobantes
+                archivo_info = {
+                    'ruta': str(file_path),
+                    'mime_type': mime_type
+                }
+                
+                es_valido, razon_validacion = await validador_comprobantes.validar_comprobante_async(
+                    str(file_path),
+                    mime_type,
+                    cuenta_activa
+                )
+                
+                if es_valido:
+                    mensaje_validacion = "Comprobante válido"
+                    logger.info(f"[Comprobante] ✅ Válido: {razon_validacion}")
+                else:
+                    mensaje_validacion = f"El comprobante no corresponde a la cuenta NetCash autorizada (Banco {cuenta_activa.get('banco')}, CLABE {cuenta_activa.get('clabe')}, Beneficiario {cuenta_activa.get('beneficiario')})"
+                    logger.warning(f"[Comprobante] ❌ Inválido: {razon_validacion}")
+    
+    if progreso:
+        await progreso("guardando", 90)
+    
+    # Crear comprobante con file_url y hash
+    comprobante_dict = {
+        **datos_ocr,
+        "archivo_original": nombre_original,
+        "nombre_archivo": nombre_original,
+        "file_url": file_url,
+        "file_path": str(file_path),
+        "file_hash": file_hash,
+        "es_valido": es_valido,
+        "es_duplicado": es_duplicado,
+        "mensaje_validacion": mensaje_validacion
+    }
+    comprobante = ComprobanteDepositoOCR(**comprobante_dict)
+    
+    nuevo_estado = EstadoOperacion.ESPERANDO_DATOS_TITULAR if es_valido else EstadoOperacion.ESPERANDO_COMPROBANTES
+    # Huellas a partir de comprobante_dict: el modelo no conserva file_hash
+    huellas = comprobante_fingerprints_service.huellas(COLECCION_WEB, operacion, [comprobante_dict])
+    
+    async def guardar(session):
+        # $push y totales recalculados sobre el arreglo guardado: dos trabajos de la
+        # cola sobre la misma operación no se pisan los comprobantes
+        await db.operaciones.update_one(
+            {"id": operacion_id},
+            {"$push": {"comprobantes": comprobante.model_dump()}, "$set": {"estado": nuevo_estado}},
+            session=session
+        )
+        actualizada = await db.operaciones.find_one_and_update(
+            {"id": operacion_id},
+            [{"$set": _TOTALES_COMPROBANTES_WEB}],
+            projection={"_id": 0, "monto_total_comprobantes": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        await comprobante_fingerprints_service.registrar(huellas, session=session)
+        return (actualizada or {}).get("monto_total_comprobantes", 0)
+    
+    nuevo_monto_total = await comprobante_fingerprints_service.en_transaccion(guardar)
+    operaciones_stats_service.invalidar()
+    
+    logger.info(f"Comprobante procesado para operación {operacion_id}: {mensaje_validacion}. Monto total: {nuevo_monto_total}")
+    
+    return {
+        "success": True,
+        "comprobante": comprobante.model_dump(),
+        "operacion_id": operacion_id
+    }
+
+
 @api_router.post("/operaciones/{operacion_id}/comprobante")
 async def procesar_comprobante(
     operacion_id: str,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    asincrono: bool = False
 ):
     """
     Procesa un comprobante de depósito para una operación.
     Soporta archivos individuales (PDF, JPG, PNG) y archivos ZIP con múltiples comprobantes.
+    
+    Con ?asincrono=true solo guarda el archivo y encola el OCR/validación; responde
+    con job_id para consultar /api/ocr-jobs/{job_id} (o su stream /eventos).
     """
     try:
         # Verificar que la operación exista
@@ -592,11 +673,9 @@ async def procesar_comprobante(
         safe_filename = f"{operacion_id}_{timestamp}_{file.filename}"
         file_path = upload_dir / safe_filename
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 🔐 CALCULAR HASH para detectar duplicados
-        file_hash = calcular_hash_archivo(file_path)
+        # Una sola pasada: escribe, calcula el hash (🔐 duplicados) y detecta el tipo por su firma
+        archivo = await ingesta_archivos_service.desde_upload(file, file_path)
+        file_hash = archivo.sha256
         logger.info(f"Hash calculado para {file.filename}: {file_hash[:16]}...")
         
         # Verificar si es duplicado EXACTO (mismo archivo)
@@ -616,130 +695,82 @@ async def procesar_comprobante(
                 }
             }
         
-        # Determinar tipo MIME
-        mime_type = file.content_type or "application/octet-stream"
+        # Tipo MIME por la firma del archivo; el que declara el navegador solo si no se reconoce
+        mime_type = archivo.mime_type
+        if mime_type == MIME_DESCONOCIDO:
+            mime_type = file.content_type or MIME_DESCONOCIDO
+        
+        # Modo asíncrono: encolar OCR/validación y responder de inmediato
+        if asincrono:
+            job_id = await ocr_jobs_service.encolar(
+                TIPO_JOB_COMPROBANTE_OPERACION,
+                {
+                    "operacion_id": operacion_id,
+                    "file_path": str(file_path),
+                    "safe_filename": safe_filename,
+                    "nombre_original": file.filename,
+                    "mime_type": mime_type,
+                    "file_hash": file_hash
+                },
+                referencia=operacion_id
+            )
+            return {
+                "success": True,
+                "job_id": job_id,
+                "estado": "pendiente",
+                "status_url": f"/api/ocr-jobs/{job_id}",
+                "eventos_url": f"/api/ocr-jobs/{job_id}/eventos",
+                "operacion_id": operacion_id
+            }
         
         # ⚡ SOPORTE ZIP: Detectar si es un archivo ZIP
         if mime_type == "application/zip" or file.filename.lower().endswith('.zip'):
             logger.info(f"Archivo ZIP detectado: {file.filename}")
             return await procesar_zip_comprobantes(operacion_id, file_path, operacion, file_hash)
         
-        # Construir URL pública del archivo (relativa al backend)
-        file_url = f"/uploads/comprobantes/{safe_filename}"
-        
-        # Procesar con OCR
-        logger.info(f"Procesando comprobante para operación {operacion_id}")
-        datos_ocr = await ocr_service.leer_comprobante(str(file_path), mime_type)
-        
-        # Validar cuenta beneficiaria y detectar duplicados
-        es_valido = False
-        es_duplicado = False
-        mensaje_validacion = ""
-        
-        if "error" in datos_ocr:
-            mensaje_validacion = datos_ocr["error"]
-        else:
-            # PASO 1: Verificar si es un comprobante duplicado por clave_rastreo
-            clave_rastreo = datos_ocr.get("clave_rastreo")
-            
-            if clave_rastreo:
-                # Buscar en todas las operaciones si ya existe esta clave_rastreo
-                operacion_con_duplicado = await db.operaciones.find_one(
-                    {"comprobantes.clave_rastreo": clave_rastreo},
-                    {"_id": 0, "id": 1, "cliente_nombre": 1}
-                )
-                
-                if operacion_con_duplicado:
-                    es_duplicado = True
-                    es_valido = False
-                    mensaje_validacion = f"Este comprobante ya había sido registrado anteriormente en la operación {operacion_con_duplicado['id'][:8]}... No es necesario procesarlo de nuevo."
-                    logger.warning(f"Comprobante duplicado detectado: clave_rastreo={clave_rastreo}")
-            
-            # PASO 2: Si NO es duplicado, validar contra CUENTA ACTIVA
-            if not es_duplicado:
-                # Obtener cuenta activa
-                cuenta_activa = await cuenta_deposito_service.obtener_cuenta_activa()
-                
-                if not cuenta_activa:
-                    es_valido = False
-                    mensaje_validacion = "No hay cuenta de depósito activa configurada"
-                    logger.error("[Comprobante] No hay cuenta activa configurada")
-                else:
-                    logger.info(f"[Comprobante] Validando contra cuenta activa: {cuenta_activa.get('banco')} - {cuenta_activa.get('clabe')}")
-                    
-                    # Validar usando el servicio de validación
-                    from validador_comprobantes_service import validador_comprobantes
-                    archivo_info = {
-                        'ruta': str(file_path),
-                        'mime_type': mime_type
-                    }
-                    
-                    es_valido, razon_validacion = validador_comprobantes.validar_comprobante(
-                        str(file_path),
-                        mime_type,
-                        cuenta_activa
-                    )
-                    
-                    if es_valido:
-                        mensaje_validacion = "Comprobante válido"
-                        logger.info(f"[Comprobante] ✅ Válido: {razon_validacion}")
-                    else:
-                        mensaje_validacion = f"El comprobante no corresponde a la cuenta NetCash autorizada (Banco {cuenta_activa.get('banco')}, CLABE {cuenta_activa.get('clabe')}, Beneficiario {cuenta_activa.get('beneficiario')})"
-                        logger.warning(f"[Comprobante] ❌ Inválido: {razon_validacion}")
-        
-        # Crear comprobante con file_url y hash
-        comprobante_dict = {
-            **datos_ocr,
-            "archivo_original": file.filename,
-            "nombre_archivo": file.filename,
-            "file_url": file_url,
-            "file_path": str(file_path),
-            "file_hash": file_hash,
-            "es_valido": es_valido,
-            "es_duplicado": es_duplicado,
-            "mensaje_validacion": mensaje_validacion
-        }
-        comprobante = ComprobanteDepositoOCR(**comprobante_dict)
-        
-        # Actualizar operación
-        comprobantes = operacion.get("comprobantes", [])
-        comprobantes.append(comprobante.model_dump())
-        
-        # Recalcular monto total de comprobantes válidos
-        nuevo_monto_total = sum(
-            c.get("monto", 0) or c.get("monto_detectado", 0)
-            for c in comprobantes
-            if c.get("es_valido") and not c.get("es_duplicado")
-        )
-        
-        nuevo_estado = EstadoOperacion.ESPERANDO_DATOS_TITULAR if es_valido else EstadoOperacion.ESPERANDO_COMPROBANTES
-        
-        await db.operaciones.update_one(
-            {"id": operacion_id},
-            {
-                "$set": {
-                    "comprobantes": comprobantes,
-                    "estado": nuevo_estado,
-                    "monto_depositado_cliente": nuevo_monto_total,
-                    "monto_total_comprobantes": nuevo_monto_total,
-                    "num_comprobantes_validos": len([c for c in comprobantes if c.get("es_valido")])
-                }
-            }
+        return await _procesar_comprobante_guardado(
+            operacion_id, operacion, file_path, safe_filename, file.filename, mime_type, file_hash
         )
         
-        logger.info(f"Comprobante procesado para operación {operacion_id}: {mensaje_validacion}. Monto total: {nuevo_monto_total}")
-        
-        return {
-            "success": True,
-            "comprobante": comprobante.model_dump(),
-            "operacion_id": operacion_id
-        }
-        
+    except ArchivoDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Error procesando comprobante: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error procesando comprobante: {str(e)}")
 
 
+async def _job_comprobante_operacion(job: dict, progreso) -> dict:
+    """Handler de la cola OCR para comprobantes subidos con ?asincrono=true"""
+    payload = job["payload"]
+    operacion_id = payload["operacion_id"]
+    
+    # Releer la operación: pudo cambiar mientras el trabajo esperaba en la cola
+    operacion = await db.operaciones.find_one({"id": operacion_id}, {"_id": 0})
+    if not operacion:
+        raise ValueError(f"Operación no encontrada: {operacion_id}")
+    
+    file_path = Path(payload["file_path"])
+    if payload["mime_type"] == "application/zip" or payload["nombre_original"].lower().endswith('.zip'):
+        await progreso("zip", 10)
+        return await procesar_zip_comprobantes(operacion_id, file_path, operacion, payload["file_hash"])
+    
+    return await _procesar_comprobante_guardado(
+        operacion_id,
+        operacion,
+        file_path,
+        payload["safe_filename"],
+        payload["nombre_original"],
+        payload["mime_type"],
+        payload["file_hash"],
+        progreso=progreso,
+        # En el último intento se registra el comprobante con el error, igual que en modo síncrono
+        fallar_en_error_ocr=job["intentos"] < job["max_intentos"]
+    )
+
+
+ocr_jobs_service.registrar_handler(TIPO_JOB_COMPROBANTE_OPERACION, _job_comprobante_operacion)
+
+
 @api_router.post("/operaciones/{operacion_id}/titular")
 async def agregar_datos_titular(
     operacion_id: str,
@@ -785,6 +816,7 @@ async def agregar_datos_titular(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Operación no encontrada")
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Datos de titular agregados para operación {operacion_id} en {collection_name}")
         
@@ -808,17 +840,28 @@ async def eliminar_operacion(operacion_id: str):
     Funciona tanto para operaciones web como de Telegram.
     """
     try:
+        def eliminar_de(coleccion: str):
+            async def eliminar(session):
+                resultado = await db[coleccion].delete_one({"id": operacion_id}, session=session)
+                if resultado.deleted_count > 0:
+                    await comprobante_fingerprints_service.quitar_operacion(operacion_id, session=session)
+                    await comprobante_ocr_raw_service.quitar_operacion(operacion_id, session=session)
+                return resultado
+            return comprobante_fingerprints_service.en_transaccion(eliminar)
+        
         # Primero intentar eliminar de operaciones (web)
-        result_web = await db.operaciones.delete_one({"id": operacion_id})
+        result_web = await eliminar_de("operaciones")
         
         if result_web.deleted_count > 0:
+            operaciones_stats_service.invalidar()
             logger.info(f"Operación web eliminada: {operacion_id}")
             return {"success": True, "message": "Operación eliminada correctamente", "origen": "web"}
         
         # Si no estaba en operaciones, buscar en solicitudes_netcash (Telegram)
-        result_telegram = await db.solicitudes_netcash.delete_one({"id": operacion_id})
+        result_telegram = await eliminar_de("solicitudes_netcash")
         
         if result_telegram.deleted_count > 0:
+            operaciones_stats_service.invalidar()
             logger.info(f"Solicitud Telegram eliminada: {operacion_id}")
             return {"success": True, "message": "Solicitud eliminada correctamente", "origen": "telegram"}
         
@@ -839,12 +882,12 @@ async def eliminar_comprobante(operacion_id: str, comprobante_idx: int):
     try:
         # Primero buscar en operaciones web
         operacion = await db.operaciones.find_one({"id": operacion_id}, {"_id": 0})
-        collection = db.operaciones
+        nombre_coleccion = "operaciones"
         
         if not operacion:
             # Buscar en solicitudes Telegram
             operacion = await db.solicitudes_netcash.find_one({"id": operacion_id}, {"_id": 0})
-            collection = db.solicitudes_netcash
+            nombre_coleccion = "solicitudes_netcash"
         
         if not operacion:
             raise HTTPException(status_code=404, detail="Operación no encontrada")
@@ -855,7 +898,7 @@ async def eliminar_comprobante(operacion_id: str, comprobante_idx: int):
             raise HTTPException(status_code=400, detail="Índice de comprobante inválido")
         
         # Eliminar el comprobante del array
-        comprobantes.pop(comprobante_idx)
+        comprobante_eliminado = comprobantes.pop(comprobante_idx)
         
         # Recalcular monto total de comprobantes válidos
         nuevo_monto_total = sum(
@@ -896,10 +939,19 @@ async def eliminar_comprobante(operacion_id: str, comprobante_idx: int):
                 "total_egreso": None
             })
         
-        await collection.update_one(
-            {"id": operacion_id},
-            {"$set": update_data}
-        )
+        async def guardar(session):
+            await db[nombre_coleccion].update_one(
+                {"id": operacion_id},
+                {"$set": update_data},
+                session=session
+            )
+            await comprobante_fingerprints_service.quitar_comprobantes(
+                nombre_coleccion, operacion, [comprobante_eliminado], comprobantes, session=session
+            )
+            await comprobante_ocr_raw_service.quitar_comprobantes([comprobante_eliminado], session=session)
+        
+        await comprobante_fingerprints_service.en_transaccion(guardar)
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Comprobante {comprobante_idx} eliminado de operación {operacion_id}. Nuevo monto total: {nuevo_monto_total}")
         
@@ -919,9 +971,11 @@ async def eliminar_comprobante(operacion_id: str, comprobante_idx: int):
 
 
 @api_router.post("/operaciones/{operacion_id}/comprobantes/{comprobante_idx}/reocr")
-async def reintentar_ocr_comprobante(operacion_id: str, comprobante_idx: int):
+async def reintentar_ocr_comprobante(operacion_id: str, comprobante_idx: int, ignorar_cache: bool = True):
     """
     Re-intenta el procesamiento OCR de un comprobante específico.
+    Por defecto ignora el caché OCR (un reintento debe volver a leer el archivo);
+    el resultado nuevo reemplaza la entrada cacheada.
     """
     try:
         # Buscar en operaciones web
@@ -965,7 +1019,12 @@ async def reintentar_ocr_comprobante(operacion_id: str, comprobante_idx: int):
         if str(file_path).lower().endswith(".png"):
             mime_type = "image/png"
         
-        resultado_ocr = await ocr_service.leer_comprobante(str(file_path), mime_type)
+        resultado_ocr = await ocr_service.leer_comprobante(
+            str(file_path),
+            mime_type,
+            file_hash=comprobante.get("file_hash") or comprobante.get("archivo_hash"),
+            ignorar_cache=ignorar_cache
+        )
         
         # Verificar si hubo error
         if resultado_ocr.get("error"):
@@ -1004,7 +1063,7 @@ async def reintentar_ocr_comprobante(operacion_id: str, comprobante_idx: int):
             if cuenta_activa:
                 from validador_comprobantes_service import validador_comprobantes
                 
-                es_valido, mensaje_validacion = validador_comprobantes.validar_comprobante(
+                es_valido, mensaje_validacion = await validador_comprobantes.validar_comprobante_async(
                     str(file_path), mime_type, cuenta_activa
                 )
                 
@@ -1017,6 +1076,7 @@ async def reintentar_ocr_comprobante(operacion_id: str, comprobante_idx: int):
                 logger.warning("[Re-OCR] No hay cuenta activa configurada para validar")
         
         # Actualizar comprobante con nuevos datos
+        comprobante_anterior = dict(comprobantes[comprobante_idx])
         comprobantes[comprobante_idx].update({
             "monto": nuevo_monto,
             "monto_detectado": nuevo_monto,
@@ -1043,6 +1103,11 @@ async def reintentar_ocr_comprobante(operacion_id: str, comprobante_idx: int):
             if c.get("es_valido") and not c.get("es_duplicado")
         )
         
+        # El payload OCR crudo va a comprobante_ocr_raw; la operación guarda el resumen
+        comprobantes, payloads_ocr = comprobante_ocr_raw_service.separar_comprobantes(
+            collection, operacion_id, comprobantes
+        )
+        
         # Preparar datos de actualización
         update_data = {
             "comprobantes": comprobantes,
@@ -1085,10 +1150,22 @@ async def reintentar_ocr_comprobante(operacion_id: str, comprobante_idx: int):
         
         # Guardar en BD
         db_collection = db.operaciones if collection == "operaciones" else db.solicitudes_netcash
-        await db_collection.update_one(
-            {"id": operacion_id},
-            {"$set": update_data}
-        )
+        
+        async def guardar(session):
+            await db_collection.update_one(
+                {"id": operacion_id},
+                {"$set": update_data},
+                session=session
+            )
+            await comprobante_ocr_raw_service.guardar(payloads_ocr, session=session)
+            # La clave de rastreo pudo cambiar: la anterior deja de bloquear y la nueva se indexa
+            await comprobante_fingerprints_service.actualizar_comprobante(
+                collection, operacion, comprobante_anterior, comprobantes[comprobante_idx], comprobantes,
+                session=session
+            )
+        
+        await comprobante_fingerprints_service.en_transaccion(guardar)
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Re-OCR completado para comprobante {comprobante_idx} de operación {operacion_id}. Monto total: {nuevo_monto_total}")
         
@@ -1139,6 +1216,7 @@ async def actualizar_comprobante_manual(
         # Actualizar campos proporcionados
         update_data = {"updated_at": datetime.now(timezone.utc).isoformat()}
         
+        comprobante_anterior = dict(comprobantes[comprobante_idx])
         if monto is not None:
             comprobantes[comprobante_idx]["monto"] = monto
             comprobantes[comprobante_idx]["monto_detectado"] = monto
@@ -1163,6 +1241,11 @@ async def actualizar_comprobante_manual(
             if c.get("es_valido") and not c.get("es_duplicado")
         )
         
+        # El payload OCR crudo va a comprobante_ocr_raw; la operación guarda el resumen
+        comprobantes, payloads_ocr = comprobante_ocr_raw_service.separar_comprobantes(
+            collection, operacion_id, comprobantes
+        )
+        
         # Preparar datos de actualización
         update_data = {
             "comprobantes": comprobantes,
@@ -1197,10 +1280,22 @@ async def actualizar_comprobante_manual(
         
         # Guardar en BD
         db_collection = db.operaciones if collection == "operaciones" else db.solicitudes_netcash
-        await db_collection.update_one(
-            {"id": operacion_id},
-            {"$set": update_data}
-        )
+        
+        async def guardar(session):
+            await db_collection.update_one(
+                {"id": operacion_id},
+                {"$set": update_data},
+                session=session
+            )
+            await comprobante_ocr_raw_service.guardar(payloads_ocr, session=session)
+            # La clave de rastreo pudo cambiar: la anterior deja de bloquear y la nueva se indexa
+            await comprobante_fingerprints_service.actualizar_comprobante(
+                collection, operacion, comprobante_anterior, comprobantes[comprobante_idx], comprobantes,
+                session=session
+            )
+        
+        await comprobante_fingerprints_service.en_transaccion(guardar)
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Comprobante {comprobante_idx} actualizado manualmente para operación {operacion_id}. Monto total: {nuevo_monto_total}")
         
@@ -1259,6 +1354,7 @@ async def actualizar_datos_manuales(
             {"id": operacion_id},
             {"$set": update_data}
         )
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Datos manuales actualizados para operación {operacion_id}")
         
@@ -1356,6 +1452,7 @@ async def calcular_operacion(
             update_data["comision_cliente_porcentaje"] = calculos_dict["comision_cliente_porcentaje"]
             update_data["estado"] = "lista_para_confirmacion"  # Estado Telegram equivalente
             await db.solicitudes_netcash.update_one({"id": operacion_id}, {"$set": update_data})
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Cálculos realizados para operación {operacion_id}")
         
@@ -1408,6 +1505,7 @@ async def confirmar_operacion(operacion_id: str):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Operación no encontrada")
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Operación {operacion_id} confirmada desde {collection_name} - Estado: DATOS_COMPLETOS")
         
@@ -1433,7 +1531,7 @@ async def obtener_clientes():
     """
     Obtiene todos los clientes.
     """
-    clientes = await db.clientes.find({}, {"_id": 0}).to_list(1000)
+    clientes = await db.clientes.find({}, PROYECCION_CLIENTE).to_list(1000)
     
     for cliente in clientes:
         if isinstance(cliente.get('fecha_alta'), str):
@@ -1454,8 +1552,10 @@ async def crear_cliente(cliente_input: ClienteCreate):
     
     doc = cliente.model_dump()
     doc['fecha_alta'] = doc['fecha_alta'].isoformat()
+    doc.update(campos_busqueda(doc))
     
     await db.clientes.insert_one(doc)
+    identidad_cache.invalidar_cliente(cliente.id)
     
     logger.info(f"Cliente creado: {cliente.id} - {cliente.nombre}")
     return cliente
@@ -1483,13 +1583,17 @@ async def actualizar_cliente(cliente_id: str, cliente_input: dict):
             update_data[campo] = cliente_input[campo]
     
     if update_data:
+        # Mantener la clave de búsqueda al día con nombre / email / teléfono
+        update_data.update(campos_busqueda({**cliente_existente, **update_data}))
         await db.clientes.update_one(
             {"id": cliente_id},
             {"$set": update_data}
         )
+        # Activar / aprobar / editar: el bot no debe seguir viendo el estado anterior
+        identidad_cache.invalidar_cliente(cliente_id)
     
     # Obtener cliente actualizado
-    cliente_actualizado = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
+    cliente_actualizado = await db.clientes.find_one({"id": cliente_id}, PROYECCION_CLIENTE)
     
     if isinstance(cliente_actualizado.get('fecha_alta'), str):
         cliente_actualizado['fecha_alta'] = datetime.fromisoformat(cliente_actualizado['fecha_alta'])
@@ -1499,31 +1603,31 @@ async def actualizar_cliente(cliente_id: str, cliente_input: dict):
 
 
 @api_router.get("/clientes/buscar")
-async def buscar_clientes(q: str = ""):
+async def buscar_clientes(
+    q: str = "",
+    pagina: int = 1,
+    limite: int = LIMITE_BUSQUEDA_CLIENTES,
+    ngramas: Optional[bool] = None
+):
     """
-    Busca clientes por nombre, email o teléfono.
+    Busca clientes por nombre, email o teléfono (sin acentos ni mayúsculas).
+    
+    Query params:
+    - q: términos de búsqueda; cada uno debe ser inicio de una palabra del cliente
+    - pagina, limite (máx. 100)
+    - ngramas: true = también coincidencias a media palabra; por defecto solo si no hay resultados por prefijo
+    
+    Returns: {"clientes": [...], "pagina", "limite", "hay_mas", "modo"}
+    Sin q devuelve los clientes en orden alfabético.
     """
-    if not q:
-        # Si no hay búsqueda, devolver todos
-        clientes = await db.clientes.find({}, {"_id": 0}).limit(50).to_list(50)
-    else:
-        # Búsqueda por nombre, email o teléfono
-        query = {
-            "$or": [
-                {"nombre": {"$regex": q, "$options": "i"}},
-                {"email": {"$regex": q, "$options": "i"}},
-                {"telefono_completo": {"$regex": q, "$options": "i"}},
-                {"telefono": {"$regex": q, "$options": "i"}}
-            ]
-        }
-        clientes = await db.clientes.find(query, {"_id": 0}).limit(20).to_list(20)
+    resultado = await clientes_busqueda_service.buscar(q, pagina=pagina, limite=limite, ngramas=ngramas)
     
     # Convertir timestamps
-    for cliente in clientes:
+    for cliente in resultado["clientes"]:
         if isinstance(cliente.get('fecha_alta'), str):
             cliente['fecha_alta'] = datetime.fromisoformat(cliente['fecha_alta'])
     
-    return clientes
+    return resultado
 
 
 # ============================================
@@ -1650,6 +1754,7 @@ async def registrar_clave_mbcontrol(
                 }
             }
         )
+        operaciones_stats_service.invalidar()
         
         logger.info(f"Clave MBControl registrada para operación {operacion_id} en {collection_name}. Layout generado: {layout_path}")
         
@@ -2094,12 +2199,18 @@ app.include_router(api_router)
 from api_telegram import router as telegram_router
 app.include_router(telegram_router, prefix="/api")
 
+# Webhook del bot de Telegram (solo recibe updates con TELEGRAM_MODO=webhook y TELEGRAM_WEBHOOK_EN_SERVER=1)
+from telegram_webhook_service import router as telegram_webhook_router, telegram_webhook_service
+app.include_router(telegram_webhook_router, prefix="/api")
+
 # Import and include NetCash V1 router
 from routes.netcash_routes import router as netcash_router
 from routes.usuarios_routes import router as usuarios_router
+from routes.ocr_jobs_routes import router as ocr_jobs_router
 
 app.include_router(netcash_router, prefix="/api")
 app.include_router(usuarios_router)
+app.include_router(ocr_jobs_router, prefix="/api")
 
 app.add_middleware(
     CORSMiddleware,
@@ -2113,6 +2224,16 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     """Inicialización al arrancar el servidor"""
+    # Asegurar índices de las colecciones calientes (idempotente)
+    from indices_service import asegurar_indices
+    await asegurar_indices()
+    
+    # El contador de folios no debe quedar detrás de los folios ya asignados
+    await folio_mbco_service.reparar(aplicar=True)
+    
+    # Clave de búsqueda de clientes creados antes de la búsqueda indexada o por otros canales
+    await clientes_busqueda_service.reindexar()
+    
     # Sembrar usuarios iniciales si no existen
     from usuarios_repo import usuarios_repo
     await usuarios_repo.sembrar_usuarios_iniciales()
@@ -2130,6 +2251,17 @@ async def startup_event():
     from scheduler_email_monitor import email_monitor_scheduler
     email_monitor_scheduler.start()
     logger.info("[Server] Scheduler de Monitoreo de Emails iniciado")
+    
+    # Iniciar workers de la cola OCR (comprobantes en modo asíncrono)
+    ocr_jobs_service.start()
+    
+    # Mantener la vista materializada operaciones_view (change stream)
+    operaciones_view_service.start()
+    
+    # Bot de Telegram por webhook dentro de este proceso
+    if telegram_webhook_service.modo_webhook and telegram_webhook_service.en_server:
+        from telegram_bot import TelegramBotNetCash
+        await telegram_webhook_service.iniciar(TelegramBotNetCash())
 
 
 @app.on_event("shutdown")
@@ -2143,7 +2275,18 @@ async def shutdown_db_client():
     email_monitor_scheduler.shutdown()
     logger.info("[Server] Scheduler de Monitoreo de Emails detenido")
     
-    client.close()
+    # Detener workers de la cola OCR (los trabajos en curso vuelven a la cola)
+    await ocr_jobs_service.stop()
+    
+    await operaciones_view_service.stop()
+    
+    await telegram_webhook_service.detener()
+    
+    # Detener pool de extracción de texto (PyPDF2/Tesseract)
+    from extraccion_texto_service import extraccion_texto_service
+    extraccion_texto_service.shutdown()
+    
+    cerrar_cliente()
 
 
 if __name__ == "__main__":
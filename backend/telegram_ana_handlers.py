@@ -14,19 +14,13 @@ import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from netcash_service import netcash_service
-from motor.motor_asyncio import AsyncIOMotorClient
 
 # P2: Servicio de aprendizaje
 from netcash_pdf_learning_service import netcash_pdf_learning_service
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 # Estados del flujo de Ana
 ANA_ESPERANDO_FOLIO_MBCO = 100
 ANA_ESPERANDO_MOTIVO_RECHAZO = 101  # P1: Estado para capturar motivo de rechazo
@@ -574,15 +568,8 @@ class TelegramAnaHandlers:
                 return ConversationHandler.END
             
             # Actualizar estado a rechazada
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
             from datetime import datetime, timezone
             
-            mongo_url = os.getenv('MONGO_URL')
-            db_name = os.getenv('DB_NAME', 'netcash_mbco')
-            client = AsyncIOMotorClient(mongo_url)
-            db = client[db_name]
-            
             await db.solicitudes_netcash.update_one(
                 {"id": solicitud_id},
                 {
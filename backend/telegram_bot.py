@@ -13,13 +13,18 @@ from telegram.ext import (
 )
 from dotenv import load_dotenv
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import aiohttp
 from pathlib import Path
 
 from models import OperacionNetCash, EstadoOperacion, Propietario
 from config import MENSAJE_BIENVENIDA_CUENTA, MENSAJE_MANTENIMIENTO, MODO_MANTENIMIENTO, CONTACTOS
+from database import db
+from clientes_busqueda_service import campos_busqueda
+from identidad_cache_service import (
+    ESPACIO_CLIENTE, ESPACIO_USUARIO_TELEGRAM, etiquetas_de_usuario_telegram, etiquetas_usuario_telegram,
+    identidad_cache
+)
 
 load_dotenv()
 
@@ -59,11 +64,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-mongo_client = AsyncIOMotorClient(mongo_url)
-db = mongo_client[os.environ.get('DB_NAME', 'netcash_mbco')]
-
 # Backend API URL
 BACKEND_API = os.getenv("BACKEND_API_URL", "http://localhost:8001/api")
 
@@ -121,7 +121,12 @@ class TelegramBotNetCash:
     
     async def obtener_o_crear_usuario(self, chat_id: str, telefono: str = None, nombre: str = None):
         """Obtiene o crea un usuario en la BD"""
-        usuario = await db.usuarios_telegram.find_one({"chat_id": chat_id}, {"_id": 0})
+        usuario = await identidad_cache.obtener(
+            ESPACIO_USUARIO_TELEGRAM, ("chat_id", str(chat_id)),
+            lambda: db.usuarios_telegram.find_one({"chat_id": chat_id}, {"_id": 0}),
+            etiquetas=etiquetas_usuario_telegram(chat_id=chat_id),
+            etiquetas_del_valor=etiquetas_de_usuario_telegram,
+        )
         
         if usuario:
             return usuario
@@ -185,6 +190,7 @@ class TelegramBotNetCash:
         }
         
         await db.usuarios_telegram.insert_one(nuevo_usuario)
+        identidad_cache.invalidar_usuario_telegram(str(chat_id), chat_id)
         logger.info(f"Usuario creado: {chat_id} - Rol: {rol}")
         
         # Si se vinculó un cliente activo, actualizar el cliente en BD con telegram_id
@@ -193,6 +199,7 @@ class TelegramBotNetCash:
                 {"id": id_cliente},
                 {"$set": {"telegram_id": str(chat_id)}}
             )
+            identidad_cache.invalidar_cliente(id_cliente)
             logger.info(f"Cliente {id_cliente} vinculado con telegram_id {chat_id}")
         
         # Si es usuario desconocido (no cliente ni rol interno), notificar a Ana
@@ -264,6 +271,7 @@ class TelegramBotNetCash:
                 }
                 
                 await db.usuarios_telegram.insert_one(nuevo_usuario)
+                identidad_cache.invalidar_usuario_telegram(telegram_id, chat_id)
                 logger.info(f"[NetCash][START] Usuario nuevo creado en BD: {telegram_id}")
                 
                 # Mostrar mensaje de bienvenida + botón para compartir teléfono
@@ -288,6 +296,7 @@ class TelegramBotNetCash:
                     {"telegram_id": telegram_id},
                     {"$set": {"chat_id": chat_id, "updated_at": datetime.now(timezone.utc).isoformat()}}
                 )
+                identidad_cache.invalidar_usuario_telegram(telegram_id, chat_id)
                 logger.info(f"[NetCash][START] Chat ID actualizado para {telegram_id}")
             
             # Verificar estado
@@ -565,6 +574,8 @@ class TelegramBotNetCash:
                     "rol_info": {"nombre": cliente_existente["nombre"], "descripcion": "Cliente NetCash"}
                 }}
             )
+            identidad_cache.invalidar_cliente(cliente_existente["id"])
+            identidad_cache.invalidar_usuario_telegram(str(user.id), chat_id)
             
             logger.info(f"Cliente existente vinculado a Telegram: {cliente_existente['id']} - {cliente_existente['nombre']}")
             
@@ -633,6 +644,8 @@ class TelegramBotNetCash:
                 "activo": True
             }
             
+            nuevo_cliente.update(campos_busqueda(nuevo_cliente))
+            
             await db.clientes.insert_one(nuevo_cliente)
             
             # Actualizar usuario de telegram
@@ -645,6 +658,8 @@ class TelegramBotNetCash:
                 }},
                 upsert=True
             )
+            identidad_cache.invalidar_cliente(nuevo_cliente["id"])
+            identidad_cache.invalidar_usuario_telegram(str(update.effective_user.id), chat_id)
             
             logger.info(f"Cliente NUEVO registrado: {nuevo_cliente['id']} - {nuevo_cliente['nombre']}")
             
@@ -691,13 +706,15 @@ class TelegramBotNetCash:
             query = {"telegram_id": telegram_id}
         logger.info(f"[es_cliente_activo] Query MongoDB: {query}")
         
-        usuario = await db.usuarios_telegram.find_one(query, {"_id": 0})
+        usuario = await identidad_cache.obtener(
+            ESPACIO_USUARIO_TELEGRAM, ("telegram_id_o_chat_id", str(telegram_id), str(chat_id) if chat_id else None),
+            lambda: db.usuarios_telegram.find_one(query, {"_id": 0}),
+            etiquetas=etiquetas_usuario_telegram(telegram_id, chat_id),
+            etiquetas_del_valor=etiquetas_de_usuario_telegram,
+        )
         
         if not usuario:
             logger.warning(f"[es_cliente_activo] ❌ Usuario NO encontrado en BD con query: {query}")
-            # Intentar buscar también todos los usuarios para debuggear
-            todos = await db.usuarios_telegram.find({}, {"_id": 0, "telegram_id": 1, "chat_id": 1, "nombre": 1}).to_list(10)
-            logger.warning(f"[es_cliente_activo] DEBUG - Usuarios en BD: {todos}")
             return False, None, None
         
         # Verificar que tenga id_cliente o rol adecuado
@@ -713,7 +730,11 @@ class TelegramBotNetCash:
             return False, usuario, None
         
         # Buscar el cliente en BD
-        cliente = await db.clientes.find_one({"id": id_cliente}, {"_id": 0})
+        cliente = await identidad_cache.obtener(
+            ESPACIO_CLIENTE, str(id_cliente),
+            lambda: db.clientes.find_one({"id": id_cliente}, {"_id": 0}),
+            etiquetas={("cliente", str(id_cliente))},
+        )
         
         if not cliente:
             logger.warning(f"[es_cliente_activo] ❌ Cliente NO encontrado en BD con id={id_cliente}")
@@ -775,6 +796,7 @@ class TelegramBotNetCash:
                     {"telegram_id": telegram_id},
                     {"$set": {"chat_id": chat_id, "updated_at": datetime.now(timezone.utc).isoformat()}}
                 )
+                identidad_cache.invalidar_usuario_telegram(telegram_id, chat_id)
                 logger.info(f"[nueva_operacion] ✅ Chat ID actualizado exitosamente")
             else:
                 logger.info(f"[nueva_operacion] Chat ID ya es correcto: {chat_id}")
@@ -866,6 +888,7 @@ class TelegramBotNetCash:
                 {"telegram_id": telegram_id},
                 {"$set": {"chat_id": chat_id, "updated_at": datetime.now(timezone.utc).isoformat()}}
             )
+            identidad_cache.invalidar_usuario_telegram(telegram_id, chat_id)
             logger.info(f"[ver_operaciones] Chat ID actualizado para {telegram_id}: {chat_id}")
         
         # Verificar que esté registrado como cliente activo
@@ -1044,15 +1067,18 @@ class TelegramBotNetCash:
         
         try:
             # Descargar archivo
+            from ingesta_archivos_service import ingesta_archivos_service
             file = await update.message.document.get_file()
             file_path = Path("/tmp") / f"comprobante_{operacion_id}_{file.file_id}.pdf"
-            await file.download_to_drive(file_path)
+            archivo = await ingesta_archivos_service.desde_telegram(
+                file, file_path, update.message.document.file_name or file_path.name
+            )
             
             # Subir al backend para procesamiento con OCR
             async with aiohttp.ClientSession() as session:
                 with open(file_path, 'rb') as f:
                     form = aiohttp.FormData()
-                    form.add_field('file', f, filename=update.message.document.file_name, content_type=update.message.document.mime_type)
+                    form.add_field('file', f, filename=update.message.document.file_name, content_type=archivo.mime_type)
                     
                     async with session.post(f"{BACKEND_API}/operaciones/{operacion_id}/comprobante", data=form) as response:
                         if response.status == 200:
@@ -1203,9 +1229,34 @@ class TelegramBotNetCash:
         # [Previous implementation remains]
         pass
     
-    def run(self):
-        """Inicia el bot"""
-        self.app = Application.builder().token(self.token).build()
+    async def _post_init(self, application: Application):
+        """Se ejecuta una vez dentro del loop del bot, antes de empezar el polling"""
+        from indices_service import asegurar_indices
+        await asegurar_indices()
+        from folio_mbco_service import folio_mbco_service
+        await folio_mbco_service.reparar(aplicar=True)
+    
+    async def _post_shutdown(self, application: Application):
+        """Cierra el cliente MongoDB compartido al detener el bot"""
+        from database import cerrar_cliente
+        cerrar_cliente()
+    
+    def construir_aplicacion(self) -> Application:
+        """Crea la Application con todos los handlers (la usan polling y webhook)"""
+        from telegram_webhook_service import ProcesadorPorChat
+        
+        builder = Application.builder().token(self.token).post_init(self._post_init).post_shutdown(self._post_shutdown)
+        # Updates concurrentes; los de un mismo chat/usuario siguen en orden
+        builder = builder.concurrent_updates(ProcesadorPorChat.desde_entorno())
+        # Estado de conversaciones y user_data en MongoDB: sobrevive reinicios
+        from telegram_persistencia_service import MongoPersistence
+        if MongoPersistence.habilitada():
+            builder = builder.persistence(MongoPersistence.desde_entorno())
+        api_url = os.getenv("TELEGRAM_API_URL")
+        if api_url:
+            builder = builder.base_url(f"{api_url.rstrip('/')}/bot").base_file_url(f"{api_url.rstrip('/')}/file/bot")
+        self.app = builder.build()
+        persistente = self.app.persistence is not None
         
         # Importar handlers de NetCash V1
         from telegram_netcash_handlers import TelegramNetCashHandlers, NC_ESPERANDO_MONTO_MANUAL
@@ -1230,7 +1281,9 @@ class TelegramBotNetCash:
             states={
                 ESPERANDO_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.recibir_email)]
             },
-            fallbacks=[CommandHandler("cancelar", self.cancelar_registro)]
+            fallbacks=[CommandHandler("cancelar", self.cancelar_registro)],
+            name="registro",
+            persistent=persistente
         )
         
         # Conversation handler for NetCash V1 (REORDENADO)
@@ -1239,8 +1292,9 @@ class TelegramBotNetCash:
             entry_points=[CallbackQueryHandler(self.nc_handlers.iniciar_crear_operacion, pattern="^nc_crear_operacion$")],
             states={
                 NC_ESPERANDO_COMPROBANTE: [
-                    MessageHandler(filters.Document.ALL, self.nc_handlers.recibir_comprobante),
-                    MessageHandler(filters.PHOTO, self.nc_handlers.recibir_comprobante),
+                    # En segundo plano: la conversación retoma su estado cuando termina el OCR
+                    MessageHandler(filters.Document.ALL, self.nc_handlers.recibir_comprobante, block=False),
+                    MessageHandler(filters.PHOTO, self.nc_handlers.recibir_comprobante, block=False),
                     CallbackQueryHandler(self.nc_handlers.agregar_otro_comprobante, pattern="^nc_mas_comprobantes_"),
                     CallbackQueryHandler(self.nc_handlers.continuar_desde_paso1, pattern="^nc_continuar_paso1_"),
                     CallbackQueryHandler(self.nc_handlers.solicitar_monto_comprobante, pattern="^nc_editar_monto_"),
@@ -1270,13 +1324,21 @@ class TelegramBotNetCash:
                 NC_MANUAL_GUARDAR_FRECUENTE: [
                     CallbackQueryHandler(self.nc_handlers.procesar_guardar_frecuente, pattern="^nc_manual_guardar_(si|no)$")
                 ],
-                NC_MANUAL_NUM_LIGAS: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.nc_handlers.recibir_num_ligas_manual)]
+                NC_MANUAL_NUM_LIGAS: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.nc_handlers.recibir_num_ligas_manual)],
+                # Mientras recibir_comprobante procesa: más comprobantes se encolan, lo demás espera
+                ConversationHandler.WAITING: [
+                    MessageHandler(filters.Document.ALL | filters.PHOTO, self.nc_handlers.recibir_comprobante, block=False),
+                    CallbackQueryHandler(self.nc_handlers.procesando_en_espera),
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.nc_handlers.procesando_en_espera)
+                ]
             },
             fallbacks=[
                 CallbackQueryHandler(self.nc_handlers.cancelar_operacion, pattern="^nc_cancelar$"),
                 CallbackQueryHandler(self.nc_handlers.cancelar_operacion_inicio, pattern="^nc_cancelar_operacion_inicio$"),
                 CommandHandler("start", self.start)
-            ]
+            ],
+            name="netcash",
+            persistent=persistente
         )
         
         # Conversation handler para Ana (asignación de folio MBco y rechazo)
@@ -1295,7 +1357,9 @@ class TelegramBotNetCash:
             },
             fallbacks=[
                 CommandHandler("cancelar", self.ana_handlers.cancelar)
-            ]
+            ],
+            name="ana",
+            persistent=persistente
         )
         
         # Handler para botones de Tesorería
@@ -1315,10 +1379,23 @@ class TelegramBotNetCash:
         
         self.app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_mensaje_no_reconocido))
         
+        return self.app
+    
+    def run(self):
+        """Inicia el bot (polling, o webhook con TELEGRAM_MODO=webhook)"""
+        from telegram_webhook_service import telegram_webhook_service
+        
+        if telegram_webhook_service.modo_webhook and telegram_webhook_service.en_server:
+            logger.error("TELEGRAM_WEBHOOK_EN_SERVER=1: el bot corre dentro de server.py, no se inicia aquí")
+            return
+        
+        self.construir_aplicacion()
         logger.info("Bot iniciado correctamente. Esperando mensajes...")
         
-        # Iniciar el bot
-        self.app.run_polling(allowed_updates=Update.ALL_TYPES)
+        if telegram_webhook_service.modo_webhook:
+            telegram_webhook_service.servir(self)
+        else:
+            self.app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
@@ -15,6 +15,7 @@ Filosofía:
 - Sin duplicar lógica de negocio
 """
 
+import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
@@ -25,6 +26,8 @@ from netcash_service import netcash_service
 from netcash_models import SolicitudCreate, SolicitudUpdate, CanalOrigen, CanalMetadata
 from cuenta_deposito_service import cuenta_deposito_service
 from beneficiarios_frecuentes_service import beneficiarios_frecuentes_service
+from telegram_progreso import ETAPAS_COMPROBANTE, ETAPAS_ZIP, MensajeDeProgreso
+from ingesta_archivos_service import ArchivoDemasiadoGrande, ingesta_archivos_service
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +58,9 @@ class TelegramNetCashHandlers:
             bot_instance: Instancia del bot principal (para acceder a es_cliente_activo, etc.)
         """
         self.bot = bot_instance
+        # Un comprobante a la vez por solicitud (recibir_comprobante corre en segundo plano)
+        self._candados_comprobantes = {}
+        self._en_cola_comprobantes = {}
     
     # ==================== MENÚ PRINCIPAL ====================
     
@@ -93,12 +99,7 @@ class TelegramNetCashHandlers:
         
         try:
             # Verificar que solo haya UNA cuenta concertadora activa
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
-            mongo_url = os.getenv('MONGO_URL')
-            db_name = os.getenv('DB_NAME', 'netcash_mbco')
-            client = AsyncIOMotorClient(mongo_url)
-            db = client[db_name]
+            from database import db
             
             cuentas_activas = await db.config_cuentas_netcash.count_documents({
                 "tipo": "concertadora",
@@ -199,12 +200,7 @@ class TelegramNetCashHandlers:
             logger.info(f"[NC Telegram] Solicitud creada: {solicitud.get('id')} para cliente {cliente.get('id')}")
             
             # Verificar que solo haya UNA cuenta concertadora activa
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
-            mongo_url = os.getenv('MONGO_URL')
-            db_name = os.getenv('DB_NAME', 'netcash_mbco')
-            client = AsyncIOMotorClient(mongo_url)
-            db = client[db_name]
+            from database import db
             
             cuentas_activas = await db.config_cuentas_netcash.count_documents({
                 "tipo": "concertadora",
@@ -279,15 +275,18 @@ class TelegramNetCashHandlers:
         
         try:
             if solicitud_id:
-                # Eliminar el borrador de la BD
-                from motor.motor_asyncio import AsyncIOMotorClient
-                import os
-                mongo_url = os.getenv('MONGO_URL')
-                db_name = os.getenv('DB_NAME', 'netcash_mbco')
-                client = AsyncIOMotorClient(mongo_url)
-                db = client[db_name]
-                
-                result = await db.solicitudes_netcash.delete_one({"id": solicitud_id})
+                # Eliminar el borrador de la BD (y las huellas y payloads OCR de sus comprobantes)
+                from database import db
+                from comprobante_fingerprints_service import comprobante_fingerprints_service
+                from comprobante_ocr_raw_service import comprobante_ocr_raw_service
+                
+                async def eliminar_borrador(session):
+                    resultado = await db.solicitudes_netcash.delete_one({"id": solicitud_id}, session=session)
+                    await comprobante_fingerprints_service.quitar_operacion(solicitud_id, session=session)
+                    await comprobante_ocr_raw_service.quitar_operacion(solicitud_id, session=session)
+                    return resultado
+                
+                result = await comprobante_fingerprints_service.en_transaccion(eliminar_borrador)
                 if result.deleted_count > 0:
                     logger.info(f"[NC Telegram] Borrador {solicitud_id} eliminado por cancelación del usuario")
             
@@ -484,10 +483,7 @@ class TelegramNetCashHandlers:
             comprobantes[comp_idx]["ocr_data"]["cantidad_depositos_reportada"] = cantidad_depositos
             
             # Guardar en BD
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
-            client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
-            db = client[os.environ.get('DB_NAME', 'netcash_mbco')]
+            from database import db
             
             await db.solicitudes_netcash.update_one(
                 {"id": solicitud_id},
@@ -544,10 +540,9 @@ class TelegramNetCashHandlers:
             logger.info(f"[NC Telegram] Descartando comprobante {comp_idx} de solicitud {solicitud_id}")
             
             # Obtener solicitud y eliminar el comprobante
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
-            client = AsyncIOMotorClient(os.environ.get('MONGO_URL'))
-            db = client[os.environ.get('DB_NAME', 'netcash_mbco')]
+            from database import db
+            from comprobante_fingerprints_service import comprobante_fingerprints_service
+            from comprobante_ocr_raw_service import comprobante_ocr_raw_service
             
             solicitud = await netcash_service.obtener_solicitud(solicitud_id)
             comprobantes = solicitud.get("comprobantes", [])
@@ -555,10 +550,18 @@ class TelegramNetCashHandlers:
             if comp_idx < len(comprobantes):
                 comprobante_eliminado = comprobantes.pop(comp_idx)
                 
-                await db.solicitudes_netcash.update_one(
-                    {"id": solicitud_id},
-                    {"$set": {"comprobantes": comprobantes}}
-                )
+                async def descartar(session):
+                    await db.solicitudes_netcash.update_one(
+                        {"id": solicitud_id},
+                        {"$set": {"comprobantes": comprobantes}},
+                        session=session
+                    )
+                    await comprobante_fingerprints_service.quitar_comprobantes(
+                        "solicitudes_netcash", solicitud, [comprobante_eliminado], comprobantes, session=session
+                    )
+                    await comprobante_ocr_raw_service.quitar_comprobantes([comprobante_eliminado], session=session)
+                
+                await comprobante_fingerprints_service.en_transaccion(descartar)
                 
                 logger.info(f"[NC Telegram] ✅ Comprobante {comp_idx} descartado")
                 
@@ -586,10 +589,46 @@ class TelegramNetCashHandlers:
     
     # ==================== PASO 1: RECIBIR COMPROBANTES ====================
     
+    @staticmethod
+    def _progreso_comprobante(nombre_archivo: str, es_zip: bool):
+        """Título y etapas del mensaje de progreso según el tipo de archivo"""
+        if es_zip:
+            return f"📦 Procesando archivo ZIP {nombre_archivo}", ETAPAS_ZIP
+        return "🔍 Procesando comprobante...", ETAPAS_COMPROBANTE
+    
+    async def _en_turno(self, solicitud_id: str, progreso: MensajeDeProgreso, procesamiento):
+        """Espera a que termine el comprobante anterior de la solicitud y ejecuta el procesamiento"""
+        candado = self._candados_comprobantes.setdefault(solicitud_id, asyncio.Lock())
+        self._en_cola_comprobantes[solicitud_id] = self._en_cola_comprobantes.get(solicitud_id, 0) + 1
+        try:
+            if candado.locked():
+                await progreso.avisar("⏳ En cola: termino primero tu comprobante anterior")
+            async with candado:
+                return await procesamiento
+        finally:
+            self._en_cola_comprobantes[solicitud_id] -= 1
+            if not self._en_cola_comprobantes[solicitud_id]:
+                del self._en_cola_comprobantes[solicitud_id]
+                del self._candados_comprobantes[solicitud_id]
+    
+    async def procesando_en_espera(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Estado WAITING: el usuario escribe o toca un botón mientras se procesa su comprobante"""
+        mensaje = "⏳ Sigo procesando tu comprobante, en un momento te muestro el resultado."
+        if update.callback_query:
+            await update.callback_query.answer(mensaje, show_alert=False)
+        elif update.message:
+            await update.message.reply_text(mensaje)
+    
     async def recibir_comprobante(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
         Recibe y procesa comprobante(s) - Paso 1
         
+        Corre en segundo plano (handler con block=False): responde de inmediato con un
+        mensaje de progreso que se edita en cada etapa y la conversación retoma su estado
+        cuando termina. Mientras tanto los mensajes del usuario los atiende el estado
+        WAITING (procesando_en_espera); un comprobante enviado en ese lapso se procesa
+        detrás del anterior (uno a la vez por solicitud).
+        
         REFORZADO: Try/catch robusto con logging detallado y manejo de errores específico
         """
         solicitud_id = context.user_data.get('nc_solicitud_id')
@@ -603,6 +642,7 @@ class TelegramNetCashHandlers:
         nombre_archivo = None
         file_path = None
         error_id = None
+        progreso = None
         
         try:
             # Obtener telegram_user_id para logging
@@ -611,37 +651,49 @@ class TelegramNetCashHandlers:
             logger.info(f"[RECIBIR_COMP] Iniciando para solicitud {solicitud_id}, telegram_user_id: {telegram_user_id}")
             # Determinar si es documento o foto
             if update.message.document:
-                file = await update.message.document.get_file()
+                adjunto = update.message.document
                 nombre_archivo = update.message.document.file_name
             elif update.message.photo:
-                file = await update.message.photo[-1].get_file()
-                nombre_archivo = f"comprobante_{file.file_id}.jpg"
+                adjunto = update.message.photo[-1]
+                nombre_archivo = f"comprobante_{adjunto.file_id}.jpg"
             else:
                 await update.message.reply_text(
                     "❌ Por favor envía un archivo PDF o una imagen (JPG/PNG)."
                 )
                 return NC_ESPERANDO_COMPROBANTE
             
+            # Acuse inmediato: un solo mensaje que se edita en cada etapa. Antes de
+            # descargar solo se puede suponer el tipo por la extensión
+            es_zip = nombre_archivo.lower().endswith('.zip')
+            progreso = MensajeDeProgreso(*self._progreso_comprobante(nombre_archivo, es_zip))
+            await progreso.enviar(update.message)
+            
             # Descargar archivo
             upload_dir = Path("/app/backend/uploads/comprobantes_telegram")
             upload_dir.mkdir(parents=True, exist_ok=True)
             
+            # Descarga por bloques: hash, límite de tamaño y tipo real en la misma pasada
             file_path = upload_dir / f"{solicitud_id}_{nombre_archivo}"
-            await file.download_to_drive(file_path)
-            
-            # Detectar si es un archivo ZIP
-            es_zip = nombre_archivo.lower().endswith('.zip')
-            
-            if es_zip:
-                # Procesar como archivo ZIP
-                await update.message.reply_text("📦 Procesando archivo ZIP...")
-                
-                # Procesar el ZIP usando el servicio
-                resultado_zip = await netcash_service.procesar_archivo_zip(
+            try:
+                archivo = await ingesta_archivos_service.desde_telegram(
+                    await adjunto.get_file(), file_path, nombre_archivo
+                )
+            except ArchivoDemasiadoGrande as e:
+                await progreso.fallar(f"⚠️ {str(e)}. Envía un archivo más pequeño.")
+                return NC_ESPERANDO_COMPROBANTE
+            if archivo.es_zip != es_zip:
+                progreso.cambiar_etapas(*self._progreso_comprobante(nombre_archivo, archivo.es_zip))
+            await progreso.marcar("descargado")
+            
+            # La firma del archivo manda sobre la extensión del nombre
+            if archivo.es_zip:
+                # Procesar el ZIP usando el servicio (avisa cada archivo leído)
+                resultado_zip = await self._en_turno(solicitud_id, progreso, netcash_service.procesar_archivo_zip(
                     solicitud_id,
                     str(file_path),
-                    nombre_archivo
-                )
+                    nombre_archivo,
+                    progreso=progreso.marcar
+                ))
                 
                 # Construir mensaje de resultado
                 total = resultado_zip.get("total_archivos", 0)
@@ -732,17 +784,18 @@ class TelegramNetCashHandlers:
                 
             else:
                 # Procesar como comprobante individual (lógica existente)
-                await update.message.reply_text("🔍 Procesando comprobante...")
-                
-                # Enviar al motor para agregar (retorna: agregado, razon)
-                agregado, razon = await netcash_service.agregar_comprobante(
+                # Enviar al motor para agregar (retorna: agregado, razon y la solicitud ya actualizada)
+                agregado, razon, solicitud = await self._en_turno(solicitud_id, progreso, netcash_service.agregar_comprobante_detallado(
                     solicitud_id,
                     str(file_path),
-                    nombre_archivo
-                )
-            
-                # Obtener solicitud actualizada para contar comprobantes
-                solicitud = await netcash_service.obtener_solicitud(solicitud_id)
+                    nombre_archivo,
+                    progreso=progreso.marcar,
+                    archivo=archivo
+                ))
+            
+                # Si no se escribió nada (error, sin cuenta activa) se lee la solicitud para contar comprobantes
+                if solicitud is None:
+                    solicitud = await netcash_service.obtener_solicitud(solicitud_id)
                 comprobantes = solicitud.get("comprobantes", [])
                 num_comprobantes = len(comprobantes)
                 
@@ -756,8 +809,11 @@ class TelegramNetCashHandlers:
                     ocr_data = ultimo_comp.get("ocr_data", {}) if ultimo_comp else {}
                     advertencias = ocr_data.get("advertencias", [])
                     motivo_fallo = ocr_data.get("motivo_fallo", "")
-                    cantidad_transacciones = ocr_data.get("datos_completos", {}).get("cantidad_transacciones")
-                    montos_individuales = ocr_data.get("datos_completos", {}).get("montos_individuales")
+                    # Resumen en ocr_data; datos_completos solo en solicitudes sin migrar
+                    cantidad_transacciones = ocr_data.get("cantidad_transacciones",
+                                                          ocr_data.get("datos_completos", {}).get("cantidad_transacciones"))
+                    montos_individuales = ocr_data.get("montos_individuales",
+                                                       ocr_data.get("datos_completos", {}).get("montos_individuales"))
                     
                     mensaje = "⚠️ **Comprobante recibido - Se requiere captura manual**\n\n"
                     mensaje += f"📄 Archivo: _{nombre_archivo}_\n\n"
@@ -887,14 +943,12 @@ class TelegramNetCashHandlers:
             logger.error(traceback.format_exc())
             logger.error(f"=" * 70)
             
+            if progreso:
+                await progreso.fallar()
+            
             # Marcar solicitud como requiere revisión manual
             try:
-                from motor.motor_asyncio import AsyncIOMotorClient
-                import os
-                mongo_url = os.getenv('MONGO_URL')
-                db_name = os.getenv('DB_NAME', 'netcash_mbco')
-                client = AsyncIOMotorClient(mongo_url)
-                db = client[db_name]
+                from database import db
                 
                 await db.solicitudes_netcash.update_one(
                     {"id": solicitud_id},
@@ -994,11 +1048,16 @@ class TelegramNetCashHandlers:
         REFORZADO P0: Try/catch global con logging detallado y manejo robusto de errores
         """
         query = update.callback_query
-        await query.answer()
         
         # Extraer solicitud_id del callback_data
         solicitud_id = query.data.replace("nc_continuar_paso1_", "")
         
+        # Un comprobante enviado después sigue en proceso: no avanzar sin él
+        if solicitud_id in self._en_cola_comprobantes:
+            await query.answer("⏳ Aún estoy procesando un comprobante, espera el resultado para continuar.", show_alert=True)
+            return NC_ESPERANDO_COMPROBANTE
+        await query.answer()
+        
         # Variables para logging detallado en caso de error
         telegram_user_id = None
         comprobantes_nombres = []
@@ -1193,12 +1252,7 @@ class TelegramNetCashHandlers:
             
             # Marcar solicitud como requiere revisión manual (sin perder avance)
             try:
-                from motor.motor_asyncio import AsyncIOMotorClient
-                import os
-                mongo_url = os.getenv('MONGO_URL')
-                db_name = os.getenv('DB_NAME', 'netcash_mbco')
-                client = AsyncIOMotorClient(mongo_url)
-                db = client[db_name]
+                from database import db
                 
                 await db.solicitudes_netcash.update_one(
                     {"id": solicitud_id},
@@ -1250,12 +1304,7 @@ class TelegramNetCashHandlers:
             cliente_id = solicitud.get("cliente_id")
             
             # Consultar beneficiarios frecuentes
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
-            mongo_url = os.getenv('MONGO_URL')
-            db_name = os.getenv('DB_NAME', 'netcash_mbco')
-            client = AsyncIOMotorClient(mongo_url)
-            db = client[db_name]
+            from database import db
             
             beneficiarios_frecuentes = {}
             
@@ -2009,12 +2058,7 @@ class TelegramNetCashHandlers:
             cliente_id = solicitud.get("cliente_id")
             
             # Obtener cliente para obtener IDMEX
-            from motor.motor_asyncio import AsyncIOMotorClient
-            import os
-            mongo_url = os.getenv('MONGO_URL')
-            db_name = os.getenv('DB_NAME', 'netcash_mbco')
-            client = AsyncIOMotorClient(mongo_url)
-            db = client[db_name]
+            from database import db
             
             cliente = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
             
@@ -2315,12 +2359,7 @@ class TelegramNetCashHandlers:
                 telegram_chat_id = solicitud.get("canal_metadata", {}).get("telegram_chat_id")
                 
                 # Obtener IDMEX del cliente (para la asociación)
-                from motor.motor_asyncio import AsyncIOMotorClient
-                import os
-                mongo_url = os.getenv('MONGO_URL')
-                db_name = os.getenv('DB_NAME', 'netcash_mbco')
-                client = AsyncIOMotorClient(mongo_url)
-                db = client[db_name]
+                from database import db
                 
                 cliente = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
                 idmex_cliente = cliente.get("idmex") if cliente else None
@@ -2473,12 +2512,7 @@ class TelegramNetCashHandlers:
                 
                 if solicitud:
                     # Obtener usuario (cliente)
-                    from motor.motor_asyncio import AsyncIOMotorClient
-                    import os
-                    mongo_url = os.getenv('MONGO_URL')
-                    db_name = os.getenv('DB_NAME', 'netcash_mbco')
-                    client_db = AsyncIOMotorClient(mongo_url)
-                    db = client_db[db_name]
+                    from database import db
                     
                     cliente_id = solicitud.get("cliente_id")
                     usuario = await db.usuarios_netcash.find_one({"cliente_id": cliente_id}, {"_id": 0})
@@ -0,0 +1,279 @@
+"""Persistencia en MongoDB del estado de conversación del bot de Telegram
+
+El estado de las conversaciones (nc_solicitud_id, la captura manual,
+ana_solicitud_id_actual, el estado de cada ConversationHandler) vivía solo en
+la memoria del proceso: un reinicio o un despliegue dejaba a los usuarios a
+media operación con botones que ya no respondían.
+
+MongoPersistence implementa BasePersistence de python-telegram-bot:
+
+- Escritura por lotes: la Application entrega los cambios cada
+  update_interval segundos; todos los de una pasada se escriben en un solo
+  bulk_write. Los user_data/chat_data que no cambiaron no se reescriben (solo
+  se renueva su vencimiento cuando va a la mitad).
+- Carga perezosa por chat: al arrancar no se carga ningún user_data/chat_data;
+  se leen en refresh_user_data / refresh_chat_data la primera vez que el
+  usuario o chat escribe. Un caché pequeño (LRU) recuerda qué claves ya se
+  cargaron para que los mensajes siguientes no consulten MongoDB.
+- Vencimiento: cada documento lleva expira_en y un índice TTL lo borra. El
+  plazo es el TIMEOUT_MINUTOS de inactividad_monitor (pasado ese tiempo la
+  operación en captura se cancela) más un margen para reinicios.
+- Los estados de los ConversationHandler (persistent=True, con name) se
+  cargan al iniciar la Application, solo los que no han vencido.
+
+Los ConversationHandler guardan su estado en memoria: con varios procesos
+del bot cada chat debe atenderse siempre en el mismo proceso.
+
+Colección MongoDB: telegram_persistencia
+- _id: "usuario:<id>" | "chat:<id>" | "conversacion:<nombre>:<clave>"
+- tipo, clave, nombre (conversaciones), datos | datos_pickle | estado
+- actualizado_en, expira_en (índice TTL)
+
+Variables de entorno:
+- TELEGRAM_PERSISTENCIA: "0" desactiva la persistencia (default "1")
+- TELEGRAM_PERSISTENCIA_INTERVALO_SEG: cada cuánto se escriben los cambios (default 10)
+- TELEGRAM_PERSISTENCIA_MARGEN_MIN: minutos extra sobre el timeout de inactividad (default 30)
+- TELEGRAM_PERSISTENCIA_CACHE: claves recordadas como ya cargadas (default 5000)
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+import pickle
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import bson
+from bson import Binary
+from bson.errors import InvalidDocument
+from pymongo import DeleteOne, UpdateOne
+from telegram.ext import BasePersistence, PersistenceInput
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = 'telegram_persistencia'
+
+TIPO_USUARIO = "usuario"
+TIPO_CHAT = "chat"
+TIPO_CONVERSACION = "conversacion"
+
+LOTE_ESCRITURA = 500
+
+
+def _id_documento(tipo: str, clave: Any, nombre: Optional[str] = None) -> str:
+    if tipo == TIPO_CONVERSACION:
+        return f"{tipo}:{nombre}:{json.dumps(list(clave))}"
+    return f"{tipo}:{clave}"
+
+
+def _empacar(datos: Dict[str, Any]) -> Dict[str, Any]:
+    """Datos como documento BSON; si no se pueden representar (llaves no str, Decimal...), en pickle"""
+    try:
+        bson.encode({"datos": datos})
+        return {"datos": datos, "datos_pickle": None}
+    except (InvalidDocument, OverflowError):
+        return {"datos": None, "datos_pickle": Binary(pickle.dumps(datos))}
+
+
+def _desempacar(documento: Dict[str, Any]) -> Dict[str, Any]:
+    if documento.get("datos_pickle") is not None:
+        return pickle.loads(documento["datos_pickle"])
+    return documento.get("datos") or {}
+
+
+class MongoPersistence(BasePersistence):
+    """BasePersistence sobre MongoDB con escritura por lotes y carga perezosa"""
+
+    def __init__(self, ttl_minutos: float, update_interval: float = 10, max_cache: int = 5000):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.ttl = timedelta(minutes=ttl_minutos)
+        self.max_cache = max_cache
+        # _id -> operación pendiente (la última gana)
+        self._pendientes: Dict[str, Any] = {}
+        self._tarea_escritura: Optional[asyncio.Task] = None
+        # _id -> (copia de lo último escrito/leído, momento de la escritura)
+        self._cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._stats = {"lecturas": 0, "aciertos_cache": 0, "escrituras": 0, "omitidas": 0, "lotes": 0}
+
+    @classmethod
+    def desde_entorno(cls) -> "MongoPersistence":
+        from inactividad_monitor import TIMEOUT_MINUTOS
+
+        margen = float(os.environ.get('TELEGRAM_PERSISTENCIA_MARGEN_MIN', '30'))
+        return cls(
+            ttl_minutos=TIMEOUT_MINUTOS + margen,
+            update_interval=float(os.environ.get('TELEGRAM_PERSISTENCIA_INTERVALO_SEG', '10')),
+            max_cache=max(1, int(os.environ.get('TELEGRAM_PERSISTENCIA_CACHE', '5000'))),
+        )
+
+    @staticmethod
+    def habilitada() -> bool:
+        return os.environ.get('TELEGRAM_PERSISTENCIA', '1') != '0'
+
+    # --- caché de claves cargadas ---
+
+    def _recordar(self, id_doc: str, datos: Dict[str, Any], escrito_en: float):
+        self._cache[id_doc] = (datos, escrito_en)
+        self._cache.move_to_end(id_doc)
+        while len(self._cache) > self.max_cache:
+            self._cache.popitem(last=False)
+
+    # --- escritura por lotes ---
+
+    def _encolar(self, id_doc: str, operacion: Any):
+        self._pendientes[id_doc] = operacion
+        if self._tarea_escritura is None or self._tarea_escritura.done():
+            self._tarea_escritura = asyncio.create_task(self._escribir_pronto())
+
+    async def _escribir_pronto(self):
+        # La Application entrega todos los cambios de una pasada con un gather:
+        # ceder el turno una vez junta la pasada completa en un solo lote
+        await asyncio.sleep(0)
+        await self._escribir_pendientes()
+
+    async def _escribir_pendientes(self):
+        while self._pendientes:
+            lote_ids = list(self._pendientes)[:LOTE_ESCRITURA]
+            lote = {id_doc: self._pendientes.pop(id_doc) for id_doc in lote_ids}
+            try:
+                await db[COLLECTION_NAME].bulk_write(list(lote.values()), ordered=False)
+                self._stats["lotes"] += 1
+                self._stats["escrituras"] += len(lote)
+            except Exception as e:
+                # Se reintenta con el siguiente lote, salvo lo que ya tenga un cambio más nuevo
+                for id_doc, operacion in lote.items():
+                    self._pendientes.setdefault(id_doc, operacion)
+                logger.error(f"[TelegramPersistencia] ❌ Error escribiendo {len(lote)} cambio(s): {str(e)}")
+                return
+
+    def _guardar_datos(self, tipo: str, clave: int, datos: Dict[str, Any]):
+        id_doc = _id_documento(tipo, clave)
+        ahora = time.monotonic()
+        anterior = self._cache.get(id_doc)
+        # Sin cambios: solo se renueva el vencimiento a la mitad del plazo
+        if anterior and anterior[0] == datos and ahora - anterior[1] < self.ttl.total_seconds() / 2:
+            self._stats["omitidas"] += 1
+            return
+        self._recordar(id_doc, datos, ahora)
+        fecha = datetime.now(timezone.utc)
+        self._encolar(id_doc, UpdateOne(
+            {"_id": id_doc},
+            {"$set": {"tipo": tipo, "clave": clave, **_empacar(datos),
+                      "actualizado_en": fecha, "expira_en": fecha + self.ttl}},
+            upsert=True,
+        ))
+
+    def _borrar(self, tipo: str, clave: int):
+        id_doc = _id_documento(tipo, clave)
+        self._cache.pop(id_doc, None)
+        self._encolar(id_doc, DeleteOne({"_id": id_doc}))
+
+    # --- carga perezosa ---
+
+    async def _cargar(self, tipo: str, clave: int, destino: Dict[str, Any]):
+        id_doc = _id_documento(tipo, clave)
+        if id_doc in self._cache:
+            self._cache.move_to_end(id_doc)
+            self._stats["aciertos_cache"] += 1
+            return
+        # Lo que hay en memoria (o por escribir) es más nuevo que MongoDB
+        if destino or id_doc in self._pendientes:
+            self._recordar(id_doc, copy.deepcopy(destino), time.monotonic())
+            return
+
+        self._stats["lecturas"] += 1
+        documento = await db[COLLECTION_NAME].find_one(
+            {"_id": id_doc, "expira_en": {"$gt": datetime.now(timezone.utc)}}
+        )
+        datos = _desempacar(documento) if documento else {}
+        # Otro update del mismo usuario pudo escribir mientras se leía
+        if not destino:
+            destino.update(datos)
+        # Cargado sin escribir: la primera escritura con cambios renueva el vencimiento
+        self._recordar(id_doc, copy.deepcopy(destino), float("-inf") if documento else time.monotonic())
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[str, Any]) -> None:
+        await self._cargar(TIPO_USUARIO, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[str, Any]) -> None:
+        await self._cargar(TIPO_CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict[str, Any]) -> None:
+        pass
+
+    async def get_user_data(self) -> Dict[int, Dict[str, Any]]:
+        # Nada al arrancar: cada usuario se carga al escribir (refresh_user_data)
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict[str, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[str, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id: int, data: Dict[str, Any]) -> None:
+        self._guardar_datos(TIPO_USUARIO, user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[str, Any]) -> None:
+        self._guardar_datos(TIPO_CHAT, chat_id, data)
+
+    async def update_bot_data(self, data: Dict[str, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._borrar(TIPO_USUARIO, user_id)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._borrar(TIPO_CHAT, chat_id)
+
+    # --- conversaciones ---
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        conversaciones: Dict[Tuple, object] = {}
+        cursor = db[COLLECTION_NAME].find(
+            {"tipo": TIPO_CONVERSACION, "nombre": name, "expira_en": {"$gt": datetime.now(timezone.utc)}},
+            {"clave": 1, "estado": 1},
+        )
+        async for documento in cursor:
+            conversaciones[tuple(documento["clave"])] = documento["estado"]
+        logger.info(f"[TelegramPersistencia] {len(conversaciones)} conversación(es) '{name}' restaurada(s)")
+        return conversaciones
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        id_doc = _id_documento(TIPO_CONVERSACION, key, name)
+        if new_state is None:
+            self._encolar(id_doc, DeleteOne({"_id": id_doc}))
+            return
+        fecha = datetime.now(timezone.utc)
+        self._encolar(id_doc, UpdateOne(
+            {"_id": id_doc},
+            {"$set": {"tipo": TIPO_CONVERSACION, "nombre": name, "clave": list(key), "estado": new_state,
+                      "actualizado_en": fecha, "expira_en": fecha + self.ttl}},
+            upsert=True,
+        ))
+
+    async def flush(self) -> None:
+        """Al detener la Application: escribe todo lo pendiente"""
+        if self._tarea_escritura and not self._tarea_escritura.done():
+            await self._tarea_escritura
+        await self._escribir_pendientes()
+        if self._pendientes:
+            logger.error(f"[TelegramPersistencia] {len(self._pendientes)} cambio(s) sin escribir al detener el bot")
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        return {"pendientes": len(self._pendientes), "en_cache": len(self._cache), **self._stats}
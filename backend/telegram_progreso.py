@@ -0,0 +1,134 @@
+"""Mensaje de progreso del bot: un solo mensaje que se edita conforme avanza el trabajo
+
+recibir_comprobante responde de inmediato con este mensaje y lo va editando en
+cada etapa (descargado, huella, OCR, validado; en ZIPs, cada archivo leído)
+mientras el comprobante se procesa en segundo plano.
+
+Las ediciones de avance (archivos de un ZIP) se espacian al menos
+INTERVALO_MINIMO_SEG para no topar con el límite de ediciones de Telegram; los
+cambios de etapa siempre se editan. Un fallo al editar no interrumpe el
+procesamiento.
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import Message
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+INTERVALO_MINIMO_SEG = 1.5
+
+ETAPAS_COMPROBANTE: List[Tuple[str, str]] = [
+    ("descargado", "Archivo descargado"),
+    ("hash", "Huella del archivo calculada"),
+    ("ocr", "Comprobante leído (OCR)"),
+    ("validado", "Validación terminada"),
+]
+
+ETAPAS_ZIP: List[Tuple[str, str]] = [
+    ("descargado", "Archivo descargado"),
+    ("extraido", "ZIP extraído"),
+    ("hash", "Duplicados revisados"),
+    ("archivo", "Comprobantes leídos"),
+    ("validado", "Validación terminada"),
+]
+
+
+class MensajeDeProgreso:
+    """Lista de etapas con ✅ / ⏳ en un mensaje editable"""
+
+    def __init__(self, titulo: str, etapas: List[Tuple[str, str]]):
+        self.titulo = titulo
+        self.etapas = etapas
+        self.mensaje: Optional[Message] = None
+        self._terminadas: Dict[str, str] = {}
+        self._detalle: Dict[str, str] = {}
+        self._nota: Optional[str] = None
+        self._ultimo_texto: Optional[str] = None
+        self._ultima_edicion = 0.0
+
+    def _texto(self) -> str:
+        lineas = [self.titulo, ""]
+        en_curso = True
+        for clave, nombre in self.etapas:
+            detalle = f" ({self._detalle[clave]})" if clave in self._detalle else ""
+            if clave in self._terminadas:
+                lineas.append(f"✅ {nombre}{detalle}")
+            elif en_curso:
+                lineas.append(f"⏳ {nombre}{detalle}…")
+                en_curso = False
+            else:
+                lineas.append(f"▫️ {nombre}")
+        if self._nota:
+            lineas.extend(["", self._nota])
+        return "\n".join(lineas)
+
+    async def enviar(self, respuesta_a: Message, nota: Optional[str] = None):
+        """Acuse inmediato: primer envío del mensaje"""
+        self._nota = nota
+        self._ultimo_texto = self._texto()
+        self.mensaje = await respuesta_a.reply_text(self._ultimo_texto)
+        self._ultima_edicion = time.monotonic()
+
+    async def _editar(self, forzar: bool):
+        if self.mensaje is None:
+            return
+        texto = self._texto()
+        if texto == self._ultimo_texto:
+            return
+        if not forzar and time.monotonic() - self._ultima_edicion < INTERVALO_MINIMO_SEG:
+            return
+        try:
+            await self.mensaje.edit_text(texto)
+            self._ultimo_texto = texto
+            self._ultima_edicion = time.monotonic()
+        except BadRequest as e:
+            # "Message is not modified" y similares
+            logger.debug(f"[Progreso] Edición omitida: {e}")
+        except Exception as e:
+            logger.warning(f"[Progreso] No se pudo editar el mensaje de progreso: {e}")
+
+    def cambiar_etapas(self, titulo: str, etapas: List[Tuple[str, str]]):
+        """Cambia título y etapas (p. ej. el archivo resultó ser un ZIP); se ve en la siguiente edición"""
+        self.titulo = titulo
+        self.etapas = etapas
+
+    async def marcar(self, etapa: str, datos: Optional[Dict[str, Any]] = None):
+        """
+        Callback de progreso de netcash_service (progreso(etapa, datos)).
+
+        "archivo" es avance dentro de la etapa (listos/total); la etapa termina
+        cuando listos == total.
+        """
+        datos = datos or {}
+        self._nota = None
+        if etapa == "extraido":
+            self._detalle["extraido"] = f"{datos.get('total', 0)} archivo(s)"
+            self._terminadas["extraido"] = etapa
+        elif etapa == "archivo":
+            listos, total = datos.get("listos", 0), datos.get("total", 0)
+            self._detalle["archivo"] = f"{listos}/{total}"
+            if listos >= total:
+                self._terminadas["archivo"] = etapa
+            else:
+                await self._editar(forzar=False)
+                return
+        else:
+            self._terminadas[etapa] = etapa
+            if etapa == "validado":
+                # Sin OCR (duplicado, ZIP sin archivos nuevos) las etapas intermedias se dan por terminadas
+                for clave, _ in self.etapas:
+                    self._terminadas.setdefault(clave, "omitida")
+        await self._editar(forzar=True)
+
+    async def avisar(self, nota: str):
+        """Nota bajo las etapas (p. ej. en cola detrás de otro comprobante)"""
+        self._nota = nota
+        await self._editar(forzar=True)
+
+    async def fallar(self, nota: str = "⚠️ No se pudo terminar el procesamiento"):
+        self._nota = nota
+        await self._editar(forzar=True)
@@ -0,0 +1,208 @@
+"""Reproductor de updates grabados para pruebas de carga del bot (modo webhook)
+
+Envía al webhook updates tal como los manda Telegram (uno por línea en un
+.jsonl; TELEGRAM_WEBHOOK_GRABAR los graba) y mide cuánto tarda el bot en
+aceptarlos y en terminar de procesarlos (GET /api/telegram/webhook/estado).
+
+- --usuarios N clona la secuencia grabada para N usuarios (ids desplazados):
+  cada usuario envía sus updates en orden y los usuarios van en paralelo.
+- --api-falsa PUERTO levanta un sustituto de la Bot API que responde OK a
+  cualquier método, para no mandar mensajes reales. El bot se arranca con
+  TELEGRAM_API_URL=http://localhost:PUERTO. Con --archivos DIR sirve las
+  descargas de archivos (file_id = nombre del archivo en DIR).
+
+Uso:
+    python telegram_replay.py updates.jsonl --url http://localhost:8081/api/telegram/webhook
+        [--usuarios 20] [--secret S] [--api-falsa 8082 [--archivos DIR]]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Claves cuyo "id" identifica a un usuario o chat dentro de un update
+_CLAVES_IDENTIDAD = {"from", "chat", "user", "sender_chat"}
+DESPLAZAMIENTO_USUARIO = 10_000_000_000
+
+
+def cargar_updates(ruta: str) -> List[Dict[str, Any]]:
+    with open(ruta, encoding="utf-8") as archivo:
+        return [json.loads(linea) for linea in archivo if linea.strip()]
+
+
+def desplazar_ids(valor: Any, desplazamiento: int) -> Any:
+    """Copia del update con los ids de usuarios y chats desplazados (usuario simulado distinto)"""
+    if isinstance(valor, list):
+        return [desplazar_ids(v, desplazamiento) for v in valor]
+    if not isinstance(valor, dict):
+        return valor
+    resultado = {}
+    for clave, contenido in valor.items():
+        if clave in _CLAVES_IDENTIDAD and isinstance(contenido, dict) and isinstance(contenido.get("id"), int):
+            contenido = {**contenido, "id": contenido["id"] + desplazamiento}
+        resultado[clave] = desplazar_ids(contenido, desplazamiento)
+    return resultado
+
+
+def secuencias_por_usuario(updates: List[Dict[str, Any]], usuarios: int) -> List[List[Dict[str, Any]]]:
+    """Una secuencia por usuario simulado, con update_id únicos y crecientes"""
+    secuencias = []
+    siguiente_id = 1
+    for n in range(usuarios):
+        secuencia = []
+        for update in updates:
+            clon = desplazar_ids(copy.deepcopy(update), n * DESPLAZAMIENTO_USUARIO)
+            clon["update_id"] = siguiente_id
+            siguiente_id += 1
+            secuencia.append(clon)
+        secuencias.append(secuencia)
+    return secuencias
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p * (len(ordenados) - 1))))]
+
+
+async def reproducir(url: str, secuencias: List[List[Dict[str, Any]]], secreto: Optional[str] = None,
+                     espera_maxima: float = 300) -> Dict[str, Any]:
+    """Envía las secuencias en paralelo y espera a que el bot no tenga updates pendientes"""
+    encabezados = {"X-Telegram-Bot-Api-Secret-Token": secreto} if secreto else {}
+    latencias: List[float] = []
+    errores: Dict[int, int] = {}
+
+    async with aiohttp.ClientSession(headers=encabezados) as sesion:
+        async def enviar(secuencia):
+            for update in secuencia:
+                inicio = time.perf_counter()
+                async with sesion.post(url, json=update) as respuesta:
+                    await respuesta.read()
+                    if respuesta.status != 200:
+                        errores[respuesta.status] = errores.get(respuesta.status, 0) + 1
+                latencias.append(time.perf_counter() - inicio)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*[enviar(s) for s in secuencias])
+        enviado_en = time.perf_counter() - inicio
+
+        estado: Dict[str, Any] = {}
+        while time.perf_counter() - inicio < espera_maxima:
+            async with sesion.get(f"{url.rstrip('/')}/estado") as respuesta:
+                estado = await respuesta.json()
+            if not estado.get("pendientes"):
+                break
+            await asyncio.sleep(0.2)
+        procesado_en = time.perf_counter() - inicio
+
+    total = sum(len(s) for s in secuencias)
+    return {
+        "updates": total,
+        "usuarios": len(secuencias),
+        "errores": errores,
+        "aceptacion_ms": {
+            "p50": round(statistics.median(latencias) * 1000, 1) if latencias else 0,
+            "p95": round(_percentil(latencias, 0.95) * 1000, 1) if latencias else 0,
+            "max": round(max(latencias) * 1000, 1) if latencias else 0,
+        },
+        "enviado_en_s": round(enviado_en, 2),
+        "procesado_en_s": round(procesado_en, 2),
+        "updates_por_segundo": round(total / procesado_en, 1) if procesado_en else 0,
+        "procesador": estado.get("procesador"),
+    }
+
+
+def crear_api_falsa(archivos: Optional[str] = None):
+    """Sustituto de la Bot API: acepta cualquier método y devuelve un resultado válido para PTB"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import FileResponse, JSONResponse
+
+    app = FastAPI(title="Bot API falsa")
+    estado = {"mensaje_id": 0, "llamadas": {}}
+
+    def _mensaje(parametros: Dict[str, Any]) -> Dict[str, Any]:
+        estado["mensaje_id"] += 1
+        chat_id = parametros.get("chat_id", 0)
+        return {
+            "message_id": estado["mensaje_id"],
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, "type": "private"},
+            "text": parametros.get("text", ""),
+        }
+
+    @app.post("/bot{token}/{metodo}")
+    async def metodo_bot(token: str, metodo: str, request: Request):
+        if request.headers.get("content-type", "").startswith("application/json"):
+            parametros = await request.json()
+        else:
+            parametros = dict(await request.form())
+        estado["llamadas"][metodo] = estado["llamadas"].get(metodo, 0) + 1
+
+        metodo = metodo.lower()
+        if metodo == "getme":
+            resultado: Any = {"id": 1, "is_bot": True, "first_name": "NetCash", "username": "netcash_replay_bot"}
+        elif metodo == "getfile":
+            file_id = parametros.get("file_id", "")
+            resultado = {"file_id": file_id, "file_unique_id": file_id, "file_path": file_id}
+        elif metodo.startswith(("send", "edit", "copy", "forward")):
+            resultado = _mensaje(parametros)
+        else:
+            resultado = True
+        return {"ok": True, "result": resultado}
+
+    @app.get("/file/bot{token}/{ruta:path}")
+    async def archivo_bot(token: str, ruta: str):
+        if archivos:
+            candidato = Path(archivos) / Path(ruta).name
+            if candidato.is_file():
+                return FileResponse(candidato)
+        return JSONResponse({"ok": False, "description": "Not Found"}, status_code=404)
+
+    @app.get("/llamadas")
+    async def llamadas():
+        return estado["llamadas"]
+
+    return app
+
+
+async def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="Reproduce updates grabados contra el webhook del bot")
+    parser.add_argument("archivo", help=".jsonl con un update por línea")
+    parser.add_argument("--url", default="http://localhost:8081/api/telegram/webhook")
+    parser.add_argument("--usuarios", type=int, default=1)
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--api-falsa", type=int, default=None, metavar="PUERTO")
+    parser.add_argument("--archivos", default=None, help="Directorio con los archivos que sirve la API falsa")
+    args = parser.parse_args(argv)
+
+    servidor = None
+    if args.api_falsa:
+        import uvicorn
+        servidor = uvicorn.Server(uvicorn.Config(crear_api_falsa(args.archivos), port=args.api_falsa,
+                                                 log_level="warning"))
+        asyncio.create_task(servidor.serve())
+        print(f"API falsa en http://localhost:{args.api_falsa} (arranca el bot con TELEGRAM_API_URL)")
+        await asyncio.to_thread(input, "Presiona Enter cuando el bot esté listo...")
+
+    secuencias = secuencias_por_usuario(cargar_updates(args.archivo), max(1, args.usuarios))
+    resultado = await reproducir(args.url, secuencias, secreto=args.secret)
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+
+    if servidor:
+        servidor.should_exit = True
+    return 0 if not resultado["errores"] else 1
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -0,0 +1,276 @@
+"""Modo webhook y procesamiento concurrente de updates del bot de Telegram
+
+Con run_polling y el procesamiento por defecto de python-telegram-bot los
+updates se atienden de uno en uno: el OCR de un comprobante lento en
+recibir_comprobante retrasaba el menú de todos los demás usuarios.
+
+- ProcesadorPorChat: los updates se procesan concurrentemente (en polling y
+  en webhook), pero los de un mismo (chat, usuario) en orden de llegada, uno a
+  la vez. Es la misma clave que usan los ConversationHandler, así que sus
+  máquinas de estado ven los updates como antes. Un límite global acota
+  cuántos se procesan a la vez.
+- Modo webhook: Telegram envía los updates a POST /api/telegram/webhook, que
+  los encola y responde de inmediato. Puede correr dentro del proceso de
+  FastAPI (server.py) o en su propio servidor (python telegram_bot.py).
+- TELEGRAM_WEBHOOK_GRABAR graba los updates recibidos para reproducirlos con
+  telegram_replay.py (pruebas de carga).
+
+Variables de entorno:
+- TELEGRAM_MODO: "polling" (default) | "webhook"
+- TELEGRAM_WEBHOOK_URL: URL pública base (https://dominio); se registra <base>/api/telegram/webhook
+- TELEGRAM_WEBHOOK_SECRET: secret_token que Telegram manda en X-Telegram-Bot-Api-Secret-Token
+- TELEGRAM_WEBHOOK_EN_SERVER: "1" = el bot corre dentro de server.py (no arrancar telegram_bot.py)
+- TELEGRAM_WEBHOOK_PUERTO: puerto del servidor propio del bot en modo webhook (default 8081)
+- TELEGRAM_MAX_CONCURRENCIA: updates procesándose a la vez (default 16)
+- TELEGRAM_MAX_PENDIENTES: updates aceptados esperando turno antes de frenar la cola (default 1000)
+- TELEGRAM_API_URL: Bot API alternativa (p. ej. el sustituto de telegram_replay.py --api-falsa)
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+from identidad_cache_service import identidad_cache
+
+logger = logging.getLogger(__name__)
+
+MODO_POLLING = "polling"
+MODO_WEBHOOK = "webhook"
+
+RUTA_WEBHOOK = "/api/telegram/webhook"
+
+
+def clave_de_orden(update: object) -> Optional[Hashable]:
+    """(chat, usuario) del update, igual que la clave por defecto de ConversationHandler"""
+    if not isinstance(update, Update):
+        return None
+    chat = update.effective_chat
+    usuario = update.effective_user
+    if not chat and not usuario:
+        return None
+    return (chat.id if chat else None, usuario.id if usuario else None)
+
+
+class ProcesadorPorChat(BaseUpdateProcessor):
+    """
+    Procesa updates concurrentemente conservando el orden por (chat, usuario).
+
+    El semáforo de BaseUpdateProcessor se toma antes que el candado del chat,
+    así que solo limita los updates aceptados (max_pendientes); la concurrencia
+    real la limita un semáforo propio que se toma ya con el turno del chat, para
+    que un chat con muchos updates en espera no ocupe los lugares de los demás.
+    """
+
+    def __init__(self, max_concurrencia: int, max_pendientes: int):
+        super().__init__(max(max_concurrencia, max_pendientes))
+        self.max_concurrencia = max_concurrencia
+        self._limite = asyncio.Semaphore(max_concurrencia)
+        self._candados: Dict[Hashable, asyncio.Lock] = {}
+        self._en_espera: Dict[Hashable, int] = {}
+        self._en_curso = 0
+        self._stats = {"procesados": 0, "esperaron_turno": 0, "maximo_en_curso": 0}
+
+    @classmethod
+    def desde_entorno(cls) -> "ProcesadorPorChat":
+        return cls(
+            max_concurrencia=max(1, int(os.environ.get('TELEGRAM_MAX_CONCURRENCIA', '16'))),
+            max_pendientes=max(1, int(os.environ.get('TELEGRAM_MAX_PENDIENTES', '1000'))),
+        )
+
+    async def _procesar(self, coroutine: Awaitable[Any]):
+        async with self._limite:
+            self._en_curso += 1
+            self._stats["maximo_en_curso"] = max(self._stats["maximo_en_curso"], self._en_curso)
+            try:
+                await coroutine
+            finally:
+                self._en_curso -= 1
+                self._stats["procesados"] += 1
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        clave = clave_de_orden(update)
+        if clave is None:
+            await self._procesar(coroutine)
+            return
+
+        candado = self._candados.setdefault(clave, asyncio.Lock())
+        if candado.locked():
+            self._stats["esperaron_turno"] += 1
+        self._en_espera[clave] = self._en_espera.get(clave, 0) + 1
+        try:
+            async with candado:
+                await self._procesar(coroutine)
+        finally:
+            self._en_espera[clave] -= 1
+            if not self._en_espera[clave]:
+                del self._en_espera[clave]
+                del self._candados[clave]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        return {
+            "max_concurrencia": self.max_concurrencia,
+            "max_pendientes": self.max_concurrent_updates,
+            "en_curso": self._en_curso,
+            "chats_activos": len(self._candados),
+            **self._stats,
+        }
+
+
+class TelegramWebhookService:
+    """Recepción de updates por webhook para una Application del bot"""
+
+    def __init__(self):
+        self.modo = os.environ.get('TELEGRAM_MODO', MODO_POLLING).lower()
+        self.url_base = os.environ.get('TELEGRAM_WEBHOOK_URL', '').rstrip('/')
+        self.secreto = os.environ.get('TELEGRAM_WEBHOOK_SECRET') or None
+        self.en_server = os.environ.get('TELEGRAM_WEBHOOK_EN_SERVER', '0') == '1'
+        self.puerto = int(os.environ.get('TELEGRAM_WEBHOOK_PUERTO', '8081'))
+        self.archivo_grabacion = os.environ.get('TELEGRAM_WEBHOOK_GRABAR') or None
+        self.application: Optional[Application] = None
+        self._bot = None
+        self._recibidos = 0
+        self._rechazados = 0
+
+    @property
+    def modo_webhook(self) -> bool:
+        return self.modo == MODO_WEBHOOK
+
+    @property
+    def url_webhook(self) -> str:
+        return f"{self.url_base}{RUTA_WEBHOOK}"
+
+    @property
+    def activo(self) -> bool:
+        return self.application is not None and self.application.running
+
+    async def iniciar(self, bot):
+        """Arranca la Application del bot sin polling y registra el webhook en Telegram"""
+        if not self.url_base:
+            raise ValueError("TELEGRAM_WEBHOOK_URL es requerido en modo webhook")
+        if self.activo:
+            return
+
+        if bot.app is None:
+            bot.construir_aplicacion()
+        application = bot.app
+        await application.initialize()
+        # post_init solo lo llaman run_polling / run_webhook
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await application.bot.set_webhook(
+            url=self.url_webhook,
+            secret_token=self.secreto,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        self.application = application
+        self._bot = bot
+        logger.info(f"[TelegramWebhook] Webhook registrado en {self.url_webhook} "
+                    f"({'dentro de server.py' if self.en_server else 'servidor propio'})")
+
+    async def detener(self):
+        """
+        Detiene la Application. El webhook queda registrado: Telegram guarda y
+        reintenta los updates mientras el bot está abajo.
+        """
+        if self.application is None:
+            return
+        application, self.application = self.application, None
+        await application.stop()
+        # shutdown escribe la persistencia pendiente: antes de cerrar el cliente MongoDB
+        await application.shutdown()
+        # El cliente MongoDB es de server.py cuando el bot corre dentro de él
+        if application.post_shutdown and not self.en_server:
+            await application.post_shutdown(application)
+        logger.info("[TelegramWebhook] Bot detenido")
+
+    def _grabar(self, datos: Dict[str, Any]):
+        try:
+            with open(self.archivo_grabacion, "a", encoding="utf-8") as archivo:
+                archivo.write(json.dumps(datos, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"[TelegramWebhook] No se pudo grabar el update: {e}")
+
+    async def recibir(self, datos: Dict[str, Any]):
+        """Encola un update recibido; lo procesa el ProcesadorPorChat de la Application"""
+        if not self.activo:
+            # Telegram reintenta los updates que no recibieron 2xx
+            raise HTTPException(status_code=503, detail="Bot no iniciado")
+        update = Update.de_json(datos, self.application.bot)
+        if update is None:
+            raise HTTPException(status_code=400, detail="Update inválido")
+        if self.archivo_grabacion:
+            self._grabar(datos)
+        await self.application.update_queue.put(update)
+        self._recibidos += 1
+
+    def verificar_secreto(self, secreto: Optional[str]):
+        if self.secreto and secreto != self.secreto:
+            self._rechazados += 1
+            raise HTTPException(status_code=403, detail="Secret token inválido")
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        estadisticas: Dict[str, Any] = {
+            "modo": self.modo,
+            "activo": self.activo,
+            "recibidos": self._recibidos,
+            "rechazados": self._rechazados,
+            "en_cola": self.application.update_queue.qsize() if self.application else 0,
+        }
+        estadisticas["identidad"] = identidad_cache.obtener_estadisticas()
+        procesador = self.application.update_processor if self.application else None
+        if isinstance(procesador, ProcesadorPorChat):
+            estadisticas["procesador"] = procesador.obtener_estadisticas()
+            estadisticas["pendientes"] = estadisticas["en_cola"] + estadisticas["procesador"]["en_curso"]
+        return estadisticas
+
+    def servir(self, bot):
+        """Servidor propio del webhook (modo webhook sin TELEGRAM_WEBHOOK_EN_SERVER)"""
+        import uvicorn
+        from fastapi import FastAPI
+
+        app = FastAPI(title="Bot NetCash (webhook)")
+        app.include_router(router, prefix="/api")
+
+        async def al_iniciar():
+            await self.iniciar(bot)
+
+        app.add_event_handler("startup", al_iniciar)
+        app.add_event_handler("shutdown", self.detener)
+        uvicorn.run(app, host="0.0.0.0", port=self.puerto)
+
+
+# Instancia global del servicio
+telegram_webhook_service = TelegramWebhookService()
+
+router = APIRouter(prefix="/telegram", tags=["telegram"])
+
+
+@router.post("/webhook")
+async def recibir_update(request: Request, x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+    """Updates que envía Telegram en modo webhook"""
+    telegram_webhook_service.verificar_secreto(x_telegram_bot_api_secret_token)
+    try:
+        datos = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="JSON inválido")
+    await telegram_webhook_service.recibir(datos)
+    return {"ok": True}
+
+
+@router.get("/webhook/estado")
+async def estado_webhook():
+    """Estado del webhook y del procesamiento concurrente (lo consulta telegram_replay.py)"""
+    return telegram_webhook_service.obtener_estadisticas()
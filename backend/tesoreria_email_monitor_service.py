@@ -20,21 +20,15 @@ import logging
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
 
 from gmail_service import GmailService
+from database import db
 
 logger = logging.getLogger(__name__)
 
 # Variables de entorno para configuración
-MONGO_URL = os.getenv('MONGO_URL')
-DB_NAME = os.getenv('DB_NAME', 'netcash_mbco')
 TESORERIA_GMAIL_USER = os.getenv('TESORERIA_GMAIL_USER')  # Email de Toño o destinatario de Tesorería
 
-# Conectar a MongoDB
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
-
 
 class TesoreriaEmailMonitorService:
     """Servicio para monitorear respuestas de Tesorería vía Gmail"""
@@ -321,7 +315,7 @@ class TesoreriaEmailMonitorService:
             
             # Validar cada comprobante (o todos juntos si es uno solo)
             # Para simplificar, validamos el primer PDF (el principal)
-            es_valido, errores, datos_extraidos = comprobante_pago_validator.validar_comprobante(
+            es_valido, errores, datos_extraidos = await comprobante_pago_validator.validar_comprobante_async(
                 pdf_path=comprobantes_paths[0],
                 capital_esperado=capital_esperado,
                 comision_esperada=comision_esperada,
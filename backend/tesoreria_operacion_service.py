@@ -13,19 +13,13 @@ import shutil
 from datetime import datetime, timezone
 from typing import Dict, Optional, List
 from io import StringIO
-from motor.motor_asyncio import AsyncIOMotorClient
 from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
 import aiohttp
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 COLLECTION_NAME = 'solicitudes_netcash'
 
 # Configuración de tasas de comisión (igual que en tesoreria_service)
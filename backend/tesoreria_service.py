@@ -14,19 +14,13 @@ import csv
 from datetime import datetime, timezone
 from typing import List, Dict, Optional, Tuple
 from io import StringIO
-from motor.motor_asyncio import AsyncIOMotorClient
 from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
 import aiohttp
+from database import db
 
 logger = logging.getLogger(__name__)
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 # Configuración de tasas de comisión
 # IMPORTANTE: Estas son las fórmulas correctas del negocio
 # - Cliente paga: 1% del total de depósitos
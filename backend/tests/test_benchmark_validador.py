@@ -0,0 +1,121 @@
+"""
+Tests del benchmark de validadores (benchmark_validador)
+
+Verifica que:
+1. El reporte incluye versión, latencias por etapa y veredictos contra etiquetas
+2. Una etiqueta que no coincide se reporta como diferencia
+3. La instrumentación se retira al terminar
+4. La comparación entre corridas detecta veredictos cambiados
+"""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from benchmark_validador import comparar_reportes, ejecutar_benchmark, main, percentil
+from comprobante_matcher import comprobante_matcher
+from validador_comprobantes_service import VALIDADOR_THABYETHA_VERSION
+
+
+CUENTA_ACTIVA = {
+    "banco": "STP",
+    "clabe": "646180139409481462",
+    "beneficiario": "JARDINERIA Y COMERCIO THABYETHA SA DE CV"
+}
+
+
+def _pdf(ruta, lineas):
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(str(ruta))
+    for i, linea in enumerate(lineas):
+        c.drawString(72, 750 - i * 20, linea)
+    c.save()
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    _pdf(tmp_path / "valido.pdf", [
+        "COMPROBANTE DE TRANSFERENCIA SPEI",
+        "Cuenta destino",
+        "646180139409481462",
+        "Beneficiario",
+        "ARDINERIA Y COMERCIO THABYETHA SA DE CV",
+        "Monto: $125,000.00",
+    ])
+    _pdf(tmp_path / "otra_cuenta.pdf", [
+        "COMPROBANTE DE TRANSFERENCIA SPEI",
+        "Cuenta destino",
+        "002180700123456789",
+        "Beneficiario",
+        "UNION AGROINDUSTRIAL SA DE CV",
+    ])
+    _pdf(tmp_path / "sin_etiqueta.pdf", ["Cuenta destino", "646180139409481462"])
+
+    (tmp_path / "etiquetas.json").write_text(json.dumps({
+        "cuenta_activa": CUENTA_ACTIVA,
+        "comprobantes": {
+            "valido.pdf": {"valido": True, "metodo_clabe": "completa"},
+            # Etiqueta incorrecta a propósito
+            "otra_cuenta.pdf": {"valido": True}
+        }
+    }))
+    return tmp_path
+
+
+def test_percentil():
+    assert percentil([], 50) == 0.0
+    assert percentil([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+    assert percentil([5.0], 99) == 5.0
+
+
+def test_reporte_corpus(corpus):
+    reporte = ejecutar_benchmark(corpus, repeticiones=2)
+
+    assert reporte["validador_version"] == VALIDADOR_THABYETHA_VERSION
+    assert reporte["archivos"] == 3
+    assert reporte["validaciones"] == 6
+    assert reporte["latencia_ms"]["muestras"] == 6
+    assert {"extraccion_texto", "busqueda_clabe", "busqueda_beneficiario", "fuzzy", "parser_banco"} <= set(reporte["etapas_ms"])
+
+    assert reporte["veredictos"] == {"con_etiqueta": 2, "coinciden": 1, "difieren": 1, "sin_etiqueta": 1}
+    assert reporte["diferencias"] == [{
+        "archivo": "otra_cuenta.pdf",
+        "campos": {"valido": {"esperado": True, "obtenido": False}}
+    }]
+
+    # La instrumentación no queda pegada al matcher global
+    assert "_mejor_candidato_fuzzy" not in vars(comprobante_matcher)
+
+
+def test_motor_v36_mismos_veredictos(corpus):
+    actual = ejecutar_benchmark(corpus, motor="actual")
+    v36 = ejecutar_benchmark(corpus, motor="v36")
+
+    assert comparar_reportes(actual, v36)["veredictos_cambiados"] == []
+
+
+def test_comparar_detecta_cambios(corpus):
+    anterior = ejecutar_benchmark(corpus)
+    anterior["resultados"][0]["veredicto"] = {"valido": None}
+
+    comparacion = comparar_reportes(anterior, ejecutar_benchmark(corpus))
+
+    assert [c["archivo"] for c in comparacion["veredictos_cambiados"]] == [anterior["resultados"][0]["archivo"]]
+
+
+def test_main_guardar_etiquetas(corpus, tmp_path):
+    salida = tmp_path / "bench.json"
+
+    assert main([str(corpus), "--salida", str(salida)]) == 1
+    assert main([str(corpus), "--guardar-etiquetas", "--salida", str(salida)]) == 1
+    # Con las etiquetas congeladas ya no hay diferencias
+    assert main([str(corpus), "--salida", str(salida), "--comparar", str(salida)]) == 0
+
+    etiquetas = json.loads((corpus / "etiquetas.json").read_text())
+    assert etiquetas["comprobantes"]["otra_cuenta.pdf"]["valido"] is False
+    assert "sin_etiqueta.pdf" in etiquetas["comprobantes"]
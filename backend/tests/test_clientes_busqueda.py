@@ -0,0 +1,101 @@
+"""
+Tests de la búsqueda de clientes (clientes_busqueda_service)
+
+Verifica que:
+1. La clave de búsqueda es sin acentos ni mayúsculas, con prefijos y trigramas
+2. La consulta usa $all sobre prefijos (sin regex) y ordena por relevancia
+3. Sin resultados por prefijo se reintenta con trigramas
+4. La paginación pide uno extra para saber si hay más
+5. reindexar() solo recalcula los clientes sin la versión actual
+"""
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import clientes_busqueda_service as modulo
+from clientes_busqueda_service import (
+    VERSION_CLAVE, ClientesBusquedaService, campos_busqueda, normalizar
+)
+
+
+@pytest.fixture
+def coleccion():
+    coleccion = MagicMock()
+    coleccion.aggregate.return_value.to_list = AsyncMock(return_value=[])
+    coleccion.bulk_write = AsyncMock()
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = coleccion
+    with patch.object(modulo, 'db', mock_db):
+        yield coleccion
+
+
+def test_clave_normalizada():
+    assert normalizar("  José Ñúñez-Peña ") == "jose nunez pena"
+    assert normalizar("(.*)") == ""
+
+    clave = campos_busqueda({
+        "nombre": "José Peña", "email": "jose.pena@Correo.mx",
+        "telefono": "5512345678", "telefono_completo": "+525512345678",
+    })["busqueda"]
+    assert clave["nombre"] == "jose pena"
+    assert clave["tokens"] == ["jose", "pena", "correo", "mx", "5512345678", "525512345678"]
+    assert {"j", "jo", "jos", "jose", "551", "5255"} <= set(clave["prefijos"])
+    assert "5678" not in clave["prefijos"] and "678" in clave["ngramas"]
+    assert clave["version"] == VERSION_CLAVE
+
+
+def test_pipeline_prefijos_y_relevancia():
+    pipeline = ClientesBusquedaService().construir_pipeline("Pérez  JU.*", pagina=2, limite=10, ngramas=False)
+
+    assert pipeline[0] == {"$match": {"busqueda.prefijos": {"$all": ["perez", "ju"]}}}
+    assert "$regex" not in str(pipeline)
+    assert list(pipeline[2]["$sort"]) == ["_relevancia", "busqueda.nombre", "id"]
+    assert pipeline[3] == {"$skip": 10}
+    assert pipeline[4] == {"$limit": 11}
+    assert pipeline[-1]["$project"] == {"_id": 0, "busqueda": 0, "_relevancia": 0}
+
+    # Sin términos: listado alfabético
+    pipeline = ClientesBusquedaService().construir_pipeline("", pagina=1, limite=20, ngramas=None)
+    assert pipeline[0] == {"$match": {}}
+    assert pipeline[1] == {"$sort": {"busqueda.nombre": 1, "id": 1}}
+
+
+def test_pipeline_ngramas():
+    pipeline = ClientesBusquedaService().construir_pipeline("5678 ju", pagina=1, limite=20, ngramas=True)
+
+    assert pipeline[0] == {"$match": {"$and": [
+        {"busqueda.ngramas": {"$all": ["567", "678"]}},
+        {"busqueda.prefijos": "ju"},
+    ]}}
+
+
+@pytest.mark.asyncio
+async def test_reintento_con_ngramas_y_paginacion(coleccion):
+    encontrados = [{"id": f"c{i}"} for i in range(3)]
+    coleccion.aggregate.return_value.to_list = AsyncMock(side_effect=[[], encontrados])
+
+    resultado = await ClientesBusquedaService().buscar("5678", limite=2)
+
+    assert coleccion.aggregate.call_count == 2
+    assert "busqueda.ngramas" in coleccion.aggregate.call_args.args[0][0]["$match"]
+    assert resultado == {"clientes": encontrados[:2], "pagina": 1, "limite": 2, "hay_mas": True, "modo": "ngramas"}
+
+
+@pytest.mark.asyncio
+async def test_reindexar_solo_pendientes(coleccion):
+    async def iterar():
+        yield {"_id": 1, "nombre": "Ana López"}
+        yield {"_id": 2, "nombre": "Luis", "telefono": "5511112222"}
+    coleccion.find.return_value.__aiter__ = lambda self: iterar()
+
+    assert await ClientesBusquedaService().reindexar() == 2
+
+    filtro, proyeccion = coleccion.find.call_args.args
+    assert filtro == {"busqueda.version": {"$ne": VERSION_CLAVE}}
+    operaciones = coleccion.bulk_write.await_args.args[0]
+    assert operaciones[0]._doc["$set"]["busqueda"]["nombre"] == "ana lopez"
@@ -0,0 +1,252 @@
+"""
+Tests del índice de huellas de comprobantes (comprobante_fingerprints_service)
+
+Verifica que:
+1. Las huellas respetan el ámbito de cada canal (web global, Telegram por cliente)
+2. El registro usa upserts con $setOnInsert (la primera operación conserva la huella)
+3. Al quitar comprobantes se conservan las huellas que siguen en uso; editar uno cambia sus huellas
+4. La búsqueda excluye la operación actual y omite dueñas que hoy no bloquean sin borrar su huella
+5. El backfill recorre ambas colecciones y ejecutar_en_transaccion degrada en standalone
+"""
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pymongo.errors import OperationFailure
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import database
+import comprobante_fingerprints_service as modulo
+from comprobante_fingerprints_service import (
+    ComprobanteFingerprintsService, AMBITO_WEB, COLECCION_TELEGRAM, COLECCION_WEB, TIPO_CLAVE_RASTREO, TIPO_HASH
+)
+
+
+def _cursor(documentos):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=documentos)
+
+    async def iterar():
+        for documento in documentos:
+            yield documento
+    cursor.__aiter__ = lambda self: iterar()
+    return cursor
+
+
+@pytest.fixture
+def colecciones():
+    return {}
+
+
+@pytest.fixture
+def servicio(colecciones):
+    def coleccion(nombre):
+        if nombre not in colecciones:
+            col = MagicMock()
+            col.find = MagicMock(return_value=_cursor([]))
+            col.delete_one = AsyncMock()
+            col.delete_many = AsyncMock(return_value=MagicMock(deleted_count=1))
+            col.bulk_write = AsyncMock(return_value=MagicMock(upserted_count=0))
+            colecciones[nombre] = col
+        return colecciones[nombre]
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = coleccion
+    with patch.object(modulo, 'db', mock_db):
+        yield ComprobanteFingerprintsService()
+
+
+def test_huellas_por_canal(servicio):
+    web = servicio.huellas(
+        COLECCION_WEB,
+        {"id": "op-1", "folio_mbco": "0001-001-D-25", "estado": "ESPERANDO_COMPROBANTES"},
+        [
+            {"file_hash": "h1", "clave_rastreo": "CR1", "nombre_archivo": "a.pdf"},
+            {"file_hash": "h2", "es_duplicado": True},
+        ]
+    )
+    assert {(h["ambito"], h["tipo"], h["valor"]) for h in web} == {
+        (AMBITO_WEB, TIPO_HASH, "h1"), (AMBITO_WEB, TIPO_CLAVE_RASTREO, "CR1")
+    }
+    assert all(h["operacion_id"] == "op-1" and h["folio_mbco"] == "0001-001-D-25" for h in web)
+
+    telegram = servicio.huellas(
+        COLECCION_TELEGRAM,
+        {"id": "nc-1", "cliente_id": "cli_001"},
+        [{"archivo_hash": "h3", "clave_rastreo": "CR3", "nombre_archivo": "b.png"}]
+    )
+    assert [(h["ambito"], h["tipo"], h["valor"]) for h in telegram] == [("telegram:cli_001", TIPO_HASH, "h3")]
+
+
+@pytest.mark.asyncio
+async def test_registrar_upsert_conserva_original(servicio, colecciones):
+    huellas = servicio.huellas(COLECCION_WEB, {"id": "op-1"}, [{"file_hash": "h1", "clave_rastreo": "CR1"}])
+
+    await servicio.registrar(huellas, session="sesion")
+
+    bulk_write = colecciones["comprobante_fingerprints"].bulk_write
+    operaciones = bulk_write.await_args.args[0]
+    assert bulk_write.await_args.kwargs == {"ordered": False, "session": "sesion"}
+    assert len(operaciones) == 2
+    documento = operaciones[0]._doc
+    assert operaciones[0]._filter == {"ambito": AMBITO_WEB, "tipo": TIPO_HASH, "valor": "h1", "operacion_id": "op-1"}
+    assert list(documento) == ["$setOnInsert"] and documento["$setOnInsert"]["operacion_id"] == "op-1"
+    assert operaciones[0]._upsert is True
+
+    assert await servicio.registrar([]) == 0
+    bulk_write.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_quitar_conserva_valores_en_uso(servicio, colecciones):
+    operacion = {"id": "nc-1", "cliente_id": "cli_001"}
+    eliminado = {"archivo_hash": "h1"}
+
+    # Otro comprobante de la misma solicitud sigue usando h1
+    assert await servicio.quitar_comprobantes(COLECCION_TELEGRAM, operacion, [eliminado], [{"archivo_hash": "h1"}]) == 0
+
+    await servicio.quitar_comprobantes(COLECCION_TELEGRAM, operacion, [eliminado], [{"archivo_hash": "h2"}])
+    filtro = colecciones["comprobante_fingerprints"].delete_many.await_args.args[0]
+    assert filtro == {
+        "operacion_id": "nc-1",
+        "ambito": "telegram:cli_001",
+        "$or": [{"tipo": TIPO_HASH, "valor": "h1"}]
+    }
+
+
+@pytest.mark.asyncio
+async def test_editar_clave_rastreo_mueve_la_huella(servicio, colecciones):
+    operacion = {"id": "op-1"}
+    anterior = {"file_hash": "h1", "clave_rastreo": "CR-VIEJA"}
+    actual = {"file_hash": "h1", "clave_rastreo": "CR-NUEVA"}
+
+    await servicio.actualizar_comprobante(COLECCION_WEB, operacion, anterior, actual, [actual], session="s")
+
+    huellas = colecciones["comprobante_fingerprints"]
+    filtro = huellas.delete_many.await_args.args[0]
+    # El hash no cambió: solo se quita la clave anterior
+    assert filtro["$or"] == [{"tipo": TIPO_CLAVE_RASTREO, "valor": "CR-VIEJA"}]
+    registradas = [op._filter for op in huellas.bulk_write.await_args.args[0]]
+    assert {"ambito": AMBITO_WEB, "tipo": TIPO_CLAVE_RASTREO, "valor": "CR-NUEVA", "operacion_id": "op-1"} in registradas
+    assert huellas.bulk_write.await_args.kwargs["session"] == "s"
+
+
+@pytest.mark.asyncio
+async def test_buscar_duplicados_excluye_y_omite_no_vigentes(servicio, colecciones):
+    huellas = [
+        {"ambito": "telegram:cli_001", "tipo": TIPO_HASH, "valor": "h1", "operacion_id": "nc-vieja",
+         "nombre_archivo": "original.png"},
+        {"ambito": "telegram:cli_001", "tipo": TIPO_HASH, "valor": "h2", "operacion_id": "nc-cancelada"},
+        {"ambito": "telegram:cli_001", "tipo": TIPO_HASH, "valor": "h3", "operacion_id": "nc-actual"},
+    ]
+    modulo.db["comprobante_fingerprints"].find.return_value = _cursor(huellas)
+    modulo.db[COLECCION_TELEGRAM].find.return_value = _cursor([{"id": "nc-vieja", "folio_mbco": "NC-000010"}])
+
+    resultado = await servicio.buscar_duplicados(
+        COLECCION_TELEGRAM, "telegram:cli_001", TIPO_HASH, ["h1", "h2", "h3", "h1", None],
+        excluir_operacion_id="nc-actual", estados_bloqueo=["borrador", "lista_para_mbc"]
+    )
+
+    assert resultado == {"h1": {"id": "nc-vieja", "folio_mbco": "NC-000010", "estado": None,
+                                "cliente_nombre": None, "nombre_archivo": "original.png"}}
+    filtro_huellas = colecciones["comprobante_fingerprints"].find.call_args.args[0]
+    assert filtro_huellas["valor"] == {"$in": ["h1", "h2", "h3"]}
+    filtro_duenas = colecciones[COLECCION_TELEGRAM].find.call_args.args[0]
+    assert sorted(filtro_duenas["id"]["$in"]) == ["nc-cancelada", "nc-vieja"]
+    assert filtro_duenas["estado"] == {"$in": ["borrador", "lista_para_mbc"]}
+    # La huella de la solicitud que hoy no bloquea se conserva
+    colecciones["comprobante_fingerprints"].delete_one.assert_not_awaited()
+    colecciones["comprobante_fingerprints"].delete_many.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_huella_vuelve_a_bloquear_al_regresar_el_estado(servicio, colecciones):
+    """esperando_validacion_ana no bloquea; al pasar a lista_para_mbc el comprobante vuelve a ser duplicado"""
+    estados_bloqueo = ["borrador", "lista_para_mbc"]
+    huella = {"ambito": "telegram:cli_001", "tipo": TIPO_HASH, "valor": "h1", "operacion_id": "nc-ana"}
+    modulo.db["comprobante_fingerprints"].find.side_effect = lambda *a, **kw: _cursor([huella])
+
+    # Mientras espera a Ana la solicitud no aparece entre las dueñas que bloquean
+    modulo.db[COLECCION_TELEGRAM].find.return_value = _cursor([])
+    assert await servicio.buscar_duplicados(
+        COLECCION_TELEGRAM, "telegram:cli_001", TIPO_HASH, ["h1"], estados_bloqueo=estados_bloqueo
+    ) == {}
+
+    # Ana valida: cambiar_estado(..., LISTA_PARA_MBC) no vuelve a registrar huellas
+    modulo.db[COLECCION_TELEGRAM].find.return_value = _cursor([{"id": "nc-ana", "estado": "lista_para_mbc"}])
+    resultado = await servicio.buscar_duplicados(
+        COLECCION_TELEGRAM, "telegram:cli_001", TIPO_HASH, ["h1"], estados_bloqueo=estados_bloqueo
+    )
+    assert resultado["h1"]["id"] == "nc-ana"
+    colecciones["comprobante_fingerprints"].delete_one.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_varias_duenas_reporta_la_mas_antigua_vigente(servicio, colecciones):
+    huellas = [
+        {"ambito": AMBITO_WEB, "tipo": TIPO_HASH, "valor": "h1", "operacion_id": "op-borrada"},
+        {"ambito": AMBITO_WEB, "tipo": TIPO_HASH, "valor": "h1", "operacion_id": "op-2"},
+        {"ambito": AMBITO_WEB, "tipo": TIPO_HASH, "valor": "h1", "operacion_id": "op-3"},
+    ]
+    modulo.db["comprobante_fingerprints"].find.return_value = _cursor(huellas)
+    modulo.db[COLECCION_WEB].find.return_value = _cursor([{"id": "op-3"}, {"id": "op-2"}])
+
+    resultado = await servicio.buscar_duplicados(COLECCION_WEB, AMBITO_WEB, TIPO_HASH, ["h1"])
+
+    assert resultado["h1"]["id"] == "op-2"
+    colecciones["comprobante_fingerprints"].find.return_value.sort.assert_called_once_with("created_at", 1)
+
+
+@pytest.mark.asyncio
+async def test_buscar_sin_coincidencias_una_sola_consulta(servicio, colecciones):
+    assert await servicio.buscar_duplicados(COLECCION_WEB, AMBITO_WEB, TIPO_CLAVE_RASTREO, ["CR1"]) == {}
+    assert colecciones["comprobante_fingerprints"].find.call_args.args[0]["valor"] == "CR1"
+    assert COLECCION_WEB not in colecciones
+
+
+@pytest.mark.asyncio
+async def test_backfill_recorre_ambas_colecciones(servicio, colecciones):
+    modulo.db[COLECCION_WEB].find.return_value = _cursor([
+        {"id": "op-1", "comprobantes": [{"file_hash": "h1"}]},
+    ])
+    modulo.db[COLECCION_TELEGRAM].find.return_value = _cursor([
+        {"id": "nc-1", "cliente_id": "cli_001", "comprobantes": [{"archivo_hash": "h2"}, {"archivo_hash": "h3"}]},
+    ])
+    modulo.db["comprobante_fingerprints"].bulk_write.side_effect = lambda ops, **kw: MagicMock(upserted_count=len(ops))
+
+    resumen = await servicio.backfill()
+
+    assert resumen == {"operaciones": 2, "huellas_nuevas": 3}
+    # Las solicitudes se incluyen en cualquier estado: pueden volver a uno que bloquea
+    filtro_telegram = colecciones[COLECCION_TELEGRAM].find.call_args.args[0]
+    assert "estado" not in filtro_telegram
+    colecciones[COLECCION_WEB].find.return_value.sort.assert_called_once_with("fecha_creacion", 1)
+
+
+@pytest.mark.asyncio
+async def test_transaccion_degrada_en_standalone(monkeypatch):
+    sesion = MagicMock()
+    sesion.with_transaction = AsyncMock(side_effect=OperationFailure("Transaction numbers...", code=20))
+    sesion.__aenter__ = AsyncMock(return_value=sesion)
+    sesion.__aexit__ = AsyncMock(return_value=False)
+    cliente = MagicMock()
+    cliente.start_session = AsyncMock(return_value=sesion)
+    monkeypatch.setattr(database, 'obtener_cliente', lambda: cliente)
+    monkeypatch.setattr(database, '_transacciones_soportadas', True)
+
+    sesiones = []
+
+    async def operacion(session):
+        sesiones.append(session)
+        return "ok"
+
+    assert await database.ejecutar_en_transaccion(operacion) == "ok"
+    assert await database.ejecutar_en_transaccion(operacion) == "ok"
+
+    assert sesiones == [None, None]
+    cliente.start_session.assert_awaited_once()
+    assert database.estadisticas_pool()["transacciones"] is False
@@ -0,0 +1,166 @@
+"""
+Tests del motor de búsqueda CLABE/beneficiario (comprobante_matcher)
+
+Verifica que:
+1. Los veredictos son idénticos a la implementación V3.6 original
+   (ValidadorComprobantesV36) en layouts reales y en textos generados
+2. La distancia indel con banda coincide con la calculada sin banda
+3. El índice normalizado equivale a normalizar el texto completo
+"""
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from comprobante_matcher import TextoComprobante, distancia_indel_acotada, normalizar_avanzado
+from validador_comprobantes_service import ValidadorComprobantes
+from validador_comprobantes_v36 import ValidadorComprobantesV36
+
+
+CUENTA_ACTIVA = {
+    "banco": "STP",
+    "clabe": "646180139409481462",
+    "beneficiario": "JARDINERIA Y COMERCIO THABYETHA SA DE CV"
+}
+
+TEXTO_BANREGIO_ERROR_OCR = """banregio
+Recibo de la solicitud de transferencia
+
+Cuenta de Cargo (Origen)
+SOLVER BASKET CO S.A. DE C.V.
+Número de cuenta: *0015
+
+------ INFORMACIÓN DE DESTINO ------
+
+Cuenta Destino
+ARDINERIA Y COMERCIO THABYETHA SA DE CV
+CLABE: 646180139409481462
+
+Cantidad a Transferir: $168,765.40
+Banco Destino: STP
+Número de referencia: 951303"""
+
+TEXTO_VAULT_TABULAR = """VAULT
+Comprobante de operación
+Cuenta de retiro
+012180001234567891
+ORIGEN                          DESTINO
+012180001234567891              646180139409481462
+Titular de la cuenta beneficiaria
+JARDINERÍA Y COMERCIO THABYETHA, S.A. DE C.V.
+Monto $1,507,500.00"""
+
+TEXTO_ENMASCARADO = """BBVA
+Transferencia SPEI enviada
+Cuenta origen ****0015
+Para
+Jardineria y Comercio Thabyetha
+Cuenta destino ***1462
+Importe $25,000.00"""
+
+TEXTO_RASTREO = """Comprobante electrónico
+Clave de rastreo
+646180139409481462
+Beneficiario: OTRA EMPRESA SA DE CV
+CLABE destino 002180700123456789"""
+
+TEXTO_CLABE_PARTIDA = """Transferencia
+Cuenta beneficiaria
+6461 8013 9409 4814 62
+Nombre del beneficiario JARDINERIA Y COMERCIO THABYETA SA DE CV"""
+
+CORPUS = [
+    TEXTO_BANREGIO_ERROR_OCR,
+    TEXTO_VAULT_TABULAR,
+    TEXTO_ENMASCARADO,
+    TEXTO_RASTREO,
+    TEXTO_CLABE_PARTIDA,
+]
+
+# Fragmentos para generar textos aleatorios con las mismas trampas de layout
+LINEAS_GENERADOR = [
+    "Cuenta origen", "Cuenta de retiro", "ORDENANTE", "Cuenta asociada",
+    "Cuenta destino", "CLABE beneficiaria", "Abono a cuenta", "Depósito",
+    "ORIGEN            DESTINO", "Clave de rastreo", "Referencia", "Folio 123",
+    "646180139409481462", "6461 8013 9409 4814 62", "012180001234567891",
+    "646180139409481463", "CLABE-462", "****1462", "64**1462", "...1462", "*0015",
+    "JARDINERIA Y COMERCIO THABYETHA SA DE CV", "ARDINERIA Y COMERCIO THABYETHA",
+    "JARDINERA Y COMERSIO THABYETA S.A. DE C.V.", "Jardinería y Comercio",
+    "COMERCIO THABYETHA", "Beneficiario:", "Para", "Nombre", "UNION AGROINDUSTRIAL SA DE CV",
+    "Monto $125,000.00", "", "   ",
+]
+
+
+def _texto_aleatorio(rng: random.Random) -> str:
+    return "\n".join(rng.choice(LINEAS_GENERADOR) for _ in range(rng.randint(3, 25)))
+
+
+def _veredictos(validador, texto):
+    clabe = validador.buscar_clabe_en_texto(texto, CUENTA_ACTIVA["clabe"])
+    return (
+        validador.extraer_clabes_del_texto(texto),
+        clabe,
+        validador.buscar_beneficiario_en_texto(texto, CUENTA_ACTIVA["beneficiario"], False),
+        validador.buscar_beneficiario_en_texto(texto, CUENTA_ACTIVA["beneficiario"], True),
+        validador.validar_texto_comprobante("corpus.pdf", texto, CUENTA_ACTIVA),
+    )
+
+
+@pytest.mark.parametrize("texto", CORPUS)
+def test_corpus_mismos_veredictos_que_v36(texto):
+    assert _veredictos(ValidadorComprobantes(), texto) == _veredictos(ValidadorComprobantesV36(), texto)
+
+
+def test_textos_generados_mismos_veredictos_que_v36():
+    rng = random.Random(20251126)
+    nuevo = ValidadorComprobantes()
+    original = ValidadorComprobantesV36()
+
+    for _ in range(300):
+        texto = _texto_aleatorio(rng)
+        assert _veredictos(nuevo, texto) == _veredictos(original, texto), texto
+
+
+def test_casos_conocidos():
+    validador = ValidadorComprobantes()
+
+    # Error OCR en el nombre: válido solo por fuzzy con CLABE completa
+    assert validador.validar_texto_comprobante("a.pdf", TEXTO_BANREGIO_ERROR_OCR, CUENTA_ACTIVA)[0] is True
+    # CLABE destino en columna derecha de layout tabular
+    assert validador.buscar_clabe_en_texto(TEXTO_VAULT_TABULAR, CUENTA_ACTIVA["clabe"]) == (True, "completa")
+    # Sufijo enmascarado en contexto de destino
+    assert validador.buscar_clabe_en_texto(TEXTO_ENMASCARADO, CUENTA_ACTIVA["clabe"]) == (True, "sufijo_enmascarado")
+    # La CLABE objetivo aparece como clave de rastreo: no cuenta
+    assert validador.buscar_clabe_en_texto(TEXTO_RASTREO, CUENTA_ACTIVA["clabe"]) == (False, "no_encontrada")
+
+
+def _distancia_indel(a, b):
+    # LCS clásico sin banda
+    previa = [0] * (len(b) + 1)
+    for ca in a:
+        actual = [0]
+        for j, cb in enumerate(b, 1):
+            actual.append(previa[j - 1] + 1 if ca == cb else max(previa[j], actual[j - 1]))
+        previa = actual
+    return len(a) + len(b) - 2 * previa[-1]
+
+
+def test_distancia_indel_acotada():
+    rng = random.Random(7)
+    for _ in range(500):
+        a = "".join(rng.choice("ABCDE ") for _ in range(rng.randint(0, 15)))
+        b = "".join(rng.choice("ABCDE ") for _ in range(rng.randint(0, 15)))
+        limite = rng.randint(0, 12)
+        exacta = _distancia_indel(a, b)
+        esperada = exacta if exacta <= limite else limite + 1
+        assert distancia_indel_acotada(a, b, limite) == esperada, (a, b, limite)
+
+
+def test_texto_norm_equivale_a_normalizar_todo():
+    rng = random.Random(3)
+    for texto in CORPUS + [_texto_aleatorio(rng) for _ in range(100)]:
+        assert TextoComprobante(texto).texto_norm == normalizar_avanzado(texto)
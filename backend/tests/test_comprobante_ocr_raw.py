@@ -0,0 +1,170 @@
+"""
+Tests de los payloads OCR crudos fuera de las solicitudes (comprobante_ocr_raw_service)
+
+Verifica que:
+1. Separar deja un resumen con id y los campos que usan los flujos
+2. Agregar comprobantes guarda el payload en la colección lateral, en la misma transacción
+3. include=ocr_raw vuelve a adjuntar datos_completos por comprobante
+4. La migración solo reescribe documentos que no cambiaron desde su lectura
+5. La vista materializada no copia el payload crudo
+"""
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import comprobante_ocr_raw_service as modulo
+from comprobante_ocr_raw_service import (
+    ComprobanteOcrRawService, incluye_ocr_raw, separar, sin_ocr_raw
+)
+from operaciones_view_service import documento_vista
+
+RAW = {"monto": 1500.0, "cantidad_transacciones": 2, "montos_individuales": [500.0, 1000.0],
+       "texto_extraido": "x" * 2000}
+
+
+def _comprobante(**extra):
+    return {"nombre_archivo": "a.pdf", "monto_detectado": 1500.0,
+            "ocr_data": {"es_confiable": True, "advertencias": [], "datos_completos": RAW}, **extra}
+
+
+def _cursor(documentos):
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=documentos)
+
+    async def iterar():
+        for documento in documentos:
+            yield documento
+    cursor.__aiter__ = lambda self: iterar()
+    return cursor
+
+
+@pytest.fixture
+def colecciones():
+    return {}
+
+
+@pytest.fixture
+def mock_db(colecciones):
+    def coleccion(nombre):
+        if nombre not in colecciones:
+            col = MagicMock()
+            col.find = MagicMock(return_value=_cursor([]))
+            col.update_one = AsyncMock(return_value=MagicMock(modified_count=1))
+            col.bulk_write = AsyncMock()
+            col.delete_many = AsyncMock(return_value=MagicMock(deleted_count=1))
+            colecciones[nombre] = col
+        return colecciones[nombre]
+
+    db = MagicMock()
+    db.__getitem__.side_effect = coleccion
+
+    async def sin_transaccion(operacion):
+        return await operacion(None)
+
+    with patch.object(modulo, 'db', db), \
+         patch.object(modulo, 'ejecutar_en_transaccion', AsyncMock(side_effect=sin_transaccion)):
+        yield db
+
+
+def test_separar_deja_resumen():
+    compacto, raw = separar(_comprobante())
+
+    assert raw == RAW
+    assert compacto["id"]
+    assert "datos_completos" not in compacto["ocr_data"]
+    assert compacto["ocr_data"]["cantidad_transacciones"] == 2
+    assert compacto["ocr_data"]["montos_individuales"] == [500.0, 1000.0]
+    assert compacto["ocr_data"]["raw_externo"] is True
+
+    # Ya separado (o web sin payload): conserva su id y no produce payload
+    assert separar(compacto) == (compacto, None)
+    assert incluye_ocr_raw("ocr_raw") and incluye_ocr_raw("cliente, ocr_raw")
+    assert not incluye_ocr_raw(None) and not incluye_ocr_raw("cliente")
+
+
+@pytest.mark.asyncio
+async def test_push_comprobantes_guarda_payload_aparte():
+    from netcash_service import NetCashService
+
+    async def sin_transaccion(operacion):
+        return await operacion(None)
+
+    coleccion = MagicMock()
+    coleccion.update_one = AsyncMock()
+    db = MagicMock()
+    db.__getitem__.return_value = coleccion
+    huellas = MagicMock()
+    huellas.en_transaccion = AsyncMock(side_effect=sin_transaccion)
+    huellas.registrar = AsyncMock()
+    ocr_raw = MagicMock()
+    ocr_raw.separar_comprobantes = ComprobanteOcrRawService().separar_comprobantes
+    ocr_raw.guardar = AsyncMock()
+
+    with patch('netcash_service.db', db), \
+         patch('netcash_service.comprobante_fingerprints_service', huellas), \
+         patch('netcash_service.comprobante_ocr_raw_service', ocr_raw):
+        await NetCashService()._push_comprobantes("nc-1", [_comprobante()])
+
+    empujado = coleccion.update_one.await_args.args[1]["$push"]["comprobantes"]["$each"][0]
+    assert "datos_completos" not in empujado["ocr_data"]
+    documentos = ocr_raw.guardar.await_args.args[0]
+    assert documentos == [{"comprobante_id": empujado["id"], "operacion_id": "nc-1",
+                           "coleccion": "solicitudes_netcash", "datos_completos": RAW}]
+    assert ocr_raw.guardar.await_args.kwargs == {"session": None}
+
+
+@pytest.mark.asyncio
+async def test_guardar_y_adjuntar(mock_db, colecciones):
+    servicio = ComprobanteOcrRawService()
+    compactos, documentos = servicio.separar_comprobantes("operaciones", "op-1", [_comprobante(), {"monto": 1}])
+    assert len(documentos) == 1
+
+    await servicio.guardar(documentos)
+    upsert = colecciones["comprobante_ocr_raw"].bulk_write.await_args.args[0][0]
+    assert upsert._filter == {"comprobante_id": compactos[0]["id"]}
+    assert upsert._upsert is True
+
+    colecciones["comprobante_ocr_raw"].find.return_value = _cursor(
+        [{"comprobante_id": compactos[0]["id"], "datos_completos": RAW}]
+    )
+    operacion = await servicio.adjuntar({"id": "op-1", "comprobantes": compactos})
+
+    assert operacion["comprobantes"][0]["ocr_data"]["datos_completos"] == RAW
+    assert operacion["comprobantes"][0]["ocr_data"]["es_confiable"] is True
+    assert "ocr_data" not in operacion["comprobantes"][1]
+
+
+@pytest.mark.asyncio
+async def test_migrar_con_escritura_optimista(mock_db, colecciones):
+    sin_cambios = {"_id": ObjectId(), "id": "nc-1", "comprobantes": [_comprobante()]}
+    concurrente = {"_id": ObjectId(), "id": "nc-2", "comprobantes": [_comprobante(nombre_archivo="b.pdf")]}
+    colecciones_origen = {"solicitudes_netcash": [sin_cambios, concurrente], "operaciones": []}
+    for nombre, documentos in colecciones_origen.items():
+        mock_db[nombre].find.return_value = _cursor(documentos)
+    mock_db["solicitudes_netcash"].update_one.side_effect = [
+        MagicMock(modified_count=1), MagicMock(modified_count=0)
+    ]
+
+    resumen = await ComprobanteOcrRawService().migrar()
+
+    assert resumen == {"documentos": 1, "payloads": 1, "omitidas": 1}
+    filtro, update = mock_db["solicitudes_netcash"].update_one.await_args_list[0].args
+    assert filtro == {"_id": sin_cambios["_id"], "comprobantes": sin_cambios["comprobantes"]}
+    assert "datos_completos" not in update["$set"]["comprobantes"][0]["ocr_data"]
+    # Solo el documento reescrito guarda sus payloads
+    colecciones["comprobante_ocr_raw"].bulk_write.assert_awaited_once()
+
+
+def test_vista_sin_payload_crudo():
+    solicitud = {"_id": ObjectId(), "id": "nc-1", "estado": "borrador", "comprobantes": [_comprobante()]}
+    vista = documento_vista("solicitudes_netcash", solicitud)
+
+    assert "datos_completos" not in vista["comprobantes"][0]["ocr_data"]
+    assert solicitud["comprobantes"][0]["ocr_data"]["datos_completos"] == RAW
+    assert sin_ocr_raw([{"monto": 1}]) == [{"monto": 1}]
@@ -0,0 +1,189 @@
+"""
+Tests del procesamiento de comprobantes en segundo plano (Telegram)
+
+Verifica que:
+1. El mensaje de progreso se envía una vez y se edita por etapa
+2. El avance por archivo de un ZIP se espacia y la última edición siempre sale
+3. agregar_comprobante_detallado y procesar_archivo_zip avisan cada etapa
+4. Los comprobantes de una misma solicitud se procesan uno a la vez y
+   "Continuar" espera a que terminen
+5. Un ZIP enviado con otro nombre muestra el título y las etapas de ZIP
+"""
+import asyncio
+import sys
+import zipfile
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from telegram.error import BadRequest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import telegram_progreso
+from netcash_service import NetCashService
+from telegram_netcash_handlers import NC_ESPERANDO_COMPROBANTE, TelegramNetCashHandlers
+from telegram_progreso import ETAPAS_COMPROBANTE, ETAPAS_ZIP, MensajeDeProgreso
+
+CUENTA_ACTIVA = {"banco": "STP", "clabe": "646180139409481462", "beneficiario": "MBCO"}
+
+
+def _mensaje_telegram():
+    enviado = MagicMock()
+    enviado.edit_text = AsyncMock()
+    mensaje = MagicMock()
+    mensaje.reply_text = AsyncMock(return_value=enviado)
+    return mensaje, enviado
+
+
+@pytest.mark.asyncio
+async def test_progreso_por_etapas():
+    mensaje, enviado = _mensaje_telegram()
+    progreso = MensajeDeProgreso("🔍 Procesando comprobante...", ETAPAS_COMPROBANTE)
+
+    await progreso.enviar(mensaje)
+    assert "⏳ Archivo descargado…" in mensaje.reply_text.await_args.args[0]
+
+    await progreso.marcar("descargado")
+    await progreso.marcar("hash", {})
+    texto = enviado.edit_text.await_args.args[0]
+    assert "✅ Huella del archivo calculada" in texto and "⏳ Comprobante leído (OCR)…" in texto
+
+    # Un duplicado termina sin OCR: validado cierra todas las etapas
+    enviado.edit_text.side_effect = [None, BadRequest("Message is not modified")]
+    await progreso.marcar("validado", {"duplicado": True})
+    assert "⏳" not in enviado.edit_text.await_args.args[0]
+    await progreso.fallar()
+    assert enviado.edit_text.await_count == 4
+
+
+@pytest.mark.asyncio
+async def test_avance_zip_espaciado():
+    mensaje, enviado = _mensaje_telegram()
+    progreso = MensajeDeProgreso("📦 Procesando archivo ZIP lote.zip", ETAPAS_ZIP)
+    await progreso.enviar(mensaje)
+
+    with patch.object(telegram_progreso, 'INTERVALO_MINIMO_SEG', 60):
+        await progreso.marcar("extraido", {"total": 3})
+        for listos in (1, 2):
+            await progreso.marcar("archivo", {"listos": listos, "total": 3})
+        assert enviado.edit_text.await_count == 1
+
+        await progreso.marcar("archivo", {"listos": 3, "total": 3})
+    assert enviado.edit_text.await_count == 2
+    assert "✅ Comprobantes leídos (3/3)" in enviado.edit_text.await_args.args[0]
+
+
+@pytest.fixture
+def servicio():
+    coleccion = MagicMock()
+    coleccion.find_one = AsyncMock(return_value={"cliente_id": "cli_001", "comprobantes": []})
+    coleccion.find = MagicMock()
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = coleccion
+    with patch('netcash_service.db', mock_db), \
+         patch('netcash_service.cuenta_deposito_service.obtener_cuenta_activa',
+               AsyncMock(return_value=CUENTA_ACTIVA)):
+        servicio = NetCashService()
+        servicio._buscar_duplicados_globales = AsyncMock(return_value={})
+        servicio._push_comprobantes = AsyncMock(return_value={"comprobantes": []})
+        servicio._analizar_comprobante_ocr = AsyncMock(side_effect=lambda url, nombre, h, cuenta: {
+            "archivo_url": url, "nombre_archivo": nombre, "archivo_hash": h, "es_valido": True,
+            "monto_detectado": 10.0, "ocr_data": {"es_confiable": True},
+        })
+        yield servicio
+
+
+@pytest.mark.asyncio
+async def test_servicio_avisa_etapas(servicio, tmp_path):
+    archivo = tmp_path / "comp.pdf"
+    archivo.write_bytes(b"comprobante")
+    avisos = []
+
+    async def progreso(etapa, datos):
+        avisos.append(etapa)
+
+    agregado, _, _ = await servicio.agregar_comprobante_detallado("nc-1", str(archivo), "comp.pdf", progreso=progreso)
+    assert agregado is True
+    assert avisos == ["hash", "ocr", "validado"]
+
+    ruta_zip = tmp_path / "lote.zip"
+    with zipfile.ZipFile(ruta_zip, "w") as zf:
+        zf.writestr("a.pdf", "uno")
+        zf.writestr("b.pdf", "dos")
+        zf.writestr("c.pdf", "uno")
+    avisos_zip = []
+
+    async def progreso_zip(etapa, datos):
+        avisos_zip.append((etapa, datos.get("listos"), datos.get("total")))
+
+    await servicio.procesar_archivo_zip("nc-1", str(ruta_zip), "lote.zip", progreso=progreso_zip)
+    # El repetido cuenta como listo desde el inicio; cada OCR avanza uno
+    assert avisos_zip == [("extraido", None, 3), ("hash", None, None), ("archivo", 2, 3),
+                          ("archivo", 3, 3), ("validado", None, None)]
+
+
+@pytest.mark.asyncio
+async def test_un_comprobante_a_la_vez_por_solicitud():
+    handlers = TelegramNetCashHandlers(MagicMock())
+    orden = []
+    liberar = asyncio.Event()
+
+    async def procesar(nombre, esperar=None):
+        orden.append(f"inicio {nombre}")
+        if esperar:
+            await esperar.wait()
+        orden.append(f"fin {nombre}")
+        return nombre
+
+    primero = MagicMock(avisar=AsyncMock())
+    segundo = MagicMock(avisar=AsyncMock())
+    tarea_1 = asyncio.create_task(handlers._en_turno("nc-1", primero, procesar("1", liberar)))
+    await asyncio.sleep(0)
+    tarea_2 = asyncio.create_task(handlers._en_turno("nc-1", segundo, procesar("2")))
+    await asyncio.sleep(0.01)
+
+    assert orden == ["inicio 1"]
+    segundo.avisar.assert_awaited_once()
+
+    # Mientras hay comprobantes en proceso "Continuar" no avanza
+    update = MagicMock()
+    update.callback_query.data = "nc_continuar_paso1_nc-1"
+    update.callback_query.answer = AsyncMock()
+    assert await handlers.continuar_desde_paso1(update, MagicMock()) == NC_ESPERANDO_COMPROBANTE
+    assert update.callback_query.answer.await_args.kwargs["show_alert"] is True
+
+    liberar.set()
+    assert await asyncio.gather(tarea_1, tarea_2) == ["1", "2"]
+    assert orden == ["inicio 1", "fin 1", "inicio 2", "fin 2"]
+    assert handlers._candados_comprobantes == {} and handlers._en_cola_comprobantes == {}
+
+
+@pytest.mark.asyncio
+async def test_zip_con_otro_nombre_cambia_las_etapas(tmp_path):
+    import telegram_netcash_handlers as modulo
+    from ingesta_archivos_service import ArchivoIngerido
+
+    handlers = TelegramNetCashHandlers(MagicMock())
+    mensaje, enviado = _mensaje_telegram()
+    mensaje.document.file_name = "comprobantes.pdf"
+    mensaje.document.get_file = AsyncMock()
+    update = MagicMock(message=mensaje)
+    context = MagicMock(user_data={"nc_solicitud_id": "nc-1"})
+    archivo = ArchivoIngerido(ruta=str(tmp_path / "c.pdf"), nombre_original="comprobantes.pdf",
+                              tamano=10, sha256="h", mime_type="application/zip")
+
+    with patch.object(modulo, "Path", lambda *_: tmp_path), \
+         patch.object(modulo.ingesta_archivos_service, "desde_telegram", AsyncMock(return_value=archivo)), \
+         patch.object(modulo.netcash_service, "procesar_archivo_zip",
+                      AsyncMock(return_value={"total_archivos": 0})) as procesar_zip, \
+         patch.object(modulo.netcash_service, "obtener_solicitud", AsyncMock(return_value={"comprobantes": []})):
+        assert await handlers.recibir_comprobante(update, context) == NC_ESPERANDO_COMPROBANTE
+
+    procesar_zip.assert_awaited_once()
+    # El acuse salió como comprobante (por la extensión); la primera edición ya es de ZIP
+    assert mensaje.reply_text.await_args_list[0].args[0].startswith("🔍 Procesando comprobante")
+    editado = enviado.edit_text.await_args_list[0].args[0]
+    assert editado.startswith("📦 Procesando archivo ZIP comprobantes.pdf")
+    assert "ZIP extraído" in editado
@@ -0,0 +1,90 @@
+"""
+Tests del cliente MongoDB compartido (database)
+
+Verifica que:
+1. El cliente no se crea al importar, sino en el primer acceso, y es único
+2. Los módulos de servicio usan la misma base de datos compartida
+3. Las opciones del pool se leen del entorno
+4. Las estadísticas del pool cuentan checkouts/conexiones y el cierre es limpio
+"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import database
+
+
+@pytest.fixture(autouse=True)
+def cliente_limpio(monkeypatch):
+    # El cliente no se conecta al crearse: basta una URL válida, sin servidor
+    monkeypatch.setenv('MONGO_URL', 'mongodb://localhost:27017')
+    monkeypatch.setenv('DB_NAME', 'netcash_mbco')
+    database.cerrar_cliente()
+    yield
+    database.cerrar_cliente()
+
+
+def test_cliente_perezoso_y_unico(monkeypatch):
+    monkeypatch.setenv('DB_NAME', 'test_db')
+    assert database.estadisticas_pool()["cliente_creado"] is False
+
+    coleccion = database.db["solicitudes_netcash"]
+
+    assert database.estadisticas_pool()["cliente_creado"] is True
+    assert coleccion.name == "solicitudes_netcash"
+    assert coleccion.database.name == "test_db"
+    assert database.db.operaciones.database.client is database.obtener_cliente()
+
+
+def test_modulos_comparten_db():
+    import netcash_service
+    import usuarios_repo
+    import ocr_jobs_service
+
+    assert netcash_service.db is database.db
+    assert usuarios_repo.db is database.db
+    assert ocr_jobs_service.db is database.db
+    assert not hasattr(netcash_service, "client")
+
+
+def test_opciones_desde_entorno(monkeypatch):
+    monkeypatch.setenv('MONGO_MAX_POOL_SIZE', '20')
+    monkeypatch.setenv('MONGO_MIN_POOL_SIZE', '2')
+    monkeypatch.setenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')
+    monkeypatch.delenv('MONGO_SOCKET_TIMEOUT_MS', raising=False)
+
+    opciones = database.opciones_cliente()
+    assert opciones["maxPoolSize"] == 20
+    assert opciones["minPoolSize"] == 2
+    assert opciones["waitQueueTimeoutMS"] == 5000
+    assert "socketTimeoutMS" not in opciones
+
+    cliente = database.obtener_cliente()
+    assert cliente.options.pool_options.max_pool_size == 20
+    assert cliente.options.pool_options.min_pool_size == 2
+
+
+def test_estadisticas_y_cierre():
+    monitor = database.MonitorPool()
+    evento = SimpleNamespace(reason="timeout")
+    for _ in range(3):
+        monitor.connection_created(evento)
+        monitor.connection_checked_out(evento)
+    monitor.connection_checked_in(evento)
+    monitor.connection_closed(evento)
+    monitor.connection_check_out_failed(evento)
+
+    assert monitor.contadores["checkouts"] == 3
+    assert monitor.contadores["en_uso"] == 2
+    assert monitor.contadores["max_en_uso"] == 3
+    assert monitor.contadores["checkouts_fallidos"] == 1
+
+    primero = database.obtener_cliente()
+    database.cerrar_cliente()
+    assert database.estadisticas_pool()["cliente_creado"] is False
+    assert database.obtener_cliente() is not primero
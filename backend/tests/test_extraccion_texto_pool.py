@@ -0,0 +1,95 @@
+"""
+Tests de la extracción de texto en pool de procesos (extraccion_texto_service)
+
+Verifica que:
+1. El texto de un PDF real se extrae en el pool y coincide con la extracción síncrona
+2. El validador async devuelve el mismo veredicto que el síncrono
+3. Una tarea que excede el timeout lanza ExtraccionTextoTimeout y reinicia el pool
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from extraccion_texto_service import (
+    ExtraccionTextoService,
+    ExtraccionTextoTimeout,
+    extraer_paginas_pdf
+)
+from validador_comprobantes_service import ValidadorComprobantes
+
+
+CUENTA_ACTIVA = {
+    "banco": "STP",
+    "clabe": "646180139409481462",
+    "beneficiario": "JARDINERIA Y COMERCIO THABYETHA SA DE CV"
+}
+
+
+@pytest.fixture
+def pdf_comprobante(tmp_path):
+    """PDF con texto seleccionable tipo SPEI"""
+    from reportlab.pdfgen import canvas
+
+    ruta = tmp_path / "comprobante_spei.pdf"
+    c = canvas.Canvas(str(ruta))
+    lineas = [
+        "COMPROBANTE DE TRANSFERENCIA SPEI",
+        "Cuenta destino",
+        "646180139409481462",
+        "Beneficiario",
+        "JARDINERIA Y COMERCIO THABYETHA SA DE CV",
+        "Monto: $125,000.00",
+    ]
+    for i, linea in enumerate(lineas):
+        c.drawString(72, 750 - i * 20, linea)
+    c.save()
+    return ruta
+
+
+@pytest.fixture
+def servicio():
+    servicio = ExtraccionTextoService()
+    servicio.max_workers = 1
+    yield servicio
+    servicio.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_extraer_pdf_en_pool(servicio, pdf_comprobante):
+    paginas = await servicio.extraer_paginas_pdf(str(pdf_comprobante))
+
+    assert paginas == extraer_paginas_pdf(str(pdf_comprobante))
+    assert "646180139409481462" in paginas[0]
+
+
+@pytest.mark.asyncio
+async def test_validador_async_igual_a_sync(pdf_comprobante, monkeypatch):
+    servicio = ExtraccionTextoService()
+    servicio.max_workers = 1
+    monkeypatch.setattr('texto_extraido_cache_service.extraccion_texto_service', servicio)
+    monkeypatch.setattr('texto_extraido_cache_service.texto_extraido_cache_service.habilitado', False)
+
+    validador = ValidadorComprobantes()
+    try:
+        resultado_async = await validador.validar_comprobante_async(
+            str(pdf_comprobante), "application/pdf", CUENTA_ACTIVA
+        )
+    finally:
+        servicio.shutdown()
+    resultado_sync = validador.validar_comprobante(str(pdf_comprobante), "application/pdf", CUENTA_ACTIVA)
+
+    assert resultado_async == resultado_sync
+    assert resultado_async[0] is True
+
+
+@pytest.mark.asyncio
+async def test_timeout_reinicia_pool(servicio):
+    with pytest.raises(ExtraccionTextoTimeout):
+        await servicio._ejecutar(time.sleep, 5, timeout=0.5)
+
+    assert servicio._pool is None
@@ -0,0 +1,107 @@
+"""
+Tests del asignador de folios (folio_mbco_service)
+
+Verifica que:
+1. Cada folio sale de un $inc atómico sobre counters (ReturnDocument.AFTER)
+2. Con bloques se reserva una vez por bloque y los folios no se repiten bajo concurrencia
+3. La reparación sube el contador con $max solo si está detrás y reporta folios repetidos
+"""
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pymongo import ReturnDocument
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import folio_mbco_service as modulo
+from folio_mbco_service import FolioMbcoService
+
+
+@pytest.fixture
+def colecciones():
+    contador = {"valor": 41}
+
+    async def incrementar(filtro, update, **kwargs):
+        await asyncio.sleep(0)
+        contador["valor"] += update["$inc"]["sequence_value"]
+        return {"_id": "folio_mbco", "sequence_value": contador["valor"]}
+
+    counters = MagicMock()
+    counters.find_one_and_update = AsyncMock(side_effect=incrementar)
+    counters.find_one = AsyncMock(return_value={"_id": "folio_mbco", "sequence_value": 41})
+    counters.update_one = AsyncMock()
+    operaciones = MagicMock()
+    operaciones.aggregate.return_value.to_list = AsyncMock(return_value=[])
+
+    por_nombre = {"counters": counters, "operaciones": operaciones}
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = por_nombre.__getitem__
+    with patch.object(modulo, 'db', mock_db):
+        yield por_nombre
+
+
+@pytest.mark.asyncio
+async def test_folio_atomico(colecciones):
+    servicio = FolioMbcoService()
+
+    assert await servicio.siguiente() == "NC-000042"
+    assert await servicio.siguiente() == "NC-000043"
+
+    filtro, update = colecciones["counters"].find_one_and_update.await_args.args
+    assert filtro == {"_id": "folio_mbco"}
+    assert update == {"$inc": {"sequence_value": 1}}
+    assert colecciones["counters"].find_one_and_update.await_args.kwargs == {
+        "upsert": True, "return_document": ReturnDocument.AFTER
+    }
+
+
+@pytest.mark.asyncio
+async def test_bloques_bajo_concurrencia(colecciones):
+    servicio = FolioMbcoService()
+    servicio.tamano_bloque = 3
+
+    folios = await asyncio.gather(*[servicio.siguiente() for _ in range(5)])
+
+    assert sorted(folios) == [f"NC-0000{n}" for n in range(42, 47)]
+    assert colecciones["counters"].find_one_and_update.await_count == 2
+    assert servicio.obtener_estadisticas()["disponibles_en_bloque"] == 1
+
+
+@pytest.mark.asyncio
+async def test_reparar_contador_detras(colecciones):
+    colecciones["operaciones"].aggregate.return_value.to_list.return_value = [{
+        "maximo": [{"_id": None, "numero": 57}],
+        "repetidos": [{"_id": 50, "folio": "NC-000050", "cantidad": 2}],
+    }]
+    servicio = FolioMbcoService()
+
+    diagnostico = await servicio.reparar()
+    assert diagnostico["desfasado"] is True and diagnostico["ajustado"] is False
+    colecciones["counters"].update_one.assert_not_awaited()
+
+    resultado = await servicio.reparar(aplicar=True)
+    assert resultado == {"contador": 57, "maximo_en_datos": 57, "desfasado": True, "ajustado": True,
+                         "repetidos": [{"folio": "NC-000050", "cantidad": 2}]}
+    filtro, update = colecciones["counters"].update_one.await_args.args
+    assert update == {"$max": {"sequence_value": 57}}
+
+    # Solo folios de la secuencia, de ambas colecciones
+    pipeline = colecciones["operaciones"].aggregate.call_args.args[0]
+    assert pipeline[0] == {"$match": {"folio_mbco": {"$regex": r"^NC-[0-9]+$"}}}
+    assert pipeline[2]["$unionWith"]["coll"] == "solicitudes_netcash"
+
+
+@pytest.mark.asyncio
+async def test_reparar_contador_al_dia(colecciones):
+    colecciones["operaciones"].aggregate.return_value.to_list.return_value = [{
+        "maximo": [{"_id": None, "numero": 41}], "repetidos": []
+    }]
+
+    resultado = await FolioMbcoService().reparar(aplicar=True)
+
+    assert resultado["desfasado"] is False and resultado["ajustado"] is False
+    colecciones["counters"].update_one.assert_not_awaited()
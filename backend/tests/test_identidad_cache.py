@@ -0,0 +1,143 @@
+"""
+Tests del caché de identidades (identidad_cache_service)
+
+Verifica que:
+1. Un acierto no consulta MongoDB y entrega una copia; las métricas cuentan aciertos y fallos
+2. Los "no existe" se cachean con TTL corto y se invalidan por etiqueta
+3. Peticiones simultáneas de la misma llave hacen una sola carga
+4. es_cliente_activo resuelve usuario y cliente del caché y ve la activación tras invalidar
+5. usuarios_repo cachea sus búsquedas, no cachea errores e invalida al crear usuarios
+"""
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from identidad_cache_service import IdentidadCache, etiquetas_usuario_telegram
+
+
+@pytest.mark.asyncio
+async def test_acierto_entrega_copia_y_cuenta_metricas():
+    cache = IdentidadCache()
+    cargar = AsyncMock(return_value={"id": "c1", "estado": "activo"})
+
+    primero = await cache.obtener("cliente", "c1", cargar, etiquetas={("cliente", "c1")})
+    primero["estado"] = "modificado por el llamador"
+    segundo = await cache.obtener("cliente", "c1", cargar, etiquetas={("cliente", "c1")})
+
+    assert cargar.await_count == 1
+    assert segundo["estado"] == "activo"
+    stats = cache.obtener_estadisticas()["espacios"]["cliente"]
+    assert stats["aciertos"] == 1 and stats["fallos"] == 1 and stats["tasa_aciertos"] == 0.5
+
+
+@pytest.mark.asyncio
+async def test_cache_negativo_y_invalidacion_por_etiqueta():
+    cache = IdentidadCache(ttl_seg=30, ttl_negativo_seg=30)
+    cargar = AsyncMock(side_effect=[None, {"telegram_id": "7", "chat_id": "7"}])
+    etiquetas = etiquetas_usuario_telegram("7", "7")
+
+    assert await cache.obtener("usuario_telegram", ("chat_id", "7"), cargar, etiquetas) is None
+    assert await cache.obtener("usuario_telegram", ("chat_id", "7"), cargar, etiquetas) is None
+    assert cargar.await_count == 1
+    assert cache.obtener_estadisticas()["espacios"]["usuario_telegram"]["aciertos_negativos"] == 1
+
+    # Alta del usuario: la entrada negativa desaparece
+    assert cache.invalidar_usuario_telegram(telegram_id="7") == 1
+    usuario = await cache.obtener("usuario_telegram", ("chat_id", "7"), cargar, etiquetas)
+    assert usuario["telegram_id"] == "7"
+
+
+@pytest.mark.asyncio
+async def test_negativo_vence_antes():
+    cache = IdentidadCache(ttl_seg=30, ttl_negativo_seg=0)
+    cargar = AsyncMock(return_value=None)
+
+    await cache.obtener("cliente", "x", cargar)
+    await cache.obtener("cliente", "x", cargar)
+    assert cargar.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_peticiones_simultaneas_una_sola_carga():
+    cache = IdentidadCache()
+    liberar = asyncio.Event()
+    llamadas = []
+
+    async def cargar():
+        llamadas.append(1)
+        await liberar.wait()
+        return {"id": "c1"}
+
+    tareas = [asyncio.create_task(cache.obtener("cliente", "c1", cargar)) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    liberar.set()
+    resultados = await asyncio.gather(*tareas)
+
+    assert len(llamadas) == 1
+    assert all(r == {"id": "c1"} for r in resultados)
+
+
+def _db_bot(usuario, clientes):
+    usuarios_telegram = MagicMock()
+    usuarios_telegram.find_one = AsyncMock(return_value=usuario)
+    coleccion_clientes = MagicMock()
+    coleccion_clientes.find_one = AsyncMock(side_effect=clientes)
+    db = MagicMock()
+    db.usuarios_telegram = usuarios_telegram
+    db.clientes = coleccion_clientes
+    return db
+
+
+@pytest.mark.asyncio
+async def test_es_cliente_activo_usa_cache_y_ve_la_activacion():
+    import telegram_bot
+
+    usuario = {"telegram_id": "55", "chat_id": "55", "rol": "cliente", "id_cliente": "c-55"}
+    db = _db_bot(usuario, [
+        {"id": "c-55", "nombre": "Cliente", "estado": "pendiente_validacion"},
+        {"id": "c-55", "nombre": "Cliente", "estado": "activo"},
+    ])
+    cache = IdentidadCache()
+    bot = telegram_bot.TelegramBotNetCash.__new__(telegram_bot.TelegramBotNetCash)
+
+    with patch.object(telegram_bot, "db", db), patch.object(telegram_bot, "identidad_cache", cache):
+        activo, _, _ = await bot.es_cliente_activo("55", "55")
+        activo_otra_vez, _, _ = await bot.es_cliente_activo("55", "55")
+        assert not activo and not activo_otra_vez
+        assert db.usuarios_telegram.find_one.await_count == 1
+        assert db.clientes.find_one.await_count == 1
+
+        # Ana aprueba al cliente desde el dashboard
+        cache.invalidar_cliente("c-55")
+        activo, _, cliente = await bot.es_cliente_activo("55", "55")
+        assert activo and cliente["estado"] == "activo"
+        # La invalidación del cliente también quita al usuario vinculado
+        assert db.usuarios_telegram.find_one.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_usuarios_repo_cachea_sin_cachear_errores():
+    import usuarios_repo as modulo
+
+    coleccion = MagicMock()
+    coleccion.find_one = AsyncMock(side_effect=[Exception("sin conexión"), {"nombre": "Ana"}])
+    coleccion.insert_one = AsyncMock()
+    db = MagicMock()
+    db.__getitem__.return_value = coleccion
+    cache = IdentidadCache()
+
+    with patch.object(modulo, "db", db), patch.object(modulo, "identidad_cache", cache):
+        repo = modulo.UsuariosRepository()
+        assert await repo.obtener_usuario_por_telegram_id(1) is None
+        assert (await repo.obtener_usuario_por_telegram_id(1))["nombre"] == "Ana"
+        assert (await repo.obtener_usuario_por_telegram_id(1))["nombre"] == "Ana"
+        assert coleccion.find_one.await_count == 2
+
+        await repo.crear_usuario({"nombre": "Toño", "telegram_id": 1})
+        assert cache.obtener_estadisticas()["entradas"] == 0
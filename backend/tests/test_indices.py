@@ -0,0 +1,109 @@
+"""
+Tests del registro de índices (indices_service)
+
+Verifica que:
+1. Se crean todos los índices registrados, con nombre por defecto y opciones
+2. Un conflicto con un índice existente no detiene el arranque; otros errores se reportan
+3. El explain() detecta COLLSCAN en cualquier nivel del plan ganador
+4. Cada consulta crítica tiene un índice registrado cuyo prefijo cubre su filtro/orden
+"""
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pymongo.errors import OperationFailure
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import indices_service
+from indices_service import CONSULTAS_CRITICAS, INDICES_REGISTRADOS, etapas_plan
+
+
+def _mock_db(colecciones):
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = lambda nombre: colecciones.setdefault(nombre, _coleccion())
+    return mock_db
+
+
+def _coleccion():
+    coleccion = MagicMock()
+    coleccion.create_indexes = AsyncMock(side_effect=lambda modelos: [m.document["name"] for m in modelos])
+    return coleccion
+
+
+@pytest.mark.asyncio
+async def test_aplica_todos_los_indices():
+    colecciones = {}
+    with patch.object(indices_service, 'db', _mock_db(colecciones)):
+        resumen = await indices_service.aplicar_indices()
+
+    assert resumen["errores"] == []
+    assert set(colecciones) == set(INDICES_REGISTRADOS)
+    assert "id_1" in resumen["creados"]["solicitudes_netcash"]
+    assert "email_thread_id_1_estado_1" in resumen["creados"]["solicitudes_netcash"]
+
+    modelos = [c.args[0][0].document for c in colecciones["operaciones"].create_indexes.await_args_list]
+    assert {"name": "id_1", "key": {"id": 1}, "unique": True}.items() <= modelos[0].items()
+
+
+@pytest.mark.asyncio
+async def test_conflictos_no_detienen_el_arranque():
+    colecciones = {"clientes": _coleccion(), "operaciones": _coleccion()}
+    colecciones["clientes"].create_indexes.side_effect = OperationFailure("IndexOptionsConflict", code=85)
+    colecciones["operaciones"].create_indexes.side_effect = OperationFailure("E11000 duplicate key", code=11000)
+
+    with patch.object(indices_service, 'db', _mock_db(colecciones)):
+        resumen = await indices_service.aplicar_indices()
+
+    assert resumen["creados"]["clientes"] == []
+    assert {e["coleccion"] for e in resumen["errores"]} == {"operaciones"}
+    assert resumen["creados"]["usuarios_telegram"] == ["telegram_id_1", "chat_id_1"]
+
+
+def test_etapas_plan_anidadas():
+    plan_clasico = {"stage": "LIMIT", "inputStage": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}
+    plan_sbe = {"queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}, "slotBasedPlan": {}}
+    plan_or = {"stage": "SUBPLAN", "inputStage": {"stage": "OR", "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]}}
+
+    assert "COLLSCAN" in etapas_plan(plan_clasico)
+    assert etapas_plan(plan_sbe) == ["FETCH", "IXSCAN"]
+    assert "COLLSCAN" in etapas_plan(plan_or)
+
+
+@pytest.mark.asyncio
+async def test_verificacion_marca_collscan():
+    planes = {
+        "operaciones": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}},
+    }
+
+    def coleccion(nombre):
+        col = MagicMock()
+        cursor = MagicMock()
+        cursor.sort.return_value = cursor
+        cursor.limit.return_value = cursor
+        cursor.explain = AsyncMock(return_value=planes.get(
+            nombre, {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}
+        ))
+        col.find.return_value = cursor
+        return col
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = coleccion
+    with patch.object(indices_service, 'db', mock_db):
+        resultados = await indices_service.verificar_consultas_criticas()
+
+    con_collscan = {r["nombre"] for r in resultados if r["collscan"]}
+    esperadas = {c["nombre"] for c in CONSULTAS_CRITICAS if c["coleccion"] == "operaciones"}
+    assert con_collscan == esperadas
+
+
+def test_consultas_criticas_tienen_indice():
+    for consulta in CONSULTAS_CRITICAS:
+        campos = list(consulta["filtro"]) + [campo for campo, _ in consulta.get("sort", [])]
+        prefijos = [
+            [campo for campo, _ in spec["keys"]]
+            for spec in INDICES_REGISTRADOS[consulta["coleccion"]]
+        ]
+        assert any(prefijo[0] in campos and set(prefijo) <= set(campos) for prefijo in prefijos), consulta["nombre"]
@@ -0,0 +1,149 @@
+"""
+Tests de la ingesta de archivos (ingesta_archivos_service)
+
+Verifica que:
+1. El tipo se detecta por la firma del archivo, no por la extensión; un .docx/.xlsx no es un ZIP
+2. Una sola pasada escribe el archivo y calcula el mismo SHA-256 que leerlo de nuevo
+3. Al pasar del límite se corta la transferencia y no queda nada en disco
+4. Funciona con UploadFile de FastAPI y con archivos de Telegram (servidor Bot API local)
+5. agregar_comprobante_detallado reutiliza hash y tipo del descriptor sin releer el archivo
+"""
+import hashlib
+import io
+import sys
+import zipfile
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import UploadFile
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from ingesta_archivos_service import (
+    MIME_DESCONOCIDO, ArchivoDemasiadoGrande, IngestaArchivosService, detectar_mime
+)
+
+PDF = b"%PDF-1.7\n" + b"x" * 200_000
+
+
+async def _bloques(datos: bytes, tamano: int = 4096):
+    for i in range(0, len(datos), tamano):
+        yield datos[i:i + tamano]
+
+
+def test_detectar_mime_por_firma():
+    assert detectar_mime(b"%PDF-1.4 ...") == "application/pdf"
+    assert detectar_mime(b"\xff\xd8\xff\xe0\x00\x10JFIF") == "image/jpeg"
+    assert detectar_mime(b"\x89PNG\r\n\x1a\n\x00\x00") == "image/png"
+    assert detectar_mime(b"PK\x03\x04\x14\x00") == "application/zip"
+    assert detectar_mime(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert detectar_mime(b"hola") == MIME_DESCONOCIDO
+
+
+def _zip(entradas) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for nombre in entradas:
+            zf.writestr(nombre, b"contenido")
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_documentos_office_no_son_zip(tmp_path):
+    servicio = IngestaArchivosService()
+    docx = _zip(["[Content_Types].xml", "word/document.xml"])
+
+    word = await servicio.guardar(_bloques(docx), tmp_path / "estado.docx", "estado.docx")
+    assert word.mime_type == MIME_DESCONOCIDO and not word.es_zip
+
+    # Con extensión .zip manda el nombre; un ZIP común con otro nombre sigue siendo ZIP
+    renombrado = await servicio.guardar(_bloques(docx), tmp_path / "a.zip", "a.zip")
+    assert renombrado.es_zip
+    lote = await servicio.guardar(_bloques(_zip(["c1.pdf", "c2.jpg"])), tmp_path / "lote", "lote")
+    assert lote.es_zip
+
+
+@pytest.mark.asyncio
+async def test_una_pasada_con_hash_y_tipo(tmp_path):
+    servicio = IngestaArchivosService()
+    destino = tmp_path / "sub" / "comprobante.jpg"
+
+    archivo = await servicio.guardar(_bloques(PDF, tamano=7), destino, "comprobante.jpg")
+
+    assert archivo.sha256 == hashlib.sha256(PDF).hexdigest()
+    assert archivo.tamano == len(PDF)
+    # Nombre .jpg, contenido PDF: manda la firma
+    assert archivo.mime_type == "application/pdf" and archivo.es_pdf and not archivo.es_zip
+    assert destino.read_bytes() == PDF
+    assert not list(tmp_path.rglob("*.parcial"))
+
+
+@pytest.mark.asyncio
+async def test_limite_corta_y_limpia(tmp_path):
+    servicio = IngestaArchivosService()
+    servicio.max_bytes = 50_000
+    destino = tmp_path / "grande.pdf"
+
+    with pytest.raises(ArchivoDemasiadoGrande):
+        await servicio.guardar(_bloques(PDF), destino, "grande.pdf")
+    assert not destino.exists()
+    assert not list(tmp_path.iterdir())
+
+    # Con el tamaño declarado se rechaza antes de transferir
+    with pytest.raises(ArchivoDemasiadoGrande):
+        servicio.verificar_tamano(60_000)
+
+
+@pytest.mark.asyncio
+async def test_desde_upload_y_desde_telegram_local(tmp_path):
+    servicio = IngestaArchivosService()
+
+    upload = UploadFile(file=io.BytesIO(PDF), filename="web.pdf")
+    web = await servicio.desde_upload(upload, tmp_path / "web.pdf")
+    assert web.nombre_original == "web.pdf" and web.sha256 == hashlib.sha256(PDF).hexdigest()
+
+    origen = tmp_path / "bot_api_local.bin"
+    origen.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 1000)
+    archivo_tg = SimpleNamespace(file_size=origen.stat().st_size, file_path=str(origen))
+    foto = await servicio.desde_telegram(archivo_tg, tmp_path / "foto.jpg", "foto.jpg")
+    assert foto.mime_type == "image/png" and foto.tamano == 1008
+
+    servicio.max_bytes = 100
+    with pytest.raises(ArchivoDemasiadoGrande):
+        await servicio.desde_telegram(archivo_tg, tmp_path / "otra.jpg", "otra.jpg")
+    assert not (tmp_path / "otra.jpg").exists()
+
+
+@pytest.mark.asyncio
+async def test_servicio_netcash_reutiliza_descriptor(tmp_path):
+    from netcash_service import NetCashService
+
+    destino = tmp_path / "comp.jpg"
+    archivo = await IngestaArchivosService().guardar(_bloques(PDF), destino, "comp.jpg")
+
+    coleccion = MagicMock()
+    coleccion.find_one = AsyncMock(return_value={"cliente_id": "cli_001", "comprobantes": []})
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = coleccion
+    with patch('netcash_service.db', mock_db), \
+         patch('netcash_service.cuenta_deposito_service.obtener_cuenta_activa',
+               AsyncMock(return_value={"banco": "STP", "clabe": "646180139409481462"})):
+        servicio = NetCashService()
+        servicio._calcular_hash_archivo = MagicMock(side_effect=AssertionError("no debe releer el archivo"))
+        servicio._buscar_duplicados_globales = AsyncMock(return_value={})
+        servicio._push_comprobantes = AsyncMock(return_value={"comprobantes": []})
+        servicio._analizar_comprobante_ocr = AsyncMock(return_value={
+            "es_valido": True, "monto_detectado": 10.0, "ocr_data": {"es_confiable": True}
+        })
+
+        agregado, _, _ = await servicio.agregar_comprobante_detallado(
+            "nc-1", str(destino), "comp.jpg", archivo=archivo
+        )
+
+    assert agregado is True
+    args = servicio._analizar_comprobante_ocr.await_args
+    assert args.args[2] == archivo.sha256
+    assert args.kwargs["mime_type"] == "application/pdf"
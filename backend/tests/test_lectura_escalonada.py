@@ -0,0 +1,127 @@
+"""
+Tests de la lectura escalonada de comprobantes (lectura_comprobante_service)
+
+Verifica que:
+1. Un PDF de banco con parser específico y CLABE completa se lee sin LLM
+2. Sin parser específico, con monto no confiable o imagen, se recurre al LLM con motivo
+3. NetCashService registra el nivel de extracción en ocr_data
+"""
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import texto_extraido_cache_service
+from lectura_comprobante_service import LecturaComprobanteService, NIVEL_LLM, NIVEL_TEXTO_LOCAL
+from netcash_service import NetCashService
+
+
+CUENTA_ACTIVA = {
+    "banco": "STP",
+    "clabe": "646180139409481462",
+    "beneficiario": "JARDINERIA Y COMERCIO THABYETHA SA DE CV"
+}
+
+DATOS_LLM = {
+    "monto": 125000.0,
+    "banco_emisor": "BBVA",
+    "cuenta_beneficiaria": "646180139409481462",
+    "nombre_beneficiario": "JARDINERIA Y COMERCIO THABYETHA SA DE CV",
+    "clave_rastreo": "MBAN01002511260001",
+}
+
+
+def _pdf(ruta, lineas):
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(str(ruta))
+    for i, linea in enumerate(lineas):
+        c.drawString(72, 750 - i * 20, linea)
+    c.save()
+    return ruta
+
+
+def _lineas_albo(monto="$125,000.00", clabe="646180139409481462"):
+    return [
+        "albo - Comprobante de transferencia SPEI",
+        f"Monto total: {monto}",
+        "Comisiones: $0.00",
+        "Cuenta destino",
+        clabe,
+        "Beneficiario: JARDINERIA Y COMERCIO THABYETHA SA DE CV",
+    ]
+
+
+@pytest.fixture(autouse=True)
+def cache_texto(tmp_path, monkeypatch):
+    monkeypatch.setenv('TEXTO_CACHE_DIR', str(tmp_path / "cache"))
+    monkeypatch.setattr('lectura_comprobante_service.texto_extraido_cache_service',
+                        texto_extraido_cache_service.TextoExtraidoCacheService())
+    # Sin pool de procesos: extraer en el mismo proceso
+    pool = MagicMock()
+    pool.extraer_paginas_pdf = AsyncMock(side_effect=lambda ruta: texto_extraido_cache_service.extraer_paginas_pdf(ruta))
+    monkeypatch.setattr(texto_extraido_cache_service, 'extraccion_texto_service', pool)
+
+
+@pytest.fixture
+def servicio():
+    servicio = LecturaComprobanteService()
+    servicio._leer_con_llm = AsyncMock(side_effect=lambda *args: dict(DATOS_LLM))
+    return servicio
+
+
+@pytest.mark.asyncio
+async def test_pdf_albo_se_lee_localmente(servicio, tmp_path):
+    ruta = _pdf(tmp_path / "albo.pdf", _lineas_albo())
+
+    datos = await servicio.leer_comprobante(str(ruta), "application/pdf", CUENTA_ACTIVA)
+
+    servicio._leer_con_llm.assert_not_awaited()
+    assert datos["nivel_extraccion"] == NIVEL_TEXTO_LOCAL
+    assert datos["monto"] == 125000.0
+    assert datos["banco_emisor"] == "ALBO"
+    assert datos["cuenta_beneficiaria"] == CUENTA_ACTIVA["clabe"]
+    assert servicio.obtener_estadisticas()["porcentaje_local"] == 1.0
+
+
+@pytest.mark.parametrize("nombre,lineas,mime,motivo", [
+    ("bbva.pdf", ["BBVA Transferencia", "Importe $125,000.00", "646180139409481462"] * 3,
+     "application/pdf", "sin_parser_especifico"),
+    ("albo_cero.pdf", _lineas_albo(monto="$0.00"), "application/pdf", "monto_cero_invalido"),
+    ("albo_otra.pdf", _lineas_albo(clabe="002180700123456789"), "application/pdf", "clabe_no_confirmada"),
+    ("foto.jpg", None, "image/jpeg", "no_es_pdf"),
+])
+@pytest.mark.asyncio
+async def test_fallback_al_llm(servicio, tmp_path, nombre, lineas, mime, motivo):
+    ruta = tmp_path / nombre
+    if lineas:
+        _pdf(ruta, lineas)
+    else:
+        ruta.write_bytes(b"\xff\xd8\xff")
+
+    datos = await servicio.leer_comprobante(str(ruta), mime, CUENTA_ACTIVA, file_hash="abc")
+
+    servicio._leer_con_llm.assert_awaited_once_with(str(ruta), mime, "abc", False)
+    assert datos["nivel_extraccion"] == NIVEL_LLM
+    assert datos["motivo_fallback_local"] == motivo
+    assert datos["clave_rastreo"] == DATOS_LLM["clave_rastreo"]
+
+
+@pytest.mark.asyncio
+async def test_netcash_registra_nivel(tmp_path):
+    ruta = _pdf(tmp_path / "albo.pdf", _lineas_albo())
+
+    with patch('netcash_service.db', MagicMock()):
+        servicio = NetCashService()
+    with patch('netcash_service.lectura_comprobante_service._leer_con_llm', AsyncMock()) as mock_llm:
+        detalle = await servicio._analizar_comprobante_ocr(str(ruta), "albo.pdf", None, CUENTA_ACTIVA)
+
+    mock_llm.assert_not_awaited()
+    assert detalle["ocr_data"]["nivel_extraccion"] == NIVEL_TEXTO_LOCAL
+    assert detalle["ocr_data"]["es_confiable"] is True
+    assert detalle["es_valido"] is True
+    assert detalle["monto_detectado"] == 125000.0
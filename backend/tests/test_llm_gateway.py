@@ -0,0 +1,163 @@
+"""
+Tests del gateway LLM (llm_gateway_service)
+
+Verifica que:
+1. Los errores transitorios se reintentan y los no transitorios no
+2. El circuito se abre tras N fallas, rechaza de inmediato y se cierra al recuperarse
+3. El semáforo limita las llamadas en vuelo y el token bucket la tasa
+4. El timeout por intento cuenta como falla transitoria
+5. Con el circuito abierto, NetCash manda el comprobante a captura manual
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from llm_gateway_service import (
+    CIRCUITO_ABIERTO, CIRCUITO_CERRADO, LLMGateway, LLMNoDisponible, TokenBucket, es_error_transitorio
+)
+from netcash_service import NetCashService
+
+
+@pytest.fixture
+def gateway():
+    gateway = LLMGateway()
+    gateway.backoff_base_seg = 0.001
+    gateway.max_reintentos = 2
+    gateway.token_bucket = TokenBucket(tasa=0, capacidad=1)
+    gateway.circuito.umbral_fallos = 3
+    gateway.circuito.enfriamiento_seg = 0.05
+    return gateway
+
+
+def _llamada(*resultados):
+    """Fábrica que regresa/lanza los resultados en orden"""
+    pendientes = list(resultados)
+
+    async def llamada():
+        resultado = pendientes.pop(0)
+        if isinstance(resultado, BaseException):
+            raise resultado
+        return resultado
+
+    return llamada
+
+
+def test_clasificacion_errores():
+    assert es_error_transitorio(asyncio.TimeoutError())
+    assert es_error_transitorio(Exception("429 Too Many Requests"))
+    assert es_error_transitorio(Exception("503 Service Unavailable"))
+    assert not es_error_transitorio(ValueError("Invalid file format"))
+
+
+@pytest.mark.asyncio
+async def test_reintenta_transitorios(gateway):
+    resultado = await gateway.ejecutar(_llamada(Exception("503 overloaded"), Exception("429"), "ok"))
+
+    assert resultado == "ok"
+    assert gateway.metricas["reintentos"] == 2
+    assert gateway.circuito.estado == CIRCUITO_CERRADO
+    assert gateway.circuito.fallos_consecutivos == 0
+
+
+@pytest.mark.asyncio
+async def test_no_reintenta_no_transitorios(gateway):
+    with pytest.raises(ValueError):
+        await gateway.ejecutar(_llamada(ValueError("archivo inválido"), "ok"))
+
+    assert gateway.metricas["reintentos"] == 0
+    assert gateway.circuito.fallos_consecutivos == 0
+
+
+@pytest.mark.asyncio
+async def test_circuito_abre_rechaza_y_se_recupera(gateway):
+    with pytest.raises(Exception, match="503"):
+        await gateway.ejecutar(_llamada(*[Exception("503")] * 3))
+
+    assert gateway.circuito.estado == CIRCUITO_ABIERTO
+    assert not gateway.disponible()
+
+    llamada = AsyncMock(return_value="ok")
+    with pytest.raises(LLMNoDisponible):
+        await gateway.ejecutar(llamada)
+    llamada.assert_not_called()
+    assert gateway.metricas["rechazos_circuito"] == 1
+
+    # Tras el enfriamiento una llamada de prueba exitosa cierra el circuito
+    await asyncio.sleep(0.06)
+    assert await gateway.ejecutar(llamada) == "ok"
+    assert gateway.circuito.estado == CIRCUITO_CERRADO
+
+
+@pytest.mark.asyncio
+async def test_timeout_por_intento(gateway):
+    gateway.timeout_seg = 0.02
+    gateway.max_reintentos = 0
+
+    async def lenta():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await gateway.ejecutar(lenta)
+
+    assert gateway.metricas["timeouts"] == 1
+    assert gateway.circuito.fallos_consecutivos == 1
+
+
+@pytest.mark.asyncio
+async def test_semaforo_limita_concurrencia(gateway):
+    gateway.max_concurrencia = 2
+    en_vuelo = 0
+    max_en_vuelo = 0
+
+    async def llamada():
+        nonlocal en_vuelo, max_en_vuelo
+        en_vuelo += 1
+        max_en_vuelo = max(max_en_vuelo, en_vuelo)
+        await asyncio.sleep(0.01)
+        en_vuelo -= 1
+        return True
+
+    await asyncio.gather(*[gateway.ejecutar(llamada) for _ in range(6)])
+
+    assert max_en_vuelo == 2
+    assert gateway.obtener_metricas()["exitos"] == 6
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limita_tasa():
+    bucket = TokenBucket(tasa=50, capacidad=2)
+    inicio = time.monotonic()
+
+    for _ in range(5):
+        await bucket.adquirir()
+
+    # 2 de la ráfaga + 3 a 50/seg ≈ 60ms
+    assert time.monotonic() - inicio >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_netcash_circuito_abierto_a_captura_manual():
+    datos_no_disponible = {
+        "error": "OCR no disponible temporalmente: Proveedor LLM degradado (circuito abierto)",
+        "codigo_error": "llm_no_disponible",
+        "nivel_extraccion": "llm"
+    }
+    with patch('netcash_service.db', MagicMock()):
+        servicio = NetCashService()
+    with patch('netcash_service.lectura_comprobante_service.leer_comprobante',
+               AsyncMock(return_value=datos_no_disponible)):
+        detalle = await servicio._analizar_comprobante_ocr(
+            "/tmp/x.jpg", "x.jpg", "hash", {"clabe": "646180139409481462"}
+        )
+
+    assert detalle["ocr_data"]["motivo_fallo"] == "ocr_no_disponible"
+    update = servicio._campos_update_comprobante(detalle, es_primero=True)
+    assert update["modo_captura"] == "manual_por_fallo_ocr"
+    assert servicio._razon_retorno(detalle) == "requiere_captura_manual"
@@ -0,0 +1,147 @@
+"""
+Tests del caché OCR por hash de archivo (ocr_cache_service)
+
+Verifica que:
+1. Un resultado guardado se recupera desde memoria sin ir a MongoDB
+2. Si no está en memoria, se recupera de MongoDB y se promueve a memoria
+3. Las entradas expiradas no se regresan
+4. Los resultados con error nunca se cachean
+5. El LRU respeta el tamaño máximo
+6. Cambiar la versión del prompt produce un miss
+"""
+import sys
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from ocr_cache_service import OCRCacheService
+
+
+HASH_A = "a" * 64
+HASH_B = "b" * 64
+VERSION = "v1-gemini-2.0-flash"
+DATOS_OCR = {"monto": 500000.0, "clave_rastreo": "MBAN01002511210001", "banco_emisor": "BBVA"}
+
+
+@pytest.fixture
+def mock_collection():
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=None)
+    collection.update_one = AsyncMock()
+    collection.delete_many = AsyncMock()
+    collection.create_index = AsyncMock()
+    return collection
+
+
+@pytest.fixture
+def cache(mock_collection):
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_collection
+    with patch('ocr_cache_service.db', mock_db):
+        yield OCRCacheService()
+
+
+@pytest.mark.asyncio
+async def test_guardar_y_obtener_desde_memoria(cache, mock_collection):
+    assert await cache.guardar(HASH_A, VERSION, DATOS_OCR, "application/pdf") is True
+    mock_collection.update_one.assert_awaited_once()
+
+    datos = await cache.obtener(HASH_A, VERSION)
+
+    assert datos == DATOS_OCR
+    mock_collection.find_one.assert_not_awaited()
+    assert cache.obtener_estadisticas()["hits_memoria"] == 1
+
+
+@pytest.mark.asyncio
+async def test_resultado_es_copia(cache):
+    await cache.guardar(HASH_A, VERSION, DATOS_OCR)
+
+    datos = await cache.obtener(HASH_A, VERSION)
+    datos["monto"] = 0
+
+    assert (await cache.obtener(HASH_A, VERSION))["monto"] == 500000.0
+
+
+@pytest.mark.asyncio
+async def test_obtener_desde_mongo_y_promover(cache, mock_collection):
+    # Mongo regresa datetimes naive en UTC
+    expira = (datetime.now(timezone.utc) + timedelta(hours=1)).replace(tzinfo=None)
+    mock_collection.find_one.return_value = {"_id": f"{HASH_A}:{VERSION}", "datos": DATOS_OCR, "expira_en": expira}
+
+    assert await cache.obtener(HASH_A, VERSION) == DATOS_OCR
+    assert await cache.obtener(HASH_A, VERSION) == DATOS_OCR
+
+    assert mock_collection.find_one.await_count == 1
+    stats = cache.obtener_estadisticas()
+    assert stats["hits_mongo"] == 1
+    assert stats["hits_memoria"] == 1
+
+
+@pytest.mark.asyncio
+async def test_entrada_expirada_en_mongo_es_miss(cache, mock_collection):
+    expira = (datetime.now(timezone.utc) - timedelta(minutes=1)).replace(tzinfo=None)
+    mock_collection.find_one.return_value = {"_id": f"{HASH_A}:{VERSION}", "datos": DATOS_OCR, "expira_en": expira}
+
+    assert await cache.obtener(HASH_A, VERSION) is None
+    assert cache.obtener_estadisticas()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_entrada_expirada_en_memoria(cache):
+    cache.ttl = timedelta(seconds=-1)
+    await cache.guardar(HASH_A, VERSION, DATOS_OCR)
+
+    assert await cache.obtener(HASH_A, VERSION) is None
+
+
+@pytest.mark.asyncio
+async def test_no_cachea_errores(cache, mock_collection):
+    guardado = await cache.guardar(HASH_A, VERSION, {"error": "Error al procesar comprobante: timeout"})
+
+    assert guardado is False
+    mock_collection.update_one.assert_not_awaited()
+    assert await cache.obtener(HASH_A, VERSION) is None
+
+
+@pytest.mark.asyncio
+async def test_lru_respeta_maximo(cache):
+    cache.max_memoria = 1
+
+    await cache.guardar(HASH_A, VERSION, DATOS_OCR)
+    await cache.guardar(HASH_B, VERSION, DATOS_OCR)
+
+    assert cache.obtener_estadisticas()["entradas_memoria"] == 1
+    assert cache.obtener_estadisticas()["evicciones"] == 1
+    assert cache._leer_memoria(f"{HASH_A}:{VERSION}") is None
+    assert cache._leer_memoria(f"{HASH_B}:{VERSION}") is not None
+
+
+@pytest.mark.asyncio
+async def test_version_distinta_es_miss(cache, mock_collection):
+    await cache.guardar(HASH_A, VERSION, DATOS_OCR)
+
+    assert await cache.obtener(HASH_A, "v2-gemini-2.0-flash") is None
+
+
+@pytest.mark.asyncio
+async def test_invalidar(cache, mock_collection):
+    await cache.guardar(HASH_A, VERSION, DATOS_OCR)
+
+    await cache.invalidar(HASH_A)
+
+    assert cache._leer_memoria(f"{HASH_A}:{VERSION}") is None
+    mock_collection.delete_many.assert_awaited_once_with({"file_hash": HASH_A})
+
+
+@pytest.mark.asyncio
+async def test_error_mongo_no_rompe_lectura(cache, mock_collection):
+    mock_collection.find_one.side_effect = Exception("connection refused")
+
+    assert await cache.obtener(HASH_A, VERSION) is None
+    assert cache.obtener_estadisticas()["errores"] == 1
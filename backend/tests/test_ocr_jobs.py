@@ -0,0 +1,178 @@
+"""
+Tests de la cola de trabajos OCR (ocr_jobs_service) y su stream SSE
+
+Verifica que:
+1. Encolar guarda el trabajo pendiente y despierta a los workers
+2. Un trabajo exitoso queda completado con su resultado
+3. Un fallo se reintenta con backoff y al agotar intentos queda en error
+4. La toma de trabajos es atómica y retoma trabajos abandonados
+5. El pool procesa la cola y el stream /eventos termina en el evento final
+6. El trabajo de comprobante NetCash devuelve su comprobante de la post-imagen, sin releer la solicitud
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo import ReturnDocument
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from ocr_jobs_service import OCRJobsService, ESTADO_COMPLETADO, ESTADO_ERROR, ESTADO_PENDIENTE
+
+
+@pytest.fixture
+def mock_collection():
+    collection = MagicMock()
+    collection.insert_one = AsyncMock()
+    collection.update_one = AsyncMock()
+    collection.create_index = AsyncMock()
+    collection.find_one_and_update = AsyncMock(return_value=None)
+    return collection
+
+
+@pytest.fixture
+def servicio(mock_collection):
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_collection
+    with patch('ocr_jobs_service.db', mock_db):
+        servicio = OCRJobsService()
+        servicio.backoff_base_seg = 10
+        yield servicio
+
+
+def _job(intentos=1, max_intentos=3):
+    return {"id": "job-1", "tipo": "prueba", "payload": {"x": 1}, "intentos": intentos, "max_intentos": max_intentos}
+
+
+def _set_final(mock_collection):
+    return mock_collection.update_one.await_args_list[-1].args[1]["$set"]
+
+
+@pytest.mark.asyncio
+async def test_encolar(servicio, mock_collection):
+    servicio.registrar_handler("prueba", AsyncMock())
+
+    with pytest.raises(ValueError):
+        await servicio.encolar("desconocido", {})
+
+    job_id = await servicio.encolar("prueba", {"file_path": "/tmp/a.pdf"}, referencia="op-1")
+
+    doc = mock_collection.insert_one.await_args.args[0]
+    assert doc["id"] == job_id
+    assert doc["estado"] == ESTADO_PENDIENTE
+    assert doc["referencia"] == "op-1"
+    assert doc["intentos"] == 0
+
+
+@pytest.mark.asyncio
+async def test_trabajo_exitoso_reporta_progreso(servicio, mock_collection):
+    async def handler(job, progreso):
+        await progreso("ocr", 20)
+        return {"monto": 1000.0}
+
+    servicio.registrar_handler("prueba", handler)
+    await servicio._ejecutar_trabajo(_job())
+
+    progreso = mock_collection.update_one.await_args_list[0].args[1]["$set"]["progreso"]
+    assert progreso == {"etapa": "ocr", "porcentaje": 20}
+    final = _set_final(mock_collection)
+    assert final["estado"] == ESTADO_COMPLETADO
+    assert final["resultado"] == {"monto": 1000.0}
+
+
+@pytest.mark.asyncio
+async def test_reintento_con_backoff_y_error_final(servicio, mock_collection):
+    servicio.registrar_handler("prueba", AsyncMock(side_effect=RuntimeError("timeout gemini")))
+
+    antes = datetime.now(timezone.utc)
+    await servicio._ejecutar_trabajo(_job(intentos=2))
+    reintento = _set_final(mock_collection)
+    assert reintento["estado"] == ESTADO_PENDIENTE
+    assert reintento["error"] == "timeout gemini"
+    # Segundo intento: base * 2
+    assert (reintento["disponible_en"] - antes).total_seconds() >= 20
+
+    await servicio._ejecutar_trabajo(_job(intentos=3))
+    assert _set_final(mock_collection)["estado"] == ESTADO_ERROR
+
+
+@pytest.mark.asyncio
+async def test_tomar_trabajo_retoma_abandonados(servicio, mock_collection):
+    servicio.registrar_handler("prueba", AsyncMock())
+    await servicio._tomar_trabajo("w-1")
+
+    kwargs = mock_collection.find_one_and_update.await_args.kwargs
+    filtro, update = mock_collection.find_one_and_update.await_args.args
+    assert filtro["tipo"] == {"$in": ["prueba"]}
+    assert {c["estado"] for c in filtro["$or"]} == {"pendiente", "procesando"}
+    assert update["$inc"] == {"intentos": 1}
+    assert kwargs["return_document"] == ReturnDocument.AFTER
+
+
+@pytest.mark.asyncio
+async def test_pool_procesa_cola(servicio, mock_collection):
+    procesados = []
+
+    async def handler(job, progreso):
+        procesados.append(job["id"])
+        return {}
+
+    servicio.registrar_handler("prueba", handler)
+    servicio.workers = 2
+    servicio.intervalo_sondeo_seg = 0.05
+    mock_collection.find_one_and_update.side_effect = [_job(), None, None, None, None, None, None, None] + [None] * 100
+
+    servicio.start()
+    await asyncio.sleep(0.2)
+    await servicio.stop()
+
+    assert procesados == ["job-1"]
+
+
+def test_stream_eventos_termina_en_final():
+    from routes import ocr_jobs_routes
+
+    base = {"id": "job-1", "estado": "procesando", "intentos": 1, "progreso": {"etapa": "ocr", "porcentaje": 20}}
+    estados = [
+        {**base, "updated_at": 1},
+        {**base, "updated_at": 1},
+        {**base, "updated_at": 2, "progreso": {"etapa": "validacion", "porcentaje": 60}},
+        {**base, "updated_at": 3, "estado": "completado", "resultado": {"ok": True}},
+    ]
+
+    app = FastAPI()
+    app.include_router(ocr_jobs_routes.router, prefix="/api")
+
+    with patch.object(ocr_jobs_routes, 'INTERVALO_EVENTOS_SEG', 0), \
+         patch.object(ocr_jobs_routes.ocr_jobs_service, 'obtener', AsyncMock(side_effect=estados)):
+        respuesta = TestClient(app).get("/api/ocr-jobs/job-1/eventos")
+
+    eventos = [linea for linea in respuesta.text.splitlines() if linea.startswith("event:")]
+    assert eventos == ["event: progreso", "event: progreso", "event: completado"]
+    assert respuesta.headers["content-type"].startswith("text/event-stream")
+
+
+@pytest.mark.asyncio
+async def test_job_comprobante_netcash_usa_post_imagen():
+    from routes import netcash_routes
+
+    # Otro trabajo de la misma solicitud escribió después: el último no es el de este archivo
+    solicitud = {"comprobantes": [
+        {"archivo_url": "/up/a.pdf", "nombre_archivo": "a.pdf"},
+        {"archivo_url": "/up/b.pdf", "nombre_archivo": "b.pdf"},
+    ]}
+    job = {"payload": {"solicitud_id": "nc-1", "file_path": "/up/a.pdf", "nombre_archivo": "a.pdf"}}
+
+    with patch.object(netcash_routes.netcash_service, "agregar_comprobante_detallado",
+                      AsyncMock(return_value=(True, None, solicitud))), \
+         patch.object(netcash_routes.netcash_service, "obtener_solicitud",
+                      AsyncMock(side_effect=AssertionError("no debe releer la solicitud"))):
+        resultado = await netcash_routes._job_comprobante_netcash(job, AsyncMock())
+
+    assert resultado == {"agregado": True, "razon": None, "comprobante": solicitud["comprobantes"][0]}
@@ -0,0 +1,90 @@
+"""
+Tests del OCR por lotes (OCRService.leer_comprobantes_lote)
+
+Verifica que:
+1. Los lotes respetan el máximo de archivos y de bytes por solicitud
+2. La respuesta del lote se separa por documento (y se reordena por "documento")
+3. Si el lote no se puede interpretar, cada archivo se lee por separado
+4. Los resultados en caché no se envían al LLM
+"""
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+pytest.importorskip("emergentintegrations")
+
+from ocr_service import OCRService
+
+
+@pytest.fixture
+def archivos(tmp_path):
+    rutas = []
+    for i, tamano in enumerate([100, 100, 100, 5000, 100]):
+        ruta = tmp_path / f"comp_{i}.pdf"
+        ruta.write_bytes(bytes([i]) * tamano)
+        rutas.append((str(ruta), "application/pdf", f"hash_{i}"))
+    return rutas
+
+
+@pytest.fixture
+def servicio():
+    with patch('ocr_service.ocr_cache_service') as cache:
+        cache.obtener = AsyncMock(return_value=None)
+        cache.guardar = AsyncMock(return_value=True)
+        yield OCRService()
+
+
+def test_agrupar_por_archivos_y_bytes(servicio, archivos, monkeypatch):
+    monkeypatch.setenv('OCR_LOTE_MAX_ARCHIVOS', '2')
+    monkeypatch.setenv('OCR_LOTE_MAX_MB', str(1000 / (1024 * 1024)))
+    pendientes = [(i, *a) for i, a in enumerate(archivos)]
+
+    lotes = servicio._agrupar_en_lotes(pendientes)
+
+    assert [[p[0] for p in lote] for lote in lotes] == [[0, 1], [2], [3], [4]]
+
+
+def test_parsear_respuesta_reordena(servicio):
+    respuesta = '```json\n[{"documento": 2, "monto": 200}, {"documento": 1, "monto": 100}]\n```'
+
+    assert servicio._parsear_respuesta_lote(respuesta, 2) == [{"monto": 100}, {"monto": 200}]
+
+    with pytest.raises(ValueError):
+        servicio._parsear_respuesta_lote('[{"monto": 1}]', 2)
+
+
+@pytest.mark.asyncio
+async def test_lote_fallido_lee_uno_por_uno(servicio, archivos):
+    individuales = AsyncMock(side_effect=lambda ruta, mime: {"monto": ruta})
+
+    with patch.object(servicio, '_crear_chat') as crear_chat, \
+         patch.object(servicio, '_leer_comprobante_llm', individuales):
+        crear_chat.return_value.send_message_multimodal_response = AsyncMock(return_value=("no es json", None))
+        resultados = await servicio.leer_comprobantes_lote(archivos[:3])
+
+    assert [r["monto"] for r in resultados] == [a[0] for a in archivos[:3]]
+    assert individuales.await_count == 3
+    assert servicio.estadisticas_lote["lotes_fallidos"] == 1
+
+
+@pytest.mark.asyncio
+async def test_lote_una_solicitud_y_cache(servicio, archivos):
+    respuesta = '[{"documento": 1, "monto": 1}, {"documento": 2, "monto": 2}]'
+    servicio_cache = {"hash_0": {"monto": 0}}
+
+    with patch('ocr_service.ocr_cache_service.obtener', AsyncMock(side_effect=lambda h, v: servicio_cache.get(h))), \
+         patch.object(servicio, '_crear_chat') as crear_chat:
+        enviar = AsyncMock(return_value=(respuesta, None))
+        crear_chat.return_value.send_message_multimodal_response = enviar
+        resultados = await servicio.leer_comprobantes_lote(archivos[:3])
+
+    assert resultados == [{"monto": 0}, {"monto": 1}, {"monto": 2}]
+    enviar.assert_awaited_once()
+    stats = servicio.obtener_estadisticas_lote()
+    assert stats["lotes_enviados"] == 1
+    assert stats["solicitudes_ahorradas"] == 1
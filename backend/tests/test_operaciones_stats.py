@@ -0,0 +1,130 @@
+"""
+Tests de las estadísticas del tablero (operaciones_stats_service)
+
+Verifica que:
+1. Una sola agregación une ambas colecciones y traduce estados de Telegram
+2. Los filtros de cliente (id_cliente en web, cliente_id en Telegram) y fecha se aplican en cada rama
+3. El resumen agrupa por estado, origen y etapa del Dashboard
+4. El caché responde dentro del TTL y se descarta al invalidar
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import operaciones_stats_service as modulo
+from operaciones_stats_service import OperacionesStatsService, _estado_telegram_a_web
+from operaciones_unificadas_service import ESTADOS_SOLICITUD_A_OPERACION
+
+GRUPOS = [
+    {"_id": {"estado": "COMPLETADO", "origen": "web"}, "cantidad": 3, "monto_depositado": 3000.0, "comision": 30.0},
+    {"_id": {"estado": "COMPLETADO", "origen": "telegram"}, "cantidad": 2, "monto_depositado": 1500.5, "comision": 15.0},
+    {"_id": {"estado": "ESPERANDO_TESORERIA", "origen": "telegram"}, "cantidad": 1, "monto_depositado": 800.0,
+     "comision": None},
+    {"_id": {"estado": "ESPERANDO_COMPROBANTES", "origen": "web"}, "cantidad": 4, "monto_depositado": 0,
+     "comision": 0},
+]
+
+
+@pytest.fixture
+def coleccion():
+    coleccion = MagicMock()
+    coleccion.aggregate.return_value.to_list = AsyncMock(return_value=GRUPOS)
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = coleccion
+    with patch.object(modulo, 'db', mock_db):
+        yield coleccion
+
+
+def test_switch_equivale_al_mapeo_de_estados():
+    ramas = _estado_telegram_a_web()["$switch"]["branches"]
+    for estado_telegram, estado_web in ESTADOS_SOLICITUD_A_OPERACION.items():
+        assert [r["then"] for r in ramas if estado_telegram in r["case"]["$in"][1]] == [estado_web]
+    assert _estado_telegram_a_web()["$switch"]["default"] == "ESPERANDO_COMPROBANTES"
+
+
+def test_pipeline_une_ambas_colecciones_con_filtros():
+    desde = datetime(2025, 3, 1, tzinfo=timezone.utc)
+    coleccion, pipeline = OperacionesStatsService().construir_pipeline(
+        {"cliente_id": "cli_001", "desde": desde, "hasta": None}
+    )
+
+    assert coleccion == "operaciones"
+    assert pipeline[0] == {"$match": {"id_cliente": "cli_001", "fecha_creacion": {"$gte": "2025-03-01T00:00:00"}}}
+    assert {"$match": {"_fecha": {"$gte": desde}}} in pipeline
+    union = next(e["$unionWith"] for e in pipeline if "$unionWith" in e)
+    assert union["coll"] == "solicitudes_netcash"
+    assert union["pipeline"][0] == {"$match": {"cliente_id": "cli_001", "created_at": {"$gte": desde}}}
+    assert pipeline[-1]["$group"]["_id"] == {"estado": "$estado", "origen": "$origen"}
+
+    # Sin filtros la rama web no convierte fechas
+    _, pipeline = OperacionesStatsService().construir_pipeline({})
+    assert pipeline[0] == {"$match": {}}
+    assert not any("$addFields" in etapa for etapa in pipeline)
+
+
+@pytest.mark.asyncio
+async def test_resumen_por_estado_origen_y_etapa(coleccion):
+    resultado = await OperacionesStatsService().obtener()
+
+    assert resultado["total"] == 10
+    assert resultado["monto_depositado"] == 5300.5
+    assert resultado["comision"] == 45.0
+    assert resultado["por_estado"]["COMPLETADO"] == {"cantidad": 5, "monto_depositado": 4500.5, "comision": 45.0}
+    assert resultado["por_origen"] == {"web": 7, "telegram": 3}
+    assert resultado["por_etapa"] == {"pendientes": 4, "en_proceso": 1, "completadas": 5}
+    assert resultado["desde_cache"] is False
+
+
+@pytest.mark.asyncio
+async def test_stats_de_cliente_cuentan_sus_operaciones_web(coleccion):
+    coleccion.aggregate.return_value.to_list = AsyncMock(return_value=GRUPOS[:2])
+
+    resultado = await OperacionesStatsService().obtener(cliente_id="cli_001")
+
+    pipeline = coleccion.aggregate.call_args.args[0]
+    assert pipeline[0]["$match"] == {"id_cliente": "cli_001"}
+    assert resultado["por_origen"] == {"web": 3, "telegram": 2}
+    assert resultado["total"] == 5 and resultado["monto_depositado"] == 4500.5
+
+
+@pytest.mark.asyncio
+async def test_cache_e_invalidacion(coleccion):
+    servicio = OperacionesStatsService()
+    servicio.cache_segundos = 60
+
+    await servicio.obtener(cliente_id="cli_001")
+    assert (await servicio.obtener(cliente_id="cli_001"))["desde_cache"] is True
+    # Otro filtro es otra entrada
+    await servicio.obtener(cliente_id="cli_002")
+    assert coleccion.aggregate.call_count == 2
+
+    servicio.invalidar()
+    assert (await servicio.obtener(cliente_id="cli_001"))["desde_cache"] is False
+    assert servicio.obtener_estadisticas()["calculos"] == 3
+
+
+@pytest.mark.asyncio
+async def test_calculo_invalidado_en_vuelo_no_se_guarda(coleccion):
+    servicio = OperacionesStatsService()
+    servicio.cache_segundos = 60
+    liberar = asyncio.Event()
+
+    async def lenta(_):
+        await liberar.wait()
+        return GRUPOS
+    coleccion.aggregate.return_value.to_list = AsyncMock(side_effect=lenta)
+
+    calculo = asyncio.create_task(servicio.obtener())
+    await asyncio.sleep(0)
+    servicio.invalidar()
+    liberar.set()
+    await calculo
+
+    assert servicio.obtener_estadisticas()["entradas_cache"] == 0
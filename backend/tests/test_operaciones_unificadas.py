@@ -0,0 +1,158 @@
+"""
+Tests del listado unificado de operaciones (operaciones_unificadas_service)
+
+Verifica que:
+1. El filtro por estado web se traduce a los estados de Telegram (incluido el default)
+2. El cursor se codifica/decodifica y uno inválido se rechaza
+3. La agregación une ambas colecciones ($unionWith) con orden y límite por rama
+4. La vista "lista" proyecta sin ocr_data y el cursor se aplica con índice en cada rama
+5. listar() normaliza solo la página y devuelve el siguiente cursor si hay más
+6. El filtro por cliente usa id_cliente en operaciones web y cliente_id en Telegram
+"""
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import operaciones_unificadas_service as modulo
+from operaciones_unificadas_service import (
+    CursorInvalido, OperacionesUnificadasService, PROYECCION_LISTA_WEB, VISTA_LISTA,
+    codificar_cursor, condicion_estado_telegram, decodificar_cursor
+)
+
+FECHA = datetime(2025, 3, 1, 12, 30, 15, 250000, tzinfo=timezone.utc)
+
+
+def test_estado_web_a_estados_telegram():
+    condicion = condicion_estado_telegram(["DATOS_COMPLETOS", "ESPERANDO_CODIGO_SISTEMA"])
+    assert set(condicion["$in"]) == {"lista_para_mbc", "LISTA_PARA_MBC", "lista_para_mbco",
+                                     "orden_interna_generada", "ORDEN_INTERNA_GENERADA"}
+
+    # Estados desconocidos se muestran como ESPERANDO_COMPROBANTES: se filtra por exclusión
+    condicion = condicion_estado_telegram(["ESPERANDO_COMPROBANTES"])
+    assert "borrador" not in condicion["$nin"]
+    assert "completada" in condicion["$nin"]
+
+
+def test_cursor_ida_y_vuelta():
+    assert decodificar_cursor(codificar_cursor(FECHA, "nc-1")) == (FECHA, "nc-1")
+    assert decodificar_cursor(codificar_cursor(FECHA.replace(tzinfo=None), "op-1")) == (FECHA, "op-1")
+    assert decodificar_cursor(codificar_cursor(None, "op-2")) == (None, "op-2")
+    with pytest.raises(CursorInvalido):
+        decodificar_cursor("no-es-un-cursor")
+
+
+def test_pipeline_une_ambas_colecciones():
+    servicio = OperacionesUnificadasService()
+    coleccion, pipeline = servicio.construir_pipeline({"estados": ["COMPLETADO"]}, 20)
+
+    assert coleccion == "operaciones"
+    assert pipeline[0] == {"$match": {"estado": {"$in": ["COMPLETADO"]}}}
+    assert pipeline[1] == {"$sort": {"fecha_creacion": -1, "id": -1}}
+    assert {"$limit": 21} in pipeline[:-3]
+
+    union = pipeline[-3]["$unionWith"]
+    assert union["coll"] == "solicitudes_netcash"
+    assert set(union["pipeline"][0]["$match"]["estado"]["$in"]) == {"completada", "dispersada_proveedor",
+                                                                    "DISPERSADA_PROVEEDOR"}
+    assert union["pipeline"][1:3] == [{"$sort": {"created_at": -1, "id": -1}}, {"$limit": 21}]
+    assert pipeline[-2:] == [{"$sort": {"_fecha": -1, "id": -1}}, {"$limit": 21}]
+
+
+def test_pipeline_un_solo_origen_y_vista_lista():
+    servicio = OperacionesUnificadasService()
+    coleccion, pipeline = servicio.construir_pipeline({"origen": "telegram", "cliente_id": "cli_001"}, 10,
+                                                      vista=VISTA_LISTA)
+
+    assert coleccion == "solicitudes_netcash"
+    assert not any("$unionWith" in etapa for etapa in pipeline)
+    assert pipeline[0] == {"$match": {"cliente_id": "cli_001"}}
+    proyeccion = pipeline[3]["$project"]
+    assert proyeccion["comprobantes.monto_detectado"] == 1
+    assert not any(campo.startswith("comprobantes.ocr_data") for campo in proyeccion)
+    assert "comprobantes.ocr_data" not in PROYECCION_LISTA_WEB
+
+
+def test_pipeline_con_cursor():
+    servicio = OperacionesUnificadasService()
+    _, pipeline = servicio.construir_pipeline({}, 10, cursor=(FECHA, "m"))
+
+    # Web: cota de texto al segundo siguiente (usa el índice) y comparación exacta sobre la fecha convertida
+    previo = pipeline[0]["$match"]
+    assert previo["$or"] == [{"fecha_creacion": {"$lt": "2025-03-01T12:30:16"}}, {"fecha_creacion": None}]
+    exacto = next(e["$match"] for e in pipeline[1:] if "$match" in e)
+    assert {"_fecha": FECHA, "id": {"$lt": "m"}} in exacto["$or"]
+
+    # Telegram: el cursor va directo sobre created_at
+    filtro_telegram = pipeline[-3]["$unionWith"]["pipeline"][0]["$match"]
+    assert {"created_at": {"$lt": FECHA}} in filtro_telegram["$and"][0]["$or"]
+
+
+@pytest.mark.asyncio
+async def test_listar_pagina_y_normaliza():
+    documentos = [
+        {"id": "nc-2", "estado": "lista_para_mbc", "created_at": datetime(2025, 3, 3),
+         "comprobantes": [{"monto_detectado": 500.0, "es_valido": True, "archivo_url": "/uploads/a.png"}],
+         "_origen": "telegram", "_fecha": datetime(2025, 3, 3)},
+        {"id": "op-1", "estado": "COMPLETADO", "fecha_creacion": "2025-03-02T10:00:00+00:00",
+         "_origen": "web", "_fecha": datetime(2025, 3, 2, 10)},
+        {"id": "op-0", "estado": "COMPLETADO", "fecha_creacion": "2025-03-01T10:00:00+00:00",
+         "_origen": "web", "_fecha": datetime(2025, 3, 1, 10)},
+    ]
+    coleccion = MagicMock()
+    coleccion.aggregate.return_value.to_list = AsyncMock(return_value=documentos)
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = coleccion
+
+    with patch.object(modulo, 'db', mock_db):
+        resultado = await OperacionesUnificadasService().listar(limite=2)
+
+    operaciones = resultado["operaciones"]
+    assert [op["id"] for op in operaciones] == ["nc-2", "op-1"]
+    assert operaciones[0]["estado"] == "DATOS_COMPLETOS"
+    assert operaciones[0]["monto_depositado_cliente"] == 500.0
+    assert operaciones[0]["comprobantes"][0]["file_url"] == "/api/uploads/a.png"
+    assert operaciones[1]["fecha_creacion"] == datetime(2025, 3, 2, 10, tzinfo=timezone.utc)
+    assert operaciones[1]["origen"] == "web"
+    assert not any("_origen" in op or "_fecha" in op for op in operaciones)
+
+    fecha, operacion_id = decodificar_cursor(resultado["siguiente_cursor"])
+    assert (fecha, operacion_id) == (datetime(2025, 3, 2, 10, tzinfo=timezone.utc), "op-1")
+
+
+@pytest.mark.asyncio
+async def test_filtro_por_cliente_incluye_operaciones_web():
+    documentos = [
+        {"id": "nc-1", "cliente_id": "cli_001", "estado": "borrador", "created_at": datetime(2025, 3, 3),
+         "_origen": "telegram", "_fecha": datetime(2025, 3, 3)},
+        {"id": "op-1", "id_cliente": "cli_001", "estado": "COMPLETADO",
+         "fecha_creacion": "2025-03-02T10:00:00+00:00", "_origen": "web", "_fecha": datetime(2025, 3, 2, 10)},
+    ]
+    coleccion = MagicMock()
+    coleccion.aggregate.return_value.to_list = AsyncMock(return_value=documentos)
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = coleccion
+
+    with patch.object(modulo, 'db', mock_db):
+        resultado = await OperacionesUnificadasService().listar(cliente_id="cli_001", vista=VISTA_LISTA)
+
+    pipeline = coleccion.aggregate.call_args.args[0]
+    assert pipeline[0] == {"$match": {"id_cliente": "cli_001"}}
+    assert pipeline[-3]["$unionWith"]["pipeline"][0]["$match"] == {"cliente_id": "cli_001"}
+    assert PROYECCION_LISTA_WEB["id_cliente"] == 1
+    assert [op["id"] for op in resultado["operaciones"]] == ["nc-1", "op-1"]
+    assert resultado["operaciones"][1]["id_cliente"] == "cli_001"
+
+
+@pytest.mark.asyncio
+async def test_listar_rechaza_parametros_invalidos():
+    servicio = OperacionesUnificadasService()
+    with pytest.raises(ValueError):
+        await servicio.listar(origen="email")
+    with pytest.raises(CursorInvalido):
+        await servicio.listar(cursor="%%%")
@@ -0,0 +1,217 @@
+"""
+Tests de la vista materializada operaciones_view (operaciones_view_service)
+
+Verifica que:
+1. El documento de la vista es la estructura normalizada + campos de control
+2. Los eventos del change stream insertan, reemplazan o borran por _id
+3. La reconstrucción materializa todo y quita documentos sin origen
+4. El verificador detecta faltantes, sobrantes y diferentes
+5. Sin replica set la vista queda inactiva y los endpoints leen del origen
+6. El listado desde la vista filtra por estado normalizado y pagina con cursor
+7. Las operaciones web llevan cliente_id (de id_cliente) y un cambio de versión reconstruye la vista
+"""
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import operaciones_view_service as modulo
+from operaciones_unificadas_service import decodificar_cursor
+from operaciones_view_service import OperacionesViewService, documento_vista
+
+ID_WEB = ObjectId()
+ID_TELEGRAM = ObjectId()
+
+OPERACION_WEB = {"_id": ID_WEB, "id": "op-1", "estado": "COMPLETADO",
+                 "fecha_creacion": "2025-03-01T10:00:00+00:00", "comprobantes": []}
+SOLICITUD = {"_id": ID_TELEGRAM, "id": "nc-1", "cliente_id": "cli_001", "estado": "lista_para_mbc",
+             "created_at": datetime(2025, 3, 2, 9, 0),
+             "comprobantes": [{"monto_detectado": 700.0, "es_valido": True}]}
+CLIENTE = {"id": "cli_001", "email": "cliente@example.com", "propietario": "Ana"}
+
+
+def _cursor(documentos):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=[dict(d) for d in documentos])
+
+    async def iterar():
+        for documento in documentos:
+            yield dict(documento)
+    cursor.__aiter__ = lambda self: iterar()
+    return cursor
+
+
+@pytest.fixture
+def colecciones():
+    return {}
+
+
+@pytest.fixture
+def servicio(colecciones):
+    def coleccion(nombre):
+        if nombre not in colecciones:
+            col = MagicMock()
+            col.find = MagicMock(return_value=_cursor([]))
+            col.find_one = AsyncMock(return_value=None)
+            col.replace_one = AsyncMock()
+            col.delete_one = AsyncMock()
+            col.delete_many = AsyncMock(return_value=MagicMock(deleted_count=1))
+            col.bulk_write = AsyncMock()
+            col.distinct = AsyncMock(return_value=[])
+            colecciones[nombre] = col
+        return colecciones[nombre]
+
+    mock_db = MagicMock()
+    mock_db.__getitem__.side_effect = coleccion
+    with patch.object(modulo, 'db', mock_db):
+        yield OperacionesViewService()
+
+
+def _origenes():
+    modulo.db["operaciones"].find.return_value = _cursor([OPERACION_WEB])
+    modulo.db["solicitudes_netcash"].find.return_value = _cursor([SOLICITUD])
+    modulo.db["clientes"].find.return_value = _cursor([CLIENTE])
+
+
+def test_documento_vista_normalizado():
+    web = documento_vista("operaciones", dict(OPERACION_WEB))
+    assert web["_id"] == ID_WEB
+    assert web["coleccion_origen"] == "operaciones"
+    assert web["fecha_orden"] == datetime(2025, 3, 1, 10, tzinfo=timezone.utc)
+    assert web["origen"] == "web"
+
+    telegram = documento_vista("solicitudes_netcash", dict(SOLICITUD), CLIENTE)
+    assert telegram["estado"] == "DATOS_COMPLETOS"
+    assert telegram["monto_depositado_cliente"] == 700.0
+    assert telegram["cliente_email"] == "cliente@example.com"
+    assert telegram["origen_operacion"] == "telegram"
+    assert telegram["fecha_orden"] == datetime(2025, 3, 2, 9, tzinfo=timezone.utc)
+
+
+@pytest.mark.asyncio
+async def test_eventos_del_change_stream(servicio, colecciones):
+    modulo.db["clientes"].find_one.return_value = CLIENTE
+
+    await servicio.aplicar_cambio({"operationType": "update", "ns": {"coll": "solicitudes_netcash"},
+                                   "documentKey": {"_id": ID_TELEGRAM}, "fullDocument": dict(SOLICITUD)})
+    filtro, documento = colecciones["operaciones_view"].replace_one.await_args.args
+    assert filtro == {"_id": ID_TELEGRAM}
+    assert documento["propietario"] == "Ana"
+    assert colecciones["operaciones_view"].replace_one.await_args.kwargs == {"upsert": True}
+
+    # Borrado, o actualización de un documento que ya no existe
+    await servicio.aplicar_cambio({"operationType": "delete", "ns": {"coll": "operaciones"},
+                                   "documentKey": {"_id": ID_WEB}})
+    await servicio.aplicar_cambio({"operationType": "update", "ns": {"coll": "operaciones"},
+                                   "documentKey": {"_id": ID_WEB}, "fullDocument": None})
+    assert [c.args[0] for c in colecciones["operaciones_view"].delete_one.await_args_list] == [{"_id": ID_WEB}] * 2
+
+    # Cambio en la ficha del cliente: se re-materializan sus solicitudes
+    modulo.db["solicitudes_netcash"].find.return_value = _cursor([SOLICITUD])
+    await servicio.aplicar_cambio({"operationType": "update", "ns": {"coll": "clientes"},
+                                   "documentKey": {"_id": ObjectId()}, "fullDocument": CLIENTE})
+    assert modulo.db["solicitudes_netcash"].find.call_args.args[0] == {"cliente_id": "cli_001"}
+    colecciones["operaciones_view"].bulk_write.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_reconstruir_quita_sobrantes(servicio, colecciones):
+    _origenes()
+    huerfano = ObjectId()
+    modulo.db["operaciones_view"].distinct.return_value = [ID_WEB, huerfano]
+
+    resumen = await servicio.reconstruir()
+
+    assert resumen == {"materializadas": 2, "eliminadas": 1}
+    reemplazos = colecciones["operaciones_view"].bulk_write.await_args.args[0]
+    assert [r._filter for r in reemplazos] == [{"_id": ID_WEB}, {"_id": ID_TELEGRAM}]
+    assert reemplazos[1]._doc["cliente_email"] == "cliente@example.com"
+    filtro = colecciones["operaciones_view"].delete_many.await_args.args[0]
+    assert filtro == {"_id": {"$in": [huerfano]}}
+
+
+@pytest.mark.asyncio
+async def test_verificar_consistencia(servicio, colecciones):
+    _origenes()
+    correcto = modulo._como_bson(documento_vista("operaciones", dict(OPERACION_WEB)))
+    desactualizado = modulo._como_bson(documento_vista("solicitudes_netcash", dict(SOLICITUD), CLIENTE))
+    desactualizado["estado"] = "ESPERANDO_COMPROBANTES"
+    sobrante = {"_id": ObjectId(), "id": "op-borrada", "coleccion_origen": "operaciones"}
+    modulo.db["operaciones_view"].find.return_value = _cursor([correcto, desactualizado, sobrante])
+
+    resultado = await servicio.verificar_consistencia()
+
+    assert resultado["revisadas"] == 2
+    assert (resultado["faltantes"], resultado["sobrantes"], resultado["diferentes"]) == (0, 1, 1)
+    assert resultado["ejemplos"]["diferentes"] == [
+        {"id": "nc-1", "coleccion_origen": "solicitudes_netcash", "campos": ["estado"]}
+    ]
+    assert resultado["consistente"] is False
+
+
+@pytest.mark.asyncio
+async def test_sin_replica_set_lectura_directa(servicio, colecciones):
+    stream = MagicMock()
+    stream.__aenter__ = AsyncMock(side_effect=OperationFailure("only supported on replica sets", code=40573))
+    stream.__aexit__ = AsyncMock(return_value=False)
+    modulo.db.watch = MagicMock(return_value=stream)
+
+    await servicio._ejecutar()
+
+    assert servicio.activa is False
+    assert servicio.obtener_estadisticas()["modo"] == "lectura_directa"
+
+
+@pytest.mark.asyncio
+async def test_listar_desde_la_vista(servicio, colecciones):
+    documentos = [
+        {"id": "nc-2", "estado": "DATOS_COMPLETOS", "origen": "telegram",
+         "fecha_creacion": datetime(2025, 3, 3), "fecha_orden": datetime(2025, 3, 3)},
+        {"id": "op-1", "estado": "DATOS_COMPLETOS", "origen": "web",
+         "fecha_creacion": datetime(2025, 3, 2), "fecha_orden": datetime(2025, 3, 2)},
+        {"id": "op-0", "estado": "DATOS_COMPLETOS", "origen": "web",
+         "fecha_creacion": datetime(2025, 3, 1), "fecha_orden": datetime(2025, 3, 1)},
+    ]
+    modulo.db["operaciones_view"].find.return_value = _cursor(documentos)
+
+    resultado = await servicio.listar(estados=["DATOS_COMPLETOS"], origen="web", limite=2, vista="lista")
+
+    filtro, proyeccion = colecciones["operaciones_view"].find.call_args.args
+    assert filtro == {"estado": {"$in": ["DATOS_COMPLETOS"]}, "coleccion_origen": "operaciones"}
+    assert proyeccion["fecha_orden"] == 1 and "comprobantes.ocr_data" not in proyeccion
+    operaciones = resultado["operaciones"]
+    assert [op["id"] for op in operaciones] == ["nc-2", "op-1"]
+    assert operaciones[0]["fecha_creacion"].tzinfo is None
+    assert operaciones[1]["fecha_creacion"] == datetime(2025, 3, 2, tzinfo=timezone.utc)
+    assert all("fecha_orden" not in op for op in operaciones)
+    assert decodificar_cursor(resultado["siguiente_cursor"]) == (datetime(2025, 3, 2, tzinfo=timezone.utc), "op-1")
+
+
+@pytest.mark.asyncio
+async def test_cliente_id_web_y_version_de_la_vista(servicio, colecciones):
+    web = documento_vista("operaciones", {**OPERACION_WEB, "id_cliente": "cli_001"})
+    assert web["cliente_id"] == "cli_001" and web["id_cliente"] == "cli_001"
+    assert modulo.PROYECCION_LISTA_VISTA["cliente_id"] == 1
+
+    await servicio.listar(cliente_id="cli_001")
+    assert colecciones["operaciones_view"].find.call_args.args[0] == {"cliente_id": "cli_001"}
+
+    # Token de una versión anterior de la vista: se ignora y se reconstruye
+    estado = colecciones.setdefault("operaciones_view_estado", MagicMock())
+    estado.find_one = AsyncMock(return_value={"_id": "change_stream", "resume_token": {"_data": "x"}})
+    assert await servicio._token_guardado() is None
+    estado.find_one.return_value["version"] = modulo.VERSION_VISTA
+    assert await servicio._token_guardado() == {"_data": "x"}
+
+    estado.update_one = AsyncMock()
+    await servicio._guardar_token({"_data": "y"})
+    assert estado.update_one.await_args.args[1]["$set"]["version"] == modulo.VERSION_VISTA
@@ -0,0 +1,128 @@
+"""
+Tests del procesamiento concurrente y el webhook del bot (telegram_webhook_service)
+
+Verifica que:
+1. Updates de chats distintos se procesan a la vez; los de un mismo chat en orden
+2. El límite global acota los updates en curso
+3. El webhook valida el secret token, responde 503 sin bot y encola el update
+4. El reproductor clona la secuencia por usuario con ids desplazados
+"""
+import asyncio
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+from telegram import Update
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from telegram_webhook_service import ProcesadorPorChat, TelegramWebhookService, clave_de_orden
+from telegram_replay import DESPLAZAMIENTO_USUARIO, secuencias_por_usuario
+
+
+def _datos_update(update_id: int, chat_id: int, texto: str = "hola"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": texto,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Cliente"},
+        },
+    }
+
+
+def _update(update_id: int, chat_id: int) -> Update:
+    return Update.de_json(_datos_update(update_id, chat_id), None)
+
+
+def test_clave_de_orden():
+    assert clave_de_orden(_update(1, 55)) == (55, 55)
+    assert clave_de_orden(object()) is None
+
+
+@pytest.mark.asyncio
+async def test_orden_por_chat_y_concurrencia_entre_chats():
+    procesador = ProcesadorPorChat(max_concurrencia=4, max_pendientes=100)
+    liberar_lento = asyncio.Event()
+    eventos = []
+
+    async def handler(nombre, esperar=None):
+        eventos.append(f"inicio {nombre}")
+        if esperar:
+            await esperar.wait()
+        eventos.append(f"fin {nombre}")
+
+    tareas = [
+        asyncio.create_task(procesador.process_update(_update(1, 10), handler("10-a", liberar_lento))),
+        asyncio.create_task(procesador.process_update(_update(2, 10), handler("10-b"))),
+        asyncio.create_task(procesador.process_update(_update(3, 20), handler("20-a"))),
+    ]
+    await asyncio.sleep(0.01)
+
+    # El chat 20 no espera al OCR lento del chat 10; el segundo update del chat 10 sí
+    assert "fin 20-a" in eventos
+    assert "inicio 10-b" not in eventos
+    assert procesador.obtener_estadisticas()["esperaron_turno"] == 1
+
+    liberar_lento.set()
+    await asyncio.gather(*tareas)
+    assert eventos.index("fin 10-a") < eventos.index("inicio 10-b")
+    assert procesador.obtener_estadisticas()["chats_activos"] == 0
+
+
+@pytest.mark.asyncio
+async def test_limite_global():
+    procesador = ProcesadorPorChat(max_concurrencia=2, max_pendientes=100)
+
+    async def handler():
+        await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[procesador.process_update(_update(i, 100 + i), handler()) for i in range(6)])
+
+    estadisticas = procesador.obtener_estadisticas()
+    assert estadisticas["maximo_en_curso"] == 2
+    assert estadisticas["procesados"] == 6 and estadisticas["en_curso"] == 0
+
+
+@pytest.mark.asyncio
+async def test_webhook_secreto_y_encolado(tmp_path):
+    servicio = TelegramWebhookService()
+    servicio.secreto = "s3creto"
+    servicio.archivo_grabacion = str(tmp_path / "updates.jsonl")
+
+    with pytest.raises(HTTPException) as error:
+        servicio.verificar_secreto("otro")
+    assert error.value.status_code == 403
+    servicio.verificar_secreto("s3creto")
+
+    with pytest.raises(HTTPException) as error:
+        await servicio.recibir(_datos_update(1, 10))
+    assert error.value.status_code == 503
+
+    application = MagicMock()
+    application.running = True
+    application.bot = None
+    application.update_queue = asyncio.Queue()
+    servicio.application = application
+
+    await servicio.recibir(_datos_update(7, 10))
+
+    encolado = application.update_queue.get_nowait()
+    assert isinstance(encolado, Update) and encolado.update_id == 7
+    assert (tmp_path / "updates.jsonl").read_text().count("\n") == 1
+    assert servicio.obtener_estadisticas()["recibidos"] == 1
+
+
+def test_reproductor_clona_por_usuario():
+    grabados = [_datos_update(500, 42, "hola"), _datos_update(501, 42, "1")]
+
+    secuencias = secuencias_por_usuario(grabados, usuarios=2)
+
+    assert [[u["update_id"] for u in s] for s in secuencias] == [[1, 2], [3, 4]]
+    segundo = secuencias[1][0]["message"]
+    assert segundo["chat"]["id"] == 42 + DESPLAZAMIENTO_USUARIO
+    assert segundo["from"]["id"] == 42 + DESPLAZAMIENTO_USUARIO
+    assert grabados[0]["message"]["chat"]["id"] == 42
@@ -0,0 +1,144 @@
+"""
+Tests de la persistencia del bot en MongoDB (telegram_persistencia_service)
+
+Verifica que:
+1. Los cambios de una pasada se escriben en un solo bulk_write; sin cambios no se reescribe
+2. user_data se carga una sola vez por usuario (caché) y no pisa lo que ya hay en memoria
+3. Las conversaciones se guardan, se borran al terminar y se restauran con claves tupla
+4. Datos que BSON no representa se guardan en pickle
+5. flush escribe lo pendiente al detener el bot
+"""
+import asyncio
+import sys
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pymongo import DeleteOne, UpdateOne
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from telegram_persistencia_service import MongoPersistence, _desempacar, _empacar
+
+
+def _db_falsa(coleccion):
+    db = MagicMock()
+    db.__getitem__.return_value = coleccion
+    return db
+
+
+def _coleccion(documento=None, documentos=()):
+    coleccion = MagicMock()
+    coleccion.bulk_write = AsyncMock()
+    coleccion.find_one = AsyncMock(return_value=documento)
+
+    async def iterar():
+        for doc in documentos:
+            yield doc
+
+    cursor = MagicMock()
+    cursor.__aiter__ = lambda self: iterar()
+    coleccion.find = MagicMock(return_value=cursor)
+    return coleccion
+
+
+@pytest.mark.asyncio
+async def test_una_pasada_un_lote_y_sin_cambios_no_reescribe():
+    coleccion = _coleccion()
+    persistencia = MongoPersistence(ttl_minutos=31)
+
+    with patch("telegram_persistencia_service.db", _db_falsa(coleccion)):
+        await asyncio.gather(
+            persistencia.update_user_data(1, {"nc_solicitud_id": "s1"}),
+            persistencia.update_user_data(2, {"ana_solicitud_id_actual": "s2"}),
+            persistencia.update_conversation("netcash", (1, 1), 3),
+        )
+        await persistencia.flush()
+
+        assert coleccion.bulk_write.await_count == 1
+        operaciones = coleccion.bulk_write.await_args.args[0]
+        assert len(operaciones) == 3 and all(isinstance(op, UpdateOne) for op in operaciones)
+        cambios = operaciones[0]._doc["$set"]
+        assert cambios["datos"] == {"nc_solicitud_id": "s1"}
+        assert cambios["expira_en"] > datetime.now(timezone.utc)
+
+        # Misma información en la siguiente pasada: nada que escribir
+        await persistencia.update_user_data(1, {"nc_solicitud_id": "s1"})
+        await persistencia.flush()
+        assert coleccion.bulk_write.await_count == 1
+        assert persistencia.obtener_estadisticas()["omitidas"] == 1
+
+
+@pytest.mark.asyncio
+async def test_carga_perezosa_con_cache():
+    documento = {"_id": "usuario:7", "datos": {"nc_solicitud_id": "s7", "nc_paso_actual": "ligas"}}
+    coleccion = _coleccion(documento=documento)
+    persistencia = MongoPersistence(ttl_minutos=31)
+
+    with patch("telegram_persistencia_service.db", _db_falsa(coleccion)):
+        assert await persistencia.get_user_data() == {}
+
+        user_data = {}
+        await persistencia.refresh_user_data(7, user_data)
+        await persistencia.refresh_user_data(7, user_data)
+        assert user_data == documento["datos"]
+        assert coleccion.find_one.await_count == 1
+
+        # Un usuario que ya tiene datos en memoria no se lee de MongoDB
+        en_memoria = {"nc_solicitud_id": "nuevo"}
+        await persistencia.refresh_user_data(8, en_memoria)
+        assert en_memoria == {"nc_solicitud_id": "nuevo"}
+        assert coleccion.find_one.await_count == 1
+
+        # La sesión restaurada se renueva con la primera pasada aunque no cambie
+        await persistencia.update_user_data(7, dict(documento["datos"]))
+        await persistencia.flush()
+        assert coleccion.bulk_write.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_conversaciones_se_borran_y_se_restauran():
+    coleccion = _coleccion(documentos=[{"clave": [10, 10], "estado": 4}, {"clave": [20, 21], "estado": 0}])
+    persistencia = MongoPersistence(ttl_minutos=31)
+
+    with patch("telegram_persistencia_service.db", _db_falsa(coleccion)):
+        await persistencia.update_conversation("netcash", (10, 10), 4)
+        await persistencia.update_conversation("netcash", (10, 10), None)
+        await persistencia.flush()
+        operaciones = coleccion.bulk_write.await_args.args[0]
+        # La última operación sobre la misma clave gana
+        assert len(operaciones) == 1 and isinstance(operaciones[0], DeleteOne)
+
+        restauradas = await persistencia.get_conversations("netcash")
+        assert restauradas == {(10, 10): 4, (20, 21): 0}
+        filtro = coleccion.find.call_args.args[0]
+        assert filtro["nombre"] == "netcash" and "$gt" in filtro["expira_en"]
+
+
+def test_datos_no_bson_van_en_pickle():
+    simples = {"beneficiarios_lista": {"1": {"nombre": "X"}}}
+    assert _empacar(simples)["datos"] == simples
+
+    raros = {"montos": {1: Decimal("10.50")}}
+    empacado = _empacar(raros)
+    assert empacado["datos"] is None
+    assert _desempacar(empacado) == raros
+
+
+@pytest.mark.asyncio
+async def test_error_al_escribir_se_reintenta_en_flush():
+    coleccion = _coleccion()
+    coleccion.bulk_write = AsyncMock(side_effect=[Exception("sin conexión"), None])
+    persistencia = MongoPersistence(ttl_minutos=31)
+
+    with patch("telegram_persistencia_service.db", _db_falsa(coleccion)):
+        await persistencia.update_user_data(1, {"nc_paso_actual": "idmex"})
+        await asyncio.sleep(0.01)
+        assert persistencia.obtener_estadisticas()["pendientes"] == 1
+
+        await persistencia.flush()
+        assert coleccion.bulk_write.await_count == 2
+        assert persistencia.obtener_estadisticas()["pendientes"] == 0
@@ -0,0 +1,132 @@
+"""
+Tests del caché de texto extraído (texto_extraido_cache_service)
+
+Verifica que:
+1. Un PDF se parsea una sola vez aunque se valide varias veces
+2. Las entradas sobreviven al proceso (nivel disco) e incluyen el banco detectado
+3. El disco se mantiene dentro del límite desalojando las entradas menos usadas
+4. Los errores de extracción no se cachean
+5. El validador de pagos de Tesorería y el validador async comparten el caché
+"""
+import os
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import texto_extraido_cache_service as modulo
+from comprobante_pago_validator_service import ComprobantePagoValidatorService
+from extraccion_texto_service import extraer_paginas_pdf
+from texto_extraido_cache_service import TextoExtraidoCacheService, calcular_hash_archivo
+from validador_comprobantes_service import ValidadorComprobantes
+
+
+CUENTA_ACTIVA = {
+    "banco": "STP",
+    "clabe": "646180139409481462",
+    "beneficiario": "JARDINERIA Y COMERCIO THABYETHA SA DE CV"
+}
+
+
+@pytest.fixture
+def pdf_comprobante(tmp_path):
+    from reportlab.pdfgen import canvas
+
+    ruta = tmp_path / "comprobante_bbva.pdf"
+    c = canvas.Canvas(str(ruta))
+    lineas = [
+        "BBVA - TRANSFERENCIA SPEI",
+        "Cuenta destino",
+        "646180139409481462",
+        "Beneficiario",
+        "JARDINERIA Y COMERCIO THABYETHA SA DE CV",
+    ]
+    for i, linea in enumerate(lineas):
+        c.drawString(72, 750 - i * 20, linea)
+    c.save()
+    return ruta
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('TEXTO_CACHE_DIR', str(tmp_path / "cache"))
+    servicio = TextoExtraidoCacheService()
+    monkeypatch.setattr(modulo, 'texto_extraido_cache_service', servicio)
+    monkeypatch.setattr('validador_comprobantes_service.texto_extraido_cache_service', servicio)
+    monkeypatch.setattr('comprobante_pago_validator_service.texto_extraido_cache_service', servicio)
+    return servicio
+
+
+def test_pdf_se_parsea_una_vez(cache, pdf_comprobante):
+    validador = ValidadorComprobantes()
+
+    with patch.object(modulo, 'extraer_paginas_pdf', side_effect=extraer_paginas_pdf) as mock_extraer:
+        primero = validador.validar_comprobante(str(pdf_comprobante), "application/pdf", CUENTA_ACTIVA)
+        segundo = validador.validar_comprobante(str(pdf_comprobante), "application/pdf", CUENTA_ACTIVA)
+        texto_pago = ComprobantePagoValidatorService()._extraer_texto_pdf(str(pdf_comprobante))
+
+    assert mock_extraer.call_count == 1
+    assert primero == segundo
+    assert primero[0] is True
+    assert "646180139409481462" in texto_pago
+    assert cache.obtener_estadisticas()["hits_memoria"] == 2
+
+
+def test_nivel_disco_y_banco_detectado(cache, pdf_comprobante):
+    cache.extraer_pdf(str(pdf_comprobante))
+
+    # Nuevo proceso: memoria vacía, mismo directorio
+    otro = TextoExtraidoCacheService()
+    with patch.object(modulo, 'extraer_paginas_pdf') as mock_extraer:
+        entrada = otro.extraer_pdf(str(pdf_comprobante))
+
+    mock_extraer.assert_not_called()
+    assert otro.estadisticas["hits_disco"] == 1
+    assert entrada["banco_detectado"] == "BBVA"
+    assert entrada["file_hash"] == calcular_hash_archivo(str(pdf_comprobante))
+    assert "646180139409481462" in entrada["paginas"][0]
+
+
+def test_desalojo_disco_por_tamano(cache):
+    cache.max_disco_bytes = 2000
+
+    for i in range(20):
+        cache.guardar(f"{i:02d}" + "a" * 62, "pdf", ["x" * 200])
+        # mtime creciente para que el desalojo sea determinista
+        for ruta in cache.directorio.glob(f"*/{i:02d}a*.json"):
+            os.utime(ruta, (i, i))
+
+    archivos = list(cache.directorio.glob("*/*.json"))
+    assert sum(r.stat().st_size for r in archivos) <= 2000
+    assert cache.estadisticas["evicciones_disco"] > 0
+    # Las más recientes sobreviven
+    assert any(r.name.startswith("19") for r in archivos)
+    assert not any(r.name.startswith("00") for r in archivos)
+
+
+def test_error_no_se_cachea(cache, pdf_comprobante):
+    with patch.object(modulo, 'extraer_paginas_pdf', side_effect=ValueError("PDF corrupto")):
+        with pytest.raises(ValueError):
+            cache.extraer_pdf(str(pdf_comprobante))
+
+    assert cache.obtener(calcular_hash_archivo(str(pdf_comprobante)), "pdf") is None
+    assert cache.estadisticas["escrituras"] == 0
+
+
+@pytest.mark.asyncio
+async def test_async_usa_pool_solo_en_miss(cache, pdf_comprobante):
+    paginas = extraer_paginas_pdf(str(pdf_comprobante))
+    pool = AsyncMock()
+    pool.extraer_paginas_pdf = AsyncMock(return_value=paginas)
+
+    with patch.object(modulo, 'extraccion_texto_service', pool):
+        texto_1 = await ComprobantePagoValidatorService()._extraer_texto_pdf_async(str(pdf_comprobante))
+        texto_2 = await ValidadorComprobantes().extraer_texto_pdf_async(str(pdf_comprobante))
+
+    pool.extraer_paginas_pdf.assert_awaited_once()
+    assert "646180139409481462" in texto_1
+    assert "646180139409481462" in texto_2
@@ -0,0 +1,145 @@
+"""
+Tests de la unidad de trabajo de NetCashService (UnidadDeTrabajo)
+
+Verifica que:
+1. Los cambios de varias etapas se combinan en un solo update por solicitud
+2. Con devolver_documento se usa find_one_and_update con la post-imagen
+3. Varias solicitudes se escriben con un solo bulk_write
+4. Procesar una solicitud es una lectura y una escritura (validación, totales,
+   estado e histórico) y la notificación usa la post-imagen
+5. Agregar un comprobante devuelve la solicitud actualizada sin releerla
+"""
+import sys
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from pymongo import ReturnDocument
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+import netcash_service as modulo
+from netcash_service import NetCashService, UnidadDeTrabajo
+
+SOLICITUD = {
+    "id": "nc-1", "cliente_id": "cli_001", "estado": "borrador",
+    "beneficiario_reportado": "JUAN PEREZ LOPEZ", "idmex_reportado": "1234567890",
+    "cantidad_ligas_reportada": 2,
+    "comprobantes": [{"es_valido": True, "monto_detectado": 10000.0}],
+}
+
+
+@pytest.fixture
+def coleccion():
+    coleccion = MagicMock()
+    coleccion.find_one = AsyncMock(return_value=dict(SOLICITUD))
+    coleccion.update_one = AsyncMock()
+    coleccion.find_one_and_update = AsyncMock(return_value={**SOLICITUD, "estado": "lista_para_mbc"})
+    coleccion.bulk_write = AsyncMock()
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = coleccion
+    with patch.object(modulo, 'db', mock_db):
+        yield coleccion
+
+
+@pytest.mark.asyncio
+async def test_combina_operadores_en_un_update(coleccion):
+    unidad = UnidadDeTrabajo()
+    unidad.set("nc-1", {"validacion": {}, "updated_at": 1})
+    unidad.set("nc-1", {"estado": "lista_para_mbc", "updated_at": 2})
+    unidad.push("nc-1", "estado_historico", {"estado": "lista_para_mbc"})
+
+    await unidad.confirmar()
+
+    coleccion.update_one.assert_awaited_once()
+    filtro, update = coleccion.update_one.await_args.args
+    assert filtro == {"id": "nc-1"}
+    assert update == {
+        "$set": {"validacion": {}, "estado": "lista_para_mbc", "updated_at": 2},
+        "$push": {"estado_historico": {"$each": [{"estado": "lista_para_mbc"}]}},
+    }
+
+
+@pytest.mark.asyncio
+async def test_post_imagen_y_bulk_write(coleccion):
+    unidad = UnidadDeTrabajo()
+    unidad.set("nc-1", {"estado": "lista_para_mbc"})
+    documento = await unidad.confirmar(devolver_documento=True)
+
+    assert documento["estado"] == "lista_para_mbc"
+    kwargs = coleccion.find_one_and_update.await_args.kwargs
+    assert kwargs["return_document"] == ReturnDocument.AFTER
+    assert kwargs["projection"] == {"_id": 0}
+
+    varias = UnidadDeTrabajo()
+    varias.set("nc-1", {"estado": "cancelada"})
+    varias.set("nc-2", {"estado": "cancelada"})
+    await varias.confirmar()
+    operaciones = coleccion.bulk_write.await_args.args[0]
+    assert [op._filter for op in operaciones] == [{"id": "nc-1"}, {"id": "nc-2"}]
+
+    # Sin cambios no escribe
+    await UnidadDeTrabajo().confirmar()
+    assert coleccion.update_one.await_count == 0
+
+
+@pytest.mark.asyncio
+async def test_procesar_solicitud_una_lectura_una_escritura(coleccion):
+    servicio = NetCashService()
+    notificar = AsyncMock()
+
+    with patch.object(servicio, '_validar_cliente', AsyncMock(return_value={"valido": True, "razon": "ok"})), \
+         patch.object(servicio, '_notificar_ana_solicitud_lista', notificar), \
+         patch.object(modulo.cuenta_deposito_service, 'obtener_cuenta_activa', AsyncMock(return_value=None)), \
+         patch.object(modulo.folio_mbco_service, 'siguiente', AsyncMock(return_value="NC-000100")):
+        exitoso, _ = await servicio.procesar_solicitud_automaticamente("nc-1")
+
+    assert exitoso is True
+    coleccion.find_one.assert_awaited_once()
+    coleccion.update_one.assert_not_awaited()
+    coleccion.find_one_and_update.assert_awaited_once()
+    filtro, update = coleccion.find_one_and_update.await_args.args
+    assert filtro == {"id": "nc-1"}
+    assert update["$set"]["validacion"]["comprobante"]["valido"] is True
+    assert update["$set"]["total_comprobantes_validos"] == 10000.0
+    assert update["$set"]["estado"] == "lista_para_mbc"
+    assert update["$set"]["folio_mbco"] == "NC-000100"
+    assert update["$push"]["estado_historico"]["$each"][0]["estado"] == "lista_para_mbc"
+    notificar.assert_awaited_once_with(coleccion.find_one_and_update.return_value)
+
+
+@pytest.mark.asyncio
+async def test_rechazo_en_una_escritura(coleccion):
+    coleccion.find_one.return_value = {**SOLICITUD, "idmex_reportado": "123"}
+    servicio = NetCashService()
+
+    with patch.object(servicio, '_validar_cliente', AsyncMock(return_value={"valido": True, "razon": "ok"})):
+        exitoso, mensaje = await servicio.procesar_solicitud_automaticamente("nc-1")
+
+    assert exitoso is False and "idmex" in mensaje
+    coleccion.update_one.assert_awaited_once()
+    update = coleccion.update_one.await_args.args[1]
+    assert update["$set"]["estado"] == "rechazada"
+    assert update["$set"]["validacion"]["idmex"]["valido"] is False
+
+
+@pytest.mark.asyncio
+async def test_push_comprobantes_devuelve_post_imagen(coleccion):
+    async def sin_transaccion(operacion):
+        return await operacion(None)
+
+    huellas = MagicMock()
+    huellas.en_transaccion = AsyncMock(side_effect=sin_transaccion)
+    huellas.registrar = AsyncMock()
+
+    with patch.object(modulo, 'comprobante_fingerprints_service', huellas), \
+         patch.object(modulo.comprobante_ocr_raw_service, 'guardar', AsyncMock()):
+        solicitud = await NetCashService()._push_comprobantes(
+            "nc-1", [{"nombre_archivo": "a.pdf"}], {"monto_depositado_cliente": 10.0}, devolver_solicitud=True
+        )
+
+    assert solicitud == coleccion.find_one_and_update.return_value
+    update = coleccion.find_one_and_update.await_args.args[1]
+    assert update["$set"]["monto_depositado_cliente"] == 10.0
+    assert update["$push"]["comprobantes"]["$each"][0]["nombre_archivo"] == "a.pdf"
@@ -0,0 +1,194 @@
+"""
+Tests del pipeline de ZIP de comprobantes (NetCashService.procesar_archivo_zip)
+
+Verifica que:
+1. La solicitud se lee una sola vez y los comprobantes se guardan con un solo $push
+2. Duplicados locales (dentro del ZIP) y globales se detectan sin OCR
+3. El OCR respeta el límite de concurrencia
+4. El reporte por archivo conserva el formato y los conteos
+"""
+import asyncio
+import hashlib
+import sys
+import zipfile
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from netcash_service import NetCashService
+
+
+SOLICITUD_ID = "nc-test-zip-001"
+CUENTA_ACTIVA = {"banco": "STP", "clabe": "646180139409481462", "beneficiario": "MBCO"}
+
+
+def _comprobante_ocr(archivo_url, nombre_archivo, file_hash, es_valido=True, es_confiable=True):
+    return {
+        "archivo_url": archivo_url,
+        "nombre_archivo": nombre_archivo,
+        "archivo_hash": file_hash,
+        "es_valido": es_valido,
+        "es_duplicado": False,
+        "monto_detectado": 1000.0,
+        "validacion_detalle": {"razon": "CLABE completa coincide con cuenta activa"},
+        "ocr_data": {
+            "banco_detectado": "BBVA",
+            "es_confiable": es_confiable,
+            "motivo_fallo": None if es_confiable else "sin_monto_detectado",
+            "advertencias": []
+        }
+    }
+
+
+def _cursor(documentos):
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=documentos)
+    return cursor
+
+
+@pytest.fixture
+def zip_comprobantes(tmp_path):
+    """ZIP con 4 comprobantes únicos, 1 repetido, 1 ya usado en otra operación y 1 no soportado"""
+    ruta = tmp_path / "lote.zip"
+    with zipfile.ZipFile(ruta, "w") as zf:
+        for i in range(4):
+            zf.writestr(f"unico_{i}.pdf", f"comprobante {i}")
+        zf.writestr("repetido.pdf", "comprobante 0")
+        zf.writestr("usado.png", "comprobante usado")
+        zf.writestr("notas.txt", "no es comprobante")
+    return ruta
+
+
+@pytest.fixture
+def mock_collection():
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value={"cliente_id": "cli_001", "comprobantes": []})
+    collection.update_one = AsyncMock()
+    collection.find = MagicMock(return_value=_cursor([]))
+    return collection
+
+
+@pytest.fixture
+def mock_huellas():
+    async def sin_transaccion(operacion):
+        return await operacion(None)
+
+    huellas = MagicMock()
+    huellas.en_transaccion = AsyncMock(side_effect=sin_transaccion)
+    huellas.huellas = MagicMock(return_value=[])
+    huellas.registrar = AsyncMock(return_value=0)
+    huellas.buscar_duplicados = AsyncMock(return_value={})
+    return huellas
+
+
+@pytest.fixture
+def servicio(mock_collection, mock_huellas):
+    mock_db = MagicMock()
+    mock_db.__getitem__.return_value = mock_collection
+    with patch('netcash_service.db', mock_db), \
+         patch('netcash_service.comprobante_fingerprints_service', mock_huellas), \
+         patch('netcash_service.cuenta_deposito_service.obtener_cuenta_activa',
+               AsyncMock(return_value=CUENTA_ACTIVA)):
+        servicio = NetCashService()
+        servicio.zip_ocr_concurrencia = 2
+        yield servicio
+
+
+def _mock_duplicado_global(mock_huellas):
+    hash_usado = hashlib.sha256(b"comprobante usado").hexdigest()
+    mock_huellas.buscar_duplicados.return_value = {
+        hash_usado: {"id": "nc-otra", "folio_mbco": "NC-000010", "nombre_archivo": "original.png"}
+    }
+
+
+@pytest.mark.asyncio
+async def test_zip_un_solo_push_y_reporte(servicio, mock_collection, mock_huellas, zip_comprobantes):
+    _mock_duplicado_global(mock_huellas)
+
+    en_vuelo = 0
+    max_en_vuelo = 0
+
+    async def fake_ocr(archivo_url, nombre_archivo, file_hash, cuenta_activa):
+        nonlocal en_vuelo, max_en_vuelo
+        en_vuelo += 1
+        max_en_vuelo = max(max_en_vuelo, en_vuelo)
+        await asyncio.sleep(0.01)
+        en_vuelo -= 1
+        return _comprobante_ocr(archivo_url, nombre_archivo, file_hash)
+
+    with patch.object(servicio, '_analizar_comprobante_ocr', side_effect=fake_ocr) as mock_ocr:
+        resultado = await servicio.procesar_archivo_zip(SOLICITUD_ID, str(zip_comprobantes), "lote.zip")
+
+    # OCR solo para los 4 únicos, con concurrencia acotada
+    assert mock_ocr.await_count == 4
+    assert max_en_vuelo == 2
+
+    # Una lectura de la solicitud y una sola escritura
+    mock_collection.find_one.assert_awaited_once()
+    mock_collection.update_one.assert_awaited_once()
+    filtro, update = mock_collection.update_one.await_args.args
+    assert filtro == {"id": SOLICITUD_ID}
+    nuevos = update["$push"]["comprobantes"]["$each"]
+    assert len(nuevos) == 6
+    assert update["$set"]["monto_depositado_cliente"] == 1000.0
+
+    # Huellas de los nuevos comprobantes en la misma escritura; los duplicados se consultan en una sola búsqueda
+    mock_huellas.en_transaccion.assert_awaited_once()
+    mock_huellas.registrar.assert_awaited_once()
+    mock_huellas.buscar_duplicados.assert_awaited_once()
+
+    tipos = {c["nombre_archivo"]: c.get("tipo_duplicado") for c in nuevos}
+    assert tipos["lote.zip/usado.png"] == "global"
+    assert sum(1 for t in tipos.values() if t == "local") == 1
+
+    assert resultado["total_archivos"] == 7
+    assert resultado["validos"] == 4
+    assert resultado["duplicados"] == 2
+    assert resultado["no_legibles"] == 1
+    assert [a["estado"] for a in resultado["archivos_procesados"]].count("valido") == 4
+    assert len(resultado["archivos_procesados"]) == 7
+
+
+@pytest.mark.asyncio
+async def test_zip_modo_manual_solo_primer_comprobante(servicio, mock_collection, tmp_path):
+    ruta = tmp_path / "dos.zip"
+    with zipfile.ZipFile(ruta, "w") as zf:
+        zf.writestr("a.pdf", "a")
+        zf.writestr("b.pdf", "b")
+
+    async def fake_ocr(archivo_url, nombre_archivo, file_hash, cuenta_activa):
+        return _comprobante_ocr(archivo_url, nombre_archivo, file_hash, es_confiable=False)
+
+    with patch.object(servicio, '_analizar_comprobante_ocr', side_effect=fake_ocr):
+        resultado = await servicio.procesar_archivo_zip(SOLICITUD_ID, str(ruta), "dos.zip")
+
+    update = mock_collection.update_one.await_args.args[1]
+    assert update["$set"]["modo_captura"] == "manual_por_fallo_ocr"
+    assert resultado["validos"] == 2
+
+
+@pytest.mark.asyncio
+async def test_zip_error_ocr_no_detiene_lote(servicio, mock_collection, tmp_path):
+    ruta = tmp_path / "error.zip"
+    with zipfile.ZipFile(ruta, "w") as zf:
+        zf.writestr("ok.pdf", "ok")
+        zf.writestr("falla.pdf", "falla")
+
+    async def fake_ocr(archivo_url, nombre_archivo, file_hash, cuenta_activa):
+        if "falla" in nombre_archivo:
+            raise RuntimeError("timeout gemini")
+        return _comprobante_ocr(archivo_url, nombre_archivo, file_hash)
+
+    with patch.object(servicio, '_analizar_comprobante_ocr', side_effect=fake_ocr):
+        resultado = await servicio.procesar_archivo_zip(SOLICITUD_ID, str(ruta), "error.zip")
+
+    nuevos = mock_collection.update_one.await_args.args[1]["$push"]["comprobantes"]["$each"]
+    assert [c["nombre_archivo"] for c in nuevos] == ["error.zip/ok.pdf"]
+    assert resultado["validos"] == 1
+    assert resultado["no_legibles"] == 1
+    errores = [a for a in resultado["archivos_procesados"] if a["estado"] == "error"]
+    assert errores == [{"nombre": "falla.pdf", "estado": "error", "razon": "timeout gemini"}]
@@ -0,0 +1,338 @@
+"""Caché del texto extraído de comprobantes por contenido de archivo
+
+Un mismo archivo se extrae varias veces durante su ciclo de vida: validación al
+subirlo, re-validación tras /reocr, el validador de pagos de Tesorería en cada
+pasada del monitor de correo, el benchmark, etc. PyPDF2/Tesseract son la parte
+más cara de la validación local, así que el texto se guarda una sola vez.
+
+La llave es el hash SHA-256 del archivo + el tipo de extracción (pdf / imagen
+con idioma) + EXTRACCION_TEXTO_VERSION, así un cambio de librería o de reglas
+invalida lo anterior.
+
+Cada entrada guarda el texto por página y el banco detectado.
+
+Niveles:
+1. LRU en memoria del proceso (acotado por TEXTO_CACHE_MAX_MEMORIA entradas)
+2. Archivos JSON en disco (TEXTO_CACHE_DIR, acotado por TEXTO_CACHE_MAX_DISCO_MB;
+   se desalojan los menos usados por fecha de modificación)
+
+Se usa disco y no MongoDB porque los validadores también se llaman en modo
+síncrono. Los errores de extracción nunca se cachean; un PDF sin capa de texto
+sí (páginas vacías), para no volver a parsearlo.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from banco_specific_parsers import BancoParser
+from extraccion_texto_service import extraccion_texto_service, extraer_paginas_pdf, extraer_texto_imagen
+
+logger = logging.getLogger(__name__)
+
+# Subir al cambiar la librería o la forma de extraer texto
+EXTRACCION_TEXTO_VERSION = "pypdf2-tesseract-v1"
+
+TIPO_PDF = "pdf"
+TIPO_IMAGEN = "imagen"
+
+
+def calcular_hash_archivo(ruta_archivo: str) -> str:
+    """SHA-256 del contenido del archivo, leído por bloques"""
+    sha256 = hashlib.sha256()
+    with open(ruta_archivo, 'rb') as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(bloque)
+    return sha256.hexdigest()
+
+
+class TextoExtraidoCacheService:
+    """Caché de dos niveles (memoria + disco) para el texto extraído de comprobantes"""
+
+    def __init__(self):
+        self.habilitado = os.getenv('TEXTO_CACHE_HABILITADO', 'true').lower() != 'false'
+        self.max_memoria = int(os.getenv('TEXTO_CACHE_MAX_MEMORIA', '300'))
+        self.max_disco_bytes = int(float(os.getenv('TEXTO_CACHE_MAX_DISCO_MB', '200')) * 1024 * 1024)
+        self.directorio = Path(os.getenv('TEXTO_CACHE_DIR', str(Path(__file__).parent / 'cache_texto')))
+
+        # llave -> entrada
+        self._memoria: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Bytes en disco (None = no calculado todavía)
+        self._bytes_disco: Optional[int] = None
+
+        self.estadisticas = {
+            "hits_memoria": 0,
+            "hits_disco": 0,
+            "misses": 0,
+            "escrituras": 0,
+            "evicciones_memoria": 0,
+            "evicciones_disco": 0,
+            "errores": 0
+        }
+
+    @staticmethod
+    def _llave(file_hash: str, tipo: str) -> str:
+        return f"{file_hash}_{tipo}_{EXTRACCION_TEXTO_VERSION}"
+
+    def _ruta_disco(self, llave: str) -> Path:
+        return self.directorio / llave[:2] / f"{llave}.json"
+
+    # ==================== MEMORIA (LRU) ====================
+
+    def _leer_memoria(self, llave: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entrada = self._memoria.get(llave)
+            if entrada is not None:
+                self._memoria.move_to_end(llave)
+            return entrada
+
+    def _escribir_memoria(self, llave: str, entrada: Dict[str, Any]):
+        with self._lock:
+            self._memoria[llave] = entrada
+            self._memoria.move_to_end(llave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+                self.estadisticas["evicciones_memoria"] += 1
+
+    # ==================== DISCO ====================
+
+    def _leer_disco(self, llave: str) -> Optional[Dict[str, Any]]:
+        ruta = self._ruta_disco(llave)
+        try:
+            entrada = json.loads(ruta.read_text(encoding='utf-8'))
+            # La fecha de modificación marca el último uso para el desalojo
+            os.utime(ruta)
+            return entrada
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.estadisticas["errores"] += 1
+            logger.warning(f"[Texto-Cache] Entrada de disco ilegible {ruta.name}: {str(e)}")
+            return None
+
+    def _escribir_disco(self, llave: str, entrada: Dict[str, Any]):
+        ruta = self._ruta_disco(llave)
+        try:
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            contenido = json.dumps(entrada, ensure_ascii=False).encode('utf-8')
+            # Escritura atómica: otro proceso nunca lee un JSON a medias
+            temporal = ruta.with_suffix(f".{os.getpid()}.tmp")
+            temporal.write_bytes(contenido)
+            os.replace(temporal, ruta)
+        except Exception as e:
+            self.estadisticas["errores"] += 1
+            logger.warning(f"[Texto-Cache] Error guardando en disco: {str(e)}")
+            return
+
+        with self._lock:
+            if self._bytes_disco is None:
+                self._bytes_disco = self._medir_disco()
+            else:
+                self._bytes_disco += len(contenido)
+            excedido = self._bytes_disco > self.max_disco_bytes
+
+        if excedido:
+            self._desalojar_disco()
+
+    def _archivos_disco(self) -> List[Path]:
+        if not self.directorio.exists():
+            return []
+        return list(self.directorio.glob("*/*.json"))
+
+    def _medir_disco(self) -> int:
+        total = 0
+        for ruta in self._archivos_disco():
+            try:
+                total += ruta.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _desalojar_disco(self):
+        """Borra las entradas menos usadas hasta quedar en 90% del límite"""
+        archivos = []
+        for ruta in self._archivos_disco():
+            try:
+                stat = ruta.stat()
+                archivos.append((stat.st_mtime, stat.st_size, ruta))
+            except FileNotFoundError:
+                pass
+        archivos.sort()
+
+        total = sum(tamano for _, tamano, _ in archivos)
+        objetivo = int(self.max_disco_bytes * 0.9)
+        eliminados = 0
+        for _, tamano, ruta in archivos:
+            if total <= objetivo:
+                break
+            try:
+                ruta.unlink()
+                total -= tamano
+                eliminados += 1
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            self._bytes_disco = total
+            self.estadisticas["evicciones_disco"] += eliminados
+        logger.info(f"[Texto-Cache] Desalojo de disco: {eliminados} entrada(s), {total} bytes restantes")
+
+    # ==================== CONSULTA / ESCRITURA ====================
+
+    def obtener(self, file_hash: str, tipo: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca el texto extraído de un archivo.
+
+        Args:
+            file_hash: Hash SHA-256 del contenido del archivo
+            tipo: 'pdf' o 'imagen:<lang>'
+
+        Returns:
+            Copia de la entrada ({paginas, banco_detectado, ...}) o None
+        """
+        if not self.habilitado or not file_hash:
+            return None
+
+        llave = self._llave(file_hash, tipo)
+
+        entrada = self._leer_memoria(llave)
+        if entrada is not None:
+            self.estadisticas["hits_memoria"] += 1
+            return copy.deepcopy(entrada)
+
+        entrada = self._leer_disco(llave)
+        if entrada is not None:
+            self.estadisticas["hits_disco"] += 1
+            self._escribir_memoria(llave, entrada)
+            return copy.deepcopy(entrada)
+
+        self.estadisticas["misses"] += 1
+        return None
+
+    def guardar(self, file_hash: str, tipo: str, paginas: List[str]) -> Dict[str, Any]:
+        """
+        Guarda el texto por página y el banco detectado en ambos niveles.
+
+        Returns:
+            La entrada guardada
+        """
+        texto = "\n".join(paginas)
+        entrada = {
+            "file_hash": file_hash,
+            "tipo": tipo,
+            "paginas": paginas,
+            "banco_detectado": BancoParser().identificar_banco(texto) if texto.strip() else None,
+            "version": EXTRACCION_TEXTO_VERSION,
+            "creado_en": datetime.now(timezone.utc).isoformat()
+        }
+
+        if not self.habilitado or not file_hash:
+            return entrada
+
+        llave = self._llave(file_hash, tipo)
+        self._escribir_memoria(llave, copy.deepcopy(entrada))
+        self._escribir_disco(llave, entrada)
+        self.estadisticas["escrituras"] += 1
+        return entrada
+
+    def invalidar(self, file_hash: str):
+        """Elimina todas las entradas de un archivo (memoria y disco)"""
+        with self._lock:
+            for llave in [k for k in self._memoria if k.startswith(f"{file_hash}_")]:
+                del self._memoria[llave]
+
+        for ruta in self.directorio.glob(f"{file_hash[:2]}/{file_hash}_*.json"):
+            try:
+                ruta.unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._bytes_disco = None
+
+    # ==================== EXTRACCIÓN CON CACHÉ ====================
+
+    @staticmethod
+    def _tipo_imagen(lang: str) -> str:
+        return f"{TIPO_IMAGEN}:{lang}"
+
+    def extraer_pdf(self, ruta_archivo: str, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Texto por página de un PDF, extrayéndolo solo si no está en caché.
+
+        Los errores de extracción se propagan (y no se cachean).
+        """
+        ruta_archivo = str(ruta_archivo)
+        file_hash = file_hash or calcular_hash_archivo(ruta_archivo)
+
+        entrada = self.obtener(file_hash, TIPO_PDF)
+        if entrada is not None:
+            logger.info(f"[Texto-Cache] HIT pdf: {file_hash[:16]}...")
+            return entrada
+
+        return self.guardar(file_hash, TIPO_PDF, extraer_paginas_pdf(ruta_archivo))
+
+    def extraer_imagen(self, ruta_archivo: str, lang: str = 'spa',
+                       file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Texto de una imagen (una sola 'página'), extrayéndolo solo si no está en caché"""
+        ruta_archivo = str(ruta_archivo)
+        file_hash = file_hash or calcular_hash_archivo(ruta_archivo)
+        tipo = self._tipo_imagen(lang)
+
+        entrada = self.obtener(file_hash, tipo)
+        if entrada is not None:
+            logger.info(f"[Texto-Cache] HIT imagen: {file_hash[:16]}...")
+            return entrada
+
+        return self.guardar(file_hash, tipo, [extraer_texto_imagen(ruta_archivo, lang)])
+
+    async def extraer_pdf_async(self, ruta_archivo: str, file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Como extraer_pdf, extrayendo en el pool de procesos en caso de miss"""
+        ruta_archivo = str(ruta_archivo)
+        file_hash = file_hash or await asyncio.to_thread(calcular_hash_archivo, ruta_archivo)
+
+        entrada = await asyncio.to_thread(self.obtener, file_hash, TIPO_PDF)
+        if entrada is not None:
+            logger.info(f"[Texto-Cache] HIT pdf: {file_hash[:16]}...")
+            return entrada
+
+        paginas = await extraccion_texto_service.extraer_paginas_pdf(ruta_archivo)
+        return await asyncio.to_thread(self.guardar, file_hash, TIPO_PDF, paginas)
+
+    async def extraer_imagen_async(self, ruta_archivo: str, lang: str = 'spa',
+                                   file_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Como extraer_imagen, extrayendo en el pool de procesos en caso de miss"""
+        ruta_archivo = str(ruta_archivo)
+        file_hash = file_hash or await asyncio.to_thread(calcular_hash_archivo, ruta_archivo)
+        tipo = self._tipo_imagen(lang)
+
+        entrada = await asyncio.to_thread(self.obtener, file_hash, tipo)
+        if entrada is not None:
+            logger.info(f"[Texto-Cache] HIT imagen: {file_hash[:16]}...")
+            return entrada
+
+        texto = await extraccion_texto_service.extraer_texto_imagen(ruta_archivo, lang)
+        return await asyncio.to_thread(self.guardar, file_hash, tipo, [texto])
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """Estadísticas de uso del caché para monitoreo"""
+        hits = self.estadisticas["hits_memoria"] + self.estadisticas["hits_disco"]
+        consultas = hits + self.estadisticas["misses"]
+        return {
+            **self.estadisticas,
+            "entradas_memoria": len(self._memoria),
+            "bytes_disco": self._bytes_disco,
+            "hit_rate": round(hits / consultas, 4) if consultas else 0.0
+        }
+
+
+# Instancia global del servicio
+texto_extraido_cache_service = TextoExtraidoCacheService()
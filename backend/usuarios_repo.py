@@ -7,19 +7,15 @@ Los usuarios definen quién recibe notificaciones, puede ejecutar acciones, etc.
 
 import logging
 from typing import Optional, Dict, List
-from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 from uuid import uuid4
-import os
+from database import db
+from identidad_cache_service import (
+    ESPACIO_USUARIO_NETCASH, ESPACIO_USUARIOS_POR_PERMISO, identidad_cache
+)
 
 logger = logging.getLogger(__name__)
 
-# Conexión MongoDB
-mongo_url = os.getenv('MONGO_URL')
-db_name = os.getenv('DB_NAME', 'netcash_mbco')
-client = AsyncIOMotorClient(mongo_url)
-db = client[db_name]
-
 COLLECTION_NAME = 'usuarios_netcash'
 
 
@@ -67,12 +63,15 @@ class UsuariosRepository:
             Dict con datos del usuario o None si no existe
         """
         try:
-            usuario = await db[COLLECTION_NAME].find_one(
-                {
-                    "telegram_id": telegram_id,
-                    "activo": True
-                },
-                {"_id": 0}
+            usuario = await identidad_cache.obtener(
+                ESPACIO_USUARIO_NETCASH, ("telegram_id", telegram_id),
+                lambda: db[COLLECTION_NAME].find_one(
+                    {
+                        "telegram_id": telegram_id,
+                        "activo": True
+                    },
+                    {"_id": 0}
+                ),
             )
             
             if usuario:
@@ -97,12 +96,15 @@ class UsuariosRepository:
             Dict con datos del usuario o None si no existe
         """
         try:
-            usuario = await db[COLLECTION_NAME].find_one(
-                {
-                    "rol_negocio": rol_negocio,
-                    "activo": True
-                },
-                {"_id": 0}
+            usuario = await identidad_cache.obtener(
+                ESPACIO_USUARIO_NETCASH, ("rol_negocio", rol_negocio),
+                lambda: db[COLLECTION_NAME].find_one(
+                    {
+                        "rol_negocio": rol_negocio,
+                        "activo": True
+                    },
+                    {"_id": 0}
+                ),
             )
             
             if usuario:
@@ -133,10 +135,13 @@ class UsuariosRepository:
                 f"permisos.{flag_permiso}": valor
             }
             
-            usuarios = await db[COLLECTION_NAME].find(
-                filtro,
-                {"_id": 0}
-            ).to_list(100)
+            usuarios = await identidad_cache.obtener(
+                ESPACIO_USUARIOS_POR_PERMISO, (flag_permiso, valor),
+                lambda: db[COLLECTION_NAME].find(
+                    filtro,
+                    {"_id": 0}
+                ).to_list(100),
+            )
             
             logger.info(f"[UsuariosRepo] {len(usuarios)} usuario(s) encontrado(s) con permiso '{flag_permiso}={valor}'")
             
@@ -195,6 +200,7 @@ class UsuariosRepository:
             }
             
             await db[COLLECTION_NAME].insert_one(usuario)
+            identidad_cache.invalidar_usuarios_netcash()
             
             logger.info(f"[UsuariosRepo] Usuario creado: {usuario['nombre']} ({usuario['rol_negocio']})")
             
@@ -163,7 +163,7 @@ class BackendTester:
         try:
             async with self.session.get(f"{BACKEND_URL}/operaciones") as response:
                 if response.status == 200:
-                    data = await response.json()
+                    data = (await response.json())["operaciones"]
                     logger.info(f"✅ Dashboard API Fix VERIFIED: {len(data)} operaciones obtenidas")
                     logger.info("✅ No more 500 errors - corrupted record with ID '7f96ed03-3a50-4d1b-a5ad-acab153c7a96' was successfully deleted")
                     
@@ -1358,7 +1358,7 @@ class BackendTester:
                     logger.error(f"   ❌ Failed to get operations: {response.status}")
                     return False
                 
-                operations = await response.json()
+                operations = (await response.json())["operaciones"]
                 test_operation = None
                 
                 # Find operation with multiple comprobantes
@@ -1821,7 +1821,7 @@ class BackendTester:
             
             async with self.session.get(f"{BACKEND_URL}/operaciones") as response:
                 if response.status == 200:
-                    operaciones = await response.json()
+                    operaciones = (await response.json())["operaciones"]
                     logger.info(f"   ✅ Listado obtenido: {len(operaciones)} operaciones")
                     
                     # Buscar nuestra operación específica
@@ -2546,7 +2546,7 @@ class BackendTester:
             
             async with self.session.get(f"{BACKEND_URL}/operaciones") as response:
                 if response.status == 200:
-                    operaciones = await response.json()
+                    operaciones = (await response.json())["operaciones"]
                     logger.info(f"   ✅ Operaciones obtenidas: {len(operaciones)} total")
                     
                     # Filtrar operaciones de Telegram (ID empieza con "nc-")
@@ -2883,7 +2883,7 @@ class BackendTester:
                     # Get list of operations to find a Telegram one
                     async with self.session.get(f"{BACKEND_URL}/operaciones") as list_response:
                         if list_response.status == 200:
-                            operations = await list_response.json()
+                            operations = (await list_response.json())["operaciones"]
                             telegram_ops = [op for op in operations if op.get('id', '').startswith('nc-') and op.get('estado') != 'DATOS_COMPLETOS']
                             
                             if telegram_ops:
@@ -3016,7 +3016,7 @@ class BackendTester:
                     # Get list of operations to find a Telegram one
                     async with self.session.get(f"{BACKEND_URL}/operaciones") as list_response:
                         if list_response.status == 200:
-                            operations = await list_response.json()
+                            operations = (await list_response.json())["operaciones"]
                             telegram_ops = [op for op in operations if op.get('id', '').startswith('nc-')]
                             
                             if telegram_ops:
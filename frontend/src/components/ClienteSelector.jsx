@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import axios from 'axios';
 import { Search, Plus, User, Mail, Phone, MessageCircle, Percent, X, Check } from 'lucide-react';
 import { Button } from '@/components/ui/button';
@@ -22,6 +22,10 @@ const ClienteSelector = ({ onClienteSeleccionado, clienteSeleccionado }) => {
   const [buscando, setBuscando] = useState(false);
   const [clientes, setClientes] = useState([]);
   const [busqueda, setBusqueda] = useState('');
+  const [pagina, setPagina] = useState(1);
+  const [hayMas, setHayMas] = useState(false);
+  // Solo se muestra la respuesta de la última búsqueda (las anteriores pueden llegar después)
+  const ultimaBusqueda = useRef(0);
   const [creando, setCreando] = useState(false);
   
   // Formulario de nuevo cliente
@@ -41,17 +45,22 @@ const ClienteSelector = ({ onClienteSeleccionado, clienteSeleccionado }) => {
     buscarClientes('');
   }, []);
 
-  const buscarClientes = async (termino) => {
+  const buscarClientes = async (termino, paginaBuscada = 1) => {
+    const busquedaId = ++ultimaBusqueda.current;
     try {
-      setBuscando(true);
+      setBuscando(paginaBuscada === 1);
       const response = await axios.get(`${API}/clientes/buscar`, {
-        params: { q: termino }
+        params: { q: termino, pagina: paginaBuscada }
       });
-      setClientes(response.data);
+      if (busquedaId !== ultimaBusqueda.current) return;
+      const { clientes: encontrados, hay_mas } = response.data;
+      setClientes((anteriores) => (paginaBuscada === 1 ? encontrados : [...anteriores, ...encontrados]));
+      setPagina(paginaBuscada);
+      setHayMas(hay_mas);
     } catch (error) {
       console.error('Error buscando clientes:', error);
     } finally {
-      setBuscando(false);
+      if (busquedaId === ultimaBusqueda.current) setBuscando(false);
     }
   };
 
@@ -403,6 +412,16 @@ const ClienteSelector = ({ onClienteSeleccionado, clienteSeleccionado }) => {
               </div>
             </div>
           ))}
+          {hayMas && (
+            <Button
+              variant="ghost"
+              className="w-full"
+              onClick={() => buscarClientes(busqueda, pagina + 1)}
+              data-testid="load-more-clients-btn"
+            >
+              Ver más clientes
+            </Button>
+          )}
         </div>
       )}
     </Card>
@@ -0,0 +1,17 @@
+import axios from 'axios';
+
+const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
+
+// GET /api/operaciones está paginado por cursor: recorre todas las páginas
+export async function cargarTodasLasOperaciones(params = {}) {
+  const operaciones = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(`${API}/operaciones`, {
+      params: { vista: 'lista', limite: 200, ...params, ...(cursor ? { cursor } : {}) }
+    });
+    operaciones.push(...response.data.operaciones);
+    cursor = response.data.siguiente_cursor;
+  } while (cursor);
+  return operaciones;
+}
@@ -19,6 +19,7 @@ import {
 } from "@/components/ui/alert-dialog";
 import NuevaOperacionModal from '@/components/NuevaOperacionModal';
 import ComprobantesModal from '@/components/ComprobantesModal';
+import { cargarTodasLasOperaciones } from '@/lib/operaciones';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
@@ -46,9 +47,8 @@ const Dashboard = () => {
   const cargarOperaciones = async () => {
     try {
       setLoading(true);
-      const response = await axios.get(`${API}/operaciones`);
-      setOperaciones(response.data);
-      calcularStats(response.data);
+      const [data] = await Promise.all([cargarTodasLasOperaciones(), cargarStats()]);
+      setOperaciones(data);
     } catch (error) {
       console.error('Error cargando operaciones:', error);
       toast.error('Error al cargar operaciones');
@@ -78,17 +78,15 @@ const Dashboard = () => {
     }
   };
 
-  const calcularStats = (ops) => {
-    const total = ops.length;
-    const completadas = ops.filter(op => op.estado === 'COMPLETADO').length;
-    const en_proceso = ops.filter(op => 
-      ['VALIDANDO_COMPROBANTES', 'ESPERANDO_DATOS_TITULAR', 'ESPERANDO_CONFIRMACION_CLIENTE',
-       'ESPERANDO_CODIGO_SISTEMA', 'PENDIENTE_PAGO_PROVEEDOR', 'ESPERANDO_TESORERIA',
-       'ESPERANDO_PROVEEDOR', 'LISTO_PARA_ENTREGAR'].includes(op.estado)
-    ).length;
-    const pendientes = ops.filter(op => op.estado === 'ESPERANDO_COMPROBANTES').length;
-
-    setStats({ total, completadas, en_proceso, pendientes });
+  const cargarStats = async () => {
+    const response = await axios.get(`${API}/operaciones/stats`);
+    const { total, por_etapa } = response.data;
+    setStats({
+      total,
+      completadas: por_etapa.completadas,
+      en_proceso: por_etapa.en_proceso,
+      pendientes: por_etapa.pendientes
+    });
   };
 
   const operacionesFiltradas = operaciones.filter(op => 
@@ -8,6 +8,7 @@ import { Label } from '@/components/ui/label';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
 import { Badge } from '@/components/ui/badge';
 import { toast } from 'sonner';
+import { cargarTodasLasOperaciones } from '@/lib/operaciones';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
@@ -25,15 +26,10 @@ const PendientesMBControl = () => {
   const cargarOperacionesPendientes = async () => {
     try {
       setLoading(true);
-      const response = await axios.get(`${API}/operaciones`);
-      
-      // Filtrar operaciones que tienen datos completos pero no tienen clave MBControl
-      // Incluye DATOS_COMPLETOS (nuevo) y ESPERANDO_CODIGO_SISTEMA (legacy)
-      const estadosValidos = ['DATOS_COMPLETOS', 'ESPERANDO_CODIGO_SISTEMA'];
-      const pendientes = response.data.filter(op => 
-        estadosValidos.includes(op.estado) && 
-        !op.clave_operacion_mbcontrol
-      );
+      // Operaciones con datos completos pero sin clave MBControl
+      // Incluye DATOS_COMPLETOS (nuevo) y ESPERANDO_CODIGO_SISTEMA (legacy); el estado se filtra en el servidor
+      const data = await cargarTodasLasOperaciones({ estado: 'DATOS_COMPLETOS,ESPERANDO_CODIGO_SISTEMA' });
+      const pendientes = data.filter(op => !op.clave_operacion_mbcontrol);
       
       setOperaciones(pendientes);
     } catch (error) {
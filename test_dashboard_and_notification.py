@@ -29,7 +29,7 @@ async def test_dashboard_api_fix():
                 logger.info(f"Response status: {response.status}")
                 
                 if response.status == 200:
-                    data = await response.json()
+                    data = (await response.json())["operaciones"]
                     logger.info(f"✅ Dashboard API Fix VERIFIED")
                     logger.info(f"   - Status: 200 OK")
                     logger.info(f"   - Response: Valid JSON array with {len(data)} operations")
@@ -241,7 +241,7 @@ class MaskedAccountTester:
             # Buscar una operación de Telegram existente para probar
             async with self.session.get(f"{BACKEND_URL}/operaciones") as response:
                 if response.status == 200:
-                    operaciones = await response.json()
+                    operaciones = (await response.json())["operaciones"]
                     operacion_telegram = None
                     
                     # Buscar operación de Telegram con comprobantes
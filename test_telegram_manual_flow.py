@@ -157,7 +157,7 @@ class TelegramManualFlowTester:
             # Get an existing operation to test Re-OCR
             async with self.session.get(f"{BACKEND_URL}/operaciones") as response:
                 if response.status == 200:
-                    operaciones = await response.json()
+                    operaciones = (await response.json())["operaciones"]
                     telegram_ops = [op for op in operaciones if op.get('id', '').startswith('nc-')]
                     
                     if telegram_ops: